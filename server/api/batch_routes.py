@@ -8,14 +8,22 @@ Provides REST API endpoints for managing document processing batches:
 - Monitor batch progress
 """
 
+import os
 import logging
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from services.batch_service import batch_service
+from services.provider_batches import provider_batches, EXECUTION_MODES, ACTIVE_STATUSES
+from services.change_counters import change_counters
+from utils.http_cache import conditional_get
 # Staging functionality now integrated into BatchService
 
 logger = logging.getLogger(__name__)
 
+# Progress responses carry elapsed time, throughput and ETA, which change with the
+# clock: their ETags also change this often while no row changes status
+PROGRESS_ETAG_MAX_AGE = float(os.getenv('PROGRESS_ETAG_MAX_AGE', '10'))
+
 
 def _format_connection_for_response(response):
     """
@@ -101,7 +109,10 @@ def register_batch_routes(app):
                 connection_ids=connection_ids,
                 prompt_ids=prompt_ids,
                 batch_name=batch_name,
-                meta_data=meta_data
+                meta_data=meta_data,
+                priority=data.get('priority', 0),
+                submitted_by=data.get('submitted_by'),
+                execution_mode=data.get('execution_mode', 'interactive')
             )
 
             if result['success']:
@@ -163,11 +174,15 @@ def register_batch_routes(app):
                 connection_ids=connection_ids,
                 prompt_ids=prompt_ids,
                 batch_name=batch_name,
-                meta_data=meta_data
+                meta_data=meta_data,
+                priority=data.get('priority', 0),
+                submitted_by=data.get('submitted_by'),
+                execution_mode=data.get('execution_mode', 'interactive')
             )
 
             if result['success']:
-                return jsonify(result), 200
+                # Staging continues in the background; poll /api/batches/<id>/staging
+                return jsonify(result), 202 if result.get('job_id') else 200
             else:
                 return jsonify(result), 400
 
@@ -188,8 +203,8 @@ def register_batch_routes(app):
             result = batch_service.request_state_change(batch_id, 'stage', {})
 
             if result['success']:
-                logger.info(f"Batch {batch_id} staging completed successfully")
-                return jsonify(result), 200
+                logger.info(f"Batch {batch_id} staging job {result.get('staging_job_id')} started")
+                return jsonify(result), 202
             else:
                 logger.warning(f"Batch {batch_id} staging failed: {result.get('error', 'Unknown error')}")
                 return jsonify(result), 400
@@ -212,8 +227,8 @@ def register_batch_routes(app):
             result = batch_service.request_state_change(batch_id, 'restage', {})
 
             if result['success']:
-                logger.info(f"Batch {batch_id} staging completed successfully")
-                return jsonify(result), 200
+                logger.info(f"Batch {batch_id} staging job {result.get('staging_job_id')} started")
+                return jsonify(result), 202
             else:
                 logger.warning(f"Batch {batch_id} staging failed: {result.get('error', 'Unknown error')}")
                 return jsonify(result), 400
@@ -226,12 +241,80 @@ def register_batch_routes(app):
                 'batch_id': batch_id
             }), 500
 
+    @app.route('/api/batches/<int:batch_id>/staging', methods=['GET'])
+    def get_staging_status(batch_id):
+        """Get staging progress and throughput (files/s, MB/s, ETA) for a batch"""
+        try:
+            result = batch_service.get_staging_status(batch_id)
+
+            if result['status'] == 'NOT_FOUND':
+                return jsonify({'success': False, **result}), 404
+            if result['status'] == 'ERROR':
+                return jsonify({'success': False, **result}), 500
+            return jsonify({'success': True, **result}), 200
+
+        except Exception as e:
+            logger.error(f"Error getting staging status for batch {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'batch_id': batch_id
+            }), 500
+
+    @app.route('/api/batches/<int:batch_id>/staging/cancel', methods=['POST'])
+    def cancel_staging(batch_id):
+        """Cancel a staging batch - the job stops after its current chunk and the batch returns to SAVED"""
+        try:
+            status = batch_service.get_staging_status(batch_id)
+            if status['status'] != 'STAGING':
+                return jsonify({
+                    'success': False,
+                    'error': f"Batch {batch_id} is not staging (status: {status['status']})",
+                    'batch_id': batch_id
+                }), 409
+
+            result = batch_service.request_state_change(batch_id, 'cancel', {})
+
+            if result['success']:
+                return jsonify(result), 200
+            else:
+                return jsonify(result), 400
+
+        except Exception as e:
+            logger.error(f"Error cancelling staging for batch {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'batch_id': batch_id
+            }), 500
+
     @app.route('/api/batches/<int:batch_id>/rerun', methods=['POST'])
     def rerun_analysis(batch_id):
-        """Rerun analysis for a completed batch"""
+        """
+        Rerun analysis for a completed batch
+
+        Without a body every response is recreated. Any of these fields selects a
+        selective rerun that requeues only matching rows and keeps all other results:
+        - statuses: e.g. ["FAILED", "TIMEOUT"]
+        - connection_ids / prompt_ids: limit the rerun to these connections/prompts
+        - changed_documents: true to rerun documents whose file content changed
+        - dry_run: true to only report how many calls the rerun would cost
+        """
         try:
-            # Use centralized state management
-            result = batch_service.request_state_change(batch_id, 'rerun', {})
+            data = request.get_json(silent=True) or {}
+            selective_fields = ('statuses', 'connection_ids', 'prompt_ids', 'changed_documents', 'dry_run')
+
+            if any(field in data for field in selective_fields):
+                result = batch_service.selective_rerun_batch(
+                    batch_id,
+                    statuses=data.get('statuses'),
+                    connection_ids=data.get('connection_ids'),
+                    prompt_ids=data.get('prompt_ids'),
+                    changed_documents=bool(data.get('changed_documents', False)),
+                    dry_run=bool(data.get('dry_run', False))
+                )
+            else:
+                result = batch_service.rerun_batch(batch_id)
 
             if result['success']:
                 return jsonify(result), 200
@@ -247,6 +330,7 @@ def register_batch_routes(app):
 
 
     @app.route('/api/batches', methods=['GET'])
+    @conditional_get(lambda: change_counters.versions('batches', all_progress=True))
     def list_batches():
         """List all batches with summary information"""
         try:
@@ -267,6 +351,7 @@ def register_batch_routes(app):
             }), 500
 
     @app.route('/api/batches/<int:batch_id>', methods=['GET'])
+    @conditional_get(lambda batch_id: change_counters.versions('batches', batch_id=batch_id))
     def get_batch_details(batch_id):
         """Get detailed information about a specific batch"""
         try:
@@ -334,7 +419,103 @@ def register_batch_routes(app):
                 'error': str(e)
             }), 500
 
+    @app.route('/api/batches/<int:batch_id>/priority', methods=['PUT'])
+    def update_batch_priority(batch_id):
+        """Update the scheduling priority and owner of a batch"""
+        try:
+            data = request.get_json(force=True, silent=True)
+            if not data or 'priority' not in data:
+                return jsonify({
+                    'success': False,
+                    'error': 'priority is required'
+                }), 400
+
+            try:
+                priority = int(data['priority'])
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': 'priority must be an integer'
+                }), 400
+
+            success = batch_service.update_batch_priority(batch_id, priority, data.get('submitted_by'))
+
+            if not success:
+                return jsonify({
+                    'success': False,
+                    'error': f'Failed to update batch {batch_id}'
+                }), 404
+
+            return jsonify({
+                'success': True,
+                'message': f'Batch {batch_id} priority updated successfully',
+                'batch': batch_service.get_batch_info(batch_id)
+            })
+
+        except Exception as e:
+            logger.error(f"Error updating batch priority {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @app.route('/api/batches/<int:batch_id>/execution-mode', methods=['PUT'])
+    def update_batch_execution_mode(batch_id):
+        """Switch a batch between interactive requests and offline provider batch jobs"""
+        try:
+            data = request.get_json(force=True, silent=True)
+            execution_mode = (data or {}).get('execution_mode')
+            if execution_mode not in EXECUTION_MODES:
+                return jsonify({
+                    'success': False,
+                    'error': f"execution_mode must be one of: {', '.join(EXECUTION_MODES)}"
+                }), 400
+
+            success = batch_service.update_batch_execution_mode(batch_id, execution_mode)
+
+            if not success:
+                return jsonify({
+                    'success': False,
+                    'error': f'Failed to update batch {batch_id}'
+                }), 404
+
+            return jsonify({
+                'success': True,
+                'message': f'Batch {batch_id} execution mode set to {execution_mode}',
+                'batch': batch_service.get_batch_info(batch_id)
+            })
+
+        except Exception as e:
+            logger.error(f"Error updating batch execution mode {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @app.route('/api/batches/<int:batch_id>/provider-batches', methods=['GET'])
+    def get_batch_provider_jobs(batch_id):
+        """List the provider batch jobs (offline JSONL submissions) of a batch"""
+        try:
+            jobs = provider_batches.get_batch_jobs(batch_id)
+            return jsonify({
+                'success': True,
+                'batch_id': batch_id,
+                'jobs': jobs,
+                'requests_in_flight': sum(
+                    job['request_count'] for job in jobs if job['status'] in ACTIVE_STATUSES
+                )
+            })
+
+        except Exception as e:
+            logger.error(f"Error getting provider batch jobs for batch {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
     @app.route('/api/batches/<int:batch_id>/progress', methods=['GET'])
+    @conditional_get(lambda batch_id: change_counters.versions('batches', batch_id=batch_id),
+                     max_age_seconds=PROGRESS_ETAG_MAX_AGE)
     def get_batch_progress(batch_id):
         """Get current progress of a batch"""
         try:
@@ -406,6 +587,8 @@ def register_batch_routes(app):
             }), 500
 
     @app.route('/api/batches/<int:batch_id>/real-time-progress', methods=['GET'])
+    @conditional_get(lambda batch_id: change_counters.versions('batches', batch_id=batch_id),
+                     max_age_seconds=PROGRESS_ETAG_MAX_AGE)
     def get_real_time_batch_progress(batch_id):
         """Get comprehensive real-time progress for a specific batch"""
         try:
@@ -429,7 +612,33 @@ def register_batch_routes(app):
                 'error': str(e)
             }), 500
 
+    @app.route('/api/batches/<int:batch_id>/completion-estimate', methods=['GET'])
+    def get_batch_completion_estimate(batch_id):
+        """Predicted time until the batch's remaining rows are done, from the job cost model"""
+        try:
+            estimate = batch_service.estimate_batch_completion(batch_id)
+            if estimate is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Could not estimate completion of batch {batch_id}'
+                }), 500
+
+            return jsonify({
+                'success': True,
+                'batch_id': batch_id,
+                'estimated_completion': estimate
+            })
+
+        except Exception as e:
+            logger.error(f"Error estimating completion of batch {batch_id}: {e}", exc_info=True)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
     @app.route('/api/batches/active/progress', methods=['GET'])
+    @conditional_get(lambda: change_counters.versions('batches', all_progress=True),
+                     max_age_seconds=PROGRESS_ETAG_MAX_AGE)
     def get_all_active_batches_progress():
         """Get real-time progress for all active batches"""
         try:
@@ -449,6 +658,8 @@ def register_batch_routes(app):
             }), 500
 
     @app.route('/api/batches/dashboard', methods=['GET'])
+    @conditional_get(lambda: change_counters.versions('batches', all_progress=True),
+                     max_age_seconds=PROGRESS_ETAG_MAX_AGE)
     def get_batch_dashboard():
         """Get comprehensive dashboard data for batch processing"""
         try:
@@ -515,9 +726,9 @@ def register_batch_routes(app):
         """Get LLM responses for batch from KnowledgeDocuments database using batch_id"""
         try:
             import psycopg2
-            import json
             from database import Session
             from models import Document
+            from utils.serialization import json_passthrough
             
             # Get limit and offset for pagination
             limit = int(request.args.get('limit', 50))
@@ -538,10 +749,10 @@ def register_batch_routes(app):
                 SELECT 
                     lr.id, lr.document_id, lr.prompt_id, lr.connection_id, lr.connection_details,
                     lr.task_id, lr.status, lr.started_processing_at, lr.completed_processing_at,
-                    lr.response_json, lr.response_text, lr.response_time_ms, lr.error_message,
+                    lr.response_json::text, lr.response_text, lr.response_time_ms, lr.error_message,
                     lr.overall_score, lr.input_tokens, lr.output_tokens, lr.time_taken_seconds,
                     lr.tokens_per_second, lr.timestamp, lr.created_at, lr.batch_id,
-                    d.document_id as kb_document_id
+                    d.document_id as kb_document_id, lr.connection_snapshot_id
                 FROM llm_responses lr
                 JOIN docs d ON lr.document_id = d.id
                 WHERE lr.batch_id = %s
@@ -555,6 +766,10 @@ def register_batch_routes(app):
             kb_cursor.execute("SELECT COUNT(*) FROM llm_responses WHERE batch_id = %s", (batch_id,))
             total_count = kb_cursor.fetchone()[0]
             
+            # Connection snapshots shared by the rows, loaded once and cached
+            from services.connection_snapshots import connection_snapshots
+            connection_snapshots.get_many([response[22] for response in llm_responses], kb_cursor)
+            
             kb_cursor.close()
             kb_conn.close()
             
@@ -603,18 +818,14 @@ def register_batch_routes(app):
                      response_json, response_text, response_time_ms, error_message,
                      overall_score, input_tokens, output_tokens, time_taken_seconds,
                      tokens_per_second, timestamp, created_at, batch_id_field,
-                     kb_document_id) = response
+                     kb_document_id, connection_snapshot_id) = response
                     
-                    # Parse connection details
-                    connection_details_parsed = None
-                    if connection_details:
-                        try:
-                            if isinstance(connection_details, str):
-                                connection_details_parsed = json.loads(connection_details)
-                            else:
-                                connection_details_parsed = connection_details
-                        except:
-                            connection_details_parsed = connection_details
+                    # Connection details from the snapshot (inline on rows staged before snapshots)
+                    try:
+                        connection_details_parsed = connection_snapshots.resolve(connection_snapshot_id,
+                                                                                 connection_details)
+                    except:
+                        connection_details_parsed = connection_details
                     
                     # Extract document_id from kb_document_id pattern (batch_{batch_id}_doc_{doc_id})
                     doc_eval_document_id = None
@@ -674,7 +885,8 @@ def register_batch_routes(app):
                         'status': status,
                         'started_processing_at': started_processing_at.isoformat() if started_processing_at and hasattr(started_processing_at, 'isoformat') else str(started_processing_at) if started_processing_at else None,
                         'completed_processing_at': completed_processing_at.isoformat() if completed_processing_at and hasattr(completed_processing_at, 'isoformat') else str(completed_processing_at) if completed_processing_at else None,
-                        'response_json': response_json,
+                        # Valid stored JSON is embedded without re-encoding; other text is returned as before
+                        'response_json': json_passthrough(response_json) or response_json,
                         'response_text': response_text,
                         'response_time_ms': response_time_ms,
                         'error_message': error_message,
@@ -715,12 +927,24 @@ def register_batch_routes(app):
             }), 500
 
     @app.route('/api/batches/<int:batch_id>/config-snapshot', methods=['GET'])
+    @conditional_get(lambda batch_id: change_counters.versions('batches'))
     def get_batch_config_snapshot(batch_id):
-        """Get the configuration snapshot for a specific batch"""
+        """
+        Get the configuration snapshot for a specific batch
+
+        The document list is paginated:
+        - limit: Documents per page (default: 100, max: 1000)
+        - offset: Number of documents to skip (default: 0)
+        - include_documents: 'false' to return only the configuration
+        """
         try:
             from database import Session
             from models import Batch
 
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            offset = max(int(request.args.get('offset', 0)), 0)
+            include_documents = request.args.get('include_documents', 'true').lower() != 'false'
+
             session = Session()
             try:
                 batch = session.query(Batch).filter_by(id=batch_id).first()
@@ -737,17 +961,30 @@ def register_batch_routes(app):
                         'error': f'Batch {batch_id} does not have a configuration snapshot'
                     }), 404
 
-                return jsonify({
+                # Older snapshots embed the document list; it is served through the pages below
+                config_snapshot = {k: v for k, v in batch.config_snapshot.items() if k != 'documents'}
+                response = {
                     'success': True,
                     'batch_id': batch_id,
                     'batch_name': batch.batch_name,
                     'batch_number': batch.batch_number,
-                    'config_snapshot': batch.config_snapshot
-                }), 200
-
+                    'config_snapshot': config_snapshot
+                }
             finally:
                 session.close()
 
+            if include_documents:
+                page = batch_service.get_config_snapshot_documents(batch_id, limit=limit, offset=offset)
+                response['documents'] = page['documents']
+                response['pagination'] = {
+                    'total': page['total'],
+                    'limit': limit,
+                    'offset': offset,
+                    'has_more': offset + limit < page['total']
+                }
+
+            return jsonify(response), 200
+
         except Exception as e:
             logger.error(f"Error getting batch config snapshot: {e}", exc_info=True)
             return jsonify({
@@ -4,10 +4,13 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import inspect
 from database import Session
 from models import Folder
+from services.change_counters import change_counters
+from utils.http_cache import conditional_get
 
 folder_routes = Blueprint('folder_routes', __name__)
 
 @folder_routes.route('/api/folders', methods=['GET'])
+@conditional_get(lambda: change_counters.versions('folders'))
 def list_folders():
     """List all folders with their active status"""
     try:
@@ -8,7 +8,8 @@ import logging
 from flask import Blueprint, jsonify, request
 import psycopg2
 from datetime import datetime
-import json
+
+from utils.serialization import json_passthrough, loads_json
 
 logger = logging.getLogger(__name__)
 
@@ -73,8 +74,9 @@ def get_llm_responses():
                 lr.started_processing_at,
                 lr.completed_processing_at,
                 lr.task_id,
-                lr.connection_details,
-                lr.response_json
+                lr.connection_snapshot_id,
+                lr.response_json::text AS response_json,
+                lr.connection_details
             FROM llm_responses lr
             WHERE 1=1
         """
@@ -150,8 +152,9 @@ def get_llm_responses():
                 lr.started_processing_at,
                 lr.completed_processing_at,
                 lr.task_id,
-                lr.connection_details,
-                lr.response_json""",
+                lr.connection_snapshot_id,
+                lr.response_json::text AS response_json,
+                lr.connection_details""",
             "SELECT COUNT(*) as total"
         )
         
@@ -171,13 +174,14 @@ def get_llm_responses():
         cursor.execute(query, params)
         rows = cursor.fetchall()
         
-        # Get prompts from doc_eval database
+        # Connection snapshots shared by the rows, loaded once and cached
+        from services.connection_snapshots import connection_snapshots
+        connection_snapshots.get_many([row[16] for row in rows], cursor)
+        
+        # Get prompts from the in-memory config cache
         from database import Session
-        from models import Prompt
-        session = Session()
-        prompts = {p.id: {'description': p.description, 'prompt_text': p.prompt_text} 
-                  for p in session.query(Prompt).all()}
-        session.close()
+        from services.config_lookup import config_lookup
+        prompts = config_lookup.get_prompts()
         
         # Get document info from doc_eval database if needed
         document_ids = [row[1] for row in rows if row[1]]  # document_id is at index 1
@@ -211,15 +215,14 @@ def get_llm_responses():
             # 5: status, 6: response_text, 7: overall_score, 8: error_message,
             # 9: input_tokens, 10: output_tokens, 11: response_time_ms, 12: created_at,
             # 13: started_processing_at, 14: completed_processing_at, 15: task_id,
-            # 16: connection_details, 17: response_json
+            # 16: connection_snapshot_id, 17: response_json, 18: connection_details
             
-            # Parse connection details if stored as JSON
+            # Connection details from the snapshot (inline on rows staged before snapshots)
             connection_info = {}
-            if row[16]:  # connection_details
-                try:
-                    connection_info = json.loads(row[16]) if isinstance(row[16], str) else row[16]
-                except:
-                    pass
+            try:
+                connection_info = connection_snapshots.resolve(row[16], row[18], cursor) or {}
+            except:
+                pass
             
             # Get document info
             doc_info = documents_info.get(row[1], {
@@ -260,15 +263,13 @@ def get_llm_responses():
                 }
             }
             
-            # Use response_json from database if available, otherwise try to parse response_text
+            # Use response_json from database if available (embedded as-is, without
+            # parsing), otherwise try to parse response_text
             if row[17]:  # response_json
-                try:
-                    response['response_json'] = json.loads(row[17]) if isinstance(row[17], str) else row[17]
-                except:
-                    response['response_json'] = None
+                response['response_json'] = json_passthrough(row[17])
             elif response['response_text']:
                 try:
-                    response['response_json'] = json.loads(response['response_text'])
+                    response['response_json'] = loads_json(response['response_text'])
                 except:
                     response['response_json'] = None
             else:
@@ -328,18 +329,18 @@ def get_llm_response_detail(response_id):
             if response_data.get(date_field):
                 response_data[date_field] = response_data[date_field].isoformat()
         
-        # Parse connection details
-        if response_data.get('connection_details'):
-            try:
-                response_data['connection_details'] = json.loads(response_data['connection_details']) \
-                    if isinstance(response_data['connection_details'], str) else response_data['connection_details']
-            except:
-                pass
+        # Connection details from the snapshot (inline on rows staged before snapshots)
+        try:
+            from services.connection_snapshots import connection_snapshots
+            response_data['connection_details'] = connection_snapshots.resolve(
+                response_data.get('connection_snapshot_id'), response_data.get('connection_details'), cursor)
+        except:
+            pass
         
         # Parse response text as JSON if possible
         if response_data.get('response_text'):
             try:
-                response_data['response_json'] = json.loads(response_data['response_text'])
+                response_data['response_json'] = loads_json(response_data['response_text'])
             except:
                 response_data['response_json'] = None
         
@@ -372,7 +373,9 @@ def get_llm_response_stats():
                 SUM(input_tokens) as total_input_tokens,
                 SUM(output_tokens) as total_output_tokens,
                 COUNT(DISTINCT batch_id) as total_batches,
-                COUNT(DISTINCT connection_id) as total_connections
+                COUNT(DISTINCT connection_id) as total_connections,
+                SUM(cached_tokens) as total_cached_tokens,
+                SUM(CASE WHEN cached_tokens IS NOT NULL THEN input_tokens END) as cache_reported_input_tokens
             FROM llm_responses
         """)
         
@@ -389,7 +392,10 @@ def get_llm_response_stats():
             'total_input_tokens': stats[7] or 0,
             'total_output_tokens': stats[8] or 0,
             'total_batches': stats[9] or 0,
-            'total_connections': stats[10] or 0
+            'total_connections': stats[10] or 0,
+            'total_cached_tokens': stats[11] or 0,
+            # Share of input tokens served from provider prefix caches, over responses that report it
+            'cached_token_ratio': round(stats[11] / stats[12], 3) if stats[11] and stats[12] else None
         }
         
         cursor.close()
@@ -399,4 +405,79 @@ def get_llm_response_stats():
         
     except Exception as e:
         logger.error(f"Error fetching LLM response stats: {e}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@llm_responses_bp.route('/api/llm-responses/stats/connections', methods=['GET'])
+def get_connection_latency_stats():
+    """
+    Per-connection latency and throughput of completed responses, for capacity planning.
+    Responses answered by a hedge copy count for the connection that answered.
+    
+    Query Parameters:
+    - hours: Only responses completed in the last N hours (default: 24, 0 for all)
+    - batch_id: Filter by batch ID
+    """
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        batch_id = request.args.get('batch_id', type=int)
+        
+        conditions = ["status = 'COMPLETED'"]
+        params = []
+        if hours:
+            conditions.append("completed_processing_at >= NOW() - make_interval(hours => %s)")
+            params.append(hours)
+        if batch_id:
+            conditions.append("batch_id = %s")
+            params.append(batch_id)
+        
+        conn = get_kb_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT 
+                COALESCE(answered_by_connection_id, connection_id) as connection_id,
+                COUNT(*) as completed,
+                COUNT(time_to_first_token_ms) as streamed,
+                AVG(response_time_ms) as avg_response_time_ms,
+                AVG(time_to_first_token_ms) as avg_ttft_ms,
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY time_to_first_token_ms) as p50_ttft_ms,
+                PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY time_to_first_token_ms) as p95_ttft_ms,
+                AVG(inter_token_latency_ms) as avg_inter_token_latency_ms,
+                AVG(tokens_per_second) as avg_tokens_per_second,
+                PERCENTILE_CONT(0.05) WITHIN GROUP (ORDER BY tokens_per_second) as p5_tokens_per_second,
+                SUM(output_tokens) as total_output_tokens
+            FROM llm_responses
+            WHERE {' AND '.join(conditions)}
+            GROUP BY 1
+            ORDER BY 1
+        """, params)
+        
+        def number(value, digits=1):
+            return round(float(value), digits) if value is not None else None
+        
+        connections = [
+            {
+                'connection_id': row[0],
+                'completed': row[1],
+                'streamed': row[2],
+                'avg_response_time_ms': number(row[3]),
+                'avg_time_to_first_token_ms': number(row[4]),
+                'p50_time_to_first_token_ms': number(row[5]),
+                'p95_time_to_first_token_ms': number(row[6]),
+                'avg_inter_token_latency_ms': number(row[7], 2),
+                'avg_tokens_per_second': number(row[8], 2),
+                # Slowest 5% of generations, the rate to plan capacity with
+                'p5_tokens_per_second': number(row[9], 2),
+                'total_output_tokens': row[10] or 0
+            }
+            for row in cursor.fetchall()
+        ]
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'hours': hours, 'batch_id': batch_id, 'connections': connections})
+        
+    except Exception as e:
+        logger.error(f"Error fetching connection latency stats: {e}")
+        return jsonify({'error': str(e)}), 500
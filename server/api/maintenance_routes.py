@@ -12,13 +12,15 @@ import time
 import uuid
 import threading
 import os
+import shutil
 import subprocess
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from sqlalchemy import text
+from sqlalchemy import text, func
 
 from database import Session, get_engine
 from models import Document, Snapshot, Connection, Model, LlmProvider, Batch
+from services.snapshot_engine import snapshot_engine, read_manifest, SnapshotError, KB_DATABASE
 
 logger = logging.getLogger(__name__)
 
@@ -361,15 +363,71 @@ def get_maintenance_stats():
             'error': str(e)
         }), 500
 
+def _find_incremental_parent(session):
+    """
+    Latest snapshot an incremental snapshot can build on, or None.
+
+    Any restore since that snapshot breaks the chain: the databases no longer
+    match the parent plus the rows changed after its watermark.
+    """
+    parent = session.query(Snapshot).filter(
+        Snapshot.status == 'completed',
+        Snapshot.change_watermark.isnot(None)
+    ).order_by(Snapshot.created_at.desc()).first()
+    if not parent or not os.path.isdir(parent.file_path):
+        return None
+
+    last_restore = session.query(func.max(Snapshot.restored_at)).scalar()
+    if last_restore and last_restore > parent.created_at:
+        return None
+    return parent
+
+def _snapshot_chain(session, snapshot):
+    """Snapshots from the full snapshot of an incremental chain up to this one"""
+    chain = [snapshot]
+    while chain[0].parent_snapshot_id:
+        parent = session.query(Snapshot).filter(Snapshot.id == chain[0].parent_snapshot_id).first()
+        if not parent:
+            raise SnapshotError(f"Parent snapshot {chain[0].parent_snapshot_id} of '{chain[0].name}' no longer exists")
+        chain.insert(0, parent)
+    return chain
+
+def _snapshot_catalog(session):
+    """Column values of every snapshots row, to carry the catalog across a restore"""
+    keys = [attribute.key for attribute in Snapshot.__mapper__.column_attrs]
+    return [{key: getattr(row, key) for key in keys}
+            for row in session.query(Snapshot).order_by(Snapshot.id).all()]
+
+def _restore_snapshot_catalog(session, catalog):
+    """
+    Put back the snapshots rows captured before a restore.
+
+    Restoring doc_eval replaces the snapshots table with the copy inside the
+    snapshot, which predates the restored snapshot's own row and every later one.
+    """
+    for values in catalog:
+        session.merge(Snapshot(**values))
+    session.flush()
+    # Rows put back with their ids must not collide with the next snapshot's id
+    session.execute(text(
+        "SELECT setval(pg_get_serial_sequence('snapshots', 'id'), (SELECT MAX(id) FROM snapshots))"
+    ))
+
 @maintenance_bp.route('/api/maintenance/snapshot', methods=['POST'])
 def create_snapshot():
-    """Create a database snapshot"""
+    """Create a database snapshot (quick: doc_eval, full: both databases, incremental: changes since the last snapshot)"""
     try:
         # Force JSON parsing even without proper Content-Type header
         data = request.get_json(force=True, silent=True) or {}
         snapshot_name = data.get('name', f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
         description = data.get('description', 'Database snapshot')
-        snapshot_type = data.get('type', 'quick')  # 'quick' or 'full'
+        snapshot_type = data.get('type', 'quick')  # 'quick', 'full' or 'incremental'
+
+        if snapshot_type not in ('quick', 'full', 'incremental'):
+            return jsonify({
+                'success': False,
+                'error': f"Invalid snapshot type '{snapshot_type}' (expected quick, full or incremental)"
+            }), 400
 
         # Generate task ID for tracking
         task_id = str(uuid.uuid4())
@@ -382,6 +440,7 @@ def create_snapshot():
             'current_step': 0,
             'step_name': 'Initializing snapshot...',
             'snapshot_info': {},
+            'bytes_written': 0,
             'error': None,
             'started_at': time.time()
         }
@@ -422,10 +481,10 @@ def create_snapshot():
                     'step_name': f'Metadata collected - {sum(record_counts.values())} total records'
                 })
 
-                # Step 2: Create snapshots directory and prepare file
+                # Step 2: Create snapshots directory and find the parent snapshot
                 maintenance_tasks[task_id].update({
                     'current_step': 2,
-                    'step_name': 'Preparing snapshot file...',
+                    'step_name': 'Preparing snapshot directory...',
                     'progress': 30
                 })
 
@@ -433,101 +492,60 @@ def create_snapshot():
                 snapshots_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'snapshots')
                 os.makedirs(snapshots_dir, exist_ok=True)
 
-                # Generate filename with timestamp
+                # Snapshots are directories: one parallel pg_dump archive per database
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{snapshot_name}_{timestamp}.sql.gz"
-                file_path = os.path.join(snapshots_dir, filename)
+                snapshot_dir = os.path.join(snapshots_dir, f"{snapshot_name}_{timestamp}")
+
+                # The previous snapshot anchors incrementals and supplies compression ratios for progress
+                mode = snapshot_type
+                parent = _find_incremental_parent(session)
+                parent_manifest = None
+                if parent:
+                    try:
+                        parent_manifest = read_manifest(parent.file_path)
+                    except (OSError, ValueError):
+                        parent = None
+                if mode == 'incremental' and not parent:
+                    mode = 'full'
+                    logger.info("No usable parent snapshot - taking a full snapshot instead of an incremental one")
 
                 maintenance_tasks[task_id].update({
                     'progress': 40,
-                    'step_name': f'Snapshot file: {filename}'
+                    'step_name': f'Snapshot directory: {os.path.basename(snapshot_dir)}'
+                                 + (f' (changes since "{parent.name}")' if mode == 'incremental' else '')
                 })
 
-                # Step 3: Create database dump
+                # Step 3: Dump the databases, progress measured from bytes written
                 maintenance_tasks[task_id].update({
                     'current_step': 3,
-                    'step_name': 'Creating database dump...',
-                    'progress': 50
+                    'step_name': f'Creating {mode} database dump...',
+                    'progress': 40
                 })
 
-                # PostgreSQL dump command with options based on snapshot type
-                dump_cmd = [
-                    '/opt/homebrew/opt/postgresql@17/bin/pg_dump',
-                    '--host=studio.local',
-                    '--port=5432',
-                    '--username=postgres',
-                    '--dbname=doc_eval',
-                    '--no-password',
-                    '--clean',
-                    '--no-acl',
-                    '--no-owner'
-                ]
-
-                # For quick snapshots, exclude the large docs table data
-                if snapshot_type == 'quick':
-                    dump_cmd.extend([
-                        '--exclude-table-data=public.docs'
-                    ])
-                    maintenance_tasks[task_id].update({
-                        'step_name': 'Creating quick database dump (excluding docs table data)...',
-                    })
-                else:
+                databases = snapshot_engine.databases_for(mode)
+                written_by_database = {}
+
+                def on_progress(database, bytes_written, expected_bytes):
+                    written_by_database[database] = bytes_written
+                    index = databases.index(database)
+                    fraction = (index + min(bytes_written / expected_bytes, 0.99)) / len(databases)
                     maintenance_tasks[task_id].update({
-                        'step_name': 'Creating full database dump (including all data)...',
+                        'progress': 40 + int(45 * fraction),
+                        'bytes_written': sum(written_by_database.values()),
+                        'step_name': f'Dumping {database} ({bytes_written / 1024 / 1024:.1f} MB written)'
                     })
 
-                # Set PGPASSWORD environment variable
-                env = os.environ.copy()
-                env['PGPASSWORD'] = 'prodogs03'
-
-                # Execute pg_dump and compress with better error handling
-                temp_file_path = None
-                try:
-                    # First, create the dump without compression to a temporary file
-                    temp_file_path = file_path.replace('.gz', '.tmp')
-
-                    with open(temp_file_path, 'w') as temp_f:
-                        dump_process = subprocess.Popen(
-                            dump_cmd,
-                            stdout=temp_f,
-                            stderr=subprocess.PIPE,
-                            env=env
-                        )
-
-                        dump_output, dump_error = dump_process.communicate()
-
-                        if dump_process.returncode != 0:
-                            raise Exception(f"pg_dump failed: {dump_error.decode()}")
-
-                    # Now compress the file
-                    with open(temp_file_path, 'rb') as temp_f, open(file_path, 'wb') as compressed_f:
-                        gzip_process = subprocess.Popen(
-                            ['gzip', '-c'],
-                            stdin=temp_f,
-                            stdout=compressed_f,
-                            stderr=subprocess.PIPE
-                        )
-
-                        gzip_output, gzip_error = gzip_process.communicate()
-
-                        if gzip_process.returncode != 0:
-                            raise Exception(f"gzip failed: {gzip_error.decode()}")
-
-                    # Clean up temporary file
-                    os.remove(temp_file_path)
-
-                except Exception as e:
-                    # Clean up temporary file if it exists
-                    if os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
-                    raise e
-
-                # Get file size
-                file_size = os.path.getsize(file_path)
+                manifest = snapshot_engine.create_snapshot(
+                    snapshot_dir, mode=mode,
+                    parent=parent_manifest,
+                    progress=on_progress
+                )
+                file_size = manifest['bytes_written']
 
                 maintenance_tasks[task_id].update({
-                    'progress': 80,
-                    'step_name': f'Database dump created ({file_size / 1024 / 1024:.1f} MB)'
+                    'progress': 85,
+                    'bytes_written': file_size,
+                    'step_name': f'Database dump created ({file_size / 1024 / 1024:.1f} MB in {manifest["duration_seconds"]:.0f}s)'
                 })
 
                 # Step 4: Save snapshot record to database
@@ -537,21 +555,27 @@ def create_snapshot():
                     'progress': 90
                 })
 
+                if mode == 'incremental':
+                    for table, info in manifest['databases'][KB_DATABASE]['tables'].items():
+                        record_counts[f'{table}_changed'] = info['changed_rows']
+
                 # Create snapshot record
                 snapshot = Snapshot(
                     name=snapshot_name,
                     description=description,
-                    file_path=file_path,
+                    file_path=snapshot_dir,
                     file_size=file_size,
-                    database_name='doc_eval',
-                    snapshot_type=snapshot_type,
-                    compression='gzip',
+                    database_name=','.join(databases),
+                    snapshot_type=mode,
+                    compression=snapshot_engine.compression,
                     created_by='maintenance_api',
                     tables_included=list(record_counts.keys()),
                     record_counts=record_counts,
                     database_version=db_version,
                     application_version='1.0.0',
-                    status='completed'
+                    status='completed',
+                    parent_snapshot_id=parent.id if mode == 'incremental' else None,
+                    change_watermark=manifest['change_watermark']
                 )
 
                 session.add(snapshot)
@@ -566,15 +590,17 @@ def create_snapshot():
                     'snapshot_info': {
                         'id': snapshot.id,
                         'name': snapshot_name,
-                        'file_path': file_path,
+                        'file_path': snapshot_dir,
                         'file_size': file_size,
+                        'snapshot_type': mode,
+                        'parent_snapshot_id': snapshot.parent_snapshot_id,
                         'record_counts': record_counts
                     }
                 })
 
                 session.close()
 
-                logger.info(f"Database snapshot created: {file_path} ({file_size} bytes)")
+                logger.info(f"Database snapshot created: {snapshot_dir} ({file_size} bytes)")
 
             except Exception as e:
                 maintenance_tasks[task_id].update({
@@ -631,6 +657,7 @@ def get_snapshot_status(task_id):
             'total_steps': task_info['total_steps'],
             'step_name': task_info['step_name'],
             'snapshot_info': task_info['snapshot_info'],
+            'bytes_written': task_info.get('bytes_written'),
             'elapsed_time': round(elapsed_time, 2)
         }
 
@@ -674,7 +701,10 @@ def list_snapshots():
                 'record_counts': snapshot.record_counts,
                 'database_version': snapshot.database_version,
                 'status': snapshot.status,
-                'notes': snapshot.notes
+                'notes': snapshot.notes,
+                'parent_snapshot_id': snapshot.parent_snapshot_id,
+                'change_watermark': snapshot.change_watermark.isoformat() if snapshot.change_watermark else None,
+                'restored_at': snapshot.restored_at.isoformat() if snapshot.restored_at else None
             }
             snapshot_list.append(snapshot_data)
 
@@ -695,23 +725,39 @@ def list_snapshots():
 
 @maintenance_bp.route('/api/maintenance/snapshot/<int:snapshot_id>/load', methods=['POST'])
 def load_snapshot(snapshot_id):
-    """Load/restore a database snapshot"""
+    """Load/restore a database snapshot (incremental snapshots restore their whole chain)"""
     try:
         session = Session()
+        data = request.get_json(force=True, silent=True) or {}
+        create_backup = data.get('backup', True)
 
         # Get snapshot record
         snapshot = session.query(Snapshot).filter(Snapshot.id == snapshot_id).first()
         if not snapshot:
+            session.close()
             return jsonify({
                 'success': False,
                 'error': 'Snapshot not found'
             }), 404
 
-        # Check if file exists
-        if not os.path.exists(snapshot.file_path):
+        # Single-file dumps from before snapshot directories are restored with psql
+        legacy = not os.path.isdir(snapshot.file_path)
+        try:
+            chain_paths = [snapshot.file_path] if legacy else [s.file_path for s in _snapshot_chain(session, snapshot)]
+        except SnapshotError as e:
+            session.close()
             return jsonify({
                 'success': False,
-                'error': 'Snapshot file not found'
+                'error': str(e)
+            }), 409
+
+        # Check that every file of the chain exists
+        missing = [path for path in chain_paths if not os.path.exists(path)]
+        if missing:
+            session.close()
+            return jsonify({
+                'success': False,
+                'error': f"Snapshot file not found: {missing[0]}"
             }), 404
 
         # Generate task ID for tracking
@@ -727,116 +773,59 @@ def load_snapshot(snapshot_id):
             'snapshot_info': {
                 'id': snapshot.id,
                 'name': snapshot.name,
-                'file_path': snapshot.file_path
+                'file_path': snapshot.file_path,
+                'chain': chain_paths
             },
             'error': None,
             'started_at': time.time()
         }
 
+        catalog = _snapshot_catalog(session)
         session.close()
 
         # Start restore operation in background
         def perform_restore():
             try:
-                # Step 1: Backup current database
+                snapshots_dir = os.path.dirname(snapshot.file_path)
+                backup_path = None
+
+                # Step 1: Backup current database(s)
                 maintenance_tasks[task_id].update({
                     'current_step': 1,
                     'step_name': 'Creating backup of current database...',
                     'progress': 10
                 })
 
-                # Create a backup before restore
-                backup_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                backup_filename = f"pre_restore_backup_{backup_timestamp}.sql.gz"
-                snapshots_dir = os.path.dirname(snapshot.file_path)
-                backup_path = os.path.join(snapshots_dir, backup_filename)
-
-                # Create backup using pg_dump
-                backup_cmd = [
-                    '/opt/homebrew/opt/postgresql@17/bin/pg_dump',
-                    '--host=studio.local',
-                    '--port=5432',
-                    '--username=postgres',
-                    '--dbname=doc_eval',
-                    '--no-password',
-                    '--clean',
-                    '--no-acl',
-                    '--no-owner'
-                ]
-
-                env = os.environ.copy()
-                env['PGPASSWORD'] = 'prodogs03'
-
-                with open(backup_path, 'wb') as f:
-                    backup_process = subprocess.Popen(backup_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-                    gzip_process = subprocess.Popen(['gzip'], stdin=backup_process.stdout, stdout=f, stderr=subprocess.PIPE)
-                    backup_process.stdout.close()
-
-                    backup_output, backup_error = backup_process.communicate()
-                    gzip_output, gzip_error = gzip_process.communicate()
-
-                    if backup_process.returncode != 0:
-                        raise Exception(f"Backup failed: {backup_error.decode()}")
+                if create_backup:
+                    backup_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    backup_path = os.path.join(snapshots_dir, f"pre_restore_backup_{backup_timestamp}")
+                    # Back up exactly what is about to be overwritten
+                    backup_mode = 'quick' if legacy or snapshot.snapshot_type == 'quick' else 'full'
+                    snapshot_engine.create_snapshot(backup_path, mode=backup_mode)
 
-                maintenance_tasks[task_id].update({
-                    'progress': 30,
-                    'step_name': f'Backup created: {backup_filename}'
-                })
+                    maintenance_tasks[task_id].update({
+                        'progress': 30,
+                        'step_name': f'Backup created: {os.path.basename(backup_path)}'
+                    })
 
-                # Step 2: Drop existing connections
+                # Step 2 and 3: Drop existing connections and restore
                 maintenance_tasks[task_id].update({
                     'current_step': 2,
                     'step_name': 'Terminating database connections...',
                     'progress': 40
                 })
 
-                # Terminate connections to the database
-                terminate_cmd = [
-                    '/opt/homebrew/opt/postgresql@17/bin/psql',
-                    '--host=studio.local',
-                    '--port=5432',
-                    '--username=postgres',
-                    '--dbname=postgres',
-                    '--no-password',
-                    '-c', "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = 'doc_eval' AND pid <> pg_backend_pid();"
-                ]
-
-                subprocess.run(terminate_cmd, env=env, capture_output=True)
-
-                maintenance_tasks[task_id].update({
-                    'progress': 50,
-                    'step_name': 'Database connections terminated'
-                })
-
-                # Step 3: Restore from snapshot
-                maintenance_tasks[task_id].update({
-                    'current_step': 3,
-                    'step_name': 'Restoring database from snapshot...',
-                    'progress': 60
-                })
+                if legacy:
+                    _restore_legacy_dump(snapshot.file_path)
+                else:
+                    def on_step(step_name):
+                        maintenance_tasks[task_id].update({
+                            'current_step': 3,
+                            'step_name': step_name,
+                            'progress': min(maintenance_tasks[task_id]['progress'] + 10, 85)
+                        })
 
-                # Restore using psql
-                restore_cmd = [
-                    '/opt/homebrew/opt/postgresql@17/bin/psql',
-                    '--host=studio.local',
-                    '--port=5432',
-                    '--username=postgres',
-                    '--dbname=doc_eval',
-                    '--no-password',
-                    '--quiet'
-                ]
-
-                # Decompress and restore
-                with open(snapshot.file_path, 'rb') as f:
-                    gunzip_process = subprocess.Popen(['gunzip', '-c'], stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    restore_process = subprocess.Popen(restore_cmd, stdin=gunzip_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-                    gunzip_process.stdout.close()
-
-                    restore_output, restore_error = restore_process.communicate()
-                    gunzip_output, gunzip_error = gunzip_process.communicate()
-
-                    if restore_process.returncode != 0:
-                        raise Exception(f"Restore failed: {restore_error.decode()}")
+                    snapshot_engine.restore_snapshot(chain_paths, progress=on_step)
 
                 maintenance_tasks[task_id].update({
                     'progress': 90,
@@ -858,6 +847,15 @@ def load_snapshot(snapshot_id):
                     # LlmResponse and Doc models moved to KnowledgeDocuments database
                     doc_count = verify_session.query(Document).count()
 
+                    # Later incrementals must not build on a chain the databases no longer match
+                    _restore_snapshot_catalog(verify_session, catalog)
+                    marked = verify_session.query(Snapshot).filter(Snapshot.id == snapshot_id).update(
+                        {'restored_at': datetime.now()}, synchronize_session=False
+                    )
+                    if not marked:
+                        raise SnapshotError(f"Snapshot {snapshot_id} is missing after the restore")
+                    verify_session.commit()
+
                     maintenance_tasks[task_id].update({
                         'progress': 100,
                         'step_name': f'Restore verified - {doc_count} documents found'
@@ -865,9 +863,10 @@ def load_snapshot(snapshot_id):
 
                 except Exception as verify_error:
                     logger.warning(f"Verification warning: {verify_error}")
+                    verify_session.rollback()
                     maintenance_tasks[task_id].update({
                         'progress': 100,
-                        'step_name': 'Restore completed (verification skipped)'
+                        'step_name': f'Restore completed (verification failed: {verify_error})'
                     })
                 finally:
                     verify_session.close()
@@ -910,6 +909,35 @@ def load_snapshot(snapshot_id):
             'error': str(e)
         }), 500
 
+def _restore_legacy_dump(file_path):
+    """Restore a gzipped plain SQL dump of doc_eval (snapshots taken before snapshot directories)"""
+    snapshot_engine.terminate_connections('doc_eval')
+
+    restore_cmd = [
+        os.path.join(snapshot_engine.pg_bin_dir, 'psql'),
+        '--host=studio.local',
+        '--port=5432',
+        '--username=postgres',
+        '--dbname=doc_eval',
+        '--no-password',
+        '--quiet'
+    ]
+
+    env = os.environ.copy()
+    env['PGPASSWORD'] = 'prodogs03'
+
+    # Decompress and restore
+    with open(file_path, 'rb') as f:
+        gunzip_process = subprocess.Popen(['gunzip', '-c'], stdin=f, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        restore_process = subprocess.Popen(restore_cmd, stdin=gunzip_process.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        gunzip_process.stdout.close()
+
+        restore_output, restore_error = restore_process.communicate()
+        gunzip_output, gunzip_error = gunzip_process.communicate()
+
+        if restore_process.returncode != 0:
+            raise Exception(f"Restore failed: {restore_error.decode()}")
+
 @maintenance_bp.route('/api/maintenance/snapshot/<int:snapshot_id>', methods=['DELETE'])
 def delete_snapshot(snapshot_id):
     """Delete a snapshot file and database record"""
@@ -925,14 +953,26 @@ def delete_snapshot(snapshot_id):
                 'error': 'Snapshot not found'
             }), 404
 
+        # Incremental snapshots cannot be restored without their parents
+        children = session.query(Snapshot).filter(Snapshot.parent_snapshot_id == snapshot_id).count()
+        if children:
+            session.close()
+            return jsonify({
+                'success': False,
+                'error': f'{children} incremental snapshot(s) depend on this snapshot - delete them first'
+            }), 409
+
         snapshot_name = snapshot.name
         file_path = snapshot.file_path
 
-        # Delete file if it exists
+        # Delete file (or snapshot directory) if it exists
         file_deleted = False
         if os.path.exists(file_path):
             try:
-                os.remove(file_path)
+                if os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+                else:
+                    os.remove(file_path)
                 file_deleted = True
                 logger.info(f"Deleted snapshot file: {file_path}")
             except Exception as e:
@@ -1031,15 +1071,29 @@ def cleanup_old_maintenance_tasks():
 
 @maintenance_bp.route('/api/maintenance/recovery/status', methods=['GET'])
 def get_recovery_status():
-    """Get the status of the last startup recovery operation"""
+    """Get the report of the last startup recovery and progress re-verifying recovered tasks"""
     try:
         from services.startup_recovery import get_recovery_summary
+        from services.batch_queue_processor import batch_queue_processor
+        from services.worker_registry import worker_registry
         
         summary = get_recovery_summary()
         
+        # The queue processor may run in a separate worker process
+        if batch_queue_processor.is_running:
+            verification = batch_queue_processor.get_recovery_status()
+        else:
+            worker_stats = worker_registry.get_latest_stats('batch') or {}
+            verification = worker_stats.get('recovery')
+        
+        # Recovery ran in the worker process only
+        if summary.get('status') == 'NOT_RUN' and verification:
+            summary = verification.get('startup_recovery', summary)
+        
         return jsonify({
             'success': True,
             'recovery_summary': summary,
+            'verification': verification,
             'message': 'Recovery status retrieved successfully'
         }), 200
         
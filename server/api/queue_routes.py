@@ -20,7 +20,10 @@ queue_bp = Blueprint('queue', __name__)
 def get_queue_status():
     """Get queue processor status"""
     try:
+        from services.worker_registry import worker_registry
+        
         status = get_queue_processor_status()
+        workers = worker_registry.list_workers('batch')
         
         # Add queue statistics
         import psycopg2
@@ -58,6 +61,7 @@ def get_queue_status():
         return jsonify({
             'success': True,
             'processor': status,
+            'workers': workers,
             'queue_counts': status_counts,
             'throughput': {
                 'last_hour_total': hour_stats[0] if hour_stats else 0,
@@ -73,6 +77,23 @@ def get_queue_status():
         }), 500
 
 
+@queue_bp.route('/api/queue/scheduler', methods=['GET'])
+def get_scheduler_status():
+    """Get batch scheduler state, including per-batch priority, share and queue wait time"""
+    try:
+        return jsonify({
+            'success': True,
+            'scheduler': batch_queue_processor.scheduler.get_status()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting scheduler status: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @queue_bp.route('/api/queue/start', methods=['POST'])
 def start_queue():
     """Start the queue processor"""
@@ -3,10 +3,14 @@ import logging
 
 from services.config import service_config, config_manager
 from services.health_monitor import health_monitor
+from services.rag_pool import rag_endpoint_pool
 from services.client import service_client
 from models import Prompt, Folder, Connection
 # LlmResponse model moved to KnowledgeDocuments database
 from database import Session
+from services.config_lookup import config_lookup
+from services.change_counters import change_counters
+from utils.http_cache import conditional_get
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +20,17 @@ service_routes = Blueprint('service_routes', __name__)
 def list_services():
     """List all configured services with their status"""
     try:
+        from services.worker_registry import worker_registry
+
         services = service_config.list_services()
         health_status = health_monitor.get_all_service_status()
+        workers = worker_registry.list_workers()
+
+        # When the health monitor runs in a separate worker process, use its reported results
+        if not (health_monitor.monitoring_thread and health_monitor.monitoring_thread.is_alive()):
+            worker_stats = worker_registry.get_latest_stats('health')
+            if worker_stats:
+                health_status = worker_stats.get('services', health_status)
 
         # Combine service config with health status
         for service_name, service_info in services.items():
@@ -27,7 +40,9 @@ def list_services():
         return jsonify({
             'services': services,
             'total_services': len(services),
-            'enabled_services': len([s for s in services.values() if s['enabled']])
+            'enabled_services': len([s for s in services.values() if s['enabled']]),
+            'workers': workers,
+            'healthy_workers': len([w for w in workers if w['healthy']])
         }), 200
 
     except Exception as e:
@@ -350,7 +365,64 @@ def get_response_time_analytics():
         }
     }), 410  # 410 Gone - resource no longer available
 
+@service_routes.route('/api/rag-endpoints', methods=['GET'])
+def list_rag_endpoints():
+    """RAG API instances in the endpoint pool with their load and circuit state"""
+    try:
+        rag_endpoint_pool.refresh(force=True)
+        return jsonify({'success': True, **rag_endpoint_pool.get_status()}), 200
+
+    except Exception as e:
+        logger.error(f"Error listing RAG endpoints: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@service_routes.route('/api/rag-endpoints', methods=['POST'])
+def add_rag_endpoint():
+    """Add a RAG API instance to the pool of every worker, without a restart"""
+    try:
+        data = request.get_json() or {}
+        if not data.get('name') or not data.get('url'):
+            return jsonify({'success': False, 'error': 'name and url are required'}), 400
+
+        endpoint = rag_endpoint_pool.set_endpoint(data['name'], data['url'], 'ACTIVE')
+        return jsonify({'success': True, 'endpoint': endpoint}), 201
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    except Exception as e:
+        logger.error(f"Error adding RAG endpoint: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _set_rag_endpoint_status(name, status):
+    try:
+        endpoint = rag_endpoint_pool.set_endpoint(name, status=status)
+        return jsonify({'success': True, 'endpoint': endpoint}), 200
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+    except Exception as e:
+        logger.error(f"Error setting RAG endpoint {name} to {status}: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@service_routes.route('/api/rag-endpoints/<name>/drain', methods=['POST'])
+def drain_rag_endpoint(name):
+    """Stop sending new tasks to an instance; tasks it owns are still polled there"""
+    return _set_rag_endpoint_status(name, 'DRAINING')
+
+@service_routes.route('/api/rag-endpoints/<name>/activate', methods=['POST'])
+def activate_rag_endpoint(name):
+    """Send new tasks to a drained instance again"""
+    return _set_rag_endpoint_status(name, 'ACTIVE')
+
+@service_routes.route('/api/rag-endpoints/<name>', methods=['DELETE'])
+def remove_rag_endpoint(name):
+    """Remove an instance once the tasks it owns are finished"""
+    return _set_rag_endpoint_status(name, 'REMOVED')
+
 @service_routes.route('/api/prompts', methods=['GET'])
+@conditional_get(lambda: change_counters.versions('prompts'))
 def list_prompts():
     """List all prompts with their active status"""
     try:
@@ -399,6 +471,7 @@ def activate_prompt(prompt_id):
         session.close()
 
         logger.info(f"Activated prompt ID {prompt_id}: {prompt_text}")
+        config_lookup.invalidate('prompts')
 
         return jsonify({
             'message': f'Prompt {prompt_id} activated successfully',
@@ -431,6 +504,7 @@ def deactivate_prompt(prompt_id):
         session.close()
 
         logger.info(f"Deactivated prompt ID {prompt_id}: {prompt_text}")
+        config_lookup.invalidate('prompts')
 
         return jsonify({
             'message': f'Prompt {prompt_id} deactivated successfully',
@@ -474,6 +548,7 @@ def create_prompt():
 
         session.close()
         logger.info(f"Created prompt: {prompt.prompt_text[:50]}...")
+        config_lookup.invalidate('prompts')
 
         return jsonify({
             'message': 'Prompt created successfully',
@@ -518,6 +593,7 @@ def update_prompt(prompt_id):
 
         session.close()
         logger.info(f"Updated prompt ID {prompt_id}: {prompt.prompt_text[:50]}...")
+        config_lookup.invalidate('prompts')
 
         return jsonify({
             'message': 'Prompt updated successfully',
@@ -552,6 +628,7 @@ def delete_prompt(prompt_id):
         session.close()
 
         logger.info(f"Deleted prompt ID {prompt_id}: {prompt_text}")
+        config_lookup.invalidate('prompts')
 
         return jsonify({
             'message': f'Prompt deleted successfully'
@@ -565,6 +642,7 @@ def delete_prompt(prompt_id):
         return jsonify({'error': str(e)}), 500
 
 @service_routes.route('/api/llm-configurations', methods=['GET'])
+@conditional_get(lambda: change_counters.versions('connections', 'models', 'providers'))
 def list_llm_configurations():
     """List all connections (replaces deprecated LLM configurations)"""
     try:
@@ -626,6 +704,7 @@ def activate_llm_configuration(config_id):
         session.close()
 
         logger.info(f"Activated connection ID {config_id}: {connection_name}")
+        config_lookup.invalidate('connections')
 
         return jsonify({
             'message': f'Connection {config_id} activated successfully',
@@ -660,6 +739,7 @@ def deactivate_llm_configuration(config_id):
         session.close()
 
         logger.info(f"Deactivated connection ID {config_id}: {connection_name}")
+        config_lookup.invalidate('connections')
 
         return jsonify({
             'message': f'Connection {config_id} deactivated successfully',
@@ -729,6 +809,7 @@ def create_llm_configuration():
 
         session.close()
         logger.info(f"Created connection: {connection.name}")
+        config_lookup.invalidate('connections')
 
         return jsonify({
             'message': 'Connection created successfully',
@@ -790,6 +871,7 @@ def update_llm_configuration(config_id):
 
         session.close()
         logger.info(f"Updated connection ID {config_id}: {connection.name}")
+        config_lookup.invalidate('connections')
 
         return jsonify({
             'message': 'Connection updated successfully',
@@ -824,6 +906,7 @@ def delete_llm_configuration(config_id):
         session.close()
 
         logger.info(f"Deleted connection ID {config_id}: {connection_name}")
+        config_lookup.invalidate('connections')
 
         return jsonify({
             'message': f'Connection "{connection_name}" deleted successfully'
@@ -972,6 +1055,7 @@ def fetch_available_models():
 #     }), 410  # 410 Gone - resource no longer available
 
 @service_routes.route('/api/folders', methods=['GET'])
+@conditional_get(lambda: change_counters.versions('folders'))
 def list_folders():
     """List all folders with their active status"""
     try:
@@ -1,39 +1,202 @@
 """
 Cache Module
 
-Provides caching functionality with Redis backend and fallback to in-memory cache.
+Provides two-tier caching: a bounded, thread-safe in-process LRU (L1) in front of
+an optional Redis backend (L2). Concurrent misses for the same key are coalesced
+so an expensive value is computed once.
 """
 
-import json
-import pickle
+import sys
 import time
+import fnmatch
 import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from typing import Any, Optional, Callable, Union, Dict
 from datetime import timedelta
 
-import redis
 from flask import current_app
 from app.core.logger import get_logger, get_performance_logger
+from utils.serialization import pack_cache_value, unpack_cache_value
 
 logger = get_logger(__name__)
 perf_logger = get_performance_logger('cache')
 
+# Sentinel for "not in cache" so cached falsy values are still hits
+_MISSING = object()
+
+
+class MemoryCache:
+    """Bounded, thread-safe LRU cache with per-entry TTL and a byte budget"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 sweep_interval: int = 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # key -> (value, expires, size)
+        self._lock = threading.RLock()
+        self._next_sweep = time.time() + sweep_interval
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def estimate_size(value: Any) -> int:
+        """Approximate memory footprint of a value in bytes"""
+        try:
+            return len(pack_cache_value(value))
+        except Exception:
+            return sys.getsizeof(value)
+
+    def get(self, key: str) -> Any:
+        """Return the value for key, or _MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            value, expires, _ = entry
+            if expires and expires <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, timeout: int = 0, size: Optional[int] = None):
+        """Store value, evicting least recently used entries to stay within budget"""
+        size = size if size is not None else self.estimate_size(value)
+        if size > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            self.delete(key)
+            return False
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.time() + timeout if timeout > 0 else 0, size)
+            self.current_bytes += size
+            self._enforce_limits()
+        return True
+
+    def incr(self, key: str, delta: int = 1, timeout: int = 0) -> int:
+        """Atomically add delta to an integer entry, creating it if missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] and entry[1] <= time.time()):
+                current, expires = 0, time.time() + timeout if timeout > 0 else 0
+            else:
+                current, expires = entry[0], entry[1]
+            new_value = int(current) + delta
+            self._remove(key)
+            self._entries[key] = (new_value, expires, sys.getsizeof(new_value))
+            self.current_bytes += self._entries[key][2]
+            self._enforce_limits()
+            return new_value
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self, pattern: Optional[str] = None) -> int:
+        """Remove all entries, or those whose key matches a glob pattern"""
+        with self._lock:
+            if not pattern:
+                count = len(self._entries)
+                self._entries.clear()
+                self.current_bytes = 0
+                return count
+            keys = [k for k in self._entries if fnmatch.fnmatch(k, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry"""
+        with self._lock:
+            now = time.time()
+            expired = [k for k, (_, expires, _) in self._entries.items() if expires and expires <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            self._next_sweep = now + self.sweep_interval
+            return len(expired)
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.current_bytes -= entry[2]
+        return True
+
+    def _enforce_limits(self):
+        """Sweep expired entries periodically, then evict LRU entries over budget"""
+        if time.time() >= self._next_sweep:
+            self.purge_expired()
+        while self._entries and (len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class _InFlight:
+    """A computation other threads can wait on instead of repeating it"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
 
 class CacheManager:
-    """Manages caching with Redis or in-memory fallback"""
+    """Manages caching with an in-process LRU in front of optional Redis"""
     
-    def __init__(self, redis_url: Optional[str] = None, default_timeout: int = 300):
+    def __init__(self, redis_url: Optional[str] = None, default_timeout: int = 300,
+                 local_max_entries: int = 10000, local_max_bytes: int = 64 * 1024 * 1024,
+                 local_timeout: int = 30, single_flight_timeout: int = 60):
         self.redis_url = redis_url
         self.default_timeout = default_timeout
         self.redis_client = None
-        self.memory_cache = {}  # Fallback cache
+        # L1 - when Redis is the shared L2, local copies are kept for at most
+        # local_timeout seconds so other processes' writes become visible
+        self.memory_cache = MemoryCache(local_max_entries, local_max_bytes)
+        self.local_timeout = local_timeout
+        self.single_flight_timeout = single_flight_timeout
+        self._inflight: Dict[str, _InFlight] = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'l2_hits': 0, 'l2_misses': 0, 'l2_errors': 0, 'coalesced': 0, 'computed': 0}
         self._connect()
     
     def _connect(self):
         """Connect to Redis if available"""
         if self.redis_url:
             try:
+                import redis  # Imported on demand - only needed when Redis is configured
+                
                 self.redis_client = redis.from_url(
                     self.redis_url,
                     decode_responses=False,  # We'll handle encoding/decoding
@@ -52,55 +215,55 @@ class CacheManager:
                 self.redis_client = None
     
     def _serialize(self, value: Any) -> bytes:
-        """Serialize value for storage"""
-        try:
-            # Try JSON first (more portable)
-            return json.dumps(value).encode('utf-8')
-        except (TypeError, ValueError):
-            # Fall back to pickle for complex objects
-            return pickle.dumps(value)
+        """Serialize value for storage (msgpack, pickle for complex objects)"""
+        return pack_cache_value(value)
     
     def _deserialize(self, data: bytes) -> Any:
-        """Deserialize value from storage"""
-        if not data:
-            return None
-        
-        try:
-            # Try JSON first
-            return json.loads(data.decode('utf-8'))
-        except (json.JSONDecodeError, UnicodeDecodeError):
-            # Fall back to pickle
-            return pickle.loads(data)
+        """Deserialize value from storage, including entries written as JSON/pickle"""
+        return unpack_cache_value(data)
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += amount
+
+    def _local_timeout(self, timeout: int) -> int:
+        """TTL for the L1 copy of a value"""
+        if not self.redis_client:
+            return timeout
+        return min(timeout, self.local_timeout) if timeout > 0 else self.local_timeout
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         start_time = time.time()
         
         try:
-            if self.redis_client:
-                data = self.redis_client.get(key)
-                value = self._deserialize(data) if data else None
-            else:
-                # In-memory fallback
-                entry = self.memory_cache.get(key)
-                if entry and (entry['expires'] == 0 or entry['expires'] > time.time()):
-                    value = entry['value']
-                else:
-                    value = None
-                    if key in self.memory_cache:
-                        del self.memory_cache[key]
+            value = self.memory_cache.get(key)
+            tier = 'l1'
+            if value is _MISSING:
+                value = None
+                tier = None
+                if self.redis_client:
+                    data = self.redis_client.get(key)
+                    if data:
+                        value = self._deserialize(data)
+                        tier = 'l2'
+                        self._count('l2_hits')
+                        self.memory_cache.set(key, value, self.local_timeout, size=len(data))
+                    else:
+                        self._count('l2_misses')
             
             duration = time.time() - start_time
             perf_logger.log_operation(
                 'cache_get',
                 duration,
                 success=value is not None,
-                metadata={'key': key, 'hit': value is not None}
+                metadata={'key': key, 'hit': value is not None, 'tier': tier}
             )
             
             return value
             
         except Exception as e:
+            self._count('l2_errors')
             logger.error(f"Cache get error for key {key}: {e}")
             return None
     
@@ -116,13 +279,9 @@ class CacheManager:
                     success = self.redis_client.setex(key, timeout, data)
                 else:
                     success = self.redis_client.set(key, data)
+                self.memory_cache.set(key, value, self._local_timeout(timeout), size=len(data))
             else:
-                # In-memory fallback
-                self.memory_cache[key] = {
-                    'value': value,
-                    'expires': time.time() + timeout if timeout > 0 else 0
-                }
-                success = True
+                success = self.memory_cache.set(key, value, timeout)
             
             duration = time.time() - start_time
             perf_logger.log_operation(
@@ -135,19 +294,17 @@ class CacheManager:
             return success
             
         except Exception as e:
+            self._count('l2_errors')
             logger.error(f"Cache set error for key {key}: {e}")
             return False
     
     def delete(self, key: str) -> bool:
         """Delete value from cache"""
         try:
+            deleted = self.memory_cache.delete(key)
             if self.redis_client:
                 return bool(self.redis_client.delete(key))
-            else:
-                if key in self.memory_cache:
-                    del self.memory_cache[key]
-                    return True
-                return False
+            return deleted
         except Exception as e:
             logger.error(f"Cache delete error for key {key}: {e}")
             return False
@@ -157,10 +314,11 @@ class CacheManager:
         count = 0
         
         try:
+            local_count = self.memory_cache.clear(pattern)
             if self.redis_client:
                 if pattern:
-                    # Clear matching keys
-                    keys = self.redis_client.keys(pattern)
+                    # Clear matching keys without blocking Redis the way KEYS does
+                    keys = list(self.redis_client.scan_iter(match=pattern, count=500))
                     if keys:
                         count = self.redis_client.delete(*keys)
                 else:
@@ -168,20 +326,7 @@ class CacheManager:
                     self.redis_client.flushdb()
                     count = -1  # Unknown count
             else:
-                if pattern:
-                    # Clear matching keys from memory cache
-                    import fnmatch
-                    keys_to_delete = [
-                        k for k in self.memory_cache.keys()
-                        if fnmatch.fnmatch(k, pattern)
-                    ]
-                    for key in keys_to_delete:
-                        del self.memory_cache[key]
-                        count += 1
-                else:
-                    # Clear all
-                    count = len(self.memory_cache)
-                    self.memory_cache.clear()
+                count = local_count
             
             logger.info(f"Cleared {count} cache entries")
             return count
@@ -195,18 +340,24 @@ class CacheManager:
         result = {}
         
         try:
-            if self.redis_client:
-                # Get all values in one operation
-                values = self.redis_client.mget(keys)
-                for key, data in zip(keys, values):
+            missing = []
+            for key in keys:
+                value = self.memory_cache.get(key)
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    result[key] = value
+
+            if self.redis_client and missing:
+                # Get the remaining values in one operation
+                values = self.redis_client.mget(missing)
+                for key, data in zip(missing, values):
                     if data:
                         result[key] = self._deserialize(data)
-            else:
-                # In-memory fallback
-                for key in keys:
-                    value = self.get(key)
-                    if value is not None:
-                        result[key] = value
+                        self.memory_cache.set(key, result[key], self.local_timeout, size=len(data))
+                        self._count('l2_hits')
+                    else:
+                        self._count('l2_misses')
             
             return result
             
@@ -228,11 +379,11 @@ class CacheManager:
                         pipe.setex(key, timeout, data)
                     else:
                         pipe.set(key, data)
+                    self.memory_cache.set(key, value, self._local_timeout(timeout), size=len(data))
                 pipe.execute()
             else:
-                # In-memory fallback
                 for key, value in mapping.items():
-                    self.set(key, value, timeout)
+                    self.memory_cache.set(key, value, timeout)
             
             return True
             
@@ -241,20 +392,76 @@ class CacheManager:
             return False
     
     def increment(self, key: str, delta: int = 1) -> Optional[int]:
-        """Increment a counter in cache"""
+        """Atomically increment a counter in cache"""
         try:
             if self.redis_client:
+                # Counters live only in Redis - an L1 copy would go stale immediately
+                self.memory_cache.delete(key)
                 return self.redis_client.incr(key, delta)
-            else:
-                # In-memory fallback
-                current = self.get(key) or 0
-                new_value = current + delta
-                self.set(key, new_value)
-                return new_value
+            return self.memory_cache.incr(key, delta, self.default_timeout)
         except Exception as e:
             logger.error(f"Cache increment error for key {key}: {e}")
             return None
 
+    def get_or_set(self, key: str, producer: Callable[[], Any], timeout: Optional[int] = None) -> Any:
+        """
+        Return the cached value for key, computing it with producer on a miss.
+
+        Concurrent misses for the same key in this process wait for the first
+        caller's result instead of all running producer (single-flight).
+
+        Args:
+            key: Cache key
+            producer: Zero-argument callable that computes the value
+            timeout: Cache timeout in seconds (default_timeout if None)
+
+        Returns:
+            The cached or freshly computed value (None results are not cached)
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlight()
+                self._inflight[key] = call
+
+        if not leader:
+            self._count('coalesced')
+            if call.event.wait(self.single_flight_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # The leader is taking too long - compute independently rather than hang
+            logger.warning(f"Single-flight wait timed out for key {key}")
+            return producer()
+
+        try:
+            self._count('computed')
+            call.result = producer()
+            if call.result is not None:
+                self.set(key, call.result, timeout)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit, miss, eviction and coalescing counters for both tiers"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._inflight_lock:
+            stats['in_flight'] = len(self._inflight)
+        stats['l1'] = self.memory_cache.stats()
+        return stats
+
 
 # Global cache instance
 cache = None
@@ -265,15 +472,19 @@ def init_cache(app=None):
     global cache
     
     if app:
-        redis_url = app.config.get('REDIS_URL')
-        default_timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        settings = app.config
     else:
         from app.core.config import get_config
         config = get_config()
-        redis_url = config.REDIS_URL
-        default_timeout = config.CACHE_DEFAULT_TIMEOUT
+        settings = {k: getattr(config, k) for k in dir(config) if k.isupper()}
     
-    cache = CacheManager(redis_url, default_timeout)
+    cache = CacheManager(
+        settings.get('REDIS_URL'),
+        settings.get('CACHE_DEFAULT_TIMEOUT', 300),
+        local_max_entries=settings.get('CACHE_LOCAL_MAX_ENTRIES', 10000),
+        local_max_bytes=settings.get('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024),
+        local_timeout=settings.get('CACHE_LOCAL_TIMEOUT', 30)
+    )
     return cache
 
 
@@ -302,21 +513,11 @@ def cached(timeout: Optional[int] = None, key_prefix: Optional[str] = None,
                 kwargs_key = hashlib.md5(str(sorted(kwargs.items())).encode()).hexdigest()
                 cache_key += f":{kwargs_key}"
             
-            # Try to get from cache
-            if cache:
-                cached_value = cache.get(cache_key)
-                if cached_value is not None:
-                    logger.debug(f"Cache hit for {func.__name__}")
-                    return cached_value
-            
-            # Call function and cache result
-            result = func(*args, **kwargs)
-            
-            if cache and result is not None:
-                cache.set(cache_key, result, timeout)
-                logger.debug(f"Cached result for {func.__name__}")
+            if not cache:
+                return func(*args, **kwargs)
             
-            return result
+            # Concurrent misses for the same key share one call
+            return cache.get_or_set(cache_key, lambda: func(*args, **kwargs), timeout)
         
         # Add method to clear this function's cache
         def clear_cache():
@@ -347,17 +548,10 @@ def cache_key_func(make_key: Callable):
         def wrapper(*args, **kwargs):
             cache_key = make_key(*args, **kwargs)
             
-            if cache:
-                cached_value = cache.get(cache_key)
-                if cached_value is not None:
-                    return cached_value
-            
-            result = func(*args, **kwargs)
-            
-            if cache and result is not None:
-                cache.set(cache_key, result)
+            if not cache:
+                return func(*args, **kwargs)
             
-            return result
+            return cache.get_or_set(cache_key, lambda: func(*args, **kwargs))
         
         return wrapper
     return decorator
@@ -380,6 +574,7 @@ def get_cache_stats() -> Dict[str, Any]:
         'status': 'redis' if cache.redis_client else 'memory',
         'connected': cache.redis_client is not None
     }
+    stats.update(cache.get_stats())
     
     try:
         if cache.redis_client:
@@ -399,7 +594,7 @@ def get_cache_stats() -> Dict[str, Any]:
         else:
             stats.update({
                 'keys': len(cache.memory_cache),
-                'memory_warning': 'Using in-memory cache (not persistent)'
+                'memory_warning': 'Using in-memory cache only (not shared between processes)'
             })
     except Exception as e:
         logger.error(f"Error getting cache stats: {e}")
@@ -16,6 +16,7 @@ from werkzeug.exceptions import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.logger import get_logger, log_request, log_response
+from utils.http_cache import conditional_get, compress_response  # noqa: F401 - conditional_get re-exported for routes
 
 logger = get_logger(__name__)
 
@@ -298,6 +299,9 @@ def init_middleware(app):
     app.before_request(setup_request_context)
     app.after_request(teardown_request_context)
     
+    # Compress large JSON responses (runs before teardown_request_context logs the response)
+    app.after_request(compress_response)
+    
     # Error handlers
     app.register_error_handler(APIError, handle_api_error)
     app.register_error_handler(HTTPException, handle_http_error)
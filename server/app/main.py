@@ -32,6 +32,10 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config)
     
+    # orjson-backed jsonify
+    from utils.serialization import install_json_provider
+    install_json_provider(app)
+    
     # Initialize configuration
     config.init_app(app)
     
@@ -181,7 +185,9 @@ def register_admin_routes(app):
     if not app.debug:
         return
     
+    # Cache hit/miss/eviction counters for both cache tiers
     @app.route('/api/admin/cache/stats')
+    @app.route('/admin/cache-stats')
     def cache_stats():
         from app.core.cache import get_cache_stats
         return get_cache_stats()
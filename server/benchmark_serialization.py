@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Serialization microbenchmarks
+
+Compares the previous serialization paths with utils/serialization.py on
+payloads shaped like the real ones:
+- a 50-row /api/llm-responses page whose rows carry large response_json blobs
+- a /api/batches/dashboard payload
+- a cached batch-info dict
+
+Usage (from the server directory):
+    python benchmark_serialization.py [--rows 50] [--blob-kb 20] [--repeat 200]
+"""
+
+import sys
+import os
+import json
+import time
+import pickle
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.serialization import (
+    json_passthrough, dumps_json, pack_cache_value, unpack_cache_value,
+    ORJSON_AVAILABLE, MSGPACK_AVAILABLE
+)
+
+
+def make_response_json(blob_kb: int) -> str:
+    """A stored analysis result of roughly blob_kb kilobytes"""
+    sections = []
+    while len(json.dumps(sections)) < blob_kb * 1024:
+        sections.append({
+            'section': f"Section {len(sections) + 1}",
+            'score': random.randint(0, 100),
+            'findings': [f"Finding {i}: " + 'lorem ipsum dolor sit amet ' * 4 for i in range(3)],
+            'confidence': round(random.random(), 3)
+        })
+    return json.dumps({'overall_score': random.randint(0, 100), 'sections': sections})
+
+
+def make_llm_responses_rows(rows: int, blob_kb: int):
+    """Rows as fetched from llm_responses (response_json as text)"""
+    now = datetime.now()
+    return [{
+        'id': i,
+        'document_id': 1000 + i,
+        'prompt_id': 3,
+        'connection_id': 2,
+        'batch_id': 77,
+        'status': 'COMPLETED',
+        'response_text': 'Analysis complete',
+        'overall_score': 81.5,
+        'input_tokens': 4096,
+        'output_tokens': 812,
+        'response_time_ms': 15234,
+        'created_at': (now - timedelta(minutes=i)).isoformat(),
+        'document': {'id': 1000 + i, 'filename': f"doc_{i}.pdf", 'filepath': f"/data/doc_{i}.pdf"},
+        'connection': {'name': 'ollama-local', 'model_name': 'llama3', 'provider_type': 'ollama'},
+        'response_json': make_response_json(blob_kb)
+    } for i in range(rows)]
+
+
+def make_dashboard():
+    return {
+        'success': True,
+        'dashboard': {
+            'summary_stats': {'total_batches': 250, 'completed': 230, 'failed': 5, 'stats_context': 'all_batches'},
+            'active_batches': [{'batch_id': i, 'progress': i * 3.3, 'status': 'PROCESSING',
+                                'started_at': datetime.now().isoformat()} for i in range(10)],
+            'recent_batches': [{'id': i, 'batch_name': f"Batch {i}", 'status': 'COMPLETED',
+                                'total_documents': 120, 'processed_documents': 120,
+                                'config_snapshot': {'prompts': [{'id': 1, 'prompt_text': 'x' * 500}]}}
+                               for i in range(10)],
+            'last_updated': datetime.now().isoformat()
+        }
+    }
+
+
+def timeit(func, repeat: int) -> float:
+    """Median milliseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def report(name: str, before_ms: float, after_ms: float):
+    speedup = before_ms / after_ms if after_ms else float('inf')
+    print(f"  {name:<38} before {before_ms:9.3f} ms   after {after_ms:9.3f} ms   {speedup:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serialization microbenchmarks')
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--blob-kb', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    stdlib_provider = DefaultJSONProvider(Flask(__name__))
+    rows = make_llm_responses_rows(args.rows, args.blob_kb)
+    dashboard = make_dashboard()
+
+    print(f"orjson: {ORJSON_AVAILABLE}, msgpack: {MSGPACK_AVAILABLE}")
+    print(f"llm-responses page: {args.rows} rows x ~{args.blob_kb} KB response_json, {args.repeat} repeats\n")
+
+    def page_before():
+        # json.loads each stored blob, then stdlib jsonify of the whole page
+        page = [dict(row, response_json=json.loads(row['response_json'])) for row in rows]
+        return stdlib_provider.dumps({'responses': page}, separators=(',', ':'))
+
+    def page_after():
+        page = [dict(row, response_json=json_passthrough(row['response_json'])) for row in rows]
+        return dumps_json({'responses': page})
+
+    assert json.loads(page_before()) == json.loads(page_after())
+
+    print("API payloads")
+    report('llm-responses page', timeit(page_before, args.repeat), timeit(page_after, args.repeat))
+    report('batch dashboard',
+           timeit(lambda: stdlib_provider.dumps(dashboard, separators=(',', ':')), args.repeat),
+           timeit(lambda: dumps_json(dashboard), args.repeat))
+
+    cache_value = {'batch': dashboard['dashboard']['recent_batches'][0], 'rows': rows[:5]}
+    legacy_blob = json.dumps(cache_value).encode('utf-8')
+    packed_blob = pack_cache_value(cache_value)
+
+    print("\nCache values")
+    report('encode', timeit(lambda: json.dumps(cache_value).encode('utf-8'), args.repeat),
+           timeit(lambda: pack_cache_value(cache_value), args.repeat))
+    report('decode', timeit(lambda: json.loads(legacy_blob.decode('utf-8')), args.repeat),
+           timeit(lambda: unpack_cache_value(packed_blob), args.repeat))
+
+    dated_value = {'created_at': datetime.now(), 'items': list(range(1000))}
+    report('encode with datetime (pickle fallback)', timeit(lambda: pickle.dumps(dated_value), args.repeat),
+           timeit(lambda: pack_cache_value(dated_value), args.repeat))
+    print(f"\n  cache entry size: legacy JSON {len(legacy_blob)} bytes, packed {len(packed_blob)} bytes")
+
+
+if __name__ == '__main__':
+    main()
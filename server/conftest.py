@@ -0,0 +1,95 @@
+"""
+Shared pytest fixtures for the batch queue processor tests.
+
+make_processor builds a BatchQueueProcessor whose BatchService and RAG API are
+replaced with fakes:
+- FakeBatchService hands out the document info a test supplies and records the
+  claims, task updates, completions and failures the processor reports
+- RAG API submissions are recorded as (url, form data) and answered with
+  task-1, task-2, ... in submission order
+"""
+
+import sys
+import os
+
+import pytest
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_queue_processor as processor_module
+from services.batch_queue_processor import BatchQueueProcessor
+from services.circuit_breakers import CircuitBreakerRegistry
+from services.model_affinity import ModelAffinityScheduler
+
+
+class FakeRagResponse:
+    status_code = 200
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+
+    def json(self):
+        return {'task_id': self.task_id}
+
+
+class FakeBatchService:
+    """
+    BatchService stand-in for the queue processor
+
+    Args:
+        info: Document info returned by every claim, or a callable receiving the list of
+              claims so far (the current one last) and returning the info or None
+    """
+
+    def __init__(self, info):
+        self.info = info
+        self.claims = []
+        self.task_updates = []
+        self.completions = []
+        self.failures = []
+
+    def get_next_document_for_processing(self, batch_id, **kwargs):
+        self.claims.append({'batch_id': batch_id, **kwargs})
+        return self.info(self.claims) if callable(self.info) else self.info
+
+    def update_document_task(self, doc_id, task_id, status='PROCESSING', rag_endpoint=None):
+        self.task_updates.append((doc_id, task_id, status))
+        return True
+
+    def handle_task_completion(self, task_id, result_data):
+        self.completions.append((task_id, result_data))
+        return {'success': True}
+
+    def handle_task_failure(self, task_id, error_data):
+        self.failures.append((task_id, error_data))
+        return {'success': True}
+
+
+@pytest.fixture
+def make_processor(monkeypatch):
+    """
+    Factory for a queue processor wired to fakes
+
+    Returns:
+        Callable(info, **attributes) -> (processor, fake_service, posted); attributes are
+        set on the processor after it is built, e.g. max_prompts_per_request=8
+    """
+    def make(info, **attributes):
+        fake_service = FakeBatchService(info)
+        posted = []
+
+        def fake_post(url, data=None, timeout=None):
+            posted.append((url, data))
+            return FakeRagResponse(f"task-{len(posted)}")
+
+        monkeypatch.setattr(processor_module, 'batch_service', fake_service)
+        monkeypatch.setattr(processor_module.requests, 'post', fake_post)
+        processor = BatchQueueProcessor()
+        processor.breakers = CircuitBreakerRegistry()
+        processor.affinity = ModelAffinityScheduler(lookup=lambda connection_id: None)
+        for name, value in attributes.items():
+            setattr(processor, name, value)
+        return processor, fake_service, posted
+
+    return make
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Migration: Add answered_by_connection_id to llm_responses (KnowledgeDocuments database)
+
+A hedged task (services/hedging.py) may be answered by a copy sent to an equivalent
+connection on another host. The result is written to the row of the original
+connection, so the answering connection is recorded separately:
+- answered_by_connection_id: connection that produced the result (NULL on rows
+  completed before this column; readers fall back to connection_id)
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_answered_by_connection_column():
+    """Add answered_by_connection_id to llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding answered_by_connection_id to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS answered_by_connection_id INTEGER
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added answered_by_connection_id to llm_responses")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding answered_by_connection_id: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add answered_by_connection_id to llm_responses")
+
+    success = add_answered_by_connection_column()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
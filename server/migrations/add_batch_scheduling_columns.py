@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Migration: Add scheduling columns to batches table (PostgreSQL)
+
+This migration adds the columns used by the batch scheduler:
+- priority: Scheduling priority (higher runs sooner, >= 5 is treated as urgent)
+- submitted_by: Owner of the batch, used for fair-share scheduling across users
+"""
+
+import logging
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def check_column_exists_postgresql(session, table_name, column_name):
+    """Check if a column exists in a PostgreSQL table"""
+    result = session.execute(text("""
+        SELECT COUNT(*) as count
+        FROM information_schema.columns
+        WHERE table_name = :table_name
+        AND column_name = :column_name
+    """), {"table_name": table_name, "column_name": column_name})
+    return result.fetchone()[0] > 0
+
+def add_batch_scheduling_columns():
+    """Add priority and submitted_by columns to batches table"""
+    session = Session()
+    try:
+        columns_to_add = [
+            ('priority', 'INTEGER NOT NULL DEFAULT 0'),
+            ('submitted_by', 'TEXT')
+        ]
+
+        for column_name, column_type in columns_to_add:
+            if check_column_exists_postgresql(session, 'batches', column_name):
+                logger.info(f"{column_name} column already exists in batches table")
+                continue
+
+            logger.info(f"Adding {column_name} column to batches table...")
+            session.execute(text(f"""
+                ALTER TABLE batches
+                ADD COLUMN {column_name} {column_type}
+            """))
+
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_batches_status_priority
+            ON batches(status, priority DESC)
+        """))
+
+        session.commit()
+
+        missing_columns = [
+            column_name for column_name, _ in columns_to_add
+            if not check_column_exists_postgresql(session, 'batches', column_name)
+        ]
+        if missing_columns:
+            logger.error(f"❌ Failed to add columns: {', '.join(missing_columns)}")
+            return False
+
+        logger.info("✅ Successfully added scheduling columns to batches table")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding scheduling columns to batches table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add scheduling columns to batches table (PostgreSQL)")
+
+    success = add_batch_scheduling_columns()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
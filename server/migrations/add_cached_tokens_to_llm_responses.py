@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migration: Add cached_tokens to llm_responses (KnowledgeDocuments database)
+
+Document-affinity dispatch sends a document's prompts back to back so providers
+with prefix caching can reuse the processed document tokens:
+- cached_tokens: prompt tokens the provider reports as served from its cache
+  (NULL when the provider does not report caching)
+
+Also adds a partial index matching the document-ordered claim of queued rows.
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_cached_tokens_column():
+    """Add cached_tokens column and the document-order claim index to llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding cached_tokens to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS cached_tokens INTEGER
+        """)
+
+        logger.info("Creating document-order claim index...")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_queued_document_order
+            ON llm_responses(batch_id, document_id, connection_id, prompt_id, id)
+            WHERE status = 'QUEUED'
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added cached_tokens to llm_responses")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding cached_tokens column: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add cached_tokens to llm_responses")
+
+    success = add_cached_tokens_column()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
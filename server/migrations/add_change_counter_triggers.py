@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Migration: Add change counter triggers (doc_eval and KnowledgeDocuments)
+
+Read-heavy endpoints answer conditional GETs from cheap version numbers instead
+of re-running their queries. The versions are maintained by triggers, so every
+write path (API, workers, scripts) bumps them:
+
+doc_eval:
+- config_versions rows 'batches', 'folders', 'prompts', 'connections', 'models',
+  'providers' are bumped by a statement-level trigger on each table
+
+KnowledgeDocuments:
+- batch_progress_versions(batch_id, version) is bumped whenever llm_responses
+  rows of that batch are inserted, deleted or change status. The triggers are
+  statement-level with transition tables: one upsert per distinct batch per
+  statement, so staging thousands of rows or settling a packed request does not
+  write (and lock) the version row once per llm_responses row
+
+Run after create_config_versions_table.py.
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+# Table -> config_versions name
+VERSIONED_TABLES = {
+    'batches': 'batches',
+    'folders': 'folders',
+    'prompts': 'prompts',
+    'connections': 'connections',
+    'models': 'models',
+    'llm_providers': 'providers',
+}
+
+def add_doc_eval_triggers():
+    """Bump config_versions on every write to the versioned doc_eval tables"""
+    session = Session()
+    try:
+        logger.info("Creating bump_config_version() trigger function...")
+        session.execute(text("""
+            CREATE OR REPLACE FUNCTION bump_config_version() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO config_versions (name, version, updated_at)
+                VALUES (TG_ARGV[0], 1, NOW())
+                ON CONFLICT (name) DO UPDATE
+                SET version = config_versions.version + 1, updated_at = NOW();
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+
+        for table, name in VERSIONED_TABLES.items():
+            logger.info(f"Adding change counter trigger to {table}...")
+            session.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_counter ON {table}"))
+            session.execute(text(f"""
+                CREATE TRIGGER {table}_change_counter
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_config_version('{name}')
+            """))
+            session.execute(text("""
+                INSERT INTO config_versions (name, version) VALUES (:name, 0)
+                ON CONFLICT (name) DO NOTHING
+            """), {'name': name})
+
+        session.commit()
+        logger.info("✅ doc_eval change counter triggers are ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding doc_eval change counter triggers: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def add_knowledge_documents_triggers():
+    """Per-batch progress versions for llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Creating batch_progress_versions table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS batch_progress_versions (
+                batch_id INTEGER PRIMARY KEY,
+                version BIGINT DEFAULT 0 NOT NULL,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+
+        # Batches come out sorted, so concurrent statements lock version rows in the same order
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION bump_batch_progress_version() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO batch_progress_versions (batch_id, version, updated_at)
+                    SELECT DISTINCT batch_id, 1, NOW() FROM new_rows
+                    WHERE batch_id IS NOT NULL
+                    ORDER BY batch_id
+                    ON CONFLICT (batch_id) DO UPDATE
+                    SET version = batch_progress_versions.version + 1, updated_at = NOW();
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO batch_progress_versions (batch_id, version, updated_at)
+                    SELECT DISTINCT batch_id, 1, NOW() FROM old_rows
+                    WHERE batch_id IS NOT NULL
+                    ORDER BY batch_id
+                    ON CONFLICT (batch_id) DO UPDATE
+                    SET version = batch_progress_versions.version + 1, updated_at = NOW();
+                ELSE
+                    -- Only status changes count; lease renewals and partial output do not
+                    INSERT INTO batch_progress_versions (batch_id, version, updated_at)
+                    SELECT DISTINCT n.batch_id, 1, NOW()
+                    FROM new_rows n
+                    JOIN old_rows o ON o.id = n.id
+                    WHERE n.batch_id IS NOT NULL
+                    AND o.status IS DISTINCT FROM n.status
+                    ORDER BY n.batch_id
+                    ON CONFLICT (batch_id) DO UPDATE
+                    SET version = batch_progress_versions.version + 1, updated_at = NOW();
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+
+        logger.info("Adding progress triggers to llm_responses...")
+        # Row-level triggers created by earlier runs of this migration
+        cursor.execute("DROP TRIGGER IF EXISTS llm_responses_progress_insert_delete ON llm_responses")
+        cursor.execute("DROP TRIGGER IF EXISTS llm_responses_progress_status ON llm_responses")
+        cursor.execute("DROP TRIGGER IF EXISTS llm_responses_progress_insert ON llm_responses")
+        cursor.execute("DROP TRIGGER IF EXISTS llm_responses_progress_delete ON llm_responses")
+
+        # Transition tables allow one event per trigger and no column list (UPDATE OF status)
+        cursor.execute("""
+            CREATE TRIGGER llm_responses_progress_insert
+            AFTER INSERT ON llm_responses
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_batch_progress_version()
+        """)
+        cursor.execute("""
+            CREATE TRIGGER llm_responses_progress_delete
+            AFTER DELETE ON llm_responses
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_batch_progress_version()
+        """)
+        cursor.execute("""
+            CREATE TRIGGER llm_responses_progress_status
+            AFTER UPDATE ON llm_responses
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_batch_progress_version()
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ KnowledgeDocuments progress triggers are ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding KnowledgeDocuments progress triggers: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add change counter triggers")
+
+    success = add_doc_eval_triggers() and add_knowledge_documents_triggers()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Migration: Add content_hash column to docs (KnowledgeDocuments database)
+
+Selective reruns compare the SHA-256 of each source file with the hash of the
+staged copy to find edited documents without re-encoding every file:
+- content_hash: hex SHA-256 of the decoded document content
+
+Rows staged before this column existed get their hash on the first selective
+rerun that checks them.
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_content_hash_column():
+    """Add content_hash column to docs"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding content_hash column to docs table...")
+        cursor.execute("""
+            ALTER TABLE docs
+            ADD COLUMN IF NOT EXISTS content_hash TEXT
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added content_hash column to docs")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding content_hash column: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add content_hash column to docs")
+
+    success = add_content_hash_column()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Migration: Add predicted_cost_ms to llm_responses (KnowledgeDocuments database)
+
+JOB_ORDER=largest_first/shortest_first claims sort QUEUED rows by predicted cost.
+Staging stores the job cost model's prediction on each row and refits rescore
+the queue set-based, so the claim ORDER BY is served by an index instead of
+scoring every queued row of the batch per claim:
+- predicted_cost_ms: predicted processing time of the row
+- a partial index on (batch_id, predicted_cost_ms) for QUEUED rows
+
+Existing QUEUED rows are scored with the current model.
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cost_model import job_cost_model
+
+logger = logging.getLogger(__name__)
+
+def add_predicted_cost_column():
+    """Add predicted_cost_ms and its claim index, then score the queued rows"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding predicted_cost_ms to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS predicted_cost_ms REAL
+        """)
+        conn.commit()
+
+        # Built outside a transaction so workers are not blocked
+        logger.info("Creating cost order claim index...")
+        conn.autocommit = True
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_llm_responses_queued_cost
+            ON llm_responses(batch_id, predicted_cost_ms)
+            WHERE status = 'QUEUED'
+        """)
+        conn.autocommit = False
+
+        logger.info("Scoring queued llm_responses...")
+        job_cost_model.refresh(force=True)
+        scored = job_cost_model.rescore_queued(cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info(f"✅ Successfully added predicted_cost_ms to llm_responses ({scored} queued rows scored)")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding predicted_cost_ms: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add predicted_cost_ms to llm_responses")
+
+    success = add_predicted_cost_column()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
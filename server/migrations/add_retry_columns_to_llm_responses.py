@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migration: Add retry columns to llm_responses (KnowledgeDocuments database)
+
+Transient failures are re-queued with backoff instead of being marked FAILED:
+- attempt_count: retries made for the row so far
+- next_attempt_at: the row is not claimed before this time (NULL = immediately)
+
+Also adds a partial index for rows waiting out their backoff.
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_retry_columns():
+    """Add attempt_count and next_attempt_at columns to llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding retry columns to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS attempt_count INTEGER DEFAULT 0 NOT NULL,
+            ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP
+        """)
+
+        logger.info("Creating retry index...")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_next_attempt
+            ON llm_responses(batch_id, next_attempt_at)
+            WHERE status = 'QUEUED' AND next_attempt_at IS NOT NULL
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added retry columns to llm_responses")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding retry columns: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add retry columns to llm_responses")
+
+    success = add_retry_columns()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Migration: Add change tracking for incremental snapshots (doc_eval and KnowledgeDocuments)
+
+Incremental snapshots export only the llm_responses and docs rows changed since
+the previous snapshot. This migration:
+
+KnowledgeDocuments:
+- adds updated_at to llm_responses and docs, maintained by a BEFORE INSERT OR
+  UPDATE trigger, with an index for the "changed since" scan
+
+doc_eval:
+- adds parent_snapshot_id, change_watermark and restored_at to snapshots
+- widens snapshots.file_size to BIGINT (snapshots of both databases exceed 2 GB)
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+TRACKED_TABLES = ('llm_responses', 'docs')
+
+def add_updated_at_columns():
+    """Add trigger-maintained updated_at columns to llm_responses and docs"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION set_row_updated_at() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at := NOW();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+
+        for table in TRACKED_TABLES:
+            logger.info(f"Adding updated_at to {table}...")
+            # NOW() is stable, so existing rows get the migration time without a table rewrite
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW()")
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_set_updated_at ON {table}")
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_set_updated_at
+                BEFORE INSERT OR UPDATE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION set_row_updated_at()
+            """)
+            conn.commit()
+
+            # Built outside a transaction so writers are not blocked
+            conn.autocommit = True
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at)")
+            conn.autocommit = False
+
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ KnowledgeDocuments change tracking is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding updated_at columns: {e}")
+        return False
+
+def add_snapshot_chain_columns():
+    """Add incremental chain columns to snapshots"""
+    session = Session()
+    try:
+        logger.info("Adding snapshot chain columns...")
+        session.execute(text("""
+            ALTER TABLE snapshots
+            ADD COLUMN IF NOT EXISTS parent_snapshot_id INTEGER REFERENCES snapshots(id),
+            ADD COLUMN IF NOT EXISTS change_watermark TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS restored_at TIMESTAMP
+        """))
+        session.execute(text("ALTER TABLE snapshots ALTER COLUMN file_size TYPE BIGINT"))
+        session.commit()
+
+        logger.info("✅ snapshots chain columns are ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding snapshot chain columns: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add snapshot change tracking")
+
+    success = add_updated_at_columns() and add_snapshot_chain_columns()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
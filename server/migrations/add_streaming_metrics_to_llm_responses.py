@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Migration: Add streaming metrics to llm_responses (KnowledgeDocuments database)
+
+Streamed generations (direct execution engine) record where the time goes:
+- time_to_first_token_ms: request start until the first generated text
+- inter_token_latency_ms: mean gap between generated tokens
+- tokens_per_second: generation rate after the first token
+- partial_output_at: last time partial output of a long generation was flushed
+  to response_text while the row was still PROCESSING
+
+Also adds an index for per-connection capacity statistics over completed rows.
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_streaming_metric_columns():
+    """Add streaming metric columns and the per-connection stats index to llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding streaming metric columns to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS time_to_first_token_ms INTEGER,
+            ADD COLUMN IF NOT EXISTS inter_token_latency_ms REAL,
+            ADD COLUMN IF NOT EXISTS tokens_per_second REAL,
+            ADD COLUMN IF NOT EXISTS partial_output_at TIMESTAMP
+        """)
+
+        logger.info("Creating per-connection completion index...")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_connection_completed
+            ON llm_responses(connection_id, completed_processing_at)
+            WHERE status = 'COMPLETED'
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added streaming metrics to llm_responses")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding streaming metric columns: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add streaming metrics to llm_responses")
+
+    success = add_streaming_metric_columns()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Migration: Add worker lease columns to llm_responses (KnowledgeDocuments database)
+
+Queue processors running in several processes or on several nodes claim rows
+with a lease instead of relying on in-process state:
+- claimed_by: worker_id of the process that owns the row
+- lease_expires_at: when the claim lapses unless the owner renews it
+
+Also adds the indexes used by the claim and reclaim queries.
+"""
+
+import logging
+import sys
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+def add_worker_lease_columns():
+    """Add claimed_by and lease_expires_at columns to llm_responses"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding lease columns to llm_responses table...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+            ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP
+        """)
+
+        logger.info("Creating claim and lease indexes...")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_batch_status_created
+            ON llm_responses(batch_id, status, created_at, id)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_claimed_by
+            ON llm_responses(claimed_by)
+            WHERE claimed_by IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_processing_lease
+            ON llm_responses(lease_expires_at)
+            WHERE status = 'PROCESSING'
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ Successfully added worker lease columns to llm_responses")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding worker lease columns: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Add worker lease columns to llm_responses")
+
+    success = add_worker_lease_columns()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
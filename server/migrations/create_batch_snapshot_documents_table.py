@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Migration: Move config snapshot document lists into batch_snapshot_documents (PostgreSQL)
+
+Batch.config_snapshot used to embed every validated document of the batch, which
+made the batches row tens of megabytes for large batches. This migration:
+1. Creates batch_snapshot_documents (one row per snapshot document)
+2. Copies the embedded 'documents' list of every existing snapshot into it
+3. Removes 'documents' from the snapshot JSON
+
+Batches are migrated one per transaction so a failure leaves earlier batches done.
+"""
+
+import logging
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_batch_snapshot_documents_table():
+    """Create the batch_snapshot_documents table"""
+    session = Session()
+    try:
+        logger.info("Creating batch_snapshot_documents table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS batch_snapshot_documents (
+                id SERIAL PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                document_id INTEGER,
+                folder_id INTEGER,
+                filepath TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                relative_path TEXT,
+                file_size BIGINT DEFAULT 0,
+                discovered_at TIMESTAMP
+            )
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_batch_snapshot_documents_batch_id
+            ON batch_snapshot_documents (batch_id, id)
+        """))
+        session.commit()
+
+        logger.info("✅ batch_snapshot_documents table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating batch_snapshot_documents table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def move_embedded_documents():
+    """Copy embedded snapshot documents into batch_snapshot_documents and strip them from the JSON"""
+    session = Session()
+    try:
+        # config_snapshot may be json or jsonb depending on how the column was created
+        column_type = session.execute(text("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'batches' AND column_name = 'config_snapshot'
+        """)).scalar()
+
+        batch_ids = [row[0] for row in session.execute(text("""
+            SELECT id FROM batches
+            WHERE config_snapshot IS NOT NULL AND config_snapshot::jsonb ? 'documents'
+            ORDER BY id
+        """))]
+        logger.info(f"Found {len(batch_ids)} batches with embedded snapshot documents")
+
+        for batch_id in batch_ids:
+            moved = session.execute(text("""
+                INSERT INTO batch_snapshot_documents
+                    (batch_id, document_id, folder_id, filepath, filename, relative_path, file_size, discovered_at)
+                SELECT b.id,
+                       (d->>'document_id')::int,
+                       (d->>'folder_id')::int,
+                       d->>'filepath',
+                       COALESCE(d->>'filename', ''),
+                       d->>'relative_path',
+                       COALESCE((d->>'file_size')::bigint, 0),
+                       (d->>'discovered_at')::timestamp
+                FROM batches b, jsonb_array_elements(b.config_snapshot::jsonb->'documents') AS d
+                WHERE b.id = :batch_id AND d->>'filepath' IS NOT NULL
+                ORDER BY (d->>'document_id')::int
+            """), {'batch_id': batch_id}).rowcount
+
+            session.execute(text(f"""
+                UPDATE batches
+                SET config_snapshot = ((config_snapshot::jsonb - 'documents')
+                                       || '{{"documents_storage": "batch_snapshot_documents"}}'::jsonb)::{column_type}
+                WHERE id = :batch_id
+            """), {'batch_id': batch_id})
+            session.commit()
+            logger.info(f"📄 Batch {batch_id}: moved {moved} snapshot documents")
+
+        logger.info("✅ Embedded snapshot documents moved")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error moving embedded snapshot documents: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create batch_snapshot_documents table (PostgreSQL)")
+
+    success = create_batch_snapshot_documents_table() and move_embedded_documents()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
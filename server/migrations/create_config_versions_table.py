@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration: Create config_versions table (PostgreSQL)
+
+The config lookup service keeps prompts, connections, models and providers in
+memory. Every write bumps the matching row here so other processes (API and
+workers) notice the change and reload that category.
+"""
+
+import logging
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ['prompts', 'connections', 'models', 'providers']
+
+def create_config_versions_table():
+    """Create the config_versions table and seed one row per category"""
+    session = Session()
+    try:
+        logger.info("Creating config_versions table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS config_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER DEFAULT 0 NOT NULL,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        for name in CATEGORIES:
+            session.execute(text("""
+                INSERT INTO config_versions (name, version) VALUES (:name, 0)
+                ON CONFLICT (name) DO NOTHING
+            """), {'name': name})
+        session.commit()
+
+        logger.info("✅ config_versions table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating config_versions table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create config_versions table (PostgreSQL)")
+
+    success = create_config_versions_table()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Migration: Create connection_snapshots table and llm_responses.connection_snapshot_id (PostgreSQL)
+
+Staging used to copy the full connection details into every llm_responses row.
+connection_snapshots keeps one row per distinct snapshot (keyed by content hash)
+and llm_responses references it by id. This migration:
+
+KnowledgeDocuments:
+- creates connection_snapshots (with updated_at, so incremental snapshots export it)
+- adds llm_responses.connection_snapshot_id
+- moves the inline connection_details of existing rows into snapshots, one
+  distinct value at a time (run VACUUM FULL llm_responses afterwards to give the
+  space back to the operating system)
+"""
+
+import json
+import logging
+import sys
+import os
+
+import psycopg2
+import psycopg2.extras
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.connection_snapshots import ConnectionSnapshotStore
+
+logger = logging.getLogger(__name__)
+
+def connect_kb():
+    return psycopg2.connect(
+        host="studio.local",
+        database="KnowledgeDocuments",
+        user="postgres",
+        password="prodogs03",
+        port=5432
+    )
+
+def create_connection_snapshots_table():
+    """Create connection_snapshots and reference it from llm_responses"""
+    try:
+        conn = connect_kb()
+        cursor = conn.cursor()
+
+        logger.info("Creating connection_snapshots table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS connection_snapshots (
+                id SERIAL PRIMARY KEY,
+                content_hash TEXT NOT NULL UNIQUE,
+                connection_id INTEGER,
+                details JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+
+        logger.info("Adding connection_snapshot_id to llm_responses...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS connection_snapshot_id INTEGER
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ connection_snapshots table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating connection_snapshots table: {e}")
+        return False
+
+def move_inline_connection_details():
+    """Replace the inline connection_details of existing rows with snapshot ids"""
+    try:
+        conn = connect_kb()
+        cursor = conn.cursor()
+        store = ConnectionSnapshotStore()
+
+        cursor.execute("""
+            SELECT DISTINCT connection_details
+            FROM llm_responses
+            WHERE connection_snapshot_id IS NULL AND connection_details IS NOT NULL
+        """)
+        distinct_details = [row[0] for row in cursor.fetchall()]
+        logger.info(f"Moving {len(distinct_details)} distinct connection_details values into snapshots...")
+
+        moved = 0
+        for details in distinct_details:
+            if isinstance(details, str):
+                details = json.loads(details)
+            snapshot_id = store.intern(cursor, details)
+            cursor.execute("""
+                UPDATE llm_responses
+                SET connection_snapshot_id = %s, connection_details = NULL
+                WHERE connection_snapshot_id IS NULL AND connection_details = %s::jsonb
+            """, (snapshot_id, psycopg2.extras.Json(details)))
+            moved += cursor.rowcount
+            conn.commit()
+
+        cursor.close()
+        conn.close()
+
+        logger.info(f"✅ Moved connection details of {moved} llm_responses rows into "
+                    f"{store.stats['created']} new snapshots")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error moving connection details into snapshots: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create connection_snapshots table")
+
+    success = create_connection_snapshots_table() and move_inline_connection_details()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
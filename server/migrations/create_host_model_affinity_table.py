@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Migration: Create host_model_affinity table (PostgreSQL)
+
+Model affinity keeps each local LLM host on one model at a time. With several
+worker processes dispatching to the same host, each one used to pick the host's
+model on its own. The workers now share one row per host:
+- active_model: model the host is serving; switched by compare-and-set
+- switch_times: switches of the last hour, for the shared switch budget
+"""
+
+import logging
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_host_model_affinity_table():
+    """Create the host_model_affinity table"""
+    session = Session()
+    try:
+        logger.info("Creating host_model_affinity table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS host_model_affinity (
+                host TEXT PRIMARY KEY,
+                active_model TEXT,
+                switch_times TIMESTAMP[] DEFAULT '{}' NOT NULL,
+                updated_by TEXT,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        session.commit()
+
+        logger.info("✅ host_model_affinity table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating host_model_affinity table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create host_model_affinity table (PostgreSQL)")
+
+    success = create_host_model_affinity_table()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Migration: Create provider_batch_jobs table and batches.execution_mode (PostgreSQL)
+
+Batches with execution_mode 'provider_batch' are not sent request by request:
+their queued llm_responses rows are exported as JSONL files to a provider's
+offline batch API. Each submitted file is tracked in provider_batch_jobs until
+its results have been ingested back into llm_responses.
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_provider_batch_jobs_table():
+    """Add batches.execution_mode and create the provider_batch_jobs table"""
+    session = Session()
+    try:
+        logger.info("Adding execution_mode to batches table...")
+        session.execute(text("""
+            ALTER TABLE batches
+            ADD COLUMN IF NOT EXISTS execution_mode TEXT DEFAULT 'interactive' NOT NULL
+        """))
+
+        logger.info("Creating provider_batch_jobs table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS provider_batch_jobs (
+                id TEXT PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                connection_id INTEGER NOT NULL,
+                provider_type TEXT NOT NULL,
+                status TEXT DEFAULT 'SUBMITTING' NOT NULL,
+                provider_batch_id TEXT,
+                provider_status TEXT,
+                input_file_id TEXT,
+                output_file_id TEXT,
+                error_file_id TEXT,
+                request_count INTEGER DEFAULT 0,
+                file_bytes BIGINT DEFAULT 0,
+                completed_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT NOW(),
+                submitted_at TIMESTAMP,
+                polled_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                error_message TEXT
+            )
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_provider_batch_jobs_batch_id
+            ON provider_batch_jobs (batch_id, created_at)
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_provider_batch_jobs_active
+            ON provider_batch_jobs (status) WHERE status IN ('SUBMITTING', 'SUBMITTED', 'CANCELLING', 'INGESTING')
+        """))
+        session.commit()
+
+        logger.info("✅ provider_batch_jobs table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating provider_batch_jobs table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def add_llm_responses_task_index():
+    """Index used to ingest a provider batch's results by task_id"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Creating llm_responses task_id index...")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_task_id
+            ON llm_responses(task_id)
+            WHERE task_id IS NOT NULL
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ llm_responses task_id index is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating llm_responses task_id index: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create provider_batch_jobs table")
+
+    success = create_provider_batch_jobs_table() and add_llm_responses_task_index()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Migration: Create rag_endpoints table and llm_responses.rag_endpoint (PostgreSQL)
+
+rag_endpoints holds RAG API instances added to or drained from the endpoint pool
+at runtime. llm_responses.rag_endpoint records the instance that accepted a row's
+task, so status polls (also from a worker adopting the row) go to that instance.
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_rag_endpoints_table():
+    """Create the rag_endpoints table"""
+    session = Session()
+    try:
+        logger.info("Creating rag_endpoints table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS rag_endpoints (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                status TEXT DEFAULT 'ACTIVE' NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        session.commit()
+
+        logger.info("✅ rag_endpoints table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating rag_endpoints table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def add_rag_endpoint_to_llm_responses():
+    """Record which RAG API instance owns each submitted task"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        cursor = conn.cursor()
+
+        logger.info("Adding rag_endpoint to llm_responses...")
+        cursor.execute("""
+            ALTER TABLE llm_responses
+            ADD COLUMN IF NOT EXISTS rag_endpoint TEXT
+        """)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ llm_responses.rag_endpoint is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error adding rag_endpoint to llm_responses: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create rag_endpoints table")
+
+    success = create_rag_endpoints_table() and add_rag_endpoint_to_llm_responses()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
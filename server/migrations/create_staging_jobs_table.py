@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Migration: Create staging_jobs table (PostgreSQL)
+
+Staging runs as a background job. Each job checkpoints its progress here after
+every chunk of documents, so a job interrupted by a restart resumes after the
+last checkpoint instead of the batch being reset and staged from scratch.
+
+The llm_responses lookup index makes the idempotent response inserts used by
+resumed chunks cheap.
+"""
+
+import logging
+import sys
+import os
+
+import psycopg2
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_staging_jobs_table():
+    """Create the staging_jobs table"""
+    session = Session()
+    try:
+        logger.info("Creating staging_jobs table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS staging_jobs (
+                id TEXT PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+                status TEXT DEFAULT 'QUEUED' NOT NULL,
+                folder_ids JSON,
+                connection_ids JSON,
+                prompt_ids JSON,
+                total_documents INTEGER DEFAULT 0,
+                documents_done INTEGER DEFAULT 0,
+                documents_staged INTEGER DEFAULT 0,
+                responses_created INTEGER DEFAULT 0,
+                bytes_read BIGINT DEFAULT 0,
+                last_document_id INTEGER,
+                active_seconds DOUBLE PRECISION DEFAULT 0,
+                claimed_by TEXT,
+                heartbeat_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT NOW(),
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                error_message TEXT
+            )
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_staging_jobs_batch_id
+            ON staging_jobs (batch_id, created_at)
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_staging_jobs_active
+            ON staging_jobs (status) WHERE status IN ('QUEUED', 'RUNNING', 'CANCELLING')
+        """))
+        session.commit()
+
+        logger.info("✅ staging_jobs table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating staging_jobs table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def add_llm_responses_staging_index():
+    """Index used to skip llm_responses already created by an interrupted chunk"""
+    try:
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        conn.autocommit = True
+        cursor = conn.cursor()
+
+        logger.info("Creating llm_responses (batch_id, document_id) index...")
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_llm_responses_batch_document
+            ON llm_responses (batch_id, document_id)
+        """)
+
+        cursor.close()
+        conn.close()
+
+        logger.info("✅ llm_responses staging index is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating llm_responses staging index: {e}")
+        return False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create staging_jobs table (PostgreSQL)")
+
+    success = create_staging_jobs_table() and add_llm_responses_staging_index()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migration: Create worker_heartbeats table (PostgreSQL)
+
+Background workers (queue processor, health monitor, status polling) can run as
+separate processes from the Flask API. Each worker upserts its liveness and
+latest stats into this table so /api/services can still report them.
+"""
+
+import logging
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+def create_worker_heartbeats_table():
+    """Create the worker_heartbeats table"""
+    session = Session()
+    try:
+        logger.info("Creating worker_heartbeats table...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS worker_heartbeats (
+                id SERIAL PRIMARY KEY,
+                worker_id TEXT UNIQUE NOT NULL,
+                processor TEXT NOT NULL,
+                hostname TEXT,
+                pid INTEGER,
+                status TEXT DEFAULT 'RUNNING' NOT NULL,
+                started_at TIMESTAMP DEFAULT NOW(),
+                last_heartbeat_at TIMESTAMP DEFAULT NOW(),
+                stats JSONB
+            )
+        """))
+        session.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_worker_heartbeats_processor
+            ON worker_heartbeats(processor, last_heartbeat_at DESC)
+        """))
+        session.commit()
+
+        logger.info("✅ worker_heartbeats table is ready")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating worker_heartbeats table: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting migration: Create worker_heartbeats table (PostgreSQL)")
+
+    success = create_worker_heartbeats_table()
+
+    if success:
+        logger.info("✅ Migration completed successfully")
+        sys.exit(0)
+    else:
+        logger.error("❌ Migration failed")
+        sys.exit(1)
@@ -1,14 +1,16 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, JSON, LargeBinary, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, Float, Text, DateTime, ForeignKey, JSON, LargeBinary, Boolean
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
 from database import Base
 
 # Ensure we're using the correct Base class and avoid naming conflicts
 __all__ = [
     'Batch', 'Folder', 'Doc', 'Document', 'Prompt',
     'BatchArchive', 'LlmProvider', 'Model', 'ProviderModel',
-    'ModelAlias', 'LlmModel', 'Connection', 'Snapshot'
+    'ModelAlias', 'LlmModel', 'Connection', 'Snapshot', 'WorkerHeartbeat',
+    'ConfigVersion', 'BatchSnapshotDocument', 'StagingJob', 'ProviderBatchJob', 'RagEndpoint',
+    'HostModelAffinity'
 ]
 
 class Batch(Base):
@@ -27,7 +29,10 @@ class Batch(Base):
     folder_path = Column(Text, nullable=True)  # Legacy: Path that was processed (deprecated)
     folder_ids = Column(JSONB, nullable=True)  # Deprecated: JSON array of folder IDs (replaced by config_snapshot)
     meta_data = Column(JSON, nullable=True)  # JSON metadata to be sent to LLM for context
-    config_snapshot = Column(JSON, nullable=True)  # Complete configuration snapshot at batch creation time
+    config_snapshot = deferred(Column(JSON, nullable=True))  # Configuration snapshot at batch creation time; loaded on access, documents live in batch_snapshot_documents
+    priority = Column(Integer, default=0, nullable=False)  # Scheduling priority: higher runs sooner, >= 5 is urgent
+    submitted_by = Column(Text, nullable=True)  # Owner used for fair-share scheduling across users
+    execution_mode = Column(Text, default='interactive', nullable=False)  # interactive, or provider_batch (offline provider batch APIs)
 
     documents = relationship("Document", back_populates="batch")
 
@@ -223,10 +228,10 @@ class Snapshot(Base):
     name = Column(Text, nullable=False)
     description = Column(Text)
     file_path = Column(Text, unique=True, nullable=False)
-    file_size = Column(Integer)  # Size in bytes
-    database_name = Column(Text, default='doc_eval', nullable=False)
-    snapshot_type = Column(Text, default='full', nullable=False)  # full, partial, schema_only
-    compression = Column(Text, default='gzip', nullable=False)  # gzip, none
+    file_size = Column(BigInteger)  # Size in bytes
+    database_name = Column(Text, default='doc_eval', nullable=False)  # Comma-separated when several
+    snapshot_type = Column(Text, default='full', nullable=False)  # full, quick, incremental
+    compression = Column(Text, default='gzip', nullable=False)  # zstd, lz4, gzip, none
     created_at = Column(DateTime, default=func.now())
     created_by = Column(Text, default='system')
 
@@ -240,6 +245,137 @@ class Snapshot(Base):
     status = Column(Text, default='creating', nullable=False)  # creating, completed, failed
     error_message = Column(Text)  # If status is failed
 
+    # Incremental chains: changes since the parent, up to change_watermark (KnowledgeDocuments clock)
+    parent_snapshot_id = Column(Integer, ForeignKey('snapshots.id'), nullable=True)
+    change_watermark = Column(DateTime)
+    restored_at = Column(DateTime)  # Last time the databases were restored from this snapshot
+
     # Additional metadata
     notes = Column(Text)
     tags = Column(JSONB)  # For categorizing snapshots
+
+
+class WorkerHeartbeat(Base):
+    """Liveness and stats of background worker processes (queue processor, health monitor, polling)"""
+    __tablename__ = 'worker_heartbeats'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    worker_id = Column(Text, unique=True, nullable=False)  # hostname:pid:random
+    processor = Column(Text, nullable=False)  # batch, health, polling
+    hostname = Column(Text)
+    pid = Column(Integer)
+    status = Column(Text, default='RUNNING', nullable=False)  # RUNNING, STOPPED
+    started_at = Column(DateTime, default=func.now())
+    last_heartbeat_at = Column(DateTime, default=func.now())
+    stats = Column(JSONB)  # Latest processor status reported by the worker
+
+class HostModelAffinity(Base):
+    """Model a local LLM host is serving, shared by the workers that dispatch to it (see services/model_affinity.py)"""
+    __tablename__ = 'host_model_affinity'
+    __table_args__ = {'extend_existing': True}
+
+    host = Column(Text, primary_key=True)  # Host URL, e.g. http://studio.local:11434
+    active_model = Column(Text, nullable=True)
+    switch_times = Column(ARRAY(DateTime), default=list, nullable=False)  # Switches in the last hour, for the shared budget
+    updated_by = Column(Text)  # worker_id of the last writer
+    updated_at = Column(DateTime, default=func.now())
+
+class ConfigVersion(Base):
+    """Version counter per configuration category, bumped on every write so cached lookups reload"""
+    __tablename__ = 'config_versions'
+    __table_args__ = {'extend_existing': True}
+
+    name = Column(Text, primary_key=True)  # prompts, connections, models, providers
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now())
+
+class BatchSnapshotDocument(Base):
+    """Document list of a batch's config snapshot, one row per validated document at batch creation time"""
+    __tablename__ = 'batch_snapshot_documents'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(Integer, ForeignKey('batches.id', ondelete='CASCADE'), nullable=False, index=True)
+    document_id = Column(Integer, nullable=True)  # documents.id at snapshot time (not enforced - documents can be removed)
+    folder_id = Column(Integer, nullable=True)
+    filepath = Column(Text, nullable=False)
+    filename = Column(Text, nullable=False)
+    relative_path = Column(Text, nullable=True)
+    file_size = Column(BigInteger, default=0)
+    discovered_at = Column(DateTime, nullable=True)
+
+
+class StagingJob(Base):
+    """Background staging run of a batch, checkpointed per chunk so it can resume after a restart"""
+    __tablename__ = 'staging_jobs'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Text, primary_key=True)  # uuid4
+    batch_id = Column(Integer, ForeignKey('batches.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = Column(Text, default='QUEUED', nullable=False)  # QUEUED, RUNNING, CANCELLING, CANCELLED, COMPLETED, FAILED, SUPERSEDED
+    folder_ids = Column(JSON)
+    connection_ids = Column(JSON)
+    prompt_ids = Column(JSON)
+
+    # Progress, written at every chunk checkpoint
+    total_documents = Column(Integer, default=0)
+    documents_done = Column(Integer, default=0)  # Staged or skipped
+    documents_staged = Column(Integer, default=0)
+    responses_created = Column(Integer, default=0)
+    bytes_read = Column(BigInteger, default=0)
+    last_document_id = Column(Integer, nullable=True)  # Resume after this documents.id
+    active_seconds = Column(Float, default=0)  # Time spent running, across resumes
+
+    # Ownership: the process running the job renews heartbeat_at at every checkpoint
+    claimed_by = Column(Text, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+
+class ProviderBatchJob(Base):
+    """One JSONL file of a batch's requests submitted to a provider's offline batch API"""
+    __tablename__ = 'provider_batch_jobs'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Text, primary_key=True)  # uuid4; llm_responses rows carry task_id 'provider-batch-<id>'
+    batch_id = Column(Integer, ForeignKey('batches.id', ondelete='CASCADE'), nullable=False, index=True)
+    connection_id = Column(Integer, nullable=False)
+    provider_type = Column(Text, nullable=False)
+    status = Column(Text, default='SUBMITTING', nullable=False)  # SUBMITTING, SUBMITTED, CANCELLING, INGESTING, COMPLETED, FAILED, CANCELLED
+
+    # Provider side
+    provider_batch_id = Column(Text, nullable=True)
+    provider_status = Column(Text, nullable=True)  # validating, in_progress, finalizing, completed, failed, expired, ...
+    input_file_id = Column(Text, nullable=True)
+    output_file_id = Column(Text, nullable=True)
+    error_file_id = Column(Text, nullable=True)
+
+    # Size and results
+    request_count = Column(Integer, default=0)
+    file_bytes = Column(BigInteger, default=0)
+    completed_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=func.now())
+    submitted_at = Column(DateTime, nullable=True)
+    polled_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+
+class RagEndpoint(Base):
+    """RAG API instance added to the endpoint pool at runtime (see services/rag_pool.py)"""
+    __tablename__ = 'rag_endpoints'
+    __table_args__ = {'extend_existing': True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(Text, unique=True, nullable=False)  # Also the service name health_monitor reports under
+    url = Column(Text, nullable=False)  # Base URL, e.g. http://rag2.local:7001
+    status = Column(Text, default='ACTIVE', nullable=False)  # ACTIVE, DRAINING, REMOVED
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now())
@@ -5,18 +5,105 @@ This service processes batches and their documents through BatchService coordina
 It monitors for ready batches, processes documents, and reports results back.
 """
 
+import os
 import time
 import json
 import logging
 import requests
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 from services.batch_service import batch_service
+from services.batch_scheduler import BatchScheduler
+from services.worker_lease import worker_lease
+from services.retry_policy import retry_policy, TRANSIENT
+from services.circuit_breakers import circuit_breakers, connection_key, rag_endpoint_key
+from services.rag_pool import rag_endpoint_pool
+from services.hedging import hedging_policy
+from services.config_lookup import config_lookup
+from services.cost_model import job_cost_model, JOB_ORDERS
+from services.model_affinity import model_affinity
+from services.direct_execution import direct_execution
+from services.provider_batches import provider_batches
 
 logger = logging.getLogger(__name__)
 
 
+def extract_cached_tokens(data: Dict[str, Any]) -> Optional[int]:
+    """
+    Prompt tokens the provider served from its prefix cache, where it reports them.
+    
+    Recognises OpenAI-compatible usage (prompt_tokens_details.cached_tokens), Anthropic
+    (cache_read_input_tokens) and a plain cached_tokens field, at the top level or under
+    'usage'. Returns None when the provider says nothing about caching.
+    """
+    if not isinstance(data, dict):
+        return None
+    for source in (data, data.get('usage')):
+        if not isinstance(source, dict):
+            continue
+        details = source.get('prompt_tokens_details') or source.get('input_tokens_details')
+        for value in (source.get('cached_tokens'), source.get('cache_read_input_tokens'),
+                      details.get('cached_tokens') if isinstance(details, dict) else None):
+            if value is not None:
+                try:
+                    return int(value)
+                except (TypeError, ValueError):
+                    continue
+    return None
+
+
+STREAM_METRICS = ('time_to_first_token_ms', 'inter_token_latency_ms', 'tokens_per_second')
+
+
+def extract_stream_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Streaming latency metrics of a result (time to first token, mean inter-token
+    latency, tokens/sec), None for any the executor did not measure.
+    """
+    data = data if isinstance(data, dict) else {}
+    return {field: data.get(field) for field in STREAM_METRICS}
+
+
+def split_prompt_results(status: Dict[str, Any], response_ids: List[int]):
+    """
+    Map the results of a multi-prompt task onto its llm_responses rows.
+    
+    Results come back in the order the prompts were sent. Token counts and times
+    reported per result are used as they are; when the RAG API only reports task
+    totals they are split evenly across the answered prompts.
+    
+    Returns:
+        (prompt_results, missing_response_ids)
+    """
+    results = [result for result in status.get('results') or [] if isinstance(result, dict)]
+    if not results and status.get('response_text'):
+        # Only a single analysis came back - it answers the first prompt
+        results = [{'response_text': status['response_text']}]
+    answered = list(zip(response_ids, results))
+    missing = list(response_ids[len(answered):])
+    
+    def share(total) -> int:
+        return int(round((total or 0) / len(answered)))
+    
+    prompt_results = []
+    for response_id, result in answered:
+        time_taken = result.get('time_taken_seconds')
+        prompt_results.append({
+            'response_id': response_id,
+            'response_text': (result.get('response_text') or result.get('response') or
+                              result.get('analysis') or result.get('content') or ''),
+            'input_tokens': result.get('input_tokens') or share(status.get('input_tokens')),
+            'output_tokens': result.get('output_tokens') or share(status.get('output_tokens')),
+            'cached_tokens': extract_cached_tokens(result),
+            'response_time_ms': int(time_taken * 1000) if time_taken else share(status.get('response_time_ms')),
+            'overall_score': result.get('overall_score', result.get('score')),
+            **extract_stream_metrics(result),
+            'raw_result': result
+        })
+    return prompt_results, missing
+
+
 class BatchQueueProcessor:
     """Process batches and their documents through BatchService coordination"""
     
@@ -26,15 +113,64 @@ class BatchQueueProcessor:
         self.is_running = False
         self.processing_thread = None
         self.active_tasks = {}  # task_id -> document info
+        self.recovering_tasks = {}  # task_id -> adopted task waiting for its first check with the RAG API
+        self.scheduler = BatchScheduler()
+        self.lease = worker_lease
+        self.heartbeat_interval = max(check_interval, self.lease.lease_seconds // 4)
+        self.last_heartbeat = None
         self.stats = {
             'processed': 0,
             'failed': 0,
             'started_at': None,
-            'last_activity': None
+            'last_activity': None,
+            'recovery_verified': 0,
+            'cached_tokens': 0
         }
         
-        # RAG API configuration
-        self.rag_api_url = "http://localhost:7001"
+        # Adopted in-flight tasks re-verified with the RAG API per cycle, so a restart
+        # with a large backlog does not poll every recovered task at once. Adoption is
+        # limited to what can be verified before the next heartbeat; the rest stays
+        # with expired leases for other workers to adopt
+        self.recovery_verify_per_cycle = int(os.getenv('RECOVERY_VERIFY_PER_CYCLE', '10'))
+        
+        # Prompts of one document and connection packed into a single RAG request. Packed prompts
+        # share one response and one failure, so packing is opt-in (1 = no packing)
+        self.max_prompts_per_request = max(1, int(os.getenv('PROMPTS_PER_REQUEST', '1')))
+        
+        # 'created' is plain FIFO; 'document' (opt-in) sends a document's prompts on a connection
+        # back to back so providers with prefix/KV caching reuse the processed document tokens
+        self.dispatch_order = os.getenv('DISPATCH_ORDER', 'created')
+        self._last_dispatch = {}  # batch_id -> (docs id, connection_id) dispatched last
+        
+        # Claim order by predicted row cost: 'largest_first' shortens a batch's makespan,
+        # 'shortest_first' returns partial results early, 'fifo' ignores cost
+        self.job_order = os.getenv('JOB_ORDER', 'fifo')
+        if self.job_order not in JOB_ORDERS:
+            logger.warning(f"Unknown JOB_ORDER {self.job_order}, using fifo")
+            self.job_order = 'fifo'
+        self.cost_model = job_cost_model
+        
+        # RAG API instances: new tasks go to the least loaded one, polls to the task's own
+        self.rag_pool = rag_endpoint_pool
+        
+        # Details of the last failed submission, passed on for retry classification
+        self.last_submit_error = {}
+        self.breakers = circuit_breakers
+        self.affinity = model_affinity
+        # Connections configured for direct execution skip the RAG API hop
+        self.direct = direct_execution
+        # Batches in provider_batch mode send those connections' rows as offline batch jobs
+        self.provider_batches = provider_batches
+        self._provider_batch_connections = {}  # batch_id -> connection ids left to provider_batches
+        self._health_checks_seen = {}  # service name -> last_check applied to the breakers
+        # Stragglers get a duplicate on an equivalent connection or another RAG API instance
+        self.hedging = hedging_policy
+        self._hedge_losers = {}  # task_id -> ignored losing copy, watched to measure the time saved
+        
+    @property
+    def rag_api_url(self) -> str:
+        """Primary RAG API instance (tasks without a known instance are polled there)"""
+        return self.rag_pool.primary_url()
         
     def start(self):
         """Start the queue processor"""
@@ -55,61 +191,127 @@ class BatchQueueProcessor:
         logger.info("BatchQueueProcessor started - using BatchService coordination")
     
     def _recover_processing_documents(self):
-        """Recover documents that have a task_id but are still in PROCESSING status"""
+        """Adopt PROCESSING documents whose lease expired, as many as can be verified before the next heartbeat"""
         try:
-            import psycopg2
+            cycles = max(1, int(self.heartbeat_interval // self.check_interval))
+            capacity = self.recovery_verify_per_cycle * cycles - len(self.recovering_tasks)
+            reclaimed = self.lease.reclaim_expired(limit=capacity)
             
-            # Connect to KnowledgeDocuments database for llm_responses
-            kb_conn = psycopg2.connect(
-                host="studio.local",
-                database="KnowledgeDocuments",
-                user="postgres",
-                password="prodogs03",
-                port=5432
-            )
-            kb_cursor = kb_conn.cursor()
+            for row in reclaimed:
+                task_id = row['task_id']
+                tracked = self.active_tasks.get(task_id) or self.recovering_tasks.get(task_id)
+                if tracked:
+                    # Another prompt of a multi-prompt task
+                    tracked['doc_ids'].append(row['response_id'])
+                    continue
+                # Waits for verification, keeping the original start time for timeout accounting
+                self.recovering_tasks[task_id] = {
+                    'doc_id': row['response_id'],
+                    'doc_ids': [row['response_id']],
+                    'batch_id': row['batch_id'],
+                    'submitted_at': row['started_processing_at'] or datetime.now(),
+                    'document_id': row['document_id'],
+                    'rag_endpoint': self.rag_pool.adopt(task_id, row.get('rag_endpoint')),
+                    'poll_count': 0,
+                    'recovered': True
+                }
+                logger.info(f"Reclaimed task {task_id} for llm_response {row['response_id']}")
             
-            # Find llm_responses with task_id that are still in PROCESSING status
-            kb_cursor.execute("""
-                SELECT id as response_id, task_id, document_id, batch_id
-                FROM llm_responses
-                WHERE status = 'PROCESSING' 
-                AND task_id IS NOT NULL
-                AND task_id != ''
-            """)
-            processing_docs = kb_cursor.fetchall()
+            if reclaimed:
+                logger.info(f"Worker {self.lease.worker_id} reclaimed {len(reclaimed)} tasks with expired leases")
             
-            logger.info(f"Found {len(processing_docs)} documents in PROCESSING status with task_ids on startup")
+        except Exception as e:
+            logger.error(f"Error recovering processing documents: {e}")
             
-            for doc in processing_docs:
-                response_id, task_id, document_id, batch_id = doc
-                if task_id:
-                    # Add to active tasks for monitoring
-                    self.active_tasks[task_id] = {
-                        'doc_id': response_id,
-                        'batch_id': batch_id,
-                        'submitted_at': datetime.now(),  # Use current time as we don't know original
-                        'document_id': document_id,
-                        'poll_count': 0,
-                        'recovered': True
-                    }
-                    logger.info(f"Recovered task {task_id} for llm_response {response_id}")
+    def _heartbeat(self):
+        """Renew leases on our active tasks and adopt work from dead workers"""
+        now = datetime.now()
+        if self.last_heartbeat and (now - self.last_heartbeat).total_seconds() < self.heartbeat_interval:
+            return
+        self.last_heartbeat = now
+        
+        try:
+            tracked = {
+                doc_id: task_id
+                for tasks in (self.active_tasks, self.recovering_tasks)
+                for task_id, info in tasks.items()
+                for doc_id in info.get('doc_ids', [info['doc_id']])
+            }
+            held = set(self.lease.renew(tracked.keys()))
             
-            kb_cursor.close()
-            kb_conn.close()
+            # Stop tracking rows another worker has taken over
+            for doc_id, task_id in tracked.items():
+                if doc_id not in held and (task_id in self.active_tasks or task_id in self.recovering_tasks):
+                    logger.warning(f"Lease on llm_response {doc_id} lost, no longer tracking task {task_id}")
+                    self._forget_task(task_id)
+                    
+        except Exception as e:
+            logger.error(f"Error renewing leases: {e}")
             
-            if self.active_tasks:
-                logger.info(f"Recovered {len(self.active_tasks)} tasks for monitoring")
-                logger.info(f"Active tasks after recovery: {list(self.active_tasks.keys())}")
+        self._apply_remote_health_checks()
+        if self.job_order != 'fifo' and self.cost_model.refresh():
+            try:
+                self.cost_model.rescore_queued()
+            except Exception as e:
+                logger.error(f"Error rescoring queued llm_responses: {e}")
+        self._recover_processing_documents()
+        self._resume_staging_jobs()
+        self.provider_batches.run_cycle()
+        
+    def _resume_staging_jobs(self):
+        """Restart staging jobs abandoned by a dead process after their last checkpoint"""
+        try:
+            from services.staging_jobs import staging_jobs
+            staging_jobs.resume_interrupted()
+        except Exception as e:
+            logger.error(f"Error resuming staging jobs: {e}")
+        
+    def _apply_remote_health_checks(self):
+        """Feed RAG API results of a health monitor running in another process into the breakers"""
+        from services.health_monitor import health_monitor
+        if health_monitor.monitoring_thread and health_monitor.monitoring_thread.is_alive():
+            return  # Same process - health_monitor feeds the breakers directly
+        
+        try:
+            from services.config import service_config, ServiceType
+            from services.worker_registry import worker_registry
+            health_stats = worker_registry.get_latest_stats('health') or {}
             
+            for service_name, status in health_stats.get('services', {}).items():
+                config = service_config.get_service(service_name)
+                last_check = status.get('last_check')
+                if not config or config.service_type != ServiceType.RAG_API or not last_check:
+                    continue
+                if self._health_checks_seen.get(service_name) == last_check:
+                    continue
+                self._health_checks_seen[service_name] = last_check
+                
+                if status.get('status') in ('healthy', 'unhealthy'):
+                    self.breakers.record_health(config.full_url, status['status'] == 'healthy',
+                                                status.get('error_message') or '')
         except Exception as e:
-            logger.error(f"Error recovering processing documents: {e}")
+            logger.debug(f"Could not apply remote health checks: {e}")
         
     def stop(self):
         """Stop the queue processor"""
         self.is_running = False
         if self.processing_thread:
             self.processing_thread.join(timeout=10)
+        
+        # Let other workers pick up our in-flight rows immediately
+        try:
+            released = self.lease.release_all()
+            if released:
+                logger.info(f"Released {released} leases held by worker {self.lease.worker_id}")
+        except Exception as e:
+            logger.error(f"Error releasing leases: {e}")
+        self.direct.shutdown()
+        for task_id in list(self.active_tasks) + list(self.recovering_tasks) + list(self._hedge_losers):
+            self.rag_pool.release(task_id)
+        self.active_tasks.clear()
+        self.recovering_tasks.clear()
+        self._hedge_losers.clear()
+            
         logger.info("BatchQueueProcessor stopped")
         
     def _process_loop(self):
@@ -118,6 +320,9 @@ class BatchQueueProcessor:
         
         while self.is_running:
             try:
+                # Renew our leases and adopt expired ones
+                self._heartbeat()
+                
                 # Monitor batches ready for processing
                 self._monitor_batches()
                 
@@ -134,93 +339,203 @@ class BatchQueueProcessor:
         logger.info("Queue processor loop stopped")
         
     def _monitor_batches(self):
-        """Monitor for batches ready for processing"""
+        """Monitor for batches ready for processing and claim work by weighted fair share"""
         try:
             # Get batches ready for processing from BatchService
             ready_batches = batch_service.get_batches_ready_for_processing()
+            self.scheduler.update(ready_batches)
+            # Decide which model each local LLM host serves next
+            self.affinity.update(ready_batches, self.breakers.blocked_connection_ids())
+            ready_ids = {batch['batch_id'] for batch in ready_batches}
+            self._last_dispatch = {k: v for k, v in self._last_dispatch.items() if k in ready_ids}
+            self._provider_batch_connections = {
+                batch['batch_id']: set(batch.get('provider_batch_connection_ids') or [])
+                for batch in ready_batches
+            }
             
             if not ready_batches:
                 return
                 
             logger.info(f"Found {len(ready_batches)} batches ready for processing")
             
-            # Process each batch if we have capacity
-            for batch in ready_batches:
-                if len(self.active_tasks) >= self.max_concurrent:
-                    logger.debug(f"At max concurrent limit ({self.max_concurrent}), skipping batch {batch['batch_id']}")
+            # Nothing can be submitted while every RAG API instance is draining or has an
+            # open circuit, unless some connections may bypass it with direct execution
+            if not self.rag_pool.available() and not self.direct.enabled:
+                logger.info(f"No RAG API instance available, deferring dispatch for {self.rag_pool.retry_after():.0f}s")
+                return
+            
+            # Fill free slots one claim at a time, letting the scheduler pick the batch
+            exhausted = set()
+            while len(self.active_tasks) < self.max_concurrent:
+                batch_id = self.scheduler.next_batch(exclude=exhausted)
+                if batch_id is None:
                     break
                     
-                self._process_batch_documents(batch['batch_id'])
+                if not self._dispatch_next_document(batch_id):
+                    exhausted.add(batch_id)
+                    
+            if len(self.active_tasks) >= self.max_concurrent:
+                logger.debug(f"At max concurrent limit ({self.max_concurrent})")
                 
         except Exception as e:
             logger.error(f"Error monitoring batches: {e}")
             
-    def _process_batch_documents(self, batch_id: int):
-        """Process documents from a specific batch"""
+    def _dispatch_next_document(self, batch_id: int) -> bool:
+        """
+        Claim and submit the next document from a specific batch
+        
+        Returns:
+            bool: True if a document was claimed, False if the batch has nothing left to claim
+        """
         try:
-            # Keep processing documents while we have capacity
-            while len(self.active_tasks) < self.max_concurrent:
-                # Get next document from BatchService
-                doc_info = batch_service.get_next_document_for_processing(batch_id)
+            # Rows of connections with an open circuit, or whose model is not the one their host
+            # is serving, stay queued; other connections' work goes ahead
+            excluded = set(self.breakers.blocked_connection_ids()) | set(self.affinity.deferred_connection_ids())
+            excluded |= self._provider_batch_connections.get(batch_id, set())
+            document_order = self.dispatch_order == 'document'
+            doc_info = batch_service.get_next_document_for_processing(
+                batch_id, exclude_connection_ids=sorted(excluded),
+                max_prompts=self.max_prompts_per_request,
+                document_order=document_order,
+                prefer=self._last_dispatch.get(batch_id) if document_order else None,
+                cost_order=self.cost_model.claim_order(self.job_order)
+            )
+            
+            if not doc_info:
+                logger.debug(f"No more documents to process in batch {batch_id}")
+                return False
+            
+            # All prompts claimed for this document and connection travel in one request
+            response_ids = doc_info.get('response_ids') or [doc_info['response_id']]
+            
+            # Direct connections run in-process and never touch the RAG API
+            direct = self.direct.enabled and self.direct.is_direct(doc_info.get('connection_id'),
+                                                                   doc_info.get('connection_details'))
                 
-                if not doc_info:
-                    logger.debug(f"No more documents to process in batch {batch_id}")
-                    break
-                    
-                # Submit document to RAG API
-                task_id = self._submit_document_to_rag(doc_info)
+            # Reserve the request with the connection breaker and a RAG API instance
+            # (in HALF_OPEN this takes the probe slot)
+            rag_url = None
+            conn_key = connection_key(doc_info['connection_id']) if doc_info.get('connection_id') else None
+            if not direct:
+                rag_url = self.rag_pool.acquire()
+                if not rag_url:
+                    # Step aside until an instance may take work again, so direct rows can be claimed
+                    delay = self.rag_pool.retry_after() if self.direct.enabled else 0
+                    for response_id in response_ids:
+                        self.lease.release(response_id, delay)
+                    return False
+            if conn_key and not self.breakers.allow_request(conn_key):
+                self.rag_pool.release_url(rag_url, cancel_probe=True)
+                for response_id in response_ids:
+                    self.lease.release(response_id, self.breakers.get(conn_key).retry_after())
+                return False
                 
-                if task_id:
-                    # Update BatchService with task_id
-                    success = batch_service.update_document_task(
-                        doc_info['response_id'], 
-                        task_id, 
-                        'PROCESSING'
-                    )
-                    
-                    if success:
-                        # Track active task
-                        self.active_tasks[task_id] = {
-                            'doc_id': doc_info['response_id'],
-                            'batch_id': batch_id,
-                            'submitted_at': datetime.now(),
-                            'document_id': doc_info['document_id'],
-                            'poll_count': 0
-                        }
-                        logger.info(f"✓ Submitted document {doc_info['response_id']} as task {task_id}")
-                        logger.info(f"Active tasks count: {len(self.active_tasks)}")
-                    else:
-                        logger.error(f"Failed to update task_id for document {doc_info['response_id']}")
-                else:
-                    # Failed to submit, report to BatchService
-                    error_data = {
-                        'task_id': None,  # No task_id since submission failed
+            self.scheduler.record_dispatch(batch_id)
+            
+            task_id = self.direct.submit(doc_info) if direct else None
+            if direct and not task_id:
+                # Not runnable in-process (e.g. the document needs the RAG API's text extraction)
+                direct = False
+                rag_url = self.rag_pool.acquire()
+                if not rag_url:
+                    if conn_key:
+                        self.breakers.get(conn_key).cancel_request()
+                    for response_id in response_ids:
+                        self.lease.release(response_id, self.rag_pool.retry_after())
+                    return False
+                
+            # Submit document to the chosen RAG API instance
+            if not direct:
+                task_id = self._submit_document_to_rag(doc_info, rag_url)
+            
+            if task_id:
+                if not direct:
+                    self.rag_pool.record_success(rag_url)
+                    self.rag_pool.pin(task_id, rag_url)
+                self.affinity.record_dispatch(doc_info.get('connection_id'))
+                self._last_dispatch[batch_id] = (doc_info.get('doc_id'), doc_info.get('connection_id'))
+                # Update BatchService with task_id
+                success = batch_service.update_document_task(
+                    response_ids, 
+                    task_id, 
+                    'PROCESSING',
+                    rag_endpoint=rag_url
+                )
+                
+                if success:
+                    # Track active task
+                    self.active_tasks[task_id] = {
                         'doc_id': doc_info['response_id'],
+                        'doc_ids': response_ids,
                         'batch_id': batch_id,
-                        'error': 'Failed to submit to RAG API'
+                        'submitted_at': datetime.now(),
+                        'document_id': doc_info['document_id'],
+                        'connection_id': doc_info.get('connection_id'),
+                        'rag_endpoint': rag_url,
+                        'poll_count': 0,
+                        'direct': direct,
+                        # Kept to send a duplicate if the task straggles
+                        'doc_info': doc_info if self.hedging.enabled else None
                     }
-                    batch_service.handle_task_failure(None, error_data)
-                    self.stats['failed'] += 1
-                    
+                    self.hedging.record_dispatch()
+                    logger.info(f"✓ Submitted document {doc_info['response_id']} with {len(response_ids)} prompt(s) as task {task_id}")
+                    logger.info(f"Active tasks count: {len(self.active_tasks)}")
+                else:
+                    logger.error(f"Failed to update task_id for document {doc_info['response_id']}")
+                    if direct:
+                        self.direct.cancel(task_id)
+                    self.rag_pool.release(task_id)
+                    if conn_key:
+                        self.breakers.get(conn_key).cancel_request()
+            else:
+                # Submission never reached the LLM, so it says nothing about the connection
+                if conn_key:
+                    self.breakers.get(conn_key).cancel_request()
+                self.rag_pool.release_url(rag_url)
+                status_code = self.last_submit_error.get('status_code')
+                if status_code and status_code < 500:
+                    self.rag_pool.record_success(rag_url)  # Reachable, the request itself was rejected
+                else:
+                    self.rag_pool.record_failure(rag_url)
+                
+                # Failed to submit, report to BatchService
+                error_data = {
+                    'task_id': None,  # No task_id since submission failed
+                    'doc_id': doc_info['response_id'],
+                    'doc_ids': response_ids,
+                    'batch_id': batch_id,
+                    'error': 'Failed to submit to RAG API',
+                    **self.last_submit_error
+                }
+                batch_service.handle_task_failure(None, error_data)
+                self.stats['failed'] += 1
+                
+            return True
+                
         except Exception as e:
             logger.error(f"Error processing batch {batch_id} documents: {e}")
+            return False
             
-    def _submit_document_to_rag(self, doc_info: Dict[str, Any]) -> Optional[str]:
-        """Submit document to RAG API and return task_id"""
+    def _submit_document_to_rag(self, doc_info: Dict[str, Any], rag_url: Optional[str] = None) -> Optional[str]:
+        """Submit document to a RAG API instance (default: the primary one) and return task_id"""
+        self.last_submit_error = {}
         try:
             # Prepare form data for RAG API
             form_data = {
                 'doc_id': doc_info['document_id'],
-                'prompts': json.dumps([{"prompt": doc_info['prompt']['text']}]),
+                'prompts': json.dumps([
+                    {"prompt": prompt['text']} for prompt in doc_info.get('prompts') or [doc_info['prompt']]
+                ]),
                 'llm_provider': json.dumps(doc_info['llm_config']),
-                'meta_data': json.dumps({})
+                'meta_data': json.dumps(self._cache_hints(doc_info))
             }
             
-            logger.debug(f"Submitting to RAG API: doc_id={doc_info['document_id']}")
+            rag_url = rag_url or self.rag_api_url
+            logger.debug(f"Submitting to RAG API {rag_url}: doc_id={doc_info['document_id']}")
             
             # Make request to RAG API
             response = requests.post(
-                f"{self.rag_api_url}/analyze_document_with_llm",
+                f"{rag_url}/analyze_document_with_llm",
                 data=form_data,
                 timeout=30
             )
@@ -234,44 +549,75 @@ class BatchQueueProcessor:
                     return task_id
                 else:
                     logger.error(f"RAG API response missing task_id: {result}")
+                    self.last_submit_error = {'error': 'RAG API response missing task_id', 'failure_class': 'transient'}
                     return None
             else:
                 logger.error(f"RAG API returned {response.status_code}: {response.text}")
+                self.last_submit_error = {
+                    'error': f'Failed to submit to RAG API ({response.status_code}): {response.text[:200]}',
+                    'status_code': response.status_code
+                }
                 return None
                 
         except requests.exceptions.Timeout:
             logger.error("RAG API request timed out")
+            self.last_submit_error = {'error': 'RAG API submission timed out', 'failure_class': 'transient'}
             return None
         except requests.exceptions.ConnectionError:
             logger.error("Could not connect to RAG API")
+            self.last_submit_error = {'error': 'Could not connect to RAG API', 'failure_class': 'transient'}
             return None
         except Exception as e:
             logger.error(f"Error submitting to RAG API: {e}")
             return None
             
+    def _cache_hints(self, doc_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Request metadata asking for the document to be sent as a stable prefix ahead of
+        the prompt, with a cache key shared by all requests for the same document and
+        connection (used as OpenAI's prompt_cache_key by compatible servers)
+        """
+        if self.dispatch_order != 'document':
+            return {}
+        return {
+            'document_position': 'prefix',
+            'prompt_cache_key': f"{doc_info['document_id']}:{doc_info.get('connection_id')}"
+        }
+    
     def _check_active_tasks(self):
         """Check status of all active tasks"""
+        self._check_hedge_losers()
+        self._verify_recovered_tasks()
         if not self.active_tasks:
             return
             
         logger.info(f"Checking {len(self.active_tasks)} active tasks")
         completed_tasks = []
+        hedge_candidates = []
         
         for task_id, task_info in self.active_tasks.items():
+            if task_id in completed_tasks:
+                continue  # Losing copy of a hedged task settled earlier in this pass
+            # A hedge copy answers for the rows of the task it duplicates
+            row_task_id = task_info.get('hedge_of') or task_id
             try:
                 # Increment poll count
                 task_info['poll_count'] = task_info.get('poll_count', 0) + 1
                 
                 # Check for excessive polling (max 360 checks = 30 minutes at 5-second intervals)
                 if task_info['poll_count'] > 360:
+                    if self._settle_hedge(task_id, task_info, {'success': False}, completed_tasks):
+                        continue
                     # Mark as failed due to excessive polling
                     error_data = {
-                        'task_id': task_id,
+                        'task_id': row_task_id,
                         'doc_id': task_info['doc_id'],
                         'batch_id': task_info['batch_id'],
-                        'error': f'Task {task_id} exceeded maximum poll attempts (360)'
+                        'error': f'Task {task_id} exceeded maximum poll attempts (360)',
+                        'failure_class': 'transient'
                     }
-                    batch_service.handle_task_failure(task_id, error_data)
+                    batch_service.handle_task_failure(row_task_id, error_data)
+                    self._record_task_outcome(task_info, 'connection_failure')
                     completed_tasks.append(task_id)
                     self.stats['failed'] += 1
                     logger.error(f"⚠️ Task {task_id} exceeded maximum poll attempts, marking as failed")
@@ -279,13 +625,17 @@ class BatchQueueProcessor:
                 
                 # Check for excessive 404 responses (if getting 404s for more than 12 polls = 1 minute, give up)
                 if task_info.get('consecutive_404s', 0) > 12:
+                    if self._settle_hedge(task_id, task_info, {'success': False}, completed_tasks):
+                        continue
                     error_data = {
-                        'task_id': task_id,
+                        'task_id': row_task_id,
                         'doc_id': task_info['doc_id'],
                         'batch_id': task_info['batch_id'],
-                        'error': f'Task {task_id} not found on RAG API (404) for over 1 minute'
+                        'error': f'Task {task_id} not found on RAG API (404) for over 1 minute',
+                        'failure_class': 'transient'  # Usually a RAG API restart
                     }
-                    batch_service.handle_task_failure(task_id, error_data)
+                    batch_service.handle_task_failure(row_task_id, error_data)
+                    self._record_task_outcome(task_info, 'rag_failure')
                     completed_tasks.append(task_id)
                     self.stats['failed'] += 1
                     logger.error(f"⚠️ Task {task_id} has been returning 404 for over 1 minute, marking as failed")
@@ -300,38 +650,59 @@ class BatchQueueProcessor:
                     task_info['consecutive_404s'] = 0
                 
                 if status['completed']:
-                    # Task is done, report to BatchService
+                    if self._settle_hedge(task_id, task_info, status, completed_tasks):
+                        continue
                     if status['success']:
+                        self.hedging.record_latency(task_info.get('connection_id'), self._elapsed_seconds(task_info))
+                    # Task is done, report to BatchService
+                    if status['success'] and len(task_info.get('doc_ids', [])) > 1:
+                        self._complete_packed_task(row_task_id, task_info, status)
+                    elif status['success']:
                         # Extract response data and report completion
                         result_data = {
-                            'task_id': task_id,
+                            'task_id': row_task_id,
                             'doc_id': task_info['doc_id'],
                             'batch_id': task_info['batch_id'],
                             'response_text': status.get('response_text', ''),
                             'input_tokens': status.get('input_tokens', 0),
                             'output_tokens': status.get('output_tokens', 0),
+                            'cached_tokens': status.get('cached_tokens'),
                             'response_time_ms': status.get('response_time_ms', 0),
                             'overall_score': status.get('overall_score'),
+                            **extract_stream_metrics(status),
+                            'answered_by_connection_id': task_info.get('connection_id'),
                             'raw_response': status
                         }
                         
                         # Report to BatchService for centralized handling
-                        batch_service.handle_task_completion(task_id, result_data)
+                        batch_service.handle_task_completion(row_task_id, result_data)
+                        self._record_task_outcome(task_info, 'success')
+                        self.affinity.record_completion(task_info.get('connection_id'),
+                                                        status.get('response_time_ms'), status.get('load_seconds'))
                         
                         self.stats['processed'] += 1
+                        self.stats['cached_tokens'] += status.get('cached_tokens') or 0
                         self.stats['last_activity'] = datetime.now()
                         logger.info(f"✓ Task {task_id} completed successfully")
                     else:
                         # Task failed, report to BatchService
                         error_data = {
-                            'task_id': task_id,
+                            'task_id': row_task_id,
                             'doc_id': task_info['doc_id'],
                             'batch_id': task_info['batch_id'],
-                            'error': status.get('error', 'Unknown error')
+                            'error': status.get('error', 'Unknown error'),
+                            'status_code': status.get('status_code'),
+                            'failure_class': status.get('failure_class')
                         }
                         
                         # Report to BatchService for centralized handling
-                        batch_service.handle_task_failure(task_id, error_data)
+                        batch_service.handle_task_failure(row_task_id, error_data)
+                        if status.get('status_code') and not task_info.get('direct'):
+                            self._record_task_outcome(task_info, 'rag_failure')
+                        elif retry_policy.classify(error_data) == TRANSIENT:
+                            self._record_task_outcome(task_info, 'connection_failure')
+                        else:
+                            self._record_task_outcome(task_info, 'success')  # The model answered with an error
                         
                         self.stats['failed'] += 1
                         self.stats['last_activity'] = datetime.now()
@@ -340,33 +711,274 @@ class BatchQueueProcessor:
                     completed_tasks.append(task_id)
                     
                 elif self._is_task_timeout(task_info):
+                    if self._settle_hedge(task_id, task_info, {'success': False, 'error': 'timeout'}, completed_tasks):
+                        continue
                     # Task timeout, report to BatchService
                     error_data = {
-                        'task_id': task_id,
+                        'task_id': row_task_id,
                         'doc_id': task_info['doc_id'],
                         'batch_id': task_info['batch_id'],
-                        'error': 'Task processing timeout'
+                        'error': 'Task processing timeout',
+                        'failure_class': 'transient'
                     }
                     
                     # Report to BatchService for centralized handling
-                    batch_service.handle_task_failure(task_id, error_data)
+                    batch_service.handle_task_failure(row_task_id, error_data)
+                    self._record_task_outcome(task_info, 'connection_failure')
+                    if self.direct.owns(task_id):
+                        self.direct.cancel(task_id)
                     
                     self.stats['failed'] += 1
                     completed_tasks.append(task_id)
                     logger.error(f"⏱ Task {task_id} timed out")
                     
+                elif self.hedging.should_hedge(task_info, self._elapsed_seconds(task_info)):
+                    hedge_candidates.append(task_id)
+                    
             except Exception as e:
                 logger.error(f"Error checking task {task_id}: {e}")
                 
-        # Remove completed tasks
+        # Remove completed tasks (ignored hedge losers keep their pin while they are watched)
         for task_id in completed_tasks:
-            del self.active_tasks[task_id]
+            self.active_tasks.pop(task_id, None)
+            if task_id not in self._hedge_losers:
+                self.rag_pool.release(task_id)
+        
+        for task_id in hedge_candidates:
+            if task_id in self.active_tasks:
+                self._launch_hedge(task_id)
+            
+    def _verify_recovered_tasks(self):
+        """
+        Move up to RECOVERY_VERIFY_PER_CYCLE adopted tasks into active_tasks for their first
+        check with the RAG API. Tasks already past their timeout fail without a check and
+        without using the budget.
+        """
+        budget = self.recovery_verify_per_cycle
+        for task_id, task_info in list(self.recovering_tasks.items()):
+            if self._is_task_timeout(task_info):
+                del self.recovering_tasks[task_id]
+                batch_service.handle_task_failure(task_id, {
+                    'task_id': task_id,
+                    'doc_id': task_info['doc_id'],
+                    'batch_id': task_info['batch_id'],
+                    'error': 'Task processing timeout',
+                    'failure_class': 'transient'
+                })
+                self.rag_pool.release(task_id)
+                self.stats['failed'] += 1
+                logger.error(f"⏱ Recovered task {task_id} timed out before it was verified")
+            elif budget > 0:
+                budget -= 1
+                self.active_tasks[task_id] = self.recovering_tasks.pop(task_id)
+                self.stats['recovery_verified'] += 1
+    
+    def _elapsed_seconds(self, task_info: Dict[str, Any]) -> float:
+        return (datetime.now() - task_info['submitted_at']).total_seconds()
+    
+    def _launch_hedge(self, task_id: str):
+        """Send a duplicate of a straggling task to an equivalent connection or another RAG API instance"""
+        task_info = self.active_tasks[task_id]
+        task_info['hedge_attempted'] = True
+        doc_info = task_info['doc_info']
+        
+        # Same model on a different host first, then the same connection on another RAG API instance
+        hedge_doc, rag_url = None, None
+        blocked = self.breakers.blocked_connection_ids()
+        for connection_id in self.hedging.equivalent_connections(task_info.get('connection_id'), exclude=blocked):
+            details = config_lookup.get_connection(connection_id)
+            llm_config = config_lookup.get_llm_config(connection_id)
+            if details and llm_config:
+                hedge_doc = {**doc_info, 'connection_id': connection_id,
+                             'connection_details': details, 'llm_config': llm_config}
+                break
+        if hedge_doc is None:
+            if task_info.get('direct'):
+                return  # Direct runs have no other instance to go to
+            rag_url = self.rag_pool.acquire(exclude=task_info.get('rag_endpoint'))
+            if not rag_url:
+                return
+            hedge_doc = doc_info
+        
+        conn_key = connection_key(hedge_doc['connection_id']) if hedge_doc.get('connection_id') else None
+        if conn_key and not self.breakers.allow_request(conn_key):
+            self.rag_pool.release_url(rag_url, cancel_probe=True)
+            return
+        
+        direct = rag_url is None and self.direct.enabled and \
+            self.direct.is_direct(hedge_doc.get('connection_id'), hedge_doc.get('connection_details'))
+        hedge_id = self.direct.submit(hedge_doc) if direct else None
+        if not hedge_id:
+            direct = False
+            rag_url = rag_url or self.rag_pool.acquire()
+            hedge_id = self._submit_document_to_rag(hedge_doc, rag_url) if rag_url else None
+            if not hedge_id:
+                if conn_key:
+                    self.breakers.get(conn_key).cancel_request()
+                if rag_url:
+                    self.rag_pool.release_url(rag_url)
+                    status_code = self.last_submit_error.get('status_code')
+                    if status_code and status_code < 500:
+                        self.rag_pool.record_success(rag_url)
+                    else:
+                        self.rag_pool.record_failure(rag_url)
+                logger.warning(f"Could not hedge task {task_id}")
+                return
+            self.rag_pool.record_success(rag_url)
+            self.rag_pool.pin(hedge_id, rag_url)
+        
+        self.active_tasks[hedge_id] = {
+            'doc_id': task_info['doc_id'],
+            'doc_ids': task_info['doc_ids'],
+            'batch_id': task_info['batch_id'],
+            'submitted_at': datetime.now(),
+            'document_id': task_info['document_id'],
+            'connection_id': hedge_doc.get('connection_id'),
+            'rag_endpoint': rag_url,
+            'poll_count': 0,
+            'direct': direct,
+            'hedge_of': task_id
+        }
+        task_info['hedge_task_id'] = hedge_id
+        self.hedging.record_hedge()
+        logger.info(f"⤳ Task {task_id} running for {self._elapsed_seconds(task_info):.0f}s, "
+                    f"hedged as {hedge_id} on connection {hedge_doc.get('connection_id')}"
+                    f"{f' via {rag_url}' if rag_url else ''}")
+    
+    def _settle_hedge(self, task_id: str, task_info: Dict[str, Any], status: Dict[str, Any],
+                      completed_tasks: List[str]) -> bool:
+        """
+        Resolve a finished copy of a hedged task.
+        
+        The first successful copy wins: its partner is cancelled (direct execution) or
+        ignored and watched until it ends, and the winner is reported as usual.
+        
+        Returns:
+            bool: True if the copy failed while its partner is still running - it is
+                  dropped without reporting, the partner may still answer
+        """
+        partner_id = task_info.get('hedge_task_id') or task_info.get('hedge_of')
+        partner = self.active_tasks.get(partner_id) if partner_id else None
+        if partner is None or partner_id in completed_tasks:
+            return False
+        
+        if not status.get('success'):
+            logger.warning(f"Copy {task_id} of a hedged task failed ({status.get('error')}), waiting for {partner_id}")
+            self.hedging.record_copy_failed()
+            self._record_task_outcome(task_info, 'rag_failure' if status.get('status_code') and not task_info.get('direct')
+                                      else 'connection_failure')
+            if self.direct.owns(task_id):
+                self.direct.cancel(task_id)
+            completed_tasks.append(task_id)
+            return True
+        
+        self.hedging.record_win(hedge=bool(task_info.get('hedge_of')))
+        completed_tasks.append(partner_id)
+        if partner.get('connection_id'):
+            self.breakers.get(connection_key(partner['connection_id'])).cancel_request()
+        cancelled = self.direct.owns(partner_id)
+        if cancelled:
+            self.direct.cancel(partner_id)
+            self.hedging.record_loser()
+        else:
+            # The RAG API cannot cancel a task: it runs to its end anyway
+            self._hedge_losers[partner_id] = {'won_at': datetime.now(), 'submitted_at': partner['submitted_at']}
+        logger.info(f"Hedged task settled: {task_id} answered first, {partner_id} {'cancelled' if cancelled else 'ignored'}")
+        return False
+    
+    def _check_hedge_losers(self):
+        """Watch ignored losers of hedged tasks until they end, to measure the time the hedge saved"""
+        for task_id, loser in list(self._hedge_losers.items()):
+            if self._is_task_timeout(loser):
+                finished_at = loser['submitted_at'] + timedelta(minutes=30)
+            elif self._check_task_status(task_id).get('completed'):
+                finished_at = datetime.now()
+            else:
+                continue
+            self.hedging.record_loser((finished_at - loser['won_at']).total_seconds())
+            del self._hedge_losers[task_id]
+            self.rag_pool.release(task_id)
+    
+    def _forget_task(self, task_id: str):
+        """Stop tracking a task and any hedge copy of it"""
+        task_info = self.active_tasks.pop(task_id, None) or self.recovering_tasks.pop(task_id, None) or {}
+        self.rag_pool.release(task_id)
+        for partner_id in (task_info.get('hedge_task_id'), task_info.get('hedge_of')):
+            if partner_id and self.active_tasks.pop(partner_id, None) is not None:
+                self.rag_pool.release(partner_id)
+            
+    def _complete_packed_task(self, task_id: str, task_info: Dict[str, Any], status: Dict[str, Any]):
+        """Write each result of a multi-prompt task to its own llm_responses row"""
+        prompt_results, missing = split_prompt_results(status, task_info['doc_ids'])
+        
+        batch_service.handle_task_completion(task_id, {
+            'task_id': task_id,
+            'batch_id': task_info['batch_id'],
+            'answered_by_connection_id': task_info.get('connection_id'),
+            'prompt_results': prompt_results
+        })
+        
+        if missing:
+            # Re-queued (within the retry budget) without the task id, to be sent again
+            logger.warning(f"Task {task_id} returned {len(prompt_results)} results for {len(task_info['doc_ids'])} prompts")
+            batch_service.handle_task_failure(None, {
+                'task_id': None,
+                'doc_ids': missing,
+                'batch_id': task_info['batch_id'],
+                'error': f'RAG API returned no result for this prompt (task {task_id})',
+                'failure_class': 'transient'
+            })
+            self.stats['failed'] += len(missing)
+        
+        self._record_task_outcome(task_info, 'success')
+        self.affinity.record_completion(task_info.get('connection_id'),
+                                        status.get('response_time_ms'), status.get('load_seconds'))
+        self.stats['processed'] += len(prompt_results)
+        self.stats['cached_tokens'] += sum(r['cached_tokens'] or 0 for r in prompt_results)
+        self.stats['last_activity'] = datetime.now()
+        logger.info(f"✓ Task {task_id} completed {len(prompt_results)} prompts")
+    
+    def _record_task_outcome(self, task_info: Dict[str, Any], outcome: str):
+        """
+        Feed a finished task into the circuit breakers.
+        
+        Args:
+            task_info: Tracked task (connection_id is missing for reclaimed tasks)
+            outcome: 'success', 'connection_failure' or 'rag_failure'
+        """
+        rag_key = rag_endpoint_key(task_info.get('rag_endpoint') or self.rag_api_url)
+        conn_key = connection_key(task_info['connection_id']) if task_info.get('connection_id') else None
+        
+        if task_info.get('direct'):
+            # Ran in-process: the outcome says nothing about the RAG API
+            if conn_key:
+                if outcome == 'success':
+                    self.breakers.record_success(conn_key)
+                else:
+                    self.breakers.record_failure(conn_key)
+            return
+        
+        if outcome == 'rag_failure':
+            self.breakers.record_failure(rag_key)
+            if conn_key:
+                self.breakers.get(conn_key).cancel_request()
+            return
+        
+        self.breakers.record_success(rag_key)
+        if conn_key:
+            if outcome == 'success':
+                self.breakers.record_success(conn_key)
+            else:
+                self.breakers.record_failure(conn_key)
             
     def _check_task_status(self, task_id: str) -> Dict[str, Any]:
         """Check status of a specific task"""
+        if self.direct.owns(task_id):
+            return self.direct.poll(task_id)
         try:
+            # Polled on the instance that accepted the task
             response = requests.get(
-                f"{self.rag_api_url}/task_status/{task_id}",
+                f"{self.rag_pool.url_for_task(task_id)}/task_status/{task_id}",
                 timeout=30  # Increased from 10 to 30 seconds
             )
             
@@ -393,8 +1005,14 @@ class BatchQueueProcessor:
                         'response_text': analysis.get('analysis', ''),
                         'input_tokens': analysis.get('input_tokens', 0),
                         'output_tokens': analysis.get('output_tokens', 0),
+                        'cached_tokens': extract_cached_tokens(analysis),
                         'response_time_ms': int(analysis.get('time_taken_seconds', 0) * 1000),
                         'overall_score': analysis.get('overall_score'),
+                        **extract_stream_metrics(analysis),
+                        # Ollama reports model load time in nanoseconds
+                        'load_seconds': (analysis.get('load_duration') or 0) / 1e9 or None,
+                        # One entry per prompt of a multi-prompt request, in submission order
+                        'results': data.get('results') or result.get('results') or analysis.get('results') or [],
                         'raw_data': data
                     }
                 elif status == 'failed':
@@ -415,7 +1033,8 @@ class BatchQueueProcessor:
                 return {
                     'completed': True,
                     'success': False,
-                    'error': 'Task not found on RAG API (404)'
+                    'error': 'Task not found on RAG API (404)',
+                    'status_code': 404
                 }
             elif response.status_code in [400, 500, 502, 503]:
                 # Client/server errors - treat as failure
@@ -423,7 +1042,8 @@ class BatchQueueProcessor:
                 return {
                     'completed': True,
                     'success': False,
-                    'error': f'RAG API error ({response.status_code}): {response.text[:200]}'
+                    'error': f'RAG API error ({response.status_code}): {response.text[:200]}',
+                    'status_code': response.status_code
                 }
             else:
                 # Other status codes - continue polling (might be temporary)
@@ -445,9 +1065,35 @@ class BatchQueueProcessor:
             'is_running': self.is_running,
             'check_interval': self.check_interval,
             'max_concurrent': self.max_concurrent,
+            'max_prompts_per_request': self.max_prompts_per_request,
+            'job_order': self.job_order,
             'active_tasks': len(self.active_tasks),
             'stats': self.stats.copy(),
-            'rag_api_url': self.rag_api_url
+            'rag_api_url': self.rag_api_url,
+            'worker': self.lease.get_status(),
+            'scheduler': self.scheduler.get_status(),
+            'circuit_breakers': self.breakers.get_status(),
+            'model_affinity': self.affinity.get_status(),
+            'direct_execution': self.direct.get_status(),
+            'provider_batches': self.provider_batches.get_status(),
+            'rag_pool': self.rag_pool.get_status(),
+            'hedging': self.hedging.get_status(),
+            'cost_model': self.cost_model.get_status(),
+            'recovery': self.get_recovery_status()
+        }
+    
+    def get_recovery_status(self) -> Dict[str, Any]:
+        """Startup recovery totals of this process and progress re-verifying adopted tasks"""
+        from services.startup_recovery import startup_recovery
+        report = {
+            key: value for key, value in startup_recovery.last_report.items()
+            if key not in ('batches', 'responses')
+        }
+        return {
+            'startup_recovery': report,
+            'pending_verification': len(self.recovering_tasks),
+            'verified': self.stats['recovery_verified'],
+            'verify_per_cycle': self.recovery_verify_per_cycle
         }
 
     def process_stuck_items(self, stuck_threshold_minutes=30):
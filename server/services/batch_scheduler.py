@@ -0,0 +1,172 @@
+"""
+Batch Scheduler
+
+Decides which ready batch the queue processor claims its next document from.
+
+- Each batch has a priority (Batch.priority); its weight is 2 ** priority
+- Batches at or above URGENT_PRIORITY are served before all other batches
+- Weight is shared fairly across owners (Batch.submitted_by), so a user with
+  ten batches does not get ten times the throughput of a user with one
+- Claims are spread with smooth weighted round-robin, so a giant batch can no
+  longer starve the small batches queued behind it
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OWNER = 'default'
+
+
+class BatchScheduler:
+    """Weighted fair-share scheduler across batches and their owners"""
+
+    MIN_PRIORITY = 0
+    MAX_PRIORITY = 10
+    URGENT_PRIORITY = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches: Dict[int, Dict[str, Any]] = {}  # batch_id -> scheduling entry
+        self._current_weights: Dict[int, float] = {}  # smooth WRR state, survives across rounds
+
+    @classmethod
+    def normalize_priority(cls, priority: Any) -> int:
+        """Clamp a user supplied priority into the supported range"""
+        try:
+            value = int(priority)
+        except (TypeError, ValueError):
+            return cls.MIN_PRIORITY
+        return max(cls.MIN_PRIORITY, min(cls.MAX_PRIORITY, value))
+
+    @classmethod
+    def priority_weight(cls, priority: Any) -> float:
+        """Weight of a batch with the given priority (each level doubles the share)"""
+        return float(2 ** cls.normalize_priority(priority))
+
+    def update(self, ready_batches: Iterable[Dict[str, Any]]) -> None:
+        """
+        Refresh the set of schedulable batches.
+
+        Args:
+            ready_batches: Batch dicts from BatchService.get_batches_ready_for_processing()
+        """
+        now = datetime.now()
+        with self._lock:
+            seen = set()
+            for batch in ready_batches:
+                batch_id = batch['batch_id']
+                seen.add(batch_id)
+                entry = self._batches.get(batch_id)
+                if entry is None:
+                    entry = {
+                        'batch_id': batch_id,
+                        'ready_since': now,
+                        'first_dispatch_at': None,
+                        'dispatched': 0
+                    }
+                    self._batches[batch_id] = entry
+                    self._current_weights.setdefault(batch_id, 0.0)
+
+                entry['batch_name'] = batch.get('batch_name')
+                entry['priority'] = self.normalize_priority(batch.get('priority'))
+                entry['owner'] = batch.get('submitted_by') or DEFAULT_OWNER
+                entry['queued_count'] = batch.get('queued_count')
+                entry['oldest_queued_at'] = batch.get('oldest_queued_at')
+
+            # Forget batches that are no longer ready
+            for batch_id in list(self._batches.keys()):
+                if batch_id not in seen:
+                    del self._batches[batch_id]
+                    self._current_weights.pop(batch_id, None)
+
+            self._recompute_weights()
+
+    def _recompute_weights(self) -> None:
+        """Split each owner's share across their batches in proportion to priority"""
+        owners: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self._batches.values():
+            owners.setdefault(entry['owner'], []).append(entry)
+
+        for entries in owners.values():
+            weights = [self.priority_weight(e['priority']) for e in entries]
+            owner_total = sum(weights)
+            # An owner's share is as large as their most important batch
+            owner_share = max(weights)
+            for entry, weight in zip(entries, weights):
+                entry['weight'] = owner_share * weight / owner_total
+
+    def next_batch(self, exclude: Optional[Iterable[int]] = None) -> Optional[int]:
+        """
+        Pick the batch to claim the next document from.
+
+        Args:
+            exclude: Batch ids that have nothing left to claim in this round
+
+        Returns:
+            The selected batch id, or None when no batch is eligible
+        """
+        excluded = set(exclude or [])
+        with self._lock:
+            candidates = [e for e in self._batches.values() if e['batch_id'] not in excluded]
+            if not candidates:
+                return None
+
+            # Urgent batches preempt everything else
+            urgent = [e for e in candidates if e['priority'] >= self.URGENT_PRIORITY]
+            if urgent:
+                candidates = urgent
+
+            total = sum(e['weight'] for e in candidates)
+            selected = None
+            for entry in candidates:
+                batch_id = entry['batch_id']
+                self._current_weights[batch_id] = self._current_weights.get(batch_id, 0.0) + entry['weight']
+                if selected is None or self._current_weights[batch_id] > self._current_weights[selected['batch_id']]:
+                    selected = entry
+
+            self._current_weights[selected['batch_id']] -= total
+            return selected['batch_id']
+
+    def record_dispatch(self, batch_id: int) -> None:
+        """Record that a document from the batch was claimed"""
+        with self._lock:
+            entry = self._batches.get(batch_id)
+            if not entry:
+                return
+            entry['dispatched'] += 1
+            if entry['first_dispatch_at'] is None:
+                entry['first_dispatch_at'] = datetime.now()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get scheduling state and queue wait time per batch"""
+        now = datetime.now()
+        with self._lock:
+            total_weight = sum(e.get('weight', 0) for e in self._batches.values()) or 1.0
+            batches = []
+            for entry in sorted(self._batches.values(), key=lambda e: (-e['priority'], e['batch_id'])):
+                oldest_queued_at = entry.get('oldest_queued_at')
+                first_dispatch_at = entry['first_dispatch_at']
+                batches.append({
+                    'batch_id': entry['batch_id'],
+                    'batch_name': entry.get('batch_name'),
+                    'priority': entry['priority'],
+                    'urgent': entry['priority'] >= self.URGENT_PRIORITY,
+                    'owner': entry['owner'],
+                    'weight': round(entry.get('weight', 0), 3),
+                    'share': round(entry.get('weight', 0) / total_weight, 3),
+                    'queued_count': entry.get('queued_count'),
+                    'dispatched': entry['dispatched'],
+                    'queue_wait_seconds': round((now - oldest_queued_at).total_seconds(), 1) if oldest_queued_at else None,
+                    'time_to_first_dispatch_seconds': round((first_dispatch_at - entry['ready_since']).total_seconds(), 1) if first_dispatch_at else None,
+                    'ready_since': entry['ready_since'].isoformat()
+                })
+
+        return {
+            'policy': 'weighted_fair_share',
+            'urgent_priority': self.URGENT_PRIORITY,
+            'batches': batches
+        }
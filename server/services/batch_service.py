@@ -15,13 +15,22 @@ from datetime import datetime
 from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.sql import func
 from sqlalchemy import and_, or_
-from models import Batch, Document, Folder, Connection, Prompt, Model, LlmProvider
+from models import Batch, Document, Folder, Connection, Prompt, Model, LlmProvider, BatchSnapshotDocument
 from database import Session
-from services.document_encoding_service import DocumentEncodingService
+from services.batch_scheduler import BatchScheduler
+from services.worker_lease import worker_lease
 from utils.llm_config_formatter import format_llm_config_for_rag_api
+from services.config_lookup import config_lookup
+from services.retry_policy import retry_policy
+from services.provider_batches import provider_batches, EXECUTION_MODES
+from services.rag_pool import rag_endpoint_pool
+from services.cost_model import job_cost_model
+from services.connection_snapshots import connection_snapshots
+from services.staging_jobs import StagingJobLost
 import os
 import psycopg2
 import base64
+import hashlib
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +59,9 @@ class BatchService:
         'FAILED_STAGING': ['STAGING']  # Can retry staging
     }
     
+    # llm_responses statuses a selective rerun may reset; QUEUED/PROCESSING rows are already pending
+    RERUNNABLE_STATUSES = ('COMPLETED', 'FAILED', 'TIMEOUT')
+
     # Actions that can be requested
     BATCH_ACTIONS = {
         'stage': 'Prepare batch for processing',
@@ -122,6 +134,12 @@ class BatchService:
                 result['new_state'] = new_state
             
             session.commit()
+            
+            # Staging jobs run outside the request, once the job row is committed
+            if result.get('staging_job_id'):
+                from services.staging_jobs import staging_jobs
+                staging_jobs.start(result['staging_job_id'])
+            
             return result
             
         except Exception as e:
@@ -220,7 +238,9 @@ class BatchService:
             return 0
 
     def _action_stage(self, batch: Batch, context: Optional[Dict[str, Any]], session) -> Dict[str, Any]:
-        """Handle stage action - prepare documents"""
+        """Handle stage action - queue a background staging job (started once the transition commits)"""
+        from services.staging_jobs import staging_jobs
+        
         batch.status = 'STAGING'
         session.flush()
         
@@ -228,31 +248,15 @@ class BatchService:
         connection_ids = batch.config_snapshot.get('connection_ids', [])
         prompt_ids = batch.config_snapshot.get('prompt_ids', [])
         
-        # Use existing staging logic
-        encoding_service = DocumentEncodingService()
-        staging_result = self._perform_staging(
-            session, 
-            batch.id, 
-            batch.folder_ids or [], 
-            connection_ids, 
-            prompt_ids, 
-            encoding_service
-        )
+        # Resumes after the checkpoint of an interrupted job unless a reset or restage superseded it
+        job = staging_jobs.create_job(session, batch.id, batch.folder_ids or [], connection_ids, prompt_ids)
         
-        if staging_result['success']:
-            batch.status = 'STAGED'
-            return {
-                'success': True,
-                'message': f'Batch staged successfully',
-                'total_documents': staging_result['total_documents'],
-                'total_responses': staging_result['total_responses']
-            }
-        else:
-            batch.status = 'FAILED_STAGING'
-            return {
-                'success': False,
-                'error': staging_result.get('error', 'Staging failed')
-            }
+        return {
+            'success': True,
+            'message': 'Batch staging started',
+            'batch_id': batch.id,
+            'staging_job_id': job.id
+        }
     
     def _action_run(self, batch: Batch, context: Optional[Dict[str, Any]], session) -> Dict[str, Any]:
         """Handle run action - start processing"""
@@ -382,6 +386,10 @@ class BatchService:
         for doc in documents:
             doc.batch_id = None
         
+        # The next stage starts over instead of resuming an earlier job's checkpoint
+        from services.staging_jobs import staging_jobs
+        staging_jobs.supersede_checkpoints(session, batch.id)
+        
         return {
             'success': True,
             'message': 'Batch reset to saved state',
@@ -391,6 +399,9 @@ class BatchService:
     
     def _action_cancel(self, batch: Batch, context: Optional[Dict[str, Any]], session) -> Dict[str, Any]:
         """Handle cancel action - stop active processing"""
+        if batch.status == 'STAGING':
+            return self._cancel_staging(batch, session)
+        
         try:
             import psycopg2
             kb_conn = psycopg2.connect(
@@ -414,6 +425,10 @@ class BatchService:
             kb_cursor.close()
             kb_conn.close()
             
+            # Rows already handed to a provider batch API fail once its cancellation lands
+            if batch.execution_mode == 'provider_batch':
+                cancelled_count += provider_batches.cancel(batch.id)
+            
             batch.status = 'FAILED'
             batch.completed_at = func.now()
             
@@ -429,6 +444,28 @@ class BatchService:
                 'error': f'Failed to cancel: {str(e)}'
             }
     
+    def _cancel_staging(self, batch: Batch, session) -> Dict[str, Any]:
+        """Cancel a batch's staging job; the job returns the batch to SAVED when it stops"""
+        from services.staging_jobs import staging_jobs
+        
+        # Release the batch row lock so the job can settle the batch status
+        session.commit()
+        job = staging_jobs.cancel(batch.id)
+        if not job:
+            # Nothing is staging this batch (interrupted before jobs existed)
+            batch.status = 'SAVED'
+            return {
+                'success': True,
+                'message': 'Batch had no active staging job and was returned to saved state'
+            }
+        
+        session.refresh(batch)
+        return {
+            'success': True,
+            'message': 'Staging cancelled' if job['status'] == 'CANCELLED' else 'Staging will stop after the current chunk',
+            'staging_job': job
+        }
+    
     def _action_restage(self, batch: Batch, context: Optional[Dict[str, Any]], session) -> Dict[str, Any]:
         """Handle restage action - prepare for reprocessing"""
         # Clear existing staging data
@@ -458,6 +495,10 @@ class BatchService:
         batch.completed_at = None
         batch.processed_documents = 0
         
+        # The rows earlier jobs staged are gone, so none of their checkpoints may be resumed
+        from services.staging_jobs import staging_jobs
+        staging_jobs.supersede_checkpoints(session, batch.id)
+        
         # Now stage again
         return self._action_stage(batch, context, session)
     
@@ -468,6 +509,13 @@ class BatchService:
         Args:
             task_id: The completed task ID
             result_data: Dict containing task results including response_text, tokens, etc.
+                         A multi-prompt task adds 'prompt_results': one dict per llm_responses
+                         row ({'response_id', 'response_text', 'input_tokens', 'output_tokens',
+                         'cached_tokens', 'response_time_ms', 'overall_score', 'raw_result'}),
+                         each written to its own row. Streaming executors add
+                         'time_to_first_token_ms', 'inter_token_latency_ms' and 'tokens_per_second'.
+                         'answered_by_connection_id' is the connection that produced the result
+                         (another connection than the row's when a hedge copy answered first).
             
         Returns:
             Dict with success status
@@ -483,6 +531,49 @@ class BatchService:
             )
             kb_cursor = kb_conn.cursor()
             
+            if result_data.get('prompt_results'):
+                for prompt_result in result_data['prompt_results']:
+                    kb_cursor.execute("""
+                        UPDATE llm_responses 
+                        SET status = 'COMPLETED',
+                            response_text = %s,
+                            response_json = %s,
+                            input_tokens = %s,
+                            output_tokens = %s,
+                            cached_tokens = %s,
+                            response_time_ms = %s,
+                            time_to_first_token_ms = %s,
+                            inter_token_latency_ms = %s,
+                            tokens_per_second = %s,
+                            overall_score = %s,
+                            answered_by_connection_id = %s,
+                            completed_processing_at = NOW(),
+                            claimed_by = NULL,
+                            lease_expires_at = NULL
+                        WHERE id = %s AND task_id = %s
+                    """, (
+                        prompt_result.get('response_text', ''),
+                        json.dumps(prompt_result.get('raw_result', {})),
+                        prompt_result.get('input_tokens', 0),
+                        prompt_result.get('output_tokens', 0),
+                        prompt_result.get('cached_tokens'),
+                        prompt_result.get('response_time_ms', 0),
+                        prompt_result.get('time_to_first_token_ms'),
+                        prompt_result.get('inter_token_latency_ms'),
+                        prompt_result.get('tokens_per_second'),
+                        prompt_result.get('overall_score'),
+                        result_data.get('answered_by_connection_id'),
+                        prompt_result['response_id'],
+                        task_id
+                    ))
+                
+                kb_conn.commit()
+                kb_cursor.close()
+                kb_conn.close()
+                
+                self._check_batch_completion(result_data.get('batch_id'))
+                return {'success': True}
+            
             # Update the llm_response with results
             kb_cursor.execute("""
                 UPDATE llm_responses 
@@ -491,17 +582,29 @@ class BatchService:
                     response_json = %s,
                     input_tokens = %s,
                     output_tokens = %s,
+                    cached_tokens = %s,
                     response_time_ms = %s,
+                    time_to_first_token_ms = %s,
+                    inter_token_latency_ms = %s,
+                    tokens_per_second = %s,
                     overall_score = %s,
-                    completed_processing_at = NOW()
+                    answered_by_connection_id = %s,
+                    completed_processing_at = NOW(),
+                    claimed_by = NULL,
+                    lease_expires_at = NULL
                 WHERE task_id = %s
             """, (
                 result_data.get('response_text', ''),
                 json.dumps(result_data.get('raw_response', {})),
                 result_data.get('input_tokens', 0),
                 result_data.get('output_tokens', 0),
+                result_data.get('cached_tokens'),
                 result_data.get('response_time_ms', 0),
+                result_data.get('time_to_first_token_ms'),
+                result_data.get('inter_token_latency_ms'),
+                result_data.get('tokens_per_second'),
                 result_data.get('overall_score'),
+                result_data.get('answered_by_connection_id'),
                 task_id
             ))
             
@@ -522,12 +625,17 @@ class BatchService:
         """
         Handle task failure from queue processor
         
+        Transient and rate-limited failures are re-queued with backoff (see
+        services/retry_policy.py) while the row and batch have retries left;
+        everything else marks the row FAILED.
+        
         Args:
             task_id: The failed task ID (can be None if submission failed)
-            error_data: Dict containing error information
+            error_data: Dict containing error information (error, and optionally
+                        status_code / failure_class to help classification)
             
         Returns:
-            Dict with success status
+            Dict with success status and whether the row was re-queued
         """
         try:
             import psycopg2
@@ -540,24 +648,70 @@ class BatchService:
             )
             kb_cursor = kb_conn.cursor()
             
+            error_message = error_data.get('error', 'Unknown error')
             if task_id:
-                # Update by task_id
-                kb_cursor.execute("""
-                    UPDATE llm_responses 
-                    SET status = 'FAILED',
-                        error_message = %s,
-                        completed_processing_at = NOW()
-                    WHERE task_id = %s
-                """, (error_data.get('error', 'Unknown error'), task_id))
+                row_filter, row_key = "task_id = %s", task_id
+            elif error_data.get('doc_ids'):
+                # Rows of a multi-prompt request that was never submitted
+                row_filter, row_key = "id = ANY(%s)", list(error_data['doc_ids'])
             else:
                 # Update by doc_id if no task_id
+                row_filter, row_key = "id = %s", error_data.get('doc_id')
+            
+            kb_cursor.execute(f"""
+                SELECT id, batch_id, COALESCE(attempt_count, 0)
+                FROM llm_responses
+                WHERE {row_filter}
+                ORDER BY id
+                FOR UPDATE
+            """, (row_key,))
+            # A multi-prompt task owns one row per prompt; each gets its own retry decision
+            rows = kb_cursor.fetchall()
+            
+            def load_batch_usage(batch_id):
                 kb_cursor.execute("""
-                    UPDATE llm_responses 
-                    SET status = 'FAILED',
-                        error_message = %s,
-                        completed_processing_at = NOW()
-                    WHERE id = %s
-                """, (error_data.get('error', 'Unknown error'), error_data.get('doc_id')))
+                    SELECT COALESCE(SUM(attempt_count), 0), COUNT(*)
+                    FROM llm_responses
+                    WHERE batch_id = %s
+                """, (batch_id,))
+                return tuple(kb_cursor.fetchone())
+            
+            failure_class = retry_policy.classify(error_data)
+            decision = {'retry': False, 'reason': 'response not found'}
+            retried = 0
+            for response_id, batch_id, attempt_count in rows:
+                # The batch-wide count is cached, not rescanned on every failure
+                batch_retries_used, batch_total = retry_policy.batch_usage(
+                    batch_id, lambda: load_batch_usage(batch_id)
+                )
+                decision = retry_policy.decide(failure_class, attempt_count, batch_retries_used, batch_total)
+                
+                if decision['retry']:
+                    retry_policy.record_retry(batch_id)
+                    retried += 1
+                    kb_cursor.execute("""
+                        UPDATE llm_responses 
+                        SET status = 'QUEUED',
+                            attempt_count = COALESCE(attempt_count, 0) + 1,
+                            next_attempt_at = NOW() + make_interval(secs => %s),
+                            error_message = %s,
+                            task_id = NULL,
+                            started_processing_at = NULL,
+                            claimed_by = NULL,
+                            lease_expires_at = NULL
+                        WHERE id = %s
+                    """, (decision['delay_seconds'], f"[{decision['reason']}] {error_message}", response_id))
+                    logger.info(f"🔁 Re-queued llm_response {response_id} in {decision['delay_seconds']:.0f}s: {decision['reason']}")
+                else:
+                    kb_cursor.execute("""
+                        UPDATE llm_responses 
+                        SET status = 'FAILED',
+                            error_message = %s,
+                            completed_processing_at = NOW(),
+                            claimed_by = NULL,
+                            lease_expires_at = NULL
+                        WHERE id = %s
+                    """, (f"[{failure_class}: {decision['reason']}] {error_message}", response_id))
             
             kb_conn.commit()
             kb_cursor.close()
@@ -566,7 +720,14 @@ class BatchService:
             # Check if batch is complete
             self._check_batch_completion(error_data.get('batch_id'))
             
-            return {'success': True}
+            return {
+                'success': True,
+                'retried': retried > 0,
+                'rows': len(rows),
+                'rows_retried': retried,
+                'failure_class': failure_class,
+                'reason': decision['reason']
+            }
             
         except Exception as e:
             logger.error(f"Error handling task failure: {e}")
@@ -628,13 +789,16 @@ class BatchService:
 
     def _create_config_snapshot(self, folder_ids: List[int]) -> Dict[str, Any]:
         """
-        Create a complete configuration snapshot for a batch
+        Create a configuration snapshot for a batch
+
+        The document list is not embedded; it is written to batch_snapshot_documents
+        by _save_snapshot_documents once the batch has an ID.
 
         Args:
             folder_ids: List of folder IDs to include in the snapshot
 
         Returns:
-            Dict containing complete configuration state
+            Dict containing the configuration state and document counts
         """
         session = Session()
         try:
@@ -674,7 +838,7 @@ class BatchService:
 
             # Get folders data
             folders_data = []
-            documents_data = []
+            total_documents = 0
 
             if folder_ids:
                 folders = session.query(Folder).filter(Folder.id.in_(folder_ids)).all()
@@ -688,38 +852,27 @@ class BatchService:
                     }
                     folders_data.append(folder_data)
 
-                    # Get validated documents from preprocessing instead of scanning
-                    # This ensures only properly validated files are included
-                    validated_docs = session.query(Document).filter(
-                        Document.folder_id == folder.id,
-                        Document.valid == 'Y'  # Only include valid documents
-                    ).all()
-                    
-                    for doc in validated_docs:
-                        documents_data.append({
-                            'filepath': doc.filepath,
-                            'filename': doc.filename,
-                            'folder_id': folder.id,
-                            'relative_path': os.path.relpath(doc.filepath, folder.folder_path) if folder.folder_path else doc.filename,
-                            'file_size': doc.meta_data.get('file_size', 0) if doc.meta_data else 0,
-                            'document_id': doc.id,
-                            'discovered_at': doc.created_at.isoformat() if doc.created_at else datetime.now().isoformat()
-                        })
+                # Only count validated documents from preprocessing; the list itself
+                # goes to batch_snapshot_documents
+                total_documents = session.query(func.count(Document.id)).filter(
+                    Document.folder_id.in_(folder_ids),
+                    Document.valid == 'Y'
+                ).scalar() or 0
 
-            # Create the complete snapshot
+            # Create the snapshot
             config_snapshot = {
-                'version': '1.0',
+                'version': '2.0',
                 'created_at': datetime.now().isoformat(),
                 'connections': connections_data,
                 'prompts': prompts_data,
                 'folders': folders_data,
-                'documents': documents_data,
+                'documents_storage': 'batch_snapshot_documents',
                 'summary': {
                     'total_connections': len(connections_data),
                     'total_prompts': len(prompts_data),
                     'total_folders': len(folders_data),
-                    'total_documents': len(documents_data),
-                    'expected_combinations': len(connections_data) * len(prompts_data) * len(documents_data)
+                    'total_documents': total_documents,
+                    'expected_combinations': len(connections_data) * len(prompts_data) * total_documents
                 }
             }
 
@@ -729,6 +882,106 @@ class BatchService:
         finally:
             session.close()
 
+    def _save_snapshot_documents(self, session, batch_id: int, folder_ids: List[int]) -> int:
+        """
+        Write the snapshot document list of a batch to batch_snapshot_documents
+
+        Documents are streamed from the folders and inserted in chunks, so large
+        batches never hold the whole list in memory.
+
+        Args:
+            session: Open session; the caller commits
+            batch_id: ID of the (flushed) batch
+            folder_ids: Folders included in the snapshot
+
+        Returns:
+            Number of documents written
+        """
+        if not folder_ids:
+            return 0
+
+        chunk_size = 1000
+        written = 0
+        rows = []
+
+        folder_paths = dict(session.query(Folder.id, Folder.folder_path).filter(Folder.id.in_(folder_ids)).all())
+        documents = session.query(
+            Document.id, Document.filepath, Document.filename, Document.folder_id,
+            Document.meta_data, Document.created_at
+        ).filter(
+            Document.folder_id.in_(folder_ids),
+            Document.valid == 'Y'  # Only include valid documents
+        ).order_by(Document.id).yield_per(chunk_size)
+
+        for doc in documents:
+            folder_path = folder_paths.get(doc.folder_id)
+            rows.append({
+                'batch_id': batch_id,
+                'document_id': doc.id,
+                'folder_id': doc.folder_id,
+                'filepath': doc.filepath,
+                'filename': doc.filename,
+                'relative_path': os.path.relpath(doc.filepath, folder_path) if folder_path else doc.filename,
+                'file_size': doc.meta_data.get('file_size', 0) if doc.meta_data else 0,
+                'discovered_at': doc.created_at or datetime.now()
+            })
+            if len(rows) >= chunk_size:
+                session.execute(BatchSnapshotDocument.__table__.insert(), rows)
+                written += len(rows)
+                rows = []
+
+        if rows:
+            session.execute(BatchSnapshotDocument.__table__.insert(), rows)
+            written += len(rows)
+
+        logger.info(f"Saved {written} snapshot documents for batch {batch_id}")
+        return written
+
+    def get_config_snapshot_documents(self, batch_id: int, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """
+        One page of the document list of a batch's config snapshot
+
+        Args:
+            batch_id: Batch ID
+            limit: Page size
+            offset: Number of documents to skip
+
+        Returns:
+            Dict with documents and total; snapshots created before
+            batch_snapshot_documents existed are paged from the embedded list
+        """
+        session = Session()
+        try:
+            has_rows = session.query(BatchSnapshotDocument.id).filter(
+                BatchSnapshotDocument.batch_id == batch_id
+            ).first() is not None
+
+            if not has_rows:
+                batch = session.query(Batch).filter(Batch.id == batch_id).first()
+                embedded = (batch.config_snapshot or {}).get('documents', []) if batch else []
+                return {'documents': embedded[offset:offset + limit], 'total': len(embedded)}
+
+            total = session.query(func.count(BatchSnapshotDocument.id)).filter(
+                BatchSnapshotDocument.batch_id == batch_id
+            ).scalar()
+            rows = session.query(BatchSnapshotDocument).filter(
+                BatchSnapshotDocument.batch_id == batch_id
+            ).order_by(BatchSnapshotDocument.id).offset(offset).limit(limit).all()
+
+            documents = [{
+                'filepath': row.filepath,
+                'filename': row.filename,
+                'folder_id': row.folder_id,
+                'relative_path': row.relative_path,
+                'file_size': row.file_size,
+                'document_id': row.document_id,
+                'discovered_at': row.discovered_at.isoformat() if row.discovered_at else None
+            } for row in rows]
+
+            return {'documents': documents, 'total': total}
+        finally:
+            session.close()
+
     def create_multi_folder_batch(self, folder_ids: List[int], batch_name: Optional[str] = None, description: Optional[str] = None, meta_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         STAGE 1: Create and prepare a new batch for processing multiple folders
@@ -779,6 +1032,7 @@ class BatchService:
 
             session.add(batch)
             session.flush()  # Get batch ID without committing
+            self._save_snapshot_documents(session, batch.id, folder_ids)
 
             logger.info(f"🔄 STAGE 1: Preparing batch #{next_batch_number} - {batch_name}")
 
@@ -1021,13 +1275,7 @@ class BatchService:
                         'meta_data': json.dumps(meta_data)
                     }
                     
-                    import requests
-                    response_raw = requests.post(
-                        "http://localhost:7001/analyze_document_with_llm",
-                        data=form_data,
-                        headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                        timeout=120
-                    )
+                    response_raw, rag_url = self._post_to_rag_api(form_data)
                     
                     if response_raw.status_code < 400:
                         # Update llm_response status to PROCESSING
@@ -1035,10 +1283,12 @@ class BatchService:
                             UPDATE llm_responses 
                             SET status = 'PROCESSING', 
                                 task_id = %s,
-                                started_processing_at = NOW()
+                                started_processing_at = NOW(),
+                                rag_endpoint = %s
                             WHERE id = %s
                         """, (
                             response_raw.json().get('task_id', ''),
+                            rag_url,
                             lr_id
                         ))
                         kb_conn.commit()
@@ -1303,13 +1553,7 @@ class BatchService:
                                 form_data = {k: v for k, v in form_data.items() if v is not None}
 
                                 # Send to RAG API as form data
-                                import requests
-                                response_raw = requests.post(
-                                    "http://localhost:7001/analyze_document_with_llm",
-                                    data=form_data,  # Use data for form encoding
-                                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                                    timeout=120
-                                )
+                                response_raw, rag_url = self._post_to_rag_api(form_data)
 
                                 # Convert to ServiceResponse format
                                 if response_raw.status_code < 400:
@@ -1348,6 +1592,8 @@ class BatchService:
                                     task_id = response.data.get('task_id')
                                     if task_id:
                                         logger.info(f"📋 Task ID: {task_id}")
+                                        # Status polls go to the instance that accepted the task
+                                        rag_endpoint_pool.adopt(task_id, rag_url)
                                         
                                         # Create llm_responses record in KnowledgeDocuments database
                                         try:
@@ -1462,7 +1708,6 @@ class BatchService:
             
             # Step 1: Delete all llm_responses associated with batch from KnowledgeDocuments
             import psycopg2
-            import json
             
             kb_conn = psycopg2.connect(
                 host="studio.local",
@@ -1646,17 +1891,18 @@ class BatchService:
                         'max_tokens': connection_config.get('max_tokens')
                     }
                     
+                    snapshot_id = connection_snapshots.intern(kb_cursor, conn_details)
                     for prompt_id in prompt_ids:
                         kb_cursor.execute("""
                             INSERT INTO llm_responses 
-                            (document_id, prompt_id, connection_id, connection_details, 
+                            (document_id, prompt_id, connection_id, connection_snapshot_id, 
                              status, created_at, batch_id)
                             VALUES (%s, %s, %s, %s, %s, NOW(), %s)
                         """, (
                             kb_doc_id,
                             prompt_id,
                             conn_id,
-                            json.dumps(conn_details),
+                            snapshot_id,
                             'QUEUED',
                             batch_id
                         ))
@@ -1700,6 +1946,261 @@ class BatchService:
                 'batch_id': batch_id
             }
 
+    def selective_rerun_batch(self, batch_id: int, statuses: Optional[List[str]] = None,
+                              connection_ids: Optional[List[int]] = None, prompt_ids: Optional[List[int]] = None,
+                              changed_documents: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Rerun only part of a batch by resetting the selected llm_responses rows to QUEUED in place
+
+        Unlike rerun_batch nothing is deleted: rows that are not selected keep their results.
+        A row is selected when it matches the connection and prompt filters (if given) and
+        either has one of `statuses` or belongs to a document whose content changed. With
+        neither `statuses` nor `changed_documents`, every finished row matching the filters
+        is selected.
+
+        Args:
+            batch_id: ID of the batch
+            statuses: Row statuses to rerun, e.g. ['FAILED', 'TIMEOUT']
+            connection_ids: Only rerun rows of these connections
+            prompt_ids: Only rerun rows of these prompts
+            changed_documents: Rerun documents whose file content hash differs from the staged copy
+                               (the staged copy is refreshed unless dry_run)
+            dry_run: Only report what would be rerun
+
+        Returns:
+            Dict with the number of calls the rerun costs and a breakdown by status and connection
+        """
+        statuses = [status.upper() for status in statuses] if statuses else []
+        invalid = [status for status in statuses if status not in self.RERUNNABLE_STATUSES]
+        if invalid:
+            return {
+                'success': False,
+                'error': f"Cannot rerun rows with status {', '.join(invalid)}. Allowed: {', '.join(self.RERUNNABLE_STATUSES)}",
+                'batch_id': batch_id
+            }
+
+        mode = 'DRY RUN' if dry_run else 'RERUN'
+        logger.info(f"🔄 SELECTIVE {mode}: batch {batch_id} statuses={statuses or 'any'} "
+                    f"connections={connection_ids or 'all'} prompts={prompt_ids or 'all'} changed_documents={changed_documents}")
+
+        session = Session()
+        kb_conn = None
+        try:
+            batch = session.query(Batch).filter(Batch.id == batch_id).first()
+            if not batch:
+                return {'success': False, 'error': f'Batch {batch_id} not found'}
+
+            if batch.status in ('SAVED', 'STAGING', 'FAILED_STAGING'):
+                return {
+                    'success': False,
+                    'error': f'Cannot rerun batch in {batch.status} state - it has no responses yet',
+                    'batch_id': batch_id
+                }
+
+            kb_conn = psycopg2.connect(
+                host="studio.local",
+                database="KnowledgeDocuments",
+                user="postgres",
+                password="prodogs03",
+                port=5432
+            )
+            kb_cursor = kb_conn.cursor()
+
+            changed = {}
+            if changed_documents:
+                documents = session.query(Document).filter(Document.batch_id == batch_id).all()
+                changed = self._find_changed_documents(kb_cursor, batch_id, documents, refresh=not dry_run)
+
+            conditions = ["batch_id = %s", "status = ANY(%s)"]
+            params = [batch_id, list(self.RERUNNABLE_STATUSES)]
+            if connection_ids:
+                conditions.append("connection_id = ANY(%s)")
+                params.append([int(c) for c in connection_ids])
+            if prompt_ids:
+                conditions.append("prompt_id = ANY(%s)")
+                params.append([int(p) for p in prompt_ids])
+
+            selectors = []
+            if statuses:
+                selectors.append("status = ANY(%s)")
+                params.append(statuses)
+            if changed_documents:
+                selectors.append("document_id = ANY(%s)")
+                params.append(list(changed.keys()))
+            if selectors:
+                conditions.append(f"({' OR '.join(selectors)})")
+
+            where = " AND ".join(conditions)
+
+            kb_cursor.execute(f"""
+                SELECT status, connection_id, COUNT(*), COUNT(DISTINCT document_id),
+                       COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0)
+                FROM llm_responses
+                WHERE {where}
+                GROUP BY status, connection_id
+            """, params)
+            breakdown = kb_cursor.fetchall()
+
+            by_status = {}
+            by_connection = {}
+            previous_tokens = 0
+            for status, conn_id, count, _, input_tokens, output_tokens in breakdown:
+                by_status[status] = by_status.get(status, 0) + count
+                by_connection[str(conn_id)] = by_connection.get(str(conn_id), 0) + count
+                previous_tokens += int(input_tokens) + int(output_tokens)
+            selected_calls = sum(by_status.values())
+
+            kb_cursor.execute("SELECT COUNT(*) FROM llm_responses WHERE batch_id = %s", (batch_id,))
+            total_responses = kb_cursor.fetchone()[0]
+
+            result = {
+                'success': True,
+                'batch_id': batch_id,
+                'dry_run': dry_run,
+                'calls': selected_calls,
+                'untouched_responses': total_responses - selected_calls,
+                'total_responses': total_responses,
+                'by_status': by_status,
+                'by_connection': by_connection,
+                'previous_tokens': previous_tokens,  # Tokens the selected rows used last time - a cost estimate
+                'changed_documents': [info['filename'] for info in changed.values()]
+            }
+
+            if dry_run:
+                kb_conn.rollback()
+                result['message'] = f'Rerun would dispatch {selected_calls} of {total_responses} calls'
+                return result
+
+            kb_cursor.execute(f"""
+                UPDATE llm_responses
+                SET status = 'QUEUED',
+                    task_id = NULL,
+                    response_text = NULL,
+                    response_json = NULL,
+                    error_message = NULL,
+                    input_tokens = NULL,
+                    output_tokens = NULL,
+                    cached_tokens = NULL,
+                    response_time_ms = NULL,
+                    time_to_first_token_ms = NULL,
+                    inter_token_latency_ms = NULL,
+                    tokens_per_second = NULL,
+                    partial_output_at = NULL,
+                    overall_score = NULL,
+                    answered_by_connection_id = NULL,
+                    rag_endpoint = NULL,
+                    started_processing_at = NULL,
+                    completed_processing_at = NULL,
+                    claimed_by = NULL,
+                    lease_expires_at = NULL,
+                    attempt_count = 0,
+                    next_attempt_at = NULL
+                WHERE {where}
+            """, params)
+            requeued = kb_cursor.rowcount
+            kb_conn.commit()
+            kb_cursor.close()
+
+            if requeued and batch.status in ('COMPLETED', 'FAILED'):
+                batch.status = 'STAGED'  # Ready to run the requeued rows
+                batch.completed_at = None
+            session.commit()
+
+            result['calls'] = requeued
+            result['status'] = batch.status
+            result['message'] = f'Requeued {requeued} of {total_responses} responses for batch {batch_id}'
+            logger.info(f"✅ SELECTIVE RERUN: {result['message']}")
+            return result
+
+        except Exception as e:
+            session.rollback()
+            if kb_conn:
+                kb_conn.rollback()
+            logger.error(f"❌ Error in selective_rerun_batch for batch {batch_id}: {e}", exc_info=True)
+            return {
+                'success': False,
+                'error': str(e),
+                'batch_id': batch_id
+            }
+        finally:
+            session.close()
+            if kb_conn:
+                kb_conn.close()
+
+    def _find_changed_documents(self, kb_cursor, batch_id: int, documents: List[Document],
+                                refresh: bool = False) -> Dict[int, Dict[str, Any]]:
+        """
+        Find batch documents whose file content differs from the staged copy in docs
+
+        Files not modified since they were staged are skipped without reading them.
+        Otherwise the SHA-256 of the file is compared with docs.content_hash (computed
+        from the stored content for rows staged before content_hash existed).
+
+        Args:
+            kb_cursor: KnowledgeDocuments cursor
+            batch_id: ID of the batch
+            documents: Documents of the batch
+            refresh: Store the new content and hash of changed documents, and backfill
+                     missing hashes of unchanged ones
+
+        Returns:
+            Dict of docs.id -> {'filename', 'content_hash'} for changed documents
+        """
+        doc_ids = {f"batch_{batch_id}_doc_{doc.id}": doc for doc in documents}
+        if not doc_ids:
+            return {}
+
+        kb_cursor.execute("""
+            SELECT id, document_id, content_hash, created_at
+            FROM docs
+            WHERE document_id = ANY(%s)
+        """, (list(doc_ids.keys()),))
+        staged = kb_cursor.fetchall()
+
+        changed = {}
+        for kb_id, doc_id, stored_hash, staged_at in staged:
+            doc = doc_ids[doc_id]
+            if not os.path.exists(doc.filepath):
+                logger.warning(f"⚠️ File not found for document: {doc.filepath}")
+                continue
+
+            file_modified = datetime.fromtimestamp(os.path.getmtime(doc.filepath))
+            if staged_at and hasattr(staged_at, 'replace'):
+                staged_at = staged_at.replace(tzinfo=None)
+            if stored_hash and staged_at and file_modified <= staged_at:
+                continue
+
+            with open(doc.filepath, 'rb') as f:
+                file_content = f.read()
+            file_hash = hashlib.sha256(file_content).hexdigest()
+
+            if not stored_hash:
+                kb_cursor.execute("SELECT content FROM docs WHERE id = %s", (kb_id,))
+                stored_content = kb_cursor.fetchone()[0]
+                if isinstance(stored_content, memoryview):
+                    stored_content = stored_content.tobytes()
+                if isinstance(stored_content, bytes):
+                    stored_content = stored_content.decode('utf-8')
+                stored_hash = hashlib.sha256(base64.b64decode(stored_content)).hexdigest()
+                if refresh and stored_hash == file_hash:
+                    kb_cursor.execute("UPDATE docs SET content_hash = %s WHERE id = %s", (file_hash, kb_id))
+
+            if stored_hash == file_hash:
+                continue
+
+            logger.info(f"📄 Document content changed: {doc.filename}")
+            changed[kb_id] = {'filename': doc.filename, 'content_hash': file_hash}
+
+            if refresh:
+                kb_cursor.execute("""
+                    UPDATE docs
+                    SET content = %s, file_size = %s, content_hash = %s, created_at = NOW()
+                    WHERE id = %s
+                """, (base64.b64encode(file_content).decode('utf-8'), len(file_content), file_hash, kb_id))
+
+        logger.info(f"📄 {len(changed)} of {len(staged)} staged documents changed")
+        return changed
+
     def create_batch(self, folder_path: str, batch_name: Optional[str] = None, description: Optional[str] = None, meta_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Create a new batch for document processing
@@ -1782,77 +2283,88 @@ class BatchService:
             documents = session.query(Document).filter(Document.batch_id == batch_id).all()
             total_documents = len(documents)
 
-            # Get ALL LLM response statistics (not just those with response times)
-            all_response_stats = session.query(
-                LlmResponse.status,
-                func.count(LlmResponse.id).label('count')
-            ).join(Document).filter(
-                Document.batch_id == batch_id
-            ).group_by(LlmResponse.status).all()
-
-            # Get timing statistics for completed responses only
-            timing_stats = session.query(
-                LlmResponse.status,
-                func.avg(LlmResponse.response_time_ms).label('avg_time'),
-                func.min(LlmResponse.response_time_ms).label('min_time'),
-                func.max(LlmResponse.response_time_ms).label('max_time')
-            ).join(Document).filter(
-                Document.batch_id == batch_id,
-                LlmResponse.response_time_ms.isnot(None)
-            ).group_by(LlmResponse.status).all()
+            # Response statistics live in KnowledgeDocuments llm_responses
+            kb_conn = psycopg2.connect(
+                host="studio.local",
+                database="KnowledgeDocuments",
+                user="postgres",
+                password="prodogs03",
+                port=5432
+            )
+            try:
+                kb_cursor = kb_conn.cursor()
+                kb_cursor.execute("""
+                    SELECT status, COUNT(*), AVG(response_time_ms), MIN(response_time_ms), MAX(response_time_ms)
+                    FROM llm_responses
+                    WHERE batch_id = %s
+                    GROUP BY status
+                """, (batch_id,))
+                status_rows = kb_cursor.fetchall()
+
+                # Per document: its rows by outcome
+                kb_cursor.execute("""
+                    SELECT d.document_id,
+                           COUNT(*),
+                           COUNT(*) FILTER (WHERE r.status = 'COMPLETED'),
+                           COUNT(*) FILTER (WHERE r.status IN ('FAILED', 'TIMEOUT')),
+                           COUNT(*) FILTER (WHERE r.status = 'PROCESSING')
+                    FROM llm_responses r
+                    LEFT JOIN docs d ON d.id = r.document_id
+                    WHERE r.batch_id = %s
+                    GROUP BY d.document_id
+                """, (batch_id,))
+                document_rows = kb_cursor.fetchall()
+                kb_cursor.close()
+            finally:
+                kb_conn.close()
 
             # Process response statistics
             status_counts = {}
             processing_times = {}
-
-            # Get all response counts (including those without timing)
-            for stat in all_response_stats:
-                status_counts[stat.status] = stat.count
-
-            # Get timing data for responses that have been processed
-            for stat in timing_stats:
-                if stat.avg_time:
-                    processing_times[stat.status] = {
-                        'avg_ms': round(stat.avg_time, 2),
-                        'min_ms': stat.min_time,
-                        'max_ms': stat.max_time
+            for status, count, avg_time, min_time, max_time in status_rows:
+                status_counts[status] = count
+                if avg_time:
+                    processing_times[status] = {
+                        'avg_ms': round(float(avg_time), 2),
+                        'min_ms': min_time,
+                        'max_ms': max_time
                     }
 
             # Calculate overall progress based on ALL responses
             total_responses = sum(status_counts.values())
-            completed_responses = status_counts.get('S', 0)  # Success
-            failed_responses = status_counts.get('F', 0)     # Failed
-            processing_responses = status_counts.get('P', 0) # Processing
-            ready_responses = status_counts.get('N', 0)      # Not started (was 'R' but should be 'N')
+            completed_responses = status_counts.get('COMPLETED', 0)
+            failed_responses = status_counts.get('FAILED', 0) + status_counts.get('TIMEOUT', 0)
+            processing_responses = status_counts.get('PROCESSING', 0)
+            ready_responses = total_responses - completed_responses - failed_responses - processing_responses
 
             # Calculate document-level progress (how many documents are fully processed)
-            # A document is considered "completed" when ALL its responses are either Success or Failed
+            # A document is considered "completed" when ALL its responses are finished
+            # and at least one of them succeeded
+            responses_by_document = {kb_document_id: (total, completed, failed, processing)
+                                     for kb_document_id, total, completed, failed, processing in document_rows}
             completed_documents = 0
             failed_documents = 0
             processing_documents = 0
             waiting_documents = 0
+            folder_responses = {}  # folder_id -> [total, completed, failed, processing]
 
             for document in documents:
-                doc_responses = session.query(LlmResponse).filter(
-                    LlmResponse.document_id == document.id
-                ).all()
-
-                if not doc_responses:
+                counts = responses_by_document.get(f"batch_{batch_id}_doc_{document.id}")
+                if not counts:
                     waiting_documents += 1
                     continue
 
-                # Check if all responses for this document are completed (S or F)
-                all_completed = all(r.status in ['S', 'F'] for r in doc_responses)
-                any_processing = any(r.status == 'P' for r in doc_responses)
+                total, completed, failed, processing = counts
+                folder_totals = folder_responses.setdefault(document.folder_id, [0, 0, 0, 0])
+                for i, value in enumerate(counts):
+                    folder_totals[i] += value
 
-                if all_completed:
-                    # Check if document has any successful responses
-                    has_success = any(r.status == 'S' for r in doc_responses)
-                    if has_success:
+                if completed + failed == total:
+                    if completed:
                         completed_documents += 1
                     else:
                         failed_documents += 1
-                elif any_processing:
+                elif processing:
                     processing_documents += 1
                 else:
                     waiting_documents += 1
@@ -1863,26 +2375,13 @@ class BatchService:
                 for folder_id in batch.folder_ids:
                     folder = session.query(Folder).filter(Folder.id == folder_id).first()
                     if folder:
-                        folder_docs = session.query(Document).filter(
-                            Document.folder_id == folder_id,
-                            Document.batch_id == batch_id
-                        ).all()
-
-                        folder_responses = session.query(LlmResponse).join(Document).filter(
-                            Document.folder_id == folder_id,
-                            Document.batch_id == batch_id
-                        ).all()
-
-                        folder_completed = len([r for r in folder_responses if r.status == 'S'])
-                        folder_failed = len([r for r in folder_responses if r.status == 'F'])
-                        folder_processing = len([r for r in folder_responses if r.status == 'P'])
-                        folder_total = len(folder_responses)
-
+                        folder_total, folder_completed, folder_failed, folder_processing = \
+                            folder_responses.get(folder_id, [0, 0, 0, 0])
                         folder_progress.append({
                             'folder_id': folder_id,
                             'folder_name': folder.folder_name,
                             'folder_path': folder.folder_path,
-                            'total_documents': len(folder_docs),
+                            'total_documents': len([d for d in documents if d.folder_id == folder_id]),
                             'total_responses': folder_total,
                             'completed': folder_completed,
                             'failed': folder_failed,
@@ -1892,7 +2391,6 @@ class BatchService:
 
             # Calculate timing statistics
             elapsed_time = None
-            estimated_completion = None
             if batch.started_at:
                 elapsed_seconds = (datetime.utcnow() - batch.started_at).total_seconds()
                 elapsed_time = {
@@ -1901,16 +2399,10 @@ class BatchService:
                     'hours': round(elapsed_seconds / 3600, 2)
                 }
 
-                # Estimate completion time based on current progress
-                if completed_responses > 0 and total_responses > completed_responses:
-                    avg_time_per_doc = elapsed_seconds / completed_responses
-                    remaining_docs = total_responses - completed_responses
-                    estimated_seconds = remaining_docs * avg_time_per_doc
-                    estimated_completion = {
-                        'seconds': int(estimated_seconds),
-                        'minutes': round(estimated_seconds / 60, 1),
-                        'hours': round(estimated_seconds / 3600, 2)
-                    }
+            # Predicted from the size, type and connection of every remaining row
+            estimated_completion = None
+            if ready_responses or processing_responses:
+                estimated_completion = self.estimate_batch_completion(batch_id)
 
             return {
                 'batch_id': batch_id,
@@ -1942,7 +2434,7 @@ class BatchService:
                 'processing_times': processing_times,
                 'folder_progress': folder_progress,
                 'performance': {
-                    'avg_processing_time_ms': processing_times.get('S', {}).get('avg_ms', 0),
+                    'avg_processing_time_ms': processing_times.get('COMPLETED', {}).get('avg_ms', 0),
                     'throughput_docs_per_minute': round(completed_documents / (elapsed_time['minutes'] if elapsed_time and elapsed_time['minutes'] > 0 else 1), 2) if elapsed_time else 0
                 }
             }
@@ -1953,6 +2445,62 @@ class BatchService:
         finally:
             session.close()
 
+    def estimate_batch_completion(self, batch_id: int, slots: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Predict when the remaining rows of a batch are done (see services/cost_model.py)
+        
+        Args:
+            batch_id: Batch ID
+            slots: Rows dispatched at the same time (default: rows PROCESSING right now,
+                   or the queue processor's max_concurrent when nothing is in flight)
+            
+        Returns:
+            Dict with seconds/minutes/hours and the remaining row counts, or None on error
+        """
+        try:
+            kb_conn = psycopg2.connect(
+                host="studio.local",
+                database="KnowledgeDocuments",
+                user="postgres",
+                password="prodogs03",
+                port=5432
+            )
+            kb_cursor = kb_conn.cursor()
+            # Totals per (status, connection, type) - the model is linear in size
+            kb_cursor.execute("""
+                SELECT r.status, r.connection_id, LOWER(d.doc_type), COUNT(*),
+                       COALESCE(SUM(d.file_size), 0), COALESCE(MAX(d.file_size), 0),
+                       COALESCE(SUM(EXTRACT(EPOCH FROM NOW() - r.started_processing_at)), 0)
+                FROM llm_responses r
+                LEFT JOIN docs d ON d.id = r.document_id
+                WHERE r.batch_id = %s
+                AND r.status IN ('QUEUED', 'PROCESSING')
+                GROUP BY r.status, r.connection_id, LOWER(d.doc_type)
+            """, (batch_id,))
+            groups = kb_cursor.fetchall()
+            kb_cursor.close()
+            kb_conn.close()
+        except Exception as e:
+            logger.error(f"Error estimating completion of batch {batch_id}: {e}")
+            return None
+        
+        queued = [(connection_id, doc_type, row_count, int(total_size), int(max_size))
+                  for status, connection_id, doc_type, row_count, total_size, max_size, _ in groups
+                  if status == 'QUEUED']
+        processing = [(connection_id, doc_type, row_count, int(total_size), float(elapsed))
+                      for status, connection_id, doc_type, row_count, total_size, _, elapsed in groups
+                      if status == 'PROCESSING']
+        queued_count = sum(group[2] for group in queued)
+        processing_count = sum(group[2] for group in processing)
+        
+        if not slots:
+            from services.batch_queue_processor import batch_queue_processor
+            slots = processing_count or batch_queue_processor.max_concurrent
+        job_cost_model.refresh()
+        estimate = job_cost_model.estimate_completion(queued, processing, slots)
+        estimate.update({'queued': queued_count, 'processing': processing_count})
+        return estimate
+
     def get_all_active_batches_progress(self) -> List[Dict[str, Any]]:
         """
         Get real-time progress for all active (processing) batches
@@ -2076,6 +2624,77 @@ class BatchService:
         finally:
             session.close()
 
+    def update_batch_priority(self, batch_id: int, priority: int, submitted_by: Optional[str] = None) -> bool:
+        """
+        Update the scheduling priority (and optionally the owner) of a batch
+
+        Args:
+            batch_id (int): ID of the batch to update
+            priority (int): New priority, higher runs sooner (>= 5 is urgent)
+            submitted_by (str, optional): Owner used for fair-share scheduling
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        session = Session()
+        try:
+            batch = session.query(Batch).filter_by(id=batch_id).first()
+            if not batch:
+                logger.error(f"Batch {batch_id} not found")
+                return False
+
+            batch.priority = BatchScheduler.normalize_priority(priority)
+            if submitted_by is not None:
+                batch.submitted_by = submitted_by
+
+            session.commit()
+            logger.info(f"Updated batch #{batch.batch_number} priority to {batch.priority}")
+            return True
+
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating batch priority {batch_id}: {e}", exc_info=True)
+            return False
+        finally:
+            session.close()
+
+    def update_batch_execution_mode(self, batch_id: int, execution_mode: str) -> bool:
+        """
+        Switch a batch between interactive requests and offline provider batch jobs
+
+        Rows already submitted either way finish where they are; the mode decides
+        how the batch's remaining QUEUED rows are sent.
+
+        Args:
+            batch_id (int): ID of the batch to update
+            execution_mode (str): 'interactive' or 'provider_batch'
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if execution_mode not in EXECUTION_MODES:
+            logger.error(f"Unknown execution mode {execution_mode!r}")
+            return False
+
+        session = Session()
+        try:
+            batch = session.query(Batch).filter_by(id=batch_id).first()
+            if not batch:
+                logger.error(f"Batch {batch_id} not found")
+                return False
+
+            batch.execution_mode = execution_mode
+            session.commit()
+            logger.info(f"Batch #{batch.batch_number} execution mode set to {execution_mode}")
+            return True
+
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating batch execution mode {batch_id}: {e}", exc_info=True)
+            return False
+        finally:
+            session.close()
+
     def pause_batch(self, batch_id: int) -> Dict[str, Any]:
         """
         Pause a batch - stops new documents from being submitted but allows current processing to continue
@@ -2332,6 +2951,10 @@ class BatchService:
             # Keep config_snapshot (the batch configuration)
             # Keep folder_ids and meta_data (the batch definition)
 
+            # The next staging starts over instead of resuming an earlier job's checkpoint
+            from services.staging_jobs import staging_jobs
+            staging_jobs.supersede_checkpoints(session, batch_id)
+
             session.commit()
 
             # Step 3: Unassign documents from this batch so they can be reassigned during next staging
@@ -2644,6 +3267,9 @@ class BatchService:
                 'batch_name': batch.batch_name,
                 'description': batch.description,
                 'status': batch.status,
+                'priority': batch.priority,
+                'submitted_by': batch.submitted_by,
+                'execution_mode': batch.execution_mode or 'interactive',
                 'created_at': batch.created_at.isoformat() if batch.created_at else None,
                 'completed_at': batch.completed_at.isoformat() if batch.completed_at else None,
                 'total_documents': document_count,
@@ -2880,6 +3506,41 @@ class BatchService:
         except Exception as e:
             logger.error(f"❌ Error checking batch completion status: {e}", exc_info=True)
 
+    def _post_to_rag_api(self, form_data: dict):
+        """
+        Submit a document to the least loaded RAG API instance
+        
+        Args:
+            form_data: Form fields for /analyze_document_with_llm
+            
+        Returns:
+            Tuple of (response, instance URL); the primary instance is used when
+            every instance is draining or has an open circuit
+        """
+        import requests
+        rag_url = rag_endpoint_pool.acquire()
+        target_url = rag_url or rag_endpoint_pool.primary_url()
+        try:
+            response = requests.post(
+                f"{target_url}/analyze_document_with_llm",
+                data=form_data,
+                headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                timeout=120
+            )
+        except Exception:
+            if rag_url:
+                rag_endpoint_pool.record_failure(rag_url)
+            raise
+        finally:
+            rag_endpoint_pool.release_url(rag_url)
+        
+        if rag_url:
+            if response.status_code >= 500:
+                rag_endpoint_pool.record_failure(rag_url)
+            else:
+                rag_endpoint_pool.record_success(rag_url)
+        return response, target_url
+
     def _start_task_polling(self, task_id: str, doc_id: int, connection_id: int, prompt_id: int, connection_details: dict) -> None:
         """
         Start background polling for a specific task to check completion status
@@ -2910,9 +3571,9 @@ class BatchService:
                     time.sleep(10)  # Poll every 10 seconds
                     attempt += 1
                     
-                    # Check task status via RAG API
+                    # Check task status via the RAG API instance that owns the task
                     response = requests.get(
-                        f"http://localhost:7001/analyze_status/{task_id}",
+                        f"{rag_endpoint_pool.url_for_task(task_id)}/analyze_status/{task_id}",
                         timeout=30
                     )
                     
@@ -3389,6 +4050,8 @@ class BatchService:
                     
                 except Exception as e:
                     logger.error(f"❌ Error updating llm_responses for timed out task {task_id}: {e}")
+            
+            rag_endpoint_pool.release(task_id)
         
         # Start polling in background thread
         polling_thread = threading.Thread(target=poll_task, daemon=True)
@@ -3397,7 +4060,9 @@ class BatchService:
 
     def save_batch(self, folder_ids: List[int], connection_ids: List[int], prompt_ids: List[int],
                    batch_name: Optional[str] = None, description: Optional[str] = None,
-                   meta_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                   meta_data: Optional[Dict[str, Any]] = None,
+                   priority: int = 0, submitted_by: Optional[str] = None,
+                   execution_mode: str = 'interactive') -> Dict[str, Any]:
         """Save batch configuration without staging (creates batch in SAVED status)"""
         logger.info(f"save_batch called for '{batch_name}' - creating batch configuration")
         
@@ -3423,6 +4088,9 @@ class BatchService:
                     description=description or f"Saved batch with {len(folder_ids)} folders, {len(connection_ids)} connections, {len(prompt_ids)} prompts",
                     folder_ids=folder_ids,
                     meta_data=meta_data,
+                    priority=BatchScheduler.normalize_priority(priority),
+                    submitted_by=submitted_by,
+                    execution_mode=execution_mode if execution_mode in EXECUTION_MODES else 'interactive',
                     config_snapshot=config_snapshot,
                     status='SAVED',  # Saved but not staged
                     total_documents=0,
@@ -3430,6 +4098,8 @@ class BatchService:
                 )
 
                 session.add(batch)
+                session.flush()
+                self._save_snapshot_documents(session, batch.id, folder_ids)
                 session.commit()
 
                 logger.info(f"✅ Created batch #{next_batch_number} - {batch_name} with SAVED status")
@@ -3464,7 +4134,9 @@ class BatchService:
 
     def stage_batch(self, folder_ids: List[int], connection_ids: List[int], prompt_ids: List[int],
                     batch_name: Optional[str] = None, description: Optional[str] = None,
-                    meta_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                    meta_data: Optional[Dict[str, Any]] = None,
+                    priority: int = 0, submitted_by: Optional[str] = None,
+                    execution_mode: str = 'interactive') -> Dict[str, Any]:
         """Create and stage a new batch (creates batch in STAGING status and prepares documents)"""
         logger.info(f"stage_batch called for '{batch_name}' with {len(folder_ids)} folders, {len(connection_ids)} connections, {len(prompt_ids)} prompts")
         
@@ -3490,6 +4162,9 @@ class BatchService:
                     description=description or f"Staged batch with {len(folder_ids)} folders, {len(connection_ids)} connections, {len(prompt_ids)} prompts",
                     folder_ids=folder_ids,
                     meta_data=meta_data,
+                    priority=BatchScheduler.normalize_priority(priority),
+                    submitted_by=submitted_by,
+                    execution_mode=execution_mode if execution_mode in EXECUTION_MODES else 'interactive',
                     config_snapshot=config_snapshot,
                     status='STAGING',
                     total_documents=0,
@@ -3497,6 +4172,8 @@ class BatchService:
                 )
 
                 session.add(batch)
+                session.flush()
+                self._save_snapshot_documents(session, batch.id, folder_ids)
                 session.commit()
                 batch_id = batch.id
                 
@@ -3523,42 +4200,20 @@ class BatchService:
                 batch.total_documents = total_assigned
                 session.commit()
                 
-                # Perform actual staging to KnowledgeDocuments database
-                encoding_service = DocumentEncodingService()
-                staging_result = self._perform_staging(session, batch_id, folder_ids, connection_ids, prompt_ids, encoding_service)
+                # Stage to KnowledgeDocuments in the background; the batch leaves STAGING when the job finishes
+                from services.staging_jobs import staging_jobs
+                job = staging_jobs.submit(batch_id, folder_ids, connection_ids, prompt_ids)
                 
-                if staging_result['success']:
-                    # Update batch status to STAGED
-                    batch.status = 'STAGED'
-                    session.commit()
-                    
-                    logger.info(f"Successfully staged batch {batch_id}: {staging_result['total_documents']} documents, {staging_result['total_responses']} responses")
-                    
-                    return {
-                        'success': True,
-                        'batch_id': batch_id,
-                        'batch_number': next_batch_number,
-                        'batch_name': batch_name,
-                        'status': 'STAGED',
-                        'total_documents': staging_result['total_documents'],
-                        'total_responses': staging_result['total_responses'],
-                        'message': f'Batch #{next_batch_number} staged successfully with {staging_result["total_documents"]} documents'
-                    }
-                else:
-                    # Update batch status to FAILED_STAGING
-                    batch.status = 'FAILED_STAGING'
-                    session.commit()
-                    
-                    logger.error(f"Staging failed for batch {batch_id}: {staging_result.get('error', 'Unknown error')}")
-                    
-                    return {
-                        'success': False,
-                        'batch_id': batch_id,
-                        'batch_number': next_batch_number,
-                        'status': 'FAILED_STAGING',
-                        'error': staging_result.get('error', 'Staging failed'),
-                        'message': f'Batch #{next_batch_number} staging failed'
-                    }
+                return {
+                    'success': True,
+                    'batch_id': batch_id,
+                    'batch_number': next_batch_number,
+                    'batch_name': batch_name,
+                    'status': 'STAGING',
+                    'job_id': job['job_id'],
+                    'total_documents': total_assigned,
+                    'message': f'Batch #{next_batch_number} is staging {total_assigned} documents in the background'
+                }
                     
             except Exception as e:
                 session.rollback()
@@ -3652,6 +4307,9 @@ class BatchService:
                 if total_assigned > 0:
                     # Update batch total_documents count
                     batch.total_documents = total_assigned
+                    # Freshly assigned documents are staged from the start
+                    from services.staging_jobs import staging_jobs
+                    staging_jobs.supersede_checkpoints(session, batch_id)
                     session.commit()
                     logger.info(f"Successfully assigned {total_assigned} documents to batch {batch_id}")
 
@@ -3697,42 +4355,21 @@ class BatchService:
             
             logger.info(f"Extracted from config: {len(connection_ids)} connections, {len(prompt_ids)} prompts")
 
-            # Use _perform_staging to actually create llm_responses
-            encoding_service = DocumentEncodingService()
-            staging_result = self._perform_staging(
-                session, 
-                batch_id, 
-                batch.folder_ids or [], 
-                connection_ids, 
-                prompt_ids, 
-                encoding_service
-            )
-
-            # Update batch status based on staging result
-            if staging_result['success']:
-                batch.status = 'STAGED'
-                final_status = 'STAGED'
-                documents_prepared = staging_result['total_documents']
-                responses_created = staging_result['total_responses']
-                logger.info(f"Batch {batch_id} staging completed - {documents_prepared} documents, {responses_created} llm_responses created")
-            else:
-                batch.status = 'FAILED_STAGING'
-                final_status = 'FAILED_STAGING'
-                documents_prepared = 0
-                responses_created = 0
-                logger.warning(f"Batch {batch_id} staging failed: {staging_result.get('error', 'Unknown error')}")
-
-            session.commit()
+            folder_ids = batch.folder_ids or []
             session.close()
 
+            # Stage in the background; existing llm_responses are kept, so the job resumes
+            # unless a reset or the document assignment above superseded the checkpoint
+            from services.staging_jobs import staging_jobs
+            job = staging_jobs.submit(batch_id, folder_ids, connection_ids, prompt_ids)
+
             return {
                 'success': True,
                 'batch_id': batch_id,
-                'documents_prepared': documents_prepared,
+                'job_id': job['job_id'],
                 'total_documents': len(documents),
-                'total_responses': responses_created,
-                'status': final_status,
-                'message': f'Batch staging completed - {documents_prepared}/{len(documents)} documents prepared, {responses_created} llm_responses created'
+                'status': 'STAGING',
+                'message': f'Batch staging started for {len(documents)} documents'
             }
 
         except Exception as e:
@@ -3748,8 +4385,25 @@ class BatchService:
 
     def _perform_staging(self, session, batch_id: int, folder_ids: List[int],
                         connection_ids: List[int], prompt_ids: List[int],
-                        encoding_service) -> Dict[str, Any]:
-        """Perform staging - prepare documents and create entries in KnowledgeDocuments"""
+                        encoding_service, job=None) -> Dict[str, Any]:
+        """
+        Perform staging - prepare documents and create entries in KnowledgeDocuments
+
+        Documents are staged in id order, STAGING_CHUNK_SIZE at a time, with one
+        KnowledgeDocuments commit per chunk and a savepoint per document so one bad
+        file does not lose the rest of its chunk. Response inserts are idempotent, so
+        re-running a chunk that was interrupted before its checkpoint is harmless.
+
+        Args:
+            job: Optional StagingJobContext (services/staging_jobs.py). Staging resumes
+                 after job.last_document_id, checkpoints after every chunk, draws file
+                 reads from the shared I/O budget and stops between chunks when the job
+                 is cancelled. StagingJobLost (another process took the job over) is
+                 raised at once, leaving the current chunk uncommitted.
+
+        Returns:
+            Dict with success, total_documents, total_responses and cancelled
+        """
         logger.info(f"Starting staging for batch {batch_id}")
         logger.info(f"Connection IDs: {connection_ids}")
         logger.info(f"Prompt IDs: {prompt_ids}")
@@ -3759,29 +4413,24 @@ class BatchService:
             # First, find and assign unassigned documents from the specified folders
             logger.info(f"Looking for unassigned documents in folders: {folder_ids}")
             
-            unassigned_documents = session.query(Document).filter(
+            assigned = session.query(Document).filter(
                 Document.folder_id.in_(folder_ids),
                 Document.batch_id.is_(None),  # Unassigned documents
                 Document.valid == 'Y'  # Only valid documents
-            ).all()
-            
-            logger.info(f"Found {len(unassigned_documents)} unassigned documents to assign to batch {batch_id}")
-            
-            # Assign these documents to the batch
-            for doc in unassigned_documents:
-                doc.batch_id = batch_id
-                logger.info(f"Assigned document {doc.id} ({doc.filename}) to batch {batch_id}")
-            
+            ).update({'batch_id': batch_id}, synchronize_session=False)
             session.commit()
             
-            # Now get all documents for this batch (including newly assigned ones)
-            documents = session.query(Document).filter(
+            logger.info(f"Assigned {assigned} unassigned documents to batch {batch_id}")
+            
+            # Only the columns needed to stage; documents are fetched a chunk at a time
+            documents_query = session.query(Document.id, Document.filename, Document.filepath).filter(
                 Document.batch_id == batch_id
-            ).all()
+            )
+            total_documents = documents_query.count()
             
-            logger.info(f"Found {len(documents)} total documents for batch {batch_id}")
+            logger.info(f"Found {total_documents} total documents for batch {batch_id}")
             
-            if not documents:
+            if not total_documents:
                 logger.warning(f"No documents found for batch {batch_id} after assignment")
                 return {
                     'success': False,
@@ -3790,6 +4439,9 @@ class BatchService:
                     'total_responses': 0
                 }
             
+            if job:
+                job.start(total_documents)
+            
             # Connect to KnowledgeDocuments database
             kb_conn = psycopg2.connect(
                 host="studio.local",
@@ -3800,150 +4452,87 @@ class BatchService:
             )
             kb_cursor = kb_conn.cursor()
             
-            documents_staged = 0
-            responses_created = 0
+            # Counters continue from the job's last checkpoint when resuming
+            last_document_id = job.last_document_id if job else None
+            documents_done = job.documents_done if job else 0
+            documents_staged = job.documents_staged if job else 0
+            responses_created = job.responses_created if job else 0
+            bytes_read = job.bytes_read if job else 0
+            cancelled = False
+            
+            if last_document_id:
+                logger.info(f"Resuming staging of batch {batch_id} after document {last_document_id} "
+                            f"({documents_done}/{total_documents} done)")
+            
+            # Snapshot each connection's details once; rows reference the snapshot by id
+            connection_snapshot_ids = {}
+            for conn_id in connection_ids:
+                conn_details = config_lookup.get_connection(conn_id)
+                if conn_details:
+                    connection_snapshot_ids[conn_id] = connection_snapshots.intern(kb_cursor, conn_details)
+                else:
+                    logger.warning(f"Connection {conn_id} not found in database")
+            kb_conn.commit()
             
-            logger.info(f"Starting to process {len(documents)} documents")
+            chunk_size = int(os.getenv('STAGING_CHUNK_SIZE', '50'))
+            job_cost_model.refresh()
             
-            for doc in documents:
-                logger.info(f"Processing document: {doc.filename} (ID: {doc.id}, Path: {doc.filepath})")
-                try:
-                    # Check if file exists
-                    if not os.path.exists(doc.filepath):
-                        logger.warning(f"File not found: {doc.filepath}")
-                        continue
-                    
-                    # Read and encode file
-                    with open(doc.filepath, 'rb') as f:
-                        file_content = f.read()
-                    
-                    # Encode to base64
-                    encoded_content = base64.b64encode(file_content).decode('utf-8')
-                    
-                    # Clean encoded content - ensure it's valid base64
-                    encoded_content = encoded_content.strip()
-                    if len(encoded_content) % 4 != 0:
-                        encoded_content += '=' * (4 - len(encoded_content) % 4)
-                    
-                    # Create document ID
-                    doc_id = f"batch_{batch_id}_doc_{doc.id}"
-                    
-                    # Check if document already exists
-                    kb_cursor.execute("SELECT id FROM docs WHERE document_id = %s", (doc_id,))
-                    existing = kb_cursor.fetchone()
-                    
-                    if existing:
-                        # Update existing document
-                        kb_cursor.execute("""
-                            UPDATE docs 
-                            SET content = %s, file_size = %s, created_at = NOW()
-                            WHERE document_id = %s
-                            RETURNING id
-                        """, (encoded_content, len(file_content), doc_id))
-                        kb_doc_id = kb_cursor.fetchone()[0]
-                        logger.info(f"Updated existing document in KnowledgeDocuments: {kb_doc_id}")
-                    else:
-                        # Insert new document
-                        kb_cursor.execute("""
-                            INSERT INTO docs (document_id, content, content_type, doc_type, file_size, encoding, created_at)
-                            VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                            RETURNING id
-                        """, (
-                            doc_id,
-                            encoded_content,
-                            'text/plain',
-                            os.path.splitext(doc.filename)[1][1:] if '.' in doc.filename else 'txt',
-                            len(file_content),
-                            'base64'
-                        ))
-                        kb_doc_id = kb_cursor.fetchone()[0]
-                        logger.info(f"Created new document in KnowledgeDocuments: {kb_doc_id}")
-                    kb_conn.commit()  # Commit after each document to avoid transaction issues
-                    documents_staged += 1
+            try:
+                while True:
+                    chunk_query = documents_query
+                    if last_document_id:
+                        chunk_query = chunk_query.filter(Document.id > last_document_id)
+                    chunk = chunk_query.order_by(Document.id).limit(chunk_size).all()
+                    if not chunk:
+                        break
                     
-                    # Create LLM response entries for each connection/prompt combination
-                    logger.info(f"Creating LLM responses for document {kb_doc_id} with {len(connection_ids)} connections and {len(prompt_ids)} prompts")
-                    for conn_id in connection_ids:
-                        # Get connection details from database
-                        connection = session.query(Connection).filter_by(id=conn_id).first()
-                        if not connection:
-                            logger.warning(f"Connection {conn_id} not found in database")
-                            continue
-                            
-                        # Get model and provider details for LLM config
-                        model_name = 'default'
-                        provider_type = 'ollama'
-                        
-                        if connection.model_id:
-                            model = session.query(Model).filter_by(id=connection.model_id).first()
-                            if model:
-                                model_name = model.display_name
-                        
-                        if connection.provider_id:
-                            provider = session.query(LlmProvider).filter_by(id=connection.provider_id).first()
-                            if provider:
-                                provider_type = provider.provider_type
-                            
-                        conn_details = {
-                            'id': connection.id,
-                            'name': connection.name,
-                            'provider_id': connection.provider_id,
-                            'model_id': connection.model_id,
-                            'model_name': model_name,
-                            'provider_type': provider_type,
-                            'api_key': connection.api_key,
-                            'base_url': connection.base_url,
-                            'port_no': connection.port_no,
-                            'connection_config': connection.connection_config
-                        }
+                    for doc in chunk:
+                        kb_cursor.execute("SAVEPOINT stage_document")
+                        try:
+                            staged = self._stage_document(kb_cursor, batch_id, doc, connection_snapshot_ids, prompt_ids, job)
+                            kb_cursor.execute("RELEASE SAVEPOINT stage_document")
+                        except StagingJobLost:
+                            # Another process resumed the job; this chunk is rolled back on close
+                            raise
+                        except Exception as e:
+                            kb_cursor.execute("ROLLBACK TO SAVEPOINT stage_document")
+                            logger.error(f"Error staging document {doc.filename}: {e}")
+                            staged = None
                         
-                        for prompt_id in prompt_ids:
-                            try:
-                                logger.info(f"Inserting llm_response: doc_id={kb_doc_id}, prompt_id={prompt_id}, conn_id={conn_id}, batch_id={batch_id}")
-                                kb_cursor.execute("""
-                                    INSERT INTO llm_responses 
-                                    (document_id, prompt_id, connection_id, connection_details, 
-                                     status, created_at, batch_id)
-                                    VALUES (%s, %s, %s, %s, %s, NOW(), %s)
-                                    RETURNING id
-                                """, (
-                                    kb_doc_id,
-                                    prompt_id,
-                                    conn_id,
-                                    json.dumps(conn_details),
-                                    'QUEUED',
-                                    batch_id
-                                ))
-                                result = kb_cursor.fetchone()
-                                if result:
-                                    kb_conn.commit()  # Commit each llm_response individually
-                                    responses_created += 1
-                                    logger.info(f"Created llm_response with id: {result[0]}")
-                                else:
-                                    kb_conn.rollback()  # Rollback if insert failed
-                                    logger.warning(f"llm_response insert returned nothing")
-                            except Exception as e:
-                                kb_conn.rollback()  # Rollback on error
-                                logger.error(f"Error inserting llm_response: {e}")
-                                logger.error(f"Values: doc_id={kb_doc_id}, prompt_id={prompt_id}, conn_id={conn_id}, batch_id={batch_id}")
+                        documents_done += 1
+                        if staged:
+                            documents_staged += 1
+                            responses_created += staged['responses_created']
+                            bytes_read += staged['bytes_read']
                     
-                except Exception as e:
-                    logger.error(f"Error staging document {doc.filename}: {e}")
-                    continue
-            
-            # Close database connection
-            kb_cursor.close()
-            kb_conn.close()
+                    kb_conn.commit()
+                    last_document_id = chunk[-1].id
+                    
+                    if job:
+                        job.checkpoint(last_document_id, documents_done, documents_staged, responses_created, bytes_read)
+                        if job.should_stop():
+                            cancelled = True
+                            logger.info(f"Staging of batch {batch_id} cancelled after document {last_document_id}")
+                            break
+            finally:
+                # Close database connection
+                kb_cursor.close()
+                kb_conn.close()
             
-            logger.info(f"Staging completed for batch {batch_id}: {documents_staged} documents, {responses_created} responses")
+            logger.info(f"Staging {'cancelled' if cancelled else 'completed'} for batch {batch_id}: "
+                        f"{documents_staged} documents, {responses_created} responses")
             
             return {
-                'success': True,
+                'success': not cancelled,
+                'cancelled': cancelled,
+                'error': 'Staging cancelled' if cancelled else None,
                 'total_documents': documents_staged,
                 'total_responses': responses_created,
                 'message': f'Successfully staged {documents_staged} documents'
             }
             
+        except StagingJobLost:
+            raise
         except Exception as e:
             logger.error(f"Error in _perform_staging: {e}")
             return {
@@ -3953,6 +4542,101 @@ class BatchService:
                 'total_responses': 0
             }
 
+    def _stage_document(self, kb_cursor, batch_id: int, doc, connection_snapshot_ids: Dict[int, int],
+                        prompt_ids: List[int], job=None) -> Optional[Dict[str, int]]:
+        """
+        Copy one document into docs and queue its llm_responses (within the caller's transaction)
+
+        Args:
+            connection_snapshot_ids: connection_snapshots id of each connection to queue rows for
+
+        Returns:
+            Dict with responses_created and bytes_read, or None if the file is missing
+        """
+        logger.debug(f"Processing document: {doc.filename} (ID: {doc.id}, Path: {doc.filepath})")
+        
+        # Check if file exists
+        if not os.path.exists(doc.filepath):
+            logger.warning(f"File not found: {doc.filepath}")
+            return None
+        
+        if job:
+            job.acquire_io(os.path.getsize(doc.filepath))
+        
+        # Read and encode file
+        with open(doc.filepath, 'rb') as f:
+            file_content = f.read()
+        
+        # Encode to base64
+        encoded_content = base64.b64encode(file_content).decode('utf-8')
+        
+        # Clean encoded content - ensure it's valid base64
+        encoded_content = encoded_content.strip()
+        if len(encoded_content) % 4 != 0:
+            encoded_content += '=' * (4 - len(encoded_content) % 4)
+        
+        # Create document ID
+        doc_id = f"batch_{batch_id}_doc_{doc.id}"
+        doc_type = os.path.splitext(doc.filename)[1][1:] if '.' in doc.filename else 'txt'
+        content_hash = hashlib.sha256(file_content).hexdigest()  # Lets selective reruns detect edited files
+        
+        # Check if document already exists
+        kb_cursor.execute("SELECT id FROM docs WHERE document_id = %s", (doc_id,))
+        existing = kb_cursor.fetchone()
+        
+        if existing:
+            # Update existing document
+            kb_cursor.execute("""
+                UPDATE docs 
+                SET content = %s, file_size = %s, content_hash = %s, created_at = NOW()
+                WHERE document_id = %s
+                RETURNING id
+            """, (encoded_content, len(file_content), content_hash, doc_id))
+            kb_doc_id = kb_cursor.fetchone()[0]
+        else:
+            # Insert new document
+            kb_cursor.execute("""
+                INSERT INTO docs (document_id, content, content_type, doc_type, file_size, encoding, content_hash, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                RETURNING id
+            """, (
+                doc_id,
+                encoded_content,
+                'text/plain',
+                doc_type,
+                len(file_content),
+                'base64',
+                content_hash
+            ))
+            kb_doc_id = kb_cursor.fetchone()[0]
+        
+        # Create LLM response entries for each connection/prompt combination, skipping
+        # the ones an interrupted run of this chunk already created
+        responses_created = 0
+        for conn_id, snapshot_id in connection_snapshot_ids.items():
+            # Claims in JOB_ORDER largest_first/shortest_first sort on this
+            predicted_cost_ms = job_cost_model.predict_ms(conn_id, doc_type, len(file_content))
+            for prompt_id in prompt_ids:
+                kb_cursor.execute("""
+                    INSERT INTO llm_responses 
+                    (document_id, prompt_id, connection_id, connection_snapshot_id, 
+                     status, created_at, batch_id, predicted_cost_ms)
+                    SELECT %s, %s, %s, %s, 'QUEUED', NOW(), %s, %s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM llm_responses
+                        WHERE batch_id = %s AND document_id = %s AND prompt_id = %s AND connection_id = %s
+                    )
+                    RETURNING id
+                """, (
+                    kb_doc_id, prompt_id, conn_id, snapshot_id, batch_id, predicted_cost_ms,
+                    batch_id, kb_doc_id, prompt_id, conn_id
+                ))
+                if kb_cursor.fetchone():
+                    responses_created += 1
+        
+        logger.debug(f"Staged document {doc.id} as {kb_doc_id} with {responses_created} llm_responses")
+        return {'responses_created': responses_created, 'bytes_read': len(file_content)}
+
     def get_staging_status(self, batch_id: int) -> Dict[str, Any]:
         """Get staging status for a batch"""
         logger.info(f"get_staging_status called for batch {batch_id}")
@@ -3971,11 +4655,21 @@ class BatchService:
             
             session.close()
             
+            # Progress and throughput of the latest staging job (files/s, MB/s, ETA)
+            from services.staging_jobs import staging_jobs
+            job = staging_jobs.get_batch_job(batch_id)
+            
+            message = f'Batch {batch_id} status: {batch.status}'
+            if job and job['status'] in ('QUEUED', 'RUNNING', 'CANCELLING'):
+                message = (f"Batch {batch_id} staging: {job['documents_done']}/{job['total_documents']} documents "
+                           f"({job['progress_percent']}%)")
+            
             return {
                 'batch_id': batch_id,
                 'status': batch.status,
                 'total_documents': batch.total_documents,
-                'message': f'Batch {batch_id} status: {batch.status}'
+                'job': job,
+                'message': message
             }
             
         except Exception as e:
@@ -3992,48 +4686,79 @@ class BatchService:
         Get all batches with STAGED status or PROCESSING status with queued documents
         
         Returns:
-            List of batch dictionaries with basic info
+            List of batch dictionaries with basic info, scheduling priority and queue depth
         """
         session = Session()
         try:
             # Query batches with STAGED or PROCESSING status
             batches = session.query(Batch).filter(
                 Batch.status.in_(['STAGED', 'PROCESSING'])
-            ).order_by(Batch.created_at.asc()).all()
+            ).order_by(Batch.priority.desc(), Batch.created_at.asc()).all()
+            
+            if not batches:
+                return []
+            
+            # Get queue depth and oldest queued row for all candidate batches in one query,
+            # per connection so the model affinity scheduler can see each model's backlog
+            queue_stats = {}
+            queued_by_connection = {}
+            queue_stats_available = True
+            try:
+                kb_conn = psycopg2.connect(
+                    host="studio.local",
+                    database="KnowledgeDocuments",
+                    user="postgres",
+                    password="prodogs03",
+                    port=5432
+                )
+                kb_cursor = kb_conn.cursor()
+                
+                kb_cursor.execute("""
+                    SELECT batch_id, connection_id, COUNT(*), MIN(created_at)
+                    FROM llm_responses 
+                    WHERE batch_id = ANY(%s) AND status = 'QUEUED'
+                    GROUP BY batch_id, connection_id
+                """, ([batch.id for batch in batches],))
+                
+                for batch_id, connection_id, queued_count, oldest_queued_at in kb_cursor.fetchall():
+                    total, oldest = queue_stats.get(batch_id, (0, None))
+                    if oldest is None or (oldest_queued_at and oldest_queued_at < oldest):
+                        oldest = oldest_queued_at
+                    queue_stats[batch_id] = (total + queued_count, oldest)
+                    queued_by_connection.setdefault(batch_id, {})[connection_id] = {
+                        'queued': queued_count,
+                        'oldest_queued_at': oldest_queued_at
+                    }
+                
+                kb_cursor.close()
+                kb_conn.close()
+                
+            except Exception as e:
+                logger.error(f"Error checking queued documents for ready batches: {e}")
+                queue_stats_available = False
             
             result = []
             for batch in batches:
-                # For PROCESSING batches, check if they have queued documents
-                if batch.status == 'PROCESSING':
-                    try:
-                        kb_conn = psycopg2.connect(
-                            host="studio.local",
-                            database="KnowledgeDocuments",
-                            user="postgres",
-                            password="prodogs03",
-                            port=5432
-                        )
-                        kb_cursor = kb_conn.cursor()
-                        
-                        # Check if batch has queued documents
-                        kb_cursor.execute("""
-                            SELECT COUNT(*) 
-                            FROM llm_responses 
-                            WHERE batch_id = %s AND status = 'QUEUED'
-                        """, (batch.id,))
-                        
-                        queued_count = kb_cursor.fetchone()[0]
-                        kb_cursor.close()
-                        kb_conn.close()
-                        
-                        # Skip PROCESSING batches with no queued documents
-                        if queued_count == 0:
-                            continue
-                            
-                    except Exception as e:
-                        logger.error(f"Error checking queued documents for batch {batch.id}: {e}")
+                queued_count, oldest_queued_at = queue_stats.get(batch.id, (0, None))
+                
+                # Rows of connections with a provider batch API are submitted offline
+                # (services/provider_batches.py), not by the queue processor
+                provider_batch_connection_ids = []
+                if batch.execution_mode == 'provider_batch':
+                    by_connection = queued_by_connection.get(batch.id, {})
+                    provider_batch_connection_ids = [
+                        connection_id for connection_id in by_connection
+                        if provider_batches.supports(connection_id)
+                    ]
+                    for connection_id in provider_batch_connection_ids:
+                        queued_count -= by_connection.pop(connection_id)['queued']
+                    if queued_count == 0 and queue_stats_available:
                         continue
                 
+                # Skip PROCESSING batches with no queued documents (or when we could not check)
+                if batch.status == 'PROCESSING' and (not queue_stats_available or queued_count == 0):
+                    continue
+                
                 result.append({
                     'batch_id': batch.id,
                     'batch_number': batch.batch_number,
@@ -4041,6 +4766,13 @@ class BatchService:
                     'total_documents': batch.total_documents,
                     'processed_documents': batch.processed_documents,
                     'status': batch.status,
+                    'priority': batch.priority or 0,
+                    'submitted_by': batch.submitted_by,
+                    'queued_count': queued_count if queue_stats_available else None,
+                    'oldest_queued_at': oldest_queued_at,
+                    'queued_by_connection': queued_by_connection.get(batch.id, {}),
+                    'execution_mode': batch.execution_mode or 'interactive',
+                    'provider_batch_connection_ids': provider_batch_connection_ids,
                     'created_at': batch.created_at.isoformat() if batch.created_at else None
                 })
             
@@ -4053,15 +4785,28 @@ class BatchService:
         finally:
             session.close()
 
-    def get_next_document_for_processing(self, batch_id: int) -> Optional[Dict[str, Any]]:
+    def get_next_document_for_processing(self, batch_id: int,
+                                         exclude_connection_ids: Optional[List[int]] = None,
+                                         max_prompts: int = 1, document_order: bool = False,
+                                         prefer: Optional[Tuple[int, int]] = None,
+                                         cost_order: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
         """
         Get next QUEUED document from batch for processing
         
         Args:
             batch_id: ID of the batch to get document from
+            exclude_connection_ids: Connections whose rows must be left queued (open circuit breakers)
+            max_prompts: Claim up to this many QUEUED rows of the same document and connection
+                         together so their prompts are sent as one multi-prompt request
+            document_order: Claim a document's rows back to back (see WorkerLease.claim_next)
+            prefer: (docs id, connection_id) of the previous dispatch, continued first so
+                    the provider can reuse the document prefix it just processed
+            cost_order: Rank rows by predicted cost (see JobCostModel.claim_order)
             
         Returns:
-            Dict with document details and encoded content, or None if no documents available
+            Dict with document details and encoded content, or None if no documents available.
+            'prompts' lists every claimed row ({'response_id', 'id', 'text', 'description'});
+            'response_id' and 'prompt' are those of the first.
         """
         session = Session()
         try:
@@ -4092,59 +4837,75 @@ class BatchService:
                 )
                 kb_cursor = kb_conn.cursor()
                 
-                # Get next QUEUED llm_response for this batch
-                kb_cursor.execute("""
-                    SELECT lr.id, lr.document_id, lr.prompt_id, lr.connection_id, 
-                           lr.connection_details, d.document_id as kb_doc_id
-                    FROM llm_responses lr
-                    JOIN docs d ON lr.document_id = d.id
-                    WHERE lr.batch_id = %s AND lr.status = 'QUEUED'
-                    ORDER BY lr.created_at ASC
-                    LIMIT 1
-                    FOR UPDATE SKIP LOCKED
-                """, (batch_id,))
-                
-                response_row = kb_cursor.fetchone()
+                # Claim the next QUEUED llm_response for this batch under this worker's lease,
+                # plus the other prompts queued for the same document and connection
+                response_row = worker_lease.claim_next(kb_cursor, batch_id, exclude_connection_ids,
+                                                       document_order=document_order, prefer=prefer,
+                                                       cost_order=cost_order)
+                sibling_rows = []
+                if response_row and max_prompts > 1:
+                    sibling_rows = worker_lease.claim_siblings(kb_cursor, response_row[0], max_prompts - 1)
                 
                 if not response_row:
+                    kb_conn.commit()
                     kb_cursor.close()
                     kb_conn.close()
                     logger.info(f"No queued documents found for batch {batch_id}")
                     return None
                 
-                response_id, doc_id, prompt_id, connection_id, connection_details, kb_doc_id = response_row
+                response_id, doc_id, prompt_id, connection_id, connection_details, snapshot_id = response_row
                 
+                # The claim commits together with the lookups below, so rows that can never be
+                # dispatched are failed in the same transaction instead of held until their lease expires
                 # Get document content from docs table
                 kb_cursor.execute("""
-                    SELECT content, content_type, doc_type, file_size
+                    SELECT content, content_type, doc_type, file_size, document_id
                     FROM docs
                     WHERE id = %s
                 """, (doc_id,))
                 
                 doc_row = kb_cursor.fetchone()
                 if not doc_row:
+                    logger.error(f"Document {doc_id} not found in KnowledgeDocuments")
+                    self._fail_claimed_rows(kb_cursor, [response_id] + [row[0] for row in sibling_rows],
+                                            f"Document {doc_id} not found")
+                    kb_conn.commit()
                     kb_cursor.close()
                     kb_conn.close()
-                    logger.error(f"Document {doc_id} not found in KnowledgeDocuments")
+                    self._check_batch_completion(batch_id)
                     return None
                 
-                content, content_type, doc_type, file_size = doc_row
+                content, content_type, doc_type, file_size, kb_doc_id = doc_row
                 
-                # Get prompt details from local database
-                prompt = session.query(Prompt).filter_by(id=prompt_id).first()
-                if not prompt:
+                # Get prompt details from the in-memory config cache
+                prompts = []
+                for row_id, _, row_prompt_id, *_ in [response_row] + sibling_rows:
+                    row_prompt = config_lookup.get_prompt(row_prompt_id)
+                    if not row_prompt:
+                        logger.error(f"Prompt {row_prompt_id} not found")
+                        self._fail_claimed_rows(kb_cursor, [row_id], f"Prompt {row_prompt_id} not found")
+                        continue
+                    prompts.append({
+                        'response_id': row_id,
+                        'id': row_prompt_id,
+                        'text': row_prompt['prompt_text'],
+                        'description': row_prompt['description']
+                    })
+                
+                if not prompts:
+                    kb_conn.commit()
                     kb_cursor.close()
                     kb_conn.close()
-                    logger.error(f"Prompt {prompt_id} not found")
+                    self._check_batch_completion(batch_id)
                     return None
                 
-                # Parse connection details
-                if isinstance(connection_details, str):
-                    connection_details = json.loads(connection_details)
+                # Connection details from the row's snapshot (inline on rows staged before snapshots)
+                connection_details = connection_snapshots.resolve(snapshot_id, connection_details, kb_cursor)
+                kb_conn.commit()
                 
                 # Format the document data for processing
                 result = {
-                    'response_id': response_id,
+                    'response_id': prompts[0]['response_id'],
                     'doc_id': doc_id,
                     'batch_id': batch_id,
                     'document_id': kb_doc_id,  # The unique document_id for RAG API
@@ -4152,11 +4913,9 @@ class BatchService:
                     'content_type': content_type,
                     'doc_type': doc_type,
                     'file_size': file_size,
-                    'prompt': {
-                        'id': prompt_id,
-                        'text': prompt.prompt_text,
-                        'description': prompt.description
-                    },
+                    'prompt': {key: prompts[0][key] for key in ('id', 'text', 'description')},
+                    'prompts': prompts,
+                    'response_ids': [p['response_id'] for p in prompts],
                     'llm_config': format_llm_config_for_rag_api(connection_details),
                     'connection_id': connection_id,
                     'connection_details': connection_details
@@ -4165,7 +4924,7 @@ class BatchService:
                 kb_cursor.close()
                 kb_conn.close()
                 
-                logger.info(f"Retrieved document {doc_id} for processing from batch {batch_id}")
+                logger.info(f"Retrieved document {doc_id} with {len(prompts)} prompt(s) for processing from batch {batch_id}")
                 return result
                 
             except Exception as e:
@@ -4178,14 +4937,36 @@ class BatchService:
         finally:
             session.close()
 
-    def update_document_task(self, doc_id: int, task_id: str, status: str = 'PROCESSING') -> bool:
+    def _fail_claimed_rows(self, kb_cursor, response_ids: List[int], error_message: str):
+        """
+        Mark rows claimed by this worker FAILED because they can never be dispatched
+        
+        Args:
+            kb_cursor: Cursor of the transaction holding the claim
+            response_ids: llm_responses IDs to fail
+            error_message: Reason stored on the rows
+        """
+        kb_cursor.execute("""
+            UPDATE llm_responses
+            SET status = 'FAILED',
+                error_message = %s,
+                completed_processing_at = NOW(),
+                claimed_by = NULL,
+                lease_expires_at = NULL
+            WHERE id = ANY(%s)
+            AND claimed_by = %s
+        """, (error_message, list(response_ids), worker_lease.worker_id))
+
+    def update_document_task(self, doc_id, task_id: str, status: str = 'PROCESSING',
+                             rag_endpoint: str = None) -> bool:
         """
         Update document with task_id when processing starts
         
         Args:
-            doc_id: Document ID (from llm_responses)
+            doc_id: Document ID (from llm_responses), or a list of them for a multi-prompt task
             task_id: Task ID from RAG API
             status: New status (default: PROCESSING)
+            rag_endpoint: RAG API instance that accepted the task (polled for its status)
             
         Returns:
             bool: Success status
@@ -4205,9 +4986,13 @@ class BatchService:
                 UPDATE llm_responses 
                 SET status = %s,
                     task_id = %s,
-                    started_processing_at = NOW()
-                WHERE id = %s
-            """, (status, task_id, doc_id))
+                    started_processing_at = NOW(),
+                    claimed_by = %s,
+                    lease_expires_at = NOW() + make_interval(secs => %s),
+                    rag_endpoint = %s
+                WHERE id = ANY(%s)
+            """, (status, task_id, worker_lease.worker_id, worker_lease.lease_seconds, rag_endpoint,
+                  doc_id if isinstance(doc_id, list) else [doc_id]))
             
             kb_conn.commit()
             kb_cursor.close()
@@ -4220,6 +5005,47 @@ class BatchService:
             logger.error(f"Error updating document task: {e}")
             return False
 
+    def save_partial_response(self, doc_id: int, response_text: str) -> bool:
+        """
+        Store the text generated so far for a row that is still streaming
+        
+        Only rows still PROCESSING under this worker's lease are touched, so a late
+        flush never overwrites a finished answer or a row another worker took over.
+        
+        Args:
+            doc_id: Document ID (from llm_responses)
+            response_text: Partial output
+            
+        Returns:
+            bool: True if the row was updated
+        """
+        try:
+            kb_conn = psycopg2.connect(
+                host="studio.local",
+                database="KnowledgeDocuments",
+                user="postgres",
+                password="prodogs03",
+                port=5432
+            )
+            kb_cursor = kb_conn.cursor()
+            kb_cursor.execute("""
+                UPDATE llm_responses
+                SET response_text = %s,
+                    partial_output_at = NOW()
+                WHERE id = %s
+                AND status = 'PROCESSING'
+                AND claimed_by = %s
+            """, (response_text, doc_id, worker_lease.worker_id))
+            updated = kb_cursor.rowcount > 0
+            kb_conn.commit()
+            kb_cursor.close()
+            kb_conn.close()
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error saving partial response for {doc_id}: {e}")
+            return False
+
     def update_document_status(self, doc_id: int, status: str, response_data: Optional[Dict[str, Any]] = None) -> bool:
         """
         Update document status (COMPLETED/FAILED) with results
@@ -4269,7 +5095,9 @@ class BatchService:
                         input_tokens = %s,
                         output_tokens = %s,
                         response_time_ms = %s,
-                        overall_score = %s
+                        overall_score = %s,
+                        claimed_by = NULL,
+                        lease_expires_at = NULL
                     WHERE id = %s
                 """, (
                     status,
@@ -4287,7 +5115,9 @@ class BatchService:
                     UPDATE llm_responses 
                     SET status = %s,
                         error_message = %s,
-                        completed_processing_at = NOW()
+                        completed_processing_at = NOW(),
+                        claimed_by = NULL,
+                        lease_expires_at = NULL
                     WHERE id = %s
                 """, (
                     status,
@@ -0,0 +1,131 @@
+"""
+Change Counters
+
+Cheap version numbers for conditional GETs. The counters are maintained by
+database triggers (migrations/add_change_counter_triggers.py):
+- config_versions in doc_eval, one row per table (batches, folders, prompts, ...)
+- batch_progress_versions in KnowledgeDocuments, one row per batch, bumped when
+  llm_responses rows of the batch are created, deleted or change status
+
+Reading a counter is a primary-key lookup, far cheaper than the queries behind
+the endpoints that use them. Every method returns None when a counter cannot be
+read, in which case callers must treat the resource as changed.
+"""
+
+import logging
+import threading
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from database import Session
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeCounters:
+    """Reads table change counters and batch progress versions"""
+
+    def __init__(self, max_kb_connections: int = 4):
+        self.max_kb_connections = max_kb_connections
+        self._kb_pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_kb_pool(self):
+        """Small connection pool - these lookups run on every polled request"""
+        if self._kb_pool is None:
+            with self._pool_lock:
+                if self._kb_pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    self._kb_pool = ThreadedConnectionPool(
+                        1, self.max_kb_connections,
+                        host="studio.local",
+                        database="KnowledgeDocuments",
+                        user="postgres",
+                        password="prodogs03",
+                        port=5432
+                    )
+        return self._kb_pool
+
+    def get_table_versions(self, *names: str) -> Optional[Tuple[int, ...]]:
+        """
+        Current change counters of doc_eval tables.
+
+        Args:
+            names: config_versions names, e.g. 'batches', 'prompts'
+
+        Returns:
+            Tuple of versions in the order given (0 for names never bumped), or None
+        """
+        session = Session()
+        try:
+            rows = session.execute(
+                text("SELECT name, version FROM config_versions WHERE name = ANY(:names)"),
+                {'names': list(names)}
+            ).fetchall()
+            versions = dict(rows)
+            return tuple(versions.get(name, 0) for name in names)
+        except Exception as e:
+            logger.debug(f"Could not read table versions {names}: {e}")
+            return None
+        finally:
+            session.close()
+
+    def get_batch_progress_version(self, batch_id: Optional[int] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Progress version of one batch, or of all batches when batch_id is None.
+
+        Returns:
+            (version,) for one batch, (row_count, version_sum) for all batches, or None
+        """
+        try:
+            pool = self._get_kb_pool()
+            conn = pool.getconn()
+        except Exception as e:
+            logger.debug(f"Could not connect for batch progress versions: {e}")
+            return None
+
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            if batch_id is None:
+                cursor.execute("SELECT COUNT(*), COALESCE(SUM(version), 0) FROM batch_progress_versions")
+                count, total = cursor.fetchone()
+                result = (count, int(total))
+            else:
+                cursor.execute("SELECT version FROM batch_progress_versions WHERE batch_id = %s", (batch_id,))
+                row = cursor.fetchone()
+                result = (row[0] if row else 0,)
+            cursor.close()
+            pool.putconn(conn)
+            return result
+        except Exception as e:
+            logger.debug(f"Could not read batch progress version for {batch_id}: {e}")
+            pool.putconn(conn, close=True)
+            return None
+
+    def versions(self, *names: str, batch_id: Optional[int] = None,
+                 all_progress: bool = False) -> Optional[Tuple]:
+        """
+        Combined version of tables and batch progress, or None if any part is unavailable.
+
+        Args:
+            names: config_versions names
+            batch_id: Include this batch's progress version
+            all_progress: Include the progress version of every batch
+        """
+        parts = []
+        if names:
+            table_versions = self.get_table_versions(*names)
+            if table_versions is None:
+                return None
+            parts.append(table_versions)
+        if batch_id is not None or all_progress:
+            progress = self.get_batch_progress_version(None if all_progress else batch_id)
+            if progress is None:
+                return None
+            parts.append(progress)
+        return tuple(parts)
+
+
+# Global instance
+change_counters = ChangeCounters()
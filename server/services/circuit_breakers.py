@@ -0,0 +1,99 @@
+"""
+Circuit Breaker Registry
+
+One circuit breaker per LLM connection and per RAG API endpoint, shared by
+everything in the process that talks to them:
+- the queue processor skips claiming rows of connections whose breaker is open
+  and stops submitting while the RAG endpoint's breaker is open
+- dispatch outcomes (submission errors, task failures, completions) feed the breakers
+- health_monitor results trip RAG breakers on a failed check and allow an early
+  probe on a passing one
+- ServiceClient rejects calls to services whose breaker is open
+
+Breakers are per process; each worker process learns from its own traffic.
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from utils.stability_helpers import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+def connection_key(connection_id: int) -> str:
+    return f"connection:{connection_id}"
+
+
+def rag_endpoint_key(url: str) -> str:
+    return f"rag:{url.rstrip('/')}"
+
+
+class CircuitBreakerRegistry:
+    """Creates and looks up circuit breakers by key"""
+
+    def __init__(self, failure_threshold: Optional[int] = None, recovery_timeout: Optional[int] = None):
+        self.failure_threshold = failure_threshold if failure_threshold is not None \
+            else int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+        self.recovery_timeout = recovery_timeout if recovery_timeout is not None \
+            else int(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', '60'))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CircuitBreaker:
+        """Breaker for a key, created closed on first use"""
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        failure_threshold=self.failure_threshold,
+                        recovery_timeout=self.recovery_timeout,
+                        name=key
+                    )
+                    self._breakers[key] = breaker
+        return breaker
+
+    def allow_request(self, key: str) -> bool:
+        return self.get(key).allow_request()
+
+    def is_blocking(self, key: str) -> bool:
+        breaker = self._breakers.get(key)
+        return breaker.is_blocking() if breaker else False
+
+    def record_success(self, key: str):
+        self.get(key).record_success()
+
+    def record_failure(self, key: str):
+        self.get(key).record_failure()
+
+    def blocked_connection_ids(self) -> List[int]:
+        """Connections whose rows must not be claimed right now"""
+        return [
+            int(key.split(':', 1)[1])
+            for key, breaker in list(self._breakers.items())
+            if key.startswith('connection:') and breaker.is_blocking()
+        ]
+
+    def record_health(self, url: str, healthy: bool, reason: str = ""):
+        """Feed a health check result for a RAG endpoint"""
+        breaker = self.get(rag_endpoint_key(url))
+        if healthy:
+            breaker.allow_probe()
+        else:
+            breaker.trip(reason or "health check failed")
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """State of every breaker that is not closed, plus closed ones with recent failures"""
+        return {
+            key: breaker.get_status()
+            for key, breaker in sorted(self._breakers.items())
+            if breaker.state != 'CLOSED' or breaker.failure_count
+        }
+
+
+# Global instance
+circuit_breakers = CircuitBreakerRegistry()
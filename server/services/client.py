@@ -5,8 +5,9 @@ from typing import Dict, Optional, Any, Union
 from dataclasses import dataclass
 from enum import Enum
 
-from services.config import service_config, ServiceConfig
+from services.config import service_config, ServiceConfig, ServiceType
 from services.health_monitor import health_monitor
+from services.circuit_breakers import circuit_breakers, rag_endpoint_key
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +51,62 @@ class ServiceClient:
         headers: Optional[Dict] = None,
         timeout: Optional[int] = None,
         retry_override: Optional[int] = None
+    ) -> ServiceResponse:
+        """
+        Make a request to an external service with retry logic and circuit breaker
+        
+        Requests to a service whose circuit is open fail fast without touching the network.
+        
+        Args:
+            service_name: Name of the service to call
+            endpoint: API endpoint (e.g., "/analyze_document")
+            method: HTTP method
+            data: Request data (for POST/PUT requests)
+            files: Files to upload
+            params: Query parameters
+            headers: Additional headers
+            timeout: Request timeout override
+            retry_override: Override max retries for this request
+            
+        Returns:
+            ServiceResponse with the result
+        """
+        config = service_config.get_service(service_name)
+        breaker_key = None
+        if config and config.enabled:
+            breaker_key = rag_endpoint_key(config.full_url) if config.service_type == ServiceType.RAG_API \
+                else f"service:{service_name}"
+            if not circuit_breakers.allow_request(breaker_key):
+                retry_after = circuit_breakers.get(breaker_key).retry_after()
+                logger.warning(f"Circuit open for {service_name}, not calling {endpoint}")
+                return ServiceResponse(
+                    success=False,
+                    status_code=None,
+                    error_message=f"Circuit breaker open for {service_name}, retry in {retry_after:.0f}s"
+                )
+        
+        response = self._call_service(service_name, endpoint, method, data, files, params,
+                                      headers, timeout, retry_override)
+        
+        if breaker_key:
+            # Client errors mean the service is up; only 5xx, timeouts and connection errors count
+            if response.success or (response.status_code and response.status_code < 500):
+                circuit_breakers.record_success(breaker_key)
+            else:
+                circuit_breakers.record_failure(breaker_key)
+        return response
+    
+    def _call_service(
+        self,
+        service_name: str,
+        endpoint: str,
+        method: RequestMethod = RequestMethod.GET,
+        data: Optional[Dict] = None,
+        files: Optional[Dict] = None,
+        params: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
+        timeout: Optional[int] = None,
+        retry_override: Optional[int] = None
     ) -> ServiceResponse:
         """
         Make a request to an external service with retry logic
@@ -83,10 +140,6 @@ class ServiceClient:
                 error_message=f"Service is disabled: {service_name}"
             )
         
-        # Check if service is healthy before making request
-        if not health_monitor.is_service_healthy(service_name):
-            logger.warning(f"Service {service_name} is not healthy, attempting request anyway")
-        
         # Build full URL
         url = f"{config.full_url}{endpoint}"
         
@@ -111,6 +111,25 @@ class ServiceConfigManager:
             rag_config.timeout = int(os.getenv("RAG_API_TIMEOUT", rag_config.timeout))
             rag_config.enabled = os.getenv("RAG_API_ENABLED", "true").lower() == "true"
         
+        # Additional RAG API instances for the endpoint pool (services/rag_pool.py):
+        # RAG_API_URLS=http://rag1:7001,http://rag2:7001 -> rag_api_2, rag_api_3, ...
+        # (the first URL replaces rag_api's unless RAG_API_URL is also set)
+        rag_urls = [url.strip().rstrip('/') for url in os.getenv("RAG_API_URLS", "").split(',') if url.strip()]
+        if rag_urls and not os.getenv("RAG_API_URL"):
+            rag_config = self.services["rag_api"]
+            rag_config.base_url, rag_config.port = rag_urls.pop(0), None
+        for index, url in enumerate(rag_urls, start=2):
+            self.services[f"rag_api_{index}"] = ServiceConfig(
+                name=f"rag_api_{index}",
+                service_type=ServiceType.RAG_API,
+                base_url=url,
+                api_key=os.getenv("RAG_API_KEY"),
+                timeout=self.services["rag_api"].timeout,
+                max_retries=3,
+                retry_delay=2.0,
+                health_check_endpoint="/api/health"
+            )
+        
         # Document Processor configuration
         if os.getenv("DOC_PROCESSOR_URL"):
             doc_config = self.services["document_processor"]
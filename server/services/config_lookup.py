@@ -0,0 +1,318 @@
+"""
+Config Lookup Service
+
+In-memory lookups for slowly changing configuration - prompts, connections
+(with resolved provider type, model name and RAG API config), models and
+providers - so the dispatch and staging hot paths do not query doc_eval for
+every document.
+
+Invalidation is versioned: every write bumps a counter in config_versions
+(and the local copy immediately). Readers compare their loaded version with the
+database at most every `version_check_interval` seconds and reload only the
+categories that changed, so other processes see writes within that interval.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+from sqlalchemy import text
+from database import Session
+from models import Prompt, Connection, Model, LlmProvider
+from utils.llm_config_formatter import format_llm_config_for_rag_api
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('prompts', 'connections', 'models', 'providers')
+
+# Connections embed model and provider data, so they reload with them
+DEPENDENTS = {
+    'models': ('connections',),
+    'providers': ('connections',),
+}
+
+
+class ConfigLookupService:
+    """Versioned in-memory cache of prompts, connections, models and providers"""
+
+    def __init__(self, version_check_interval: float = None, max_age: float = None):
+        self.version_check_interval = version_check_interval if version_check_interval is not None \
+            else float(os.getenv('CONFIG_VERSION_CHECK_INTERVAL', '2'))
+        # Upper bound on staleness when config_versions cannot be read
+        self.max_age = max_age if max_age is not None else float(os.getenv('CONFIG_CACHE_MAX_AGE', '60'))
+
+        self._lock = threading.RLock()
+        self._data: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._loaded_versions: Dict[str, Optional[int]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._stale = set(CATEGORIES)
+        self._last_version_check = 0.0
+        self._versions_available = True
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'version_checks': 0}
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def get_prompt(self, prompt_id: int) -> Optional[Dict[str, Any]]:
+        """Prompt dict (id, prompt_text, description, active) or None"""
+        return self._lookup('prompts', prompt_id)
+
+    def get_prompts(self) -> Dict[int, Dict[str, Any]]:
+        """All prompts keyed by id"""
+        return self._category('prompts')
+
+    def get_model(self, model_id: int) -> Optional[Dict[str, Any]]:
+        """Model dict (id, common_name, display_name, ...) or None"""
+        return self._lookup('models', model_id)
+
+    def get_model_name(self, model_id: int) -> Optional[str]:
+        """Display name of a model, or None if unknown"""
+        model = self.get_model(model_id) if model_id else None
+        return model['display_name'] if model else None
+
+    def get_provider(self, provider_id: int) -> Optional[Dict[str, Any]]:
+        """Provider dict (id, name, provider_type, ...) or None"""
+        return self._lookup('providers', provider_id)
+
+    def get_connection(self, connection_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Connection details as stored in llm_responses.connection_details.
+
+        Args:
+            connection_id: Connection ID
+
+        Returns:
+            Dict with id, name, provider_id, model_id, model_name, provider_type,
+            api_key, base_url, port_no, connection_config and is_active, or None
+        """
+        connection = self._lookup('connections', connection_id)
+        if not connection:
+            return None
+        details = dict(connection)
+        details.pop('llm_config', None)
+        return details
+
+    def get_connections(self) -> Dict[int, Dict[str, Any]]:
+        """All connections keyed by id (details without the RAG API llm_config)"""
+        return {
+            connection_id: {k: v for k, v in connection.items() if k != 'llm_config'}
+            for connection_id, connection in self._category('connections').items()
+        }
+
+    def get_llm_config(self, connection_id: int) -> Optional[Dict[str, Any]]:
+        """RAG API llm_config for a connection, or None"""
+        connection = self._lookup('connections', connection_id)
+        return dict(connection['llm_config']) if connection else None
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def invalidate(self, *categories: str):
+        """
+        Mark categories as changed, here and for every other process.
+
+        Call after committing a write to prompts, connections, models or providers.
+
+        Args:
+            categories: Any of 'prompts', 'connections', 'models', 'providers'
+        """
+        names = self._expand(categories)
+        with self._lock:
+            self._stale.update(names)
+        self._bump_versions(names)
+
+    def refresh(self):
+        """Drop everything; the next lookup reloads from the database"""
+        with self._lock:
+            self._stale.update(CATEGORIES)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Loaded versions, entry counts and hit/miss counters"""
+        with self._lock:
+            return {
+                'categories': {
+                    name: {
+                        'entries': len(self._data.get(name, {})),
+                        'version': self._loaded_versions.get(name),
+                        'age_seconds': round(time.time() - self._loaded_at[name], 1) if name in self._loaded_at else None,
+                        'stale': name in self._stale
+                    }
+                    for name in CATEGORIES
+                },
+                'versions_available': self._versions_available,
+                'version_check_interval': self.version_check_interval,
+                **self.stats
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _expand(self, categories: Iterable[str]) -> set:
+        names = set()
+        for name in categories:
+            if name not in CATEGORIES:
+                raise ValueError(f"Unknown config category: {name}")
+            names.add(name)
+            names.update(DEPENDENTS.get(name, ()))
+        return names
+
+    def _lookup(self, category: str, key: Optional[int]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        entry = self._category(category).get(key)
+        if entry is not None:
+            self.stats['hits'] += 1
+            return entry
+
+        # Possibly created by another process since our last version check
+        self.stats['misses'] += 1
+        with self._lock:
+            if time.time() - self._loaded_at.get(category, 0) >= self.version_check_interval:
+                self._stale.add(category)
+        return self._category(category).get(key)
+
+    def _category(self, category: str) -> Dict[int, Dict[str, Any]]:
+        self._check_versions()
+        data = self._data.get(category)
+        if data is not None and category not in self._stale:
+            return data
+
+        with self._lock:
+            if category in self._stale or category not in self._data:
+                to_load = {category}
+                if category == 'connections':
+                    to_load.update(name for name in ('models', 'providers')
+                                   if name in self._stale or name not in self._data)
+                self._reload(to_load)
+            return self._data.get(category, {})
+
+    def _check_versions(self):
+        """Compare loaded versions with config_versions, at most every version_check_interval seconds"""
+        now = time.time()
+        if now - self._last_version_check < self.version_check_interval:
+            return
+
+        with self._lock:
+            if now - self._last_version_check < self.version_check_interval:
+                return
+            self._last_version_check = now
+            self.stats['version_checks'] += 1
+
+            versions = self._read_versions()
+            if versions is None:
+                # No shared versions - fall back to age-based reloads
+                for name, loaded_at in self._loaded_at.items():
+                    if now - loaded_at >= self.max_age:
+                        self._stale.add(name)
+                return
+
+            for name in CATEGORIES:
+                if name in self._data and versions.get(name, 0) != self._loaded_versions.get(name):
+                    self._stale.update(self._expand([name]))
+
+    def _reload(self, categories: set):
+        """Load the given categories (models/providers before the connections that embed them)"""
+        versions = self._read_versions() or {}
+        session = Session()
+        try:
+            for name in ('prompts', 'models', 'providers', 'connections'):
+                if name not in categories:
+                    continue
+                self._data[name] = self._load(session, name)
+                self._loaded_versions[name] = versions.get(name, 0) if self._versions_available else None
+                self._loaded_at[name] = time.time()
+                self._stale.discard(name)
+                self.stats['reloads'] += 1
+                logger.debug(f"Loaded {len(self._data[name])} {name} into config cache")
+        except Exception as e:
+            logger.error(f"Error loading config cache ({', '.join(sorted(categories))}): {e}")
+        finally:
+            session.close()
+
+    def _load(self, session, category: str) -> Dict[int, Dict[str, Any]]:
+        if category == 'prompts':
+            return {
+                p.id: {'id': p.id, 'prompt_text': p.prompt_text, 'description': p.description,
+                       'active': bool(p.active)}
+                for p in session.query(Prompt).all()
+            }
+
+        if category == 'models':
+            return {
+                m.id: {'id': m.id, 'common_name': m.common_name, 'display_name': m.display_name,
+                       'model_family': m.model_family, 'context_length': m.context_length,
+                       'is_globally_active': m.is_globally_active}
+                for m in session.query(Model).all()
+            }
+
+        if category == 'providers':
+            return {
+                p.id: {'id': p.id, 'name': p.name, 'provider_type': p.provider_type,
+                       'default_base_url': p.default_base_url, 'is_active': p.is_active}
+                for p in session.query(LlmProvider).all()
+            }
+
+        models = self._data.get('models', {})
+        providers = self._data.get('providers', {})
+        connections = {}
+        for connection in session.query(Connection).all():
+            model = models.get(connection.model_id)
+            provider = providers.get(connection.provider_id)
+            details = {
+                'id': connection.id,
+                'name': connection.name,
+                'provider_id': connection.provider_id,
+                'model_id': connection.model_id,
+                'model_name': model['display_name'] if model else 'default',
+                'provider_type': provider['provider_type'] if provider else 'ollama',
+                'api_key': connection.api_key,
+                'base_url': connection.base_url,
+                'port_no': connection.port_no,
+                'connection_config': connection.connection_config,
+                'is_active': connection.is_active
+            }
+            details['llm_config'] = format_llm_config_for_rag_api(details)
+            connections[connection.id] = details
+        return connections
+
+    def _read_versions(self) -> Optional[Dict[str, int]]:
+        """Current versions from config_versions, or None if unavailable"""
+        session = Session()
+        try:
+            rows = session.execute(text("SELECT name, version FROM config_versions")).fetchall()
+            if not self._versions_available:
+                logger.info("config_versions is available again - using versioned invalidation")
+            self._versions_available = True
+            return {name: version for name, version in rows}
+        except Exception as e:
+            if self._versions_available:
+                logger.warning(f"config_versions unavailable, config cache falls back to {self.max_age}s max age: {e}")
+            self._versions_available = False
+            return None
+        finally:
+            session.close()
+
+    def _bump_versions(self, categories: Iterable[str]):
+        session = Session()
+        try:
+            for name in categories:
+                session.execute(text("""
+                    INSERT INTO config_versions (name, version, updated_at) VALUES (:name, 1, NOW())
+                    ON CONFLICT (name) DO UPDATE
+                    SET version = config_versions.version + 1, updated_at = NOW()
+                """), {'name': name})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Could not bump config versions for {sorted(categories)}: {e}")
+        finally:
+            session.close()
+
+
+# Global instance
+config_lookup = ConfigLookupService()
@@ -13,6 +13,7 @@ from sqlalchemy.orm import Session as SQLSession
 from database import Session
 from models import Connection, LlmProvider
 from services.llm_provider_service import llm_provider_service
+from services.config_lookup import config_lookup
 from sqlalchemy import text
 
 logger = logging.getLogger(__name__)
@@ -167,6 +168,7 @@ class ConnectionService:
             session.commit()
 
             logger.info(f"Created connection: {connection_data['name']}")
+            config_lookup.invalidate('connections')
 
             # Get the created connection with provider info using SQL
             result = session.execute(text("""
@@ -216,6 +218,7 @@ class ConnectionService:
                 session.commit()
 
             logger.info(f"Updated connection: {connection.name}")
+            config_lookup.invalidate('connections')
 
             # Get the updated connection with provider info using SQL
             result = session.execute(text("""
@@ -254,6 +257,7 @@ class ConnectionService:
             session.commit()
             
             logger.info(f"Deleted connection: {connection_name}")
+            config_lookup.invalidate('connections')
             return True
         finally:
             session.close()
@@ -0,0 +1,163 @@
+"""
+Connection Snapshots
+
+Point-in-time copies of connection details (name, URLs, model, provider,
+api_key, connection_config), stored once per distinct content in the
+KnowledgeDocuments connection_snapshots table instead of once per llm_responses
+row. Staging interns the snapshot of each connection and writes its id into
+llm_responses.connection_snapshot_id.
+
+- Snapshots are keyed by a hash of their canonical JSON, so re-staging with an
+  unchanged connection reuses the existing snapshot and editing a connection
+  creates a new one (older rows keep the config they ran with)
+- Snapshots never change once written, so readers resolve ids through an
+  in-process LRU cache (CONNECTION_SNAPSHOT_CACHE_SIZE entries) that needs no
+  invalidation
+- Rows staged before the table existed still carry inline connection_details;
+  resolve() falls back to those
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Iterable, Callable
+
+from services.worker_lease import connect_knowledge_documents
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_hash(details: Dict[str, Any]) -> str:
+    """Content hash of connection details, independent of key order"""
+    canonical = json.dumps(details, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ConnectionSnapshotStore:
+    """Interns connection details into connection_snapshots and resolves ids through a small cache"""
+
+    def __init__(self, cache_size: Optional[int] = None, connect: Optional[Callable] = None):
+        self.cache_size = cache_size if cache_size is not None \
+            else int(os.getenv('CONNECTION_SNAPSHOT_CACHE_SIZE', '256'))
+        self.connect = connect or connect_knowledge_documents
+        self._cache: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'interned': 0, 'created': 0, 'hits': 0, 'misses': 0, 'loads': 0}
+
+    def intern(self, cursor, details: Dict[str, Any]) -> int:
+        """
+        Store a snapshot of connection details unless an identical one exists.
+
+        Runs on the caller's cursor; the snapshot commits with the caller's transaction,
+        so the id is only cached for readers once they load it.
+
+        Args:
+            cursor: KnowledgeDocuments cursor
+            details: Connection details (see config_lookup.get_connection)
+
+        Returns:
+            connection_snapshots id
+        """
+        content_hash = snapshot_hash(details)
+        cursor.execute("""
+            INSERT INTO connection_snapshots (content_hash, connection_id, details)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (content_hash) DO NOTHING
+            RETURNING id
+        """, (content_hash, details.get('id'), json.dumps(details)))
+        row = cursor.fetchone()
+        if row:
+            self.stats['created'] += 1
+        else:
+            cursor.execute("SELECT id FROM connection_snapshots WHERE content_hash = %s", (content_hash,))
+            row = cursor.fetchone()
+        self.stats['interned'] += 1
+        return row[0]
+
+    def get(self, snapshot_id: Optional[int], cursor=None) -> Optional[Dict[str, Any]]:
+        """Connection details of one snapshot, or None if unknown"""
+        if snapshot_id is None:
+            return None
+        return self.get_many([snapshot_id], cursor).get(snapshot_id)
+
+    def get_many(self, snapshot_ids: Iterable[Optional[int]], cursor=None) -> Dict[int, Dict[str, Any]]:
+        """
+        Connection details of several snapshots, loading the uncached ones in one query.
+
+        Args:
+            snapshot_ids: Snapshot ids (None entries are ignored)
+            cursor: KnowledgeDocuments cursor to load with (default: a new connection)
+
+        Returns:
+            Dict of snapshot id to connection details, without ids that do not exist
+        """
+        wanted = {snapshot_id for snapshot_id in snapshot_ids if snapshot_id is not None}
+        found = {}
+        with self._lock:
+            for snapshot_id in wanted:
+                details = self._cache.get(snapshot_id)
+                if details is not None:
+                    self._cache.move_to_end(snapshot_id)
+                    found[snapshot_id] = details
+        self.stats['hits'] += len(found)
+
+        missing = wanted - found.keys()
+        if missing:
+            self.stats['misses'] += len(missing)
+            loaded = self._load(sorted(missing), cursor)
+            found.update(loaded)
+            with self._lock:
+                for snapshot_id, details in loaded.items():
+                    self._cache[snapshot_id] = details
+                    self._cache.move_to_end(snapshot_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
+
+    def resolve(self, snapshot_id: Optional[int], inline_details=None, cursor=None) -> Optional[Dict[str, Any]]:
+        """
+        Connection details of an llm_responses row.
+
+        Args:
+            snapshot_id: llm_responses.connection_snapshot_id
+            inline_details: llm_responses.connection_details (rows staged before snapshots)
+            cursor: KnowledgeDocuments cursor to load with
+
+        Returns:
+            Connection details, or None if the row has neither
+        """
+        details = self.get(snapshot_id, cursor) if snapshot_id is not None else None
+        if details is None and inline_details:
+            details = json.loads(inline_details) if isinstance(inline_details, str) else inline_details
+        return details
+
+    def _load(self, snapshot_ids, cursor=None) -> Dict[int, Dict[str, Any]]:
+        self.stats['loads'] += 1
+        conn = None
+        if cursor is None:
+            conn = self.connect()
+            cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, details FROM connection_snapshots WHERE id = ANY(%s)", (list(snapshot_ids),))
+            return {
+                snapshot_id: json.loads(details) if isinstance(details, str) else details
+                for snapshot_id, details in cursor.fetchall()
+            }
+        finally:
+            if conn is not None:
+                cursor.close()
+                conn.close()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'cached': len(self._cache),
+            'cache_size': self.cache_size,
+            **self.stats
+        }
+
+
+# Global instance
+connection_snapshots = ConnectionSnapshotStore()
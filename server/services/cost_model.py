@@ -0,0 +1,339 @@
+"""
+Job Cost Model
+
+Rows differ by orders of magnitude in processing time - a 2 KB text file against
+a 30 MB PDF, a remote API against a laptop-sized local model. The model predicts
+a row's response time from its document size, document type and connection,
+learned from completed llm_responses:
+
+    predicted_ms = speed[connection] * (intercept[doc_type] + ms_per_kb[doc_type] * size_kb)
+
+- one least-squares line per doc_type (pooled over connections, normalised by their
+  speed), falling back to a line over all types below COST_MODEL_MIN_SAMPLES
+- one speed factor per connection: the median of actual / predicted over its rows
+  (1.0 until it has COST_MODEL_MIN_SAMPLES completions)
+- refit from the last COST_MODEL_HISTORY completions every COST_MODEL_REFRESH_SECONDS
+
+It is used to order claims (JOB_ORDER=largest_first for batch makespan,
+shortest_first for early partial results; the default fifo keeps claim order).
+Claims sort by llm_responses.predicted_cost_ms, which staging fills in and
+rescore_queued() refreshes set-based after each refit, so a claim is an index
+scan instead of scoring every queued row of the batch. The model also predicts
+batch completion from the remaining work over the dispatch slots. Because it is
+linear in size, completion is predicted from per (connection, doc_type) row
+counts and size totals aggregated in SQL.
+"""
+
+import os
+import time
+import logging
+import threading
+from statistics import median
+from typing import Dict, Any, List, Optional, Callable, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_ORDERS = ('fifo', 'largest_first', 'shortest_first')
+
+# Priors until there is history: a fixed overhead plus a little per KB
+DEFAULT_INTERCEPT_MS = 30000.0
+DEFAULT_MS_PER_KB = 2.0
+
+
+def fit_line(points: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """
+    Least-squares (intercept, slope) of y over x, both kept non-negative.
+
+    A single point or a single x value gives a flat line through the mean.
+    """
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return mean_y, 0.0
+    slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x)
+    intercept = mean_y - slope * mean_x
+    if intercept < 0:
+        # Through the origin instead
+        sum_xx = sum(x * x for x, _ in points)
+        return 0.0, max(0.0, sum(x * y for x, y in points) / sum_xx)
+    return intercept, slope
+
+
+def normalize_doc_type(doc_type: Optional[str]) -> str:
+    return (doc_type or '').lower().lstrip('.')
+
+
+class JobCostModel:
+    """Predicts per-row processing time from document size, type and connection"""
+
+    def __init__(self, min_samples: Optional[int] = None, history: Optional[int] = None,
+                 refresh_seconds: Optional[float] = None,
+                 load_samples: Optional[Callable[[int], Iterable[tuple]]] = None):
+        self.min_samples = min_samples if min_samples is not None \
+            else int(os.getenv('COST_MODEL_MIN_SAMPLES', '10'))
+        self.history = history if history is not None else int(os.getenv('COST_MODEL_HISTORY', '5000'))
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None \
+            else float(os.getenv('COST_MODEL_REFRESH_SECONDS', '600'))
+        # Returns (connection_id, doc_type, file_size, response_time_ms) rows (default: llm_responses)
+        self._load_samples = load_samples or self._load_samples_from_db
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self.default_line = (DEFAULT_INTERCEPT_MS, DEFAULT_MS_PER_KB)
+        self.lines: Dict[str, Tuple[float, float]] = {}  # doc_type -> (intercept_ms, ms_per_kb)
+        self.speeds: Dict[int, float] = {}  # connection_id -> factor (below 1.0 is faster than usual)
+        self.samples = 0
+
+    # Fitting
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Refit from recent completions (at most every refresh_seconds).
+
+        Returns:
+            True if the model was refitted
+        """
+        now = time.monotonic()
+        if not force and self._refreshed_at is not None and now - self._refreshed_at < self.refresh_seconds:
+            return False
+        self._refreshed_at = now
+        try:
+            samples = list(self._load_samples(self.history))
+        except Exception as e:
+            logger.debug(f"Could not load completion history, keeping the current cost model: {e}")
+            return False
+        return self.fit(samples)
+
+    def fit(self, samples: Iterable[tuple]) -> bool:
+        """
+        Fit the model.
+
+        Args:
+            samples: (connection_id, doc_type, file_size_bytes, response_time_ms) of completed rows
+
+        Returns:
+            True if there were samples to fit
+        """
+        rows = [
+            (connection_id, normalize_doc_type(doc_type), (file_size or 0) / 1024.0, float(response_time_ms))
+            for connection_id, doc_type, file_size, response_time_ms in samples
+            if response_time_ms and response_time_ms > 0
+        ]
+        if not rows:
+            return False
+
+        speeds: Dict[int, float] = {}
+        lines: Dict[str, Tuple[float, float]] = {}
+        default_line = self.default_line
+        # Lines on speed-normalised times, then speeds against those lines (twice, so both settle)
+        for _ in range(2):
+            normalised = [(doc_type, size_kb, ms / speeds.get(connection_id, 1.0))
+                          for connection_id, doc_type, size_kb, ms in rows]
+            default_line = fit_line([(size_kb, ms) for _, size_kb, ms in normalised])
+            by_type: Dict[str, List[Tuple[float, float]]] = {}
+            for doc_type, size_kb, ms in normalised:
+                by_type.setdefault(doc_type, []).append((size_kb, ms))
+            lines = {doc_type: fit_line(points) for doc_type, points in by_type.items()
+                     if len(points) >= self.min_samples}
+
+            ratios: Dict[int, List[float]] = {}
+            for connection_id, doc_type, size_kb, ms in rows:
+                intercept, slope = lines.get(doc_type, default_line)
+                expected = intercept + slope * size_kb
+                if connection_id is not None and expected > 0:
+                    ratios.setdefault(connection_id, []).append(ms / expected)
+            speeds = {connection_id: min(20.0, max(0.05, median(values)))
+                      for connection_id, values in ratios.items() if len(values) >= self.min_samples}
+
+        with self._lock:
+            self.default_line, self.lines, self.speeds = default_line, lines, speeds
+            self.samples = len(rows)
+        logger.info(f"Cost model fitted on {len(rows)} completions: {len(lines)} document types, "
+                    f"{len(speeds)} connections")
+        return True
+
+    @staticmethod
+    def _load_samples_from_db(limit: int) -> List[tuple]:
+        import psycopg2
+        conn = psycopg2.connect(
+            host="studio.local",
+            database="KnowledgeDocuments",
+            user="postgres",
+            password="prodogs03",
+            port=5432
+        )
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(r.answered_by_connection_id, r.connection_id), d.doc_type, d.file_size,
+                       r.response_time_ms
+                FROM llm_responses r
+                JOIN docs d ON d.id = r.document_id
+                WHERE r.status = 'COMPLETED'
+                AND r.response_time_ms > 0
+                ORDER BY r.completed_processing_at DESC NULLS LAST
+                LIMIT %s
+            """, (limit,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            conn.close()
+
+    # Predictions
+
+    def predict_ms(self, connection_id: Optional[int], doc_type: Optional[str], file_size: Optional[int]) -> float:
+        """Predicted processing time of one row in milliseconds"""
+        return self.predict_total_ms(connection_id, doc_type, 1, file_size)
+
+    def predict_total_ms(self, connection_id: Optional[int], doc_type: Optional[str], row_count: int,
+                         total_size: Optional[int]) -> float:
+        """Predicted processing time of row_count rows of one connection and type, totalling total_size bytes"""
+        intercept, slope = self.lines.get(normalize_doc_type(doc_type), self.default_line)
+        return self.speeds.get(connection_id, 1.0) * (row_count * intercept + slope * (total_size or 0) / 1024.0)
+
+    def claim_order(self, job_order: str) -> Optional[Tuple[str, List[Any], str]]:
+        """
+        Claim ordering by predicted cost, for WorkerLease.claim_next(cost_order=...).
+
+        Returns:
+            (SQL expression over the llm_responses row, its parameters, 'DESC' or 'ASC'),
+            or None for fifo
+        """
+        if job_order not in ('largest_first', 'shortest_first'):
+            return None
+        return 'predicted_cost_ms', [], 'DESC' if job_order == 'largest_first' else 'ASC'
+
+    def score_sql(self) -> Tuple[str, List[Any]]:
+        """
+        SQL expression for predict_ms over an llm_responses row `r` joined to its docs row `d`.
+
+        Returns:
+            (expression, parameters)
+        """
+        with self._lock:
+            doc_types = list(self.lines)
+            intercepts = [self.lines[doc_type][0] for doc_type in doc_types]
+            slopes = [self.lines[doc_type][1] for doc_type in doc_types]
+            connection_ids = list(self.speeds)
+            speeds = [self.speeds[connection_id] for connection_id in connection_ids]
+            default_intercept, default_slope = self.default_line
+
+        expression = """(
+            COALESCE((%s::float8[])[array_position(%s::int[], r.connection_id)], 1.0)
+            * (COALESCE((%s::float8[])[array_position(%s::text[], LOWER(d.doc_type))], %s)
+               + COALESCE((%s::float8[])[array_position(%s::text[], LOWER(d.doc_type))], %s)
+                 * COALESCE(d.file_size, 0) / 1024.0)
+        )"""
+        params = [speeds, connection_ids, intercepts, doc_types, default_intercept,
+                  slopes, doc_types, default_slope]
+        return expression, params
+
+    def rescore_queued(self, cursor=None, tolerance: float = 0.1) -> int:
+        """
+        Store the current prediction on QUEUED rows whose stored one is missing or off.
+
+        Rows within `tolerance` (relative) of the current prediction are left alone, so
+        refits that barely move the model do not rewrite the queue (and workers that
+        refit on the same history find nothing left to change).
+
+        Args:
+            cursor: KnowledgeDocuments cursor (default: a new connection, committed here)
+            tolerance: Relative change below which a stored prediction is kept
+
+        Returns:
+            Rows rescored
+        """
+        conn = None
+        if cursor is None:
+            import psycopg2
+            conn = psycopg2.connect(
+                host="studio.local",
+                database="KnowledgeDocuments",
+                user="postgres",
+                password="prodogs03",
+                port=5432
+            )
+            cursor = conn.cursor()
+        try:
+            expression, params = self.score_sql()
+            cursor.execute(f"""
+                UPDATE llm_responses target
+                SET predicted_cost_ms = scored.cost
+                FROM (
+                    SELECT r.id, {expression} AS cost
+                    FROM llm_responses r
+                    JOIN docs d ON d.id = r.document_id
+                    WHERE r.status = 'QUEUED'
+                ) scored
+                WHERE target.id = scored.id
+                AND target.status = 'QUEUED'
+                AND (target.predicted_cost_ms IS NULL
+                     OR ABS(target.predicted_cost_ms - scored.cost) > %s * scored.cost)
+            """, params + [tolerance])
+            rescored = cursor.rowcount
+            if conn is not None:
+                conn.commit()
+        finally:
+            if conn is not None:
+                cursor.close()
+                conn.close()
+        if rescored:
+            logger.info(f"Rescored {rescored} queued llm_responses with the refitted cost model")
+        return rescored
+
+    def estimate_completion(self, queued: Iterable[tuple], processing: Iterable[tuple],
+                            slots: int) -> Dict[str, Any]:
+        """
+        Predicted time until the remaining rows of a batch are done.
+
+        The remaining work is spread over `slots` dispatch slots, but the batch cannot
+        finish before its longest row: max(work / slots, longest row). Largest-first
+        placement of the rows finishes within 4/3 of that.
+
+        Args:
+            queued: (connection_id, doc_type, row_count, total_size, max_size) per group
+                    of QUEUED rows
+            processing: (connection_id, doc_type, row_count, total_size, total_elapsed_seconds)
+                        per group of PROCESSING rows
+            slots: Rows dispatched at the same time
+
+        Returns:
+            Dict with seconds/minutes/hours, plus the predicted total work and the slots used
+        """
+        slots = max(1, slots)
+        queued_seconds, remaining_seconds, longest = 0.0, 0.0, 0.0
+        for connection_id, doc_type, row_count, total_size, max_size in queued:
+            queued_seconds += self.predict_total_ms(connection_id, doc_type, row_count, total_size) / 1000.0
+            longest = max(longest, self.predict_ms(connection_id, doc_type, max_size) / 1000.0)
+        for connection_id, doc_type, row_count, total_size, elapsed in processing:
+            predicted = self.predict_total_ms(connection_id, doc_type, row_count, total_size) / 1000.0
+            # Running over the prediction: assume a tenth of it is still left
+            remaining = max(predicted - (elapsed or 0), predicted * 0.1)
+            remaining_seconds += remaining
+            longest = max(longest, remaining / max(1, row_count))
+
+        estimated_seconds = max((queued_seconds + remaining_seconds) / slots, longest)
+        return {
+            'seconds': int(estimated_seconds),
+            'minutes': round(estimated_seconds / 60, 1),
+            'hours': round(estimated_seconds / 3600, 2),
+            'predicted_work_seconds': int(queued_seconds),
+            'slots': slots,
+            'method': 'cost_model'
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'samples': self.samples,
+            'default_line': {'intercept_ms': round(self.default_line[0], 1),
+                             'ms_per_kb': round(self.default_line[1], 4)},
+            'doc_types': {doc_type: {'intercept_ms': round(intercept, 1), 'ms_per_kb': round(slope, 4)}
+                          for doc_type, (intercept, slope) in self.lines.items()},
+            'connection_speeds': {connection_id: round(speed, 3) for connection_id, speed in self.speeds.items()}
+        }
+
+
+# Global instance
+job_cost_model = JobCostModel()
@@ -0,0 +1,504 @@
+"""
+Direct Execution Engine
+
+Runs evaluations in-process against the provider instead of going
+Flask -> RAG API (port 7001) -> provider. That removes a serialization hop, the
+re-transfer of the base64 document and the task_status polling round trips.
+
+- Selected per connection: connection_config {"execution_mode": "direct"} (or "rag"),
+  otherwise DIRECT_EXECUTION_CONNECTIONS ("all" or a comma-separated list of connection ids)
+- Requests are built by the provider adapters in services/providers/ and sent from one
+  asyncio event loop thread, with one pooled HTTP session per provider host
+- Responses are streamed and token counts come from the provider itself
+  (Ollama prompt_eval_count/eval_count, OpenAI-compatible usage, Bedrock usage)
+- Every answer records time-to-first-token, mean inter-token latency and tokens/sec;
+  text of long generations is flushed to llm_responses.response_text every
+  DIRECT_PARTIAL_FLUSH_SECONDS while the row is still PROCESSING
+- The queue processor treats a direct run like a RAG API task: it gets a task id,
+  is polled with poll(), and its result goes through the same completion and failure
+  handling (BatchService.handle_task_completion / handle_task_failure)
+
+Documents the engine cannot turn into text (anything but text types, and PDFs when
+pypdf is not installed) and providers without an adapter stay on the RAG API path.
+
+Direct results are not scored. overall_score comes from the RAG API's scoring step,
+which has no in-process equivalent, so direct runs complete with overall_score NULL
+and response_json raw_data.scored = false. Connections whose evaluations need a score
+set connection_config {"require_score": true}; they always go through the RAG API,
+whatever execution_mode or DIRECT_EXECUTION_CONNECTIONS select.
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import base64
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Callable
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PdfReader = None
+    PYPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DIRECT_TASK_PREFIX = 'direct-'
+TEXT_DOC_TYPES = ('txt', 'text', 'md', 'markdown', 'csv', 'tsv', 'json', 'xml', 'html', 'htm',
+                  'yaml', 'yml', 'log', 'ini')
+PROVIDER_ALIASES = {'lm_studio': 'lmstudio', 'lm-studio': 'lmstudio', 'xai': 'grok', 'bedrock': 'amazon'}
+
+
+class ProviderRequestError(Exception):
+    """A provider answered a generation request with an HTTP error"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def document_text(doc_info: Dict[str, Any]) -> Optional[str]:
+    """
+    Text of a claimed document, decoded from its base64 docs.content.
+
+    Returns:
+        The text, or None when the document type needs the RAG API's extraction
+    """
+    encoded = doc_info.get('encoded_content')
+    if not encoded:
+        return None
+    doc_type = (doc_info.get('doc_type') or '').lower().lstrip('.')
+    content_type = (doc_info.get('content_type') or '').lower()
+
+    try:
+        raw = base64.b64decode(encoded)
+        if doc_type in TEXT_DOC_TYPES or content_type.startswith('text/') or content_type == 'application/json':
+            return raw.decode('utf-8', errors='replace')
+        if (doc_type == 'pdf' or content_type == 'application/pdf') and PYPDF_AVAILABLE:
+            reader = PdfReader(io.BytesIO(raw))
+            return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception as e:
+        logger.warning(f"Could not extract text of document {doc_info.get('document_id')}: {e}")
+    return None
+
+
+def stream_metrics(started: float, first_token_at: Optional[float], last_token_at: Optional[float],
+                   finished: float, output_tokens: Optional[int], chunks: int) -> Dict[str, Any]:
+    """
+    Latency metrics of one generation from its monotonic timestamps.
+
+    Token counts come from the provider when reported, otherwise the number of streamed
+    text chunks stands in for them. A response that was not streamed has no first-token
+    time; its rate is taken over the whole request.
+
+    Returns:
+        Dict with time_to_first_token_ms, inter_token_latency_ms and tokens_per_second
+        (None where not measurable)
+    """
+    tokens = output_tokens or chunks
+    metrics = {'time_to_first_token_ms': None, 'inter_token_latency_ms': None, 'tokens_per_second': None}
+    if first_token_at is None:
+        if tokens and finished > started:
+            metrics['tokens_per_second'] = round(tokens / (finished - started), 2)
+        return metrics
+
+    metrics['time_to_first_token_ms'] = int((first_token_at - started) * 1000)
+    generating = (last_token_at or first_token_at) - first_token_at
+    if tokens > 1 and generating > 0:
+        metrics['inter_token_latency_ms'] = round(generating * 1000 / (tokens - 1), 2)
+        metrics['tokens_per_second'] = round((tokens - 1) / generating, 2)
+    return metrics
+
+
+def build_messages(document_id: str, text: str, prompt_text: str) -> List[Dict[str, str]]:
+    """Document first, as a stable prefix shared by every prompt, then the prompt"""
+    return [
+        {'role': 'system', 'content': f"Document {document_id}:\n\n{text}"},
+        {'role': 'user', 'content': prompt_text}
+    ]
+
+
+class DirectExecutionEngine:
+    """Runs claimed llm_responses rows against their provider from an in-process event loop"""
+
+    def __init__(self, connections: Optional[str] = None, pool_size: Optional[int] = None,
+                 timeout_seconds: Optional[float] = None,
+                 adapters: Optional[Dict[str, Any]] = None,
+                 session_factory: Optional[Callable[[], Any]] = None,
+                 lookup: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None,
+                 partial_flush_seconds: Optional[float] = None,
+                 partial_sink: Optional[Callable[[int, str], Any]] = None):
+        setting = connections if connections is not None else os.getenv('DIRECT_EXECUTION_CONNECTIONS', '')
+        self.all_connections = setting.strip().lower() == 'all'
+        self.connection_ids = {
+            int(part) for part in setting.split(',') if part.strip().isdigit()
+        }
+        self.pool_size = pool_size or int(os.getenv('DIRECT_POOL_SIZE_PER_HOST', '8'))
+        self.timeout_seconds = timeout_seconds or float(os.getenv('DIRECT_REQUEST_TIMEOUT', '600'))
+        self._adapters = adapters
+        self._session_factory = session_factory
+        self._lookup = lookup
+        self.partial_flush_seconds = partial_flush_seconds if partial_flush_seconds is not None \
+            else float(os.getenv('DIRECT_PARTIAL_FLUSH_SECONDS', '15'))
+        self._partial_sink = partial_sink
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sessions: Dict[str, Any] = {}  # scheme://host:port -> pooled HTTP session
+        self._tasks: Dict[str, Dict[str, Any]] = {}  # task_id -> future, connection, submitted_at
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'fallbacks': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'partial_flushes': 0
+        }
+
+    # Selection
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any connection can run directly (per-connection config is checked per claim)"""
+        return AIOHTTP_AVAILABLE or self._session_factory is not None
+
+    def _connection_config(self, connection_id: Optional[int],
+                           snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        details = None
+        if connection_id is not None:
+            if self._lookup:
+                details = self._lookup(connection_id)
+            else:
+                from services.config_lookup import config_lookup
+                details = config_lookup.get_connection(connection_id)
+        config = (details or snapshot or {}).get('connection_config') or {}
+        if isinstance(config, str):
+            try:
+                config = json.loads(config)
+            except ValueError:
+                config = {}
+        return config if isinstance(config, dict) else {}
+
+    def is_direct(self, connection_id: Optional[int], connection_details: Optional[Dict[str, Any]] = None) -> bool:
+        """Whether a connection is configured for direct execution (never when it requires scores)"""
+        config = self._connection_config(connection_id, connection_details)
+        if config.get('require_score'):
+            return False
+        mode = config.get('execution_mode')
+        if mode:
+            return mode == 'direct'
+        return self.all_connections or connection_id in self.connection_ids
+
+    def adapter_for(self, provider_type: Optional[str]):
+        """Provider adapter that can build generation requests, or None"""
+        provider_type = (provider_type or '').lower()
+        provider_type = PROVIDER_ALIASES.get(provider_type, provider_type)
+        if self._adapters is None:
+            from services.llm_provider_service import llm_provider_service
+            self._adapters = llm_provider_service.provider_adapters
+        return self._adapters.get(provider_type)
+
+    def owns(self, task_id: Optional[str]) -> bool:
+        """Whether a task id belongs to a direct run (of this or an earlier process)"""
+        return bool(task_id) and task_id.startswith(DIRECT_TASK_PREFIX)
+
+    # Submission and polling
+
+    def submit(self, doc_info: Dict[str, Any]) -> Optional[str]:
+        """
+        Start running the prompts of a claimed document directly.
+
+        Args:
+            doc_info: Result of BatchService.get_next_document_for_processing()
+
+        Returns:
+            Task id to poll, or None when the row has to go through the RAG API
+            (connection not selected, no adapter, document needs text extraction)
+        """
+        if not self.enabled or not self.is_direct(doc_info.get('connection_id'), doc_info.get('connection_details')):
+            return None
+
+        llm_config = dict(doc_info.get('llm_config') or {})
+        config = {**self._connection_config(doc_info.get('connection_id'), doc_info.get('connection_details')),
+                  **llm_config}
+        adapter = self.adapter_for(config.get('provider_type'))
+        text = document_text(doc_info) if adapter else None
+        if text is None:
+            self.stats['fallbacks'] += 1
+            logger.info(f"Document {doc_info.get('document_id')} on connection {doc_info.get('connection_id')} "
+                        f"goes through the RAG API (no adapter or no extractable text)")
+            return None
+
+        options = {'prompt_cache_key': f"{doc_info['document_id']}:{doc_info.get('connection_id')}"}
+        try:
+            requests_to_send = [
+                (prompt.get('response_id', doc_info.get('response_id')),
+                 *adapter.build_generation_request(config, build_messages(doc_info['document_id'], text, prompt['text']),
+                                                   options))
+                for prompt in doc_info.get('prompts') or [doc_info['prompt']]
+            ]
+        except (NotImplementedError, ValueError) as e:
+            self.stats['fallbacks'] += 1
+            logger.warning(f"Connection {doc_info.get('connection_id')} cannot run directly: {e}")
+            return None
+
+        task_id = f"{DIRECT_TASK_PREFIX}{uuid.uuid4().hex}"
+        future = asyncio.run_coroutine_threadsafe(self._run(adapter, requests_to_send), self._ensure_loop())
+        with self._lock:
+            self._tasks[task_id] = {
+                'future': future,
+                'connection_id': doc_info.get('connection_id'),
+                'provider_type': config.get('provider_type'),
+                'submitted_at': datetime.now()
+            }
+        self.stats['submitted'] += 1
+        logger.info(f"Running document {doc_info['document_id']} directly on {config.get('provider_type')} "
+                    f"as task {task_id}")
+        return task_id
+
+    def poll(self, task_id: str) -> Dict[str, Any]:
+        """
+        Status of a direct task, in the shape BatchQueueProcessor._check_task_status returns.
+
+        A task id this process does not know was started by a process that has since
+        died; it is reported as a transient failure so the rows are re-queued.
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task and task['future'].done():
+                del self._tasks[task_id]
+
+        if not task:
+            return {
+                'completed': True,
+                'success': False,
+                'error': f'Direct task {task_id} is not running in this process',
+                'failure_class': 'transient'
+            }
+        future = task['future']
+        if not future.done():
+            return {'completed': False, 'status': 'processing'}
+
+        if future.cancelled():
+            status = {'completed': True, 'success': False, 'error': 'Direct task cancelled',
+                      'failure_class': 'transient'}
+        else:
+            status = future.result()
+        self.stats['completed' if status.get('success') else 'failed'] += 1
+        self.stats['input_tokens'] += status.get('input_tokens') or 0
+        self.stats['output_tokens'] += status.get('output_tokens') or 0
+        return status
+
+    def cancel(self, task_id: str) -> bool:
+        """Stop a direct task (e.g. after the processor timed it out)"""
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+        return bool(task) and task['future'].cancel()
+
+    # Event loop
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._sessions = {}
+                self._thread = threading.Thread(target=self._loop.run_forever, name='direct-execution',
+                                                daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _session_for(self, url: str):
+        """Pooled HTTP session of the provider host (created on the loop thread)"""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(host)
+        if session is None:
+            if self._session_factory:
+                session = self._session_factory()
+            else:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit_per_host=self.pool_size, keepalive_timeout=60),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout_seconds, sock_connect=10)
+                )
+            self._sessions[host] = session
+        return session
+
+    async def _run(self, adapter, requests_to_send: List[tuple]) -> Dict[str, Any]:
+        """
+        Send a document's prompts one after another (the provider can reuse the cached
+        document prefix) and combine the answers into one task status.
+
+        A failure after the first prompt keeps the answers so far; the processor
+        re-queues the prompts left without a result.
+        """
+        results = []
+        for response_id, url, headers, payload in requests_to_send:
+            try:
+                results.append(await self._generate(adapter, url, headers, payload, response_id))
+            except ProviderRequestError as e:
+                error = {'error': f'Provider error ({e.status_code}): {e}', 'status_code': e.status_code}
+            except asyncio.TimeoutError:
+                error = {'error': f'Provider request timed out after {self.timeout_seconds:.0f}s',
+                         'failure_class': 'transient'}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = {'error': f'Provider request failed: {e}', 'failure_class': 'transient'}
+            else:
+                continue
+            if not results:
+                return {'completed': True, 'success': False, **error}
+            logger.warning(f"Direct task stopped after {len(results)} of {len(requests_to_send)} prompts: "
+                           f"{error['error']}")
+            break
+
+        def total(field: str) -> Optional[int]:
+            values = [result[field] for result in results if result.get(field) is not None]
+            return sum(values) if values else None
+
+        return {
+            'completed': True,
+            'success': True,
+            'response_text': results[0]['response_text'],
+            'input_tokens': total('input_tokens') or 0,
+            'output_tokens': total('output_tokens') or 0,
+            'cached_tokens': total('cached_tokens'),
+            'response_time_ms': sum(int(result['time_taken_seconds'] * 1000) for result in results),
+            'overall_score': None,  # Scoring is a RAG API step (see module docstring)
+            'load_seconds': sum(result.get('load_seconds') or 0 for result in results) or None,
+            # Latency of the first prompt; each entry of 'results' carries its own
+            'time_to_first_token_ms': results[0]['time_to_first_token_ms'],
+            'inter_token_latency_ms': results[0]['inter_token_latency_ms'],
+            'tokens_per_second': results[0]['tokens_per_second'],
+            'results': results,
+            'raw_data': {'execution': 'direct', 'provider_type': adapter.provider_type, 'scored': False}
+        }
+
+    async def _generate(self, adapter, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                        response_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Send one generation request and accumulate its (streamed) answer, token counts
+        and latency metrics, flushing partial text of long generations for response_id
+        """
+        result = {'response_text': '', 'input_tokens': None, 'output_tokens': None,
+                  'cached_tokens': None, 'load_seconds': None}
+        timing = {'first': None, 'last': None, 'chunks': 0}
+
+        def accumulate(parsed: Dict[str, Any]):
+            if parsed.get('text'):
+                result['response_text'] += parsed['text']
+                timing['last'] = time.monotonic()
+                timing['first'] = timing['first'] or timing['last']
+                timing['chunks'] += 1
+            for field in ('input_tokens', 'output_tokens', 'cached_tokens', 'load_seconds'):
+                if parsed.get(field) is not None:
+                    result[field] = parsed[field]
+
+        started = time.monotonic()
+        flushed_at, flushed_length = started, 0
+        async with self._session_for(url).post(url, json=payload, headers=headers) as response:
+            if response.status >= 400:
+                body = await response.text()
+                raise ProviderRequestError(response.status, body[:200])
+
+            if adapter.stream_format is None:
+                accumulate(adapter.parse_generation_chunk(await response.json(content_type=None)))
+            else:
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8', errors='replace').strip()
+                    if adapter.stream_format == 'sse':
+                        if not line.startswith('data:'):
+                            continue
+                        line = line[5:].strip()
+                        if line == '[DONE]':
+                            break
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        message = chunk['error'].get('message') if isinstance(chunk['error'], dict) else chunk['error']
+                        raise ProviderRequestError(response.status, str(message))
+                    accumulate(adapter.parse_generation_chunk(chunk))
+                    
+                    if (response_id is not None and len(result['response_text']) > flushed_length
+                            and timing['last'] - flushed_at >= self.partial_flush_seconds):
+                        await self._flush_partial(response_id, result['response_text'])
+                        flushed_at, flushed_length = timing['last'], len(result['response_text'])
+
+        finished = time.monotonic()
+        result['time_taken_seconds'] = finished - started
+        result.update(stream_metrics(started, timing['first'], timing['last'], finished,
+                                     result['output_tokens'], timing['chunks']))
+        return result
+
+    async def _flush_partial(self, response_id: int, text: str):
+        """Store the text generated so far (blocking DB write, run off the event loop)"""
+        sink = self._partial_sink
+        if sink is None:
+            from services.batch_service import batch_service
+            sink = batch_service.save_partial_response
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, sink, response_id, text)
+            self.stats['partial_flushes'] += 1
+        except Exception as e:
+            logger.warning(f"Could not flush partial output of llm_response {response_id}: {e}")
+
+    def shutdown(self):
+        """Cancel running tasks, close the pooled sessions and stop the event loop"""
+        with self._lock:
+            loop, tasks = self._loop, list(self._tasks.values())
+            self._tasks.clear()
+            self._loop = None
+        for task in tasks:
+            task['future'].cancel()
+        if loop is None:
+            return
+
+        async def close_sessions():
+            for session in list(self._sessions.values()):
+                close = getattr(session, 'close', None)
+                if close:
+                    await close()
+            self._sessions = {}
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_sessions(), loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Error closing direct execution sessions: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Selection, pool and token totals of the engine"""
+        with self._lock:
+            running = len(self._tasks)
+            hosts = list(self._sessions.keys())
+        return {
+            'available': self.enabled,
+            'all_connections': self.all_connections,
+            'connection_ids': sorted(self.connection_ids),
+            'pool_size_per_host': self.pool_size,
+            'timeout_seconds': self.timeout_seconds,
+            'partial_flush_seconds': self.partial_flush_seconds,
+            'running_tasks': running,
+            'hosts': hosts,
+            'stats': self.stats.copy()
+        }
+
+
+# Global instance
+direct_execution = DirectExecutionEngine()
@@ -7,7 +7,7 @@ from typing import Dict, Optional, List
 from enum import Enum
 from dataclasses import dataclass, field
 
-from services.config import service_config, ServiceConfig
+from services.config import service_config, ServiceConfig, ServiceType
 
 logger = logging.getLogger(__name__)
 
@@ -199,6 +199,14 @@ class ServiceHealthMonitor:
         # Update current status
         self.current_status[service_name] = health_check.status
         
+        # Trip or probe the circuit breaker of RAG endpoints
+        config = service_config.get_service(service_name)
+        if config and config.service_type == ServiceType.RAG_API \
+                and health_check.status in (HealthStatus.HEALTHY, HealthStatus.UNHEALTHY):
+            from services.circuit_breakers import circuit_breakers
+            circuit_breakers.record_health(config.full_url, health_check.status == HealthStatus.HEALTHY,
+                                           health_check.error_message or '')
+        
         # Log status changes
         if len(self.health_checks[service_name]) > 1:
             previous_status = self.health_checks[service_name][-2].status
@@ -0,0 +1,201 @@
+"""
+Hedged Requests
+
+A few tasks sit in PROCESSING far longer than their connection usually needs (a
+stuck RAG API worker, an overloaded host) and decide when a batch completes. With
+HEDGE_ENABLED=true the queue processor sends a duplicate of such a straggler:
+
+- a task is a straggler once its elapsed time exceeds the HEDGE_PERCENTILE (default
+  p95) of its connection's last HEDGE_HISTORY completion times, given at least
+  HEDGE_MIN_SAMPLES of them and never below HEDGE_MIN_SECONDS
+- the duplicate goes to an equivalent connection - same model, provider type and
+  generation settings (connection_config, e.g. temperature and max_tokens) on a
+  different host - when an active one exists, otherwise to another RAG API
+  instance of the endpoint pool
+- each task is hedged at most once, and at most HEDGE_MAX_RATE of dispatched tasks
+- the first successful copy is written to the rows, with the connection that answered
+  in llm_responses.answered_by_connection_id so latency statistics and the job cost
+  model credit it; the other copy is cancelled (direct execution) or ignored. A
+  failed copy is only reported once no copy is left.
+
+Hedge rate, wins and the time saved are reported in the queue processor status.
+Time saved is measured on ignored losers: from the winning result until the loser
+finished (or would have timed out). State is per process.
+"""
+
+import os
+import json
+import math
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# connection_config keys that tune the host serving the model, not what it generates
+HOST_SETTINGS = ('keep_alive',)
+
+
+def percentile(samples: Iterable[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None without samples"""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def generation_settings(details: Dict[str, Any]) -> tuple:
+    """Provider type and connection_config (without host settings) of a connection, canonically"""
+    config = details.get('connection_config') or {}
+    if isinstance(config, str):
+        config = json.loads(config)
+    config = {key: value for key, value in config.items() if key not in HOST_SETTINGS}
+    return (details.get('provider_type'), json.dumps(config, sort_keys=True, default=str))
+
+
+class HedgingPolicy:
+    """Decides when a running task gets a duplicate and where the duplicate goes"""
+
+    def __init__(self, enabled: Optional[bool] = None, percentile_threshold: Optional[float] = None,
+                 min_samples: Optional[int] = None, min_seconds: Optional[float] = None,
+                 max_rate: Optional[float] = None, history: Optional[int] = None,
+                 connections: Optional[Callable[[], Dict[int, Dict[str, Any]]]] = None):
+        self.enabled = enabled if enabled is not None \
+            else os.getenv('HEDGE_ENABLED', 'false').lower() == 'true'
+        self.percentile = percentile_threshold if percentile_threshold is not None \
+            else float(os.getenv('HEDGE_PERCENTILE', '95'))
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+        self.min_seconds = min_seconds if min_seconds is not None else float(os.getenv('HEDGE_MIN_SECONDS', '30'))
+        self.max_rate = max_rate if max_rate is not None else float(os.getenv('HEDGE_MAX_RATE', '0.05'))
+        self.history = history if history is not None else int(os.getenv('HEDGE_HISTORY', '200'))
+        # Returns all connections keyed by id (default: config_lookup)
+        self._connections = connections
+        self._lock = threading.Lock()
+        self._latencies: Dict[int, deque] = {}  # connection_id -> recent completion times (seconds)
+        self.stats = {
+            'dispatched': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'primary_wins': 0,
+            'copies_failed': 0,
+            'losers_cancelled': 0,
+            'losers_measured': 0,
+            'saved_seconds': 0.0
+        }
+
+    # Latency history
+
+    def record_latency(self, connection_id: Optional[int], seconds: Optional[float]):
+        """Completion time of a successful task on a connection"""
+        if connection_id is None or seconds is None or seconds < 0:
+            return
+        with self._lock:
+            self._latencies.setdefault(connection_id, deque(maxlen=self.history)).append(seconds)
+
+    def threshold(self, connection_id: Optional[int]) -> Optional[float]:
+        """Elapsed seconds after which a task on the connection is a straggler, None if unknown"""
+        samples = list(self._latencies.get(connection_id, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_seconds, percentile(samples, self.percentile))
+
+    # Decisions
+
+    def should_hedge(self, task_info: Dict[str, Any], elapsed_seconds: float) -> bool:
+        """
+        Whether a running task gets a duplicate now.
+
+        Args:
+            task_info: Tracked task of the queue processor; only tasks dispatched by this
+                       process carry the 'doc_info' needed to send a copy
+            elapsed_seconds: Time since the task was submitted
+        """
+        if not self.enabled or not task_info.get('doc_info'):
+            return False
+        if task_info.get('hedge_of') or task_info.get('hedge_attempted'):
+            return False
+        threshold = self.threshold(task_info.get('connection_id'))
+        if threshold is None or elapsed_seconds < threshold:
+            return False
+        return self.stats['hedged'] < self.max_rate * self.stats['dispatched']
+
+    def equivalent_connections(self, connection_id: Optional[int], exclude: Iterable[int] = ()) -> List[int]:
+        """
+        Active connections serving the same model with the same generation settings
+        from a different host, so a copy answers the same request.
+
+        Returns:
+            Connection ids, fastest (lowest median completion time) first
+        """
+        if connection_id is None:
+            return []
+        if self._connections:
+            connections = self._connections()
+        else:
+            from services.config_lookup import config_lookup
+            connections = config_lookup.get_connections()
+
+        from utils.llm_config_formatter import build_complete_url
+        def host(details):
+            return build_complete_url(details.get('base_url'), details.get('port_no')).rstrip('/')
+
+        source = connections.get(connection_id)
+        if not source or source.get('model_id') is None:
+            return []
+        excluded = set(exclude) | {connection_id}
+        settings = generation_settings(source)
+        candidates = [
+            other_id for other_id, details in connections.items()
+            if other_id not in excluded and details.get('is_active', True)
+            and details.get('model_id') == source['model_id'] and host(details) != host(source)
+            and generation_settings(details) == settings
+        ]
+
+        def speed(other_id):
+            median = percentile(self._latencies.get(other_id, ()), 50)
+            return (median is None, median or 0, other_id)
+        return sorted(candidates, key=speed)
+
+    # Outcomes
+
+    def record_dispatch(self):
+        self.stats['dispatched'] += 1
+
+    def record_hedge(self):
+        self.stats['hedged'] += 1
+
+    def record_win(self, hedge: bool):
+        self.stats['hedge_wins' if hedge else 'primary_wins'] += 1
+
+    def record_copy_failed(self):
+        self.stats['copies_failed'] += 1
+
+    def record_loser(self, saved_seconds: Optional[float] = None):
+        """A losing copy was cancelled (None) or finished saved_seconds after the winner"""
+        if saved_seconds is None:
+            self.stats['losers_cancelled'] += 1
+        else:
+            self.stats['losers_measured'] += 1
+            self.stats['saved_seconds'] += max(0.0, saved_seconds)
+
+    def get_status(self) -> Dict[str, Any]:
+        stats = self.stats.copy()
+        stats['saved_seconds'] = round(stats['saved_seconds'], 1)
+        return {
+            'enabled': self.enabled,
+            'percentile': self.percentile,
+            'min_samples': self.min_samples,
+            'min_seconds': self.min_seconds,
+            'max_rate': self.max_rate,
+            'hedge_rate': round(stats['hedged'] / stats['dispatched'], 4) if stats['dispatched'] else 0.0,
+            'thresholds': {
+                connection_id: self.threshold(connection_id) for connection_id in list(self._latencies)
+            },
+            'stats': stats
+        }
+
+
+# Global instance
+hedging_policy = HedgingPolicy()
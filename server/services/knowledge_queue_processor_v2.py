@@ -13,6 +13,7 @@ import threading
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from services.batch_service import batch_service
+from services.rag_pool import rag_endpoint_pool
 
 logger = logging.getLogger(__name__)
 
@@ -33,8 +34,13 @@ class KnowledgeQueueProcessorV2:
             'last_activity': None
         }
         
-        # RAG API configuration
-        self.rag_api_url = "http://localhost:7001"
+        # RAG API instances: new tasks go to the least loaded one, polls to the task's own
+        self.rag_pool = rag_endpoint_pool
+        
+    @property
+    def rag_api_url(self) -> str:
+        """Primary RAG API instance"""
+        return self.rag_pool.primary_url()
         
     def start(self):
         """Start the queue processor"""
@@ -65,7 +71,8 @@ class KnowledgeQueueProcessorV2:
             'max_concurrent': self.max_concurrent,
             'active_tasks': len(self.active_tasks),
             'stats': self.stats.copy(),
-            'rag_api_url': self.rag_api_url
+            'rag_api_url': self.rag_api_url,
+            'rag_pool': self.rag_pool.get_status()
         }
         
     def _process_loop(self):
@@ -131,7 +138,8 @@ class KnowledgeQueueProcessorV2:
                     success = batch_service.update_document_task(
                         doc_info['response_id'], 
                         task_id, 
-                        'PROCESSING'
+                        'PROCESSING',
+                        rag_endpoint=self.rag_pool.url_for_task(task_id)
                     )
                     
                     if success:
@@ -145,6 +153,7 @@ class KnowledgeQueueProcessorV2:
                         logger.info(f"✓ Submitted document {doc_info['response_id']} as task {task_id}")
                     else:
                         logger.error(f"Failed to update task_id for document {doc_info['response_id']}")
+                        self.rag_pool.release(task_id)
                 else:
                     # Failed to submit, update status
                     batch_service.update_document_status(
@@ -158,7 +167,11 @@ class KnowledgeQueueProcessorV2:
             logger.error(f"Error processing batch {batch_id} documents: {e}")
             
     def _submit_document_to_rag(self, doc_info: Dict[str, Any]) -> Optional[str]:
-        """Submit document to RAG API and return task_id"""
+        """Submit document to the least loaded RAG API instance and return task_id"""
+        rag_url = self.rag_pool.acquire()
+        if not rag_url:
+            logger.warning("No RAG API instance available")
+            return None
         try:
             # Prepare form data for RAG API
             form_data = {
@@ -172,7 +185,7 @@ class KnowledgeQueueProcessorV2:
             
             # Make request to RAG API
             response = requests.post(
-                f"{self.rag_api_url}/analyze_document_with_llm",
+                f"{rag_url}/analyze_document_with_llm",
                 data=form_data,
                 timeout=30
             )
@@ -182,24 +195,32 @@ class KnowledgeQueueProcessorV2:
                 task_id = result.get('task_id')
                 
                 if task_id:
-                    logger.info(f"RAG API accepted document, task_id: {task_id}")
+                    logger.info(f"RAG API {rag_url} accepted document, task_id: {task_id}")
+                    self.rag_pool.record_success(rag_url)
+                    self.rag_pool.pin(task_id, rag_url)
                     return task_id
                 else:
                     logger.error(f"RAG API response missing task_id: {result}")
-                    return None
+                    self.rag_pool.record_success(rag_url)
             else:
                 logger.error(f"RAG API returned {response.status_code}: {response.text}")
-                return None
+                if response.status_code >= 500:
+                    self.rag_pool.record_failure(rag_url)
+                else:
+                    self.rag_pool.record_success(rag_url)
                 
         except requests.exceptions.Timeout:
             logger.error("RAG API request timed out")
-            return None
+            self.rag_pool.record_failure(rag_url)
         except requests.exceptions.ConnectionError:
             logger.error("Could not connect to RAG API")
-            return None
+            self.rag_pool.record_failure(rag_url)
         except Exception as e:
             logger.error(f"Error submitting to RAG API: {e}")
-            return None
+            self.rag_pool.record_failure(rag_url)
+        
+        self.rag_pool.release_url(rag_url)
+        return None
             
     def _check_active_tasks(self):
         """Check status of all active tasks"""
@@ -266,12 +287,13 @@ class KnowledgeQueueProcessorV2:
         # Remove completed tasks
         for task_id in completed_tasks:
             del self.active_tasks[task_id]
+            self.rag_pool.release(task_id)
             
     def _check_task_status(self, task_id: str) -> Dict[str, Any]:
         """Check status of a specific task"""
         try:
             response = requests.get(
-                f"{self.rag_api_url}/task_status/{task_id}",
+                f"{self.rag_pool.url_for_task(task_id)}/task_status/{task_id}",
                 timeout=10
             )
             
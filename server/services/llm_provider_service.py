@@ -18,6 +18,7 @@ from sqlalchemy import and_, text
 from database import Session
 from models import LlmProvider, LlmModel
 from services.model_service import model_service
+from services.config_lookup import config_lookup
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +26,18 @@ class LlmProviderService:
     """Service for managing LLM providers and their models"""
     
     def __init__(self):
-        self.provider_adapters = {}
-        self._load_provider_adapters()
+        self._provider_adapters = None
+    
+    @property
+    def provider_adapters(self) -> Dict[str, Any]:
+        """Provider adapters, imported on first use to keep server startup fast"""
+        if self._provider_adapters is None:
+            self._load_provider_adapters()
+        return self._provider_adapters
     
     def _load_provider_adapters(self):
         """Load provider adapters dynamically"""
+        self._provider_adapters = {}
         try:
             from services.providers.ollama_provider import OllamaProvider
             from services.providers.openai_provider import OpenAIProvider
@@ -37,14 +45,14 @@ class LlmProviderService:
             from services.providers.amazon_provider import AmazonProvider
             from services.providers.grok_provider import GrokProvider
             
-            self.provider_adapters = {
+            self._provider_adapters = {
                 'ollama': OllamaProvider(),
                 'openai': OpenAIProvider(),
                 'lmstudio': LMStudioProvider(),
                 'amazon': AmazonProvider(),
                 'grok': GrokProvider()
             }
-            logger.info(f"Loaded {len(self.provider_adapters)} provider adapters")
+            logger.info(f"Loaded {len(self._provider_adapters)} provider adapters")
         except ImportError as e:
             logger.warning(f"Some provider adapters not available: {e}")
     
@@ -83,6 +91,7 @@ class LlmProviderService:
             session.commit()
             
             logger.info(f"Created provider: {provider.name}")
+            config_lookup.invalidate('providers')
             return self._provider_to_dict(provider)
         finally:
             session.close()
@@ -102,6 +111,7 @@ class LlmProviderService:
             
             session.commit()
             logger.info(f"Updated provider: {provider.name}")
+            config_lookup.invalidate('providers')
             return self._provider_to_dict(provider)
         finally:
             session.close()
@@ -122,6 +132,7 @@ class LlmProviderService:
             session.commit()
             
             logger.info(f"Deleted provider: {provider.name}")
+            config_lookup.invalidate('providers')
             return True
         finally:
             session.close()
@@ -204,6 +215,7 @@ class LlmProviderService:
             session.commit()
 
             logger.info(f"Provider {provider.name} {'activated' if is_active else 'deactivated'}")
+            config_lookup.invalidate('providers')
             return True
         finally:
             session.close()
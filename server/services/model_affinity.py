@@ -0,0 +1,420 @@
+"""
+Model Affinity Scheduler
+
+Local LLM hosts (Ollama, LM Studio) keep one or a few models in memory. When
+queued rows for several models on the same host are dispatched interleaved, the
+host unloads and reloads weights between requests and the swaps dominate the
+wall-clock time of a batch.
+
+The queue processor asks this scheduler which connections to leave queued:
+- rows are grouped by (host, model); each host has one active model at a time
+- the active model's backlog is drained before the host switches to another model
+- a switch before the backlog is drained happens only when another model's oldest
+  row has waited longer than the switch is worth (MODEL_SWITCH_COST_FACTOR times its
+  observed load time, at least MODEL_SWITCH_MIN_WAIT seconds), and only within a
+  budget of MODEL_SWITCHES_PER_HOUR per host
+- the load/swap time of every connection is measured from Ollama's load_duration
+  when the RAG API reports it, otherwise from the first response after a switch
+  compared with the connection's usual response time
+
+Remote providers have no model to swap and are never deferred.
+
+Several worker processes can dispatch to the same host. With a HostModelStore
+(the default for the global instance, MODEL_AFFINITY_SHARED=true) the active model
+of every host and its recent switches live in the host_model_affinity table: a
+worker adopts the host's model from there, and a switch is a compare-and-set on
+the model it expects, so only one of the workers racing to switch a host wins and
+the others defer to the winner's model. The switch budget is shared the same way.
+When the table cannot be reached the scheduler falls back to its own state.
+Measured load times stay per process.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Callable, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+LOCAL_PROVIDERS = ('ollama', 'lmstudio', 'lm_studio', 'lm-studio')
+DEFAULT_LOAD_SECONDS = 20.0
+EWMA_ALPHA = 0.3
+
+
+def _ewma(previous: Optional[float], sample: float) -> float:
+    return sample if previous is None else previous + EWMA_ALPHA * (sample - previous)
+
+
+class HostModelStore:
+    """Active model and switch history of each local host, shared by all workers (host_model_affinity)"""
+
+    def __init__(self, session_factory: Optional[Callable] = None, worker_id: Optional[str] = None):
+        if session_factory is None:
+            from database import Session
+            session_factory = Session
+        self.session_factory = session_factory
+        self._worker_id = worker_id
+        self._last_error = None
+
+    @property
+    def worker_id(self) -> str:
+        if self._worker_id is None:
+            from services.worker_lease import worker_lease
+            self._worker_id = worker_lease.worker_id
+        return self._worker_id
+
+    def _log_error(self, action: str, error: Exception):
+        # Logged once per distinct error: the scheduler retries every monitor cycle
+        if str(error) != self._last_error:
+            self._last_error = str(error)
+            logger.warning(f"Model affinity falls back to per-process state, could not {action}: {error}")
+
+    def load(self, hosts: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Shared state of the given hosts
+
+        Returns:
+            Dict host -> {'model', 'recent_switches'} (switches in the last hour) for hosts
+            with a row, or None when the table cannot be read
+        """
+        session = self.session_factory()
+        try:
+            rows = session.execute(text("""
+                SELECT host, active_model,
+                       cardinality(ARRAY(SELECT t FROM unnest(switch_times) AS t
+                                         WHERE t > NOW() - INTERVAL '1 hour'))
+                FROM host_model_affinity
+                WHERE host = ANY(:hosts)
+            """), {'hosts': list(hosts)}).fetchall()
+            session.commit()
+            self._last_error = None
+            return {host: {'model': model, 'recent_switches': switches} for host, model, switches in rows}
+
+        except Exception as e:
+            session.rollback()
+            self._log_error('read host_model_affinity', e)
+            return None
+        finally:
+            session.close()
+
+    def switch(self, host: str, expected: Optional[str], model: str) -> Optional[Tuple[str, bool]]:
+        """
+        Switch a host to a model unless another worker changed it first
+
+        Args:
+            host: Host URL
+            expected: Model this worker believes the host is serving (None if unknown)
+            model: Model to switch to
+
+        Returns:
+            (model the host serves afterwards, whether this worker switched it), or None
+            when the table cannot be written
+        """
+        session = self.session_factory()
+        try:
+            params = {'host': host, 'expected': expected, 'model': model, 'worker_id': self.worker_id}
+            session.execute(text("""
+                INSERT INTO host_model_affinity (host, active_model, updated_by, updated_at)
+                VALUES (:host, NULL, :worker_id, NOW())
+                ON CONFLICT (host) DO NOTHING
+            """), params)
+            # Loading the first model is not a switch and does not use the budget
+            row = session.execute(text("""
+                UPDATE host_model_affinity
+                SET active_model = :model,
+                    switch_times = CASE WHEN active_model IS NULL THEN switch_times
+                                        ELSE ARRAY(SELECT t FROM unnest(switch_times) AS t
+                                                   WHERE t > NOW() - INTERVAL '1 hour') || NOW()::timestamp
+                                   END,
+                    updated_by = :worker_id,
+                    updated_at = NOW()
+                WHERE host = :host
+                AND active_model IS NOT DISTINCT FROM CAST(:expected AS TEXT)
+                RETURNING active_model
+            """), params).fetchone()
+            switched = row is not None
+            if not switched:
+                row = session.execute(text("""
+                    SELECT active_model FROM host_model_affinity WHERE host = :host
+                """), params).fetchone()
+            session.commit()
+            self._last_error = None
+            return row[0], switched
+
+        except Exception as e:
+            session.rollback()
+            self._log_error('switch the model of a host', e)
+            return None
+        finally:
+            session.close()
+
+
+class ModelAffinityScheduler:
+    """Keeps each local LLM host on one model until its work is drained or a switch is worth it"""
+
+    def __init__(self, switches_per_hour: Optional[int] = None, min_wait_seconds: Optional[float] = None,
+                 switch_cost_factor: Optional[float] = None, clock: Callable[[], float] = time.monotonic,
+                 lookup: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None,
+                 store: Optional[HostModelStore] = None):
+        self.switches_per_hour = switches_per_hour if switches_per_hour is not None \
+            else int(os.getenv('MODEL_SWITCHES_PER_HOUR', '12'))
+        self.min_wait_seconds = min_wait_seconds if min_wait_seconds is not None \
+            else float(os.getenv('MODEL_SWITCH_MIN_WAIT', '120'))
+        self.switch_cost_factor = switch_cost_factor if switch_cost_factor is not None \
+            else float(os.getenv('MODEL_SWITCH_COST_FACTOR', '10'))
+        self.clock = clock
+        self._lookup = lookup
+        self.store = store
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, Any]] = {}  # host -> active model, recent switches, measuring flag
+        self._connections: Dict[int, Dict[str, Any]] = {}  # connection_id -> observed timings
+        self._deferred: List[int] = []
+
+    def model_key(self, connection_id: Optional[int]) -> Optional[Tuple[str, str]]:
+        """(host URL, model name) of a local connection, or None when affinity does not apply"""
+        if connection_id is None:
+            return None
+        if self._lookup:
+            details = self._lookup(connection_id)
+        else:
+            from services.config_lookup import config_lookup
+            details = config_lookup.get_connection(connection_id)
+        if not details or (details.get('provider_type') or '').lower() not in LOCAL_PROVIDERS:
+            return None
+
+        from utils.llm_config_formatter import build_complete_url
+        host = build_complete_url(details.get('base_url'), details.get('port_no')).rstrip('/')
+        return host, details.get('model_name') or f"model:{details.get('model_id')}"
+
+    def _host(self, host: str) -> Dict[str, Any]:
+        return self._hosts.setdefault(host, {
+            'model': None,
+            'switches': deque(),  # clock() of recent switches, for the hourly budget
+            'switch_count': 0,
+            'shared_switches': None,  # switches of all workers in the last hour, with a store
+            'measure_load': False
+        })
+
+    def _switch_budget_left(self, state: Dict[str, Any]) -> int:
+        if state['shared_switches'] is not None:
+            return self.switches_per_hour - state['shared_switches']
+        now = self.clock()
+        while state['switches'] and now - state['switches'][0] > 3600:
+            state['switches'].popleft()
+        return self.switches_per_hour - len(state['switches'])
+
+    def switch_cost(self, host: str, model: str) -> float:
+        """Observed seconds to load a model on a host (DEFAULT_LOAD_SECONDS until measured)"""
+        samples = [
+            stats['load_seconds'] for stats in self._connections.values()
+            if stats.get('key') == (host, model) and stats.get('load_seconds') is not None
+        ]
+        return sum(samples) / len(samples) if samples else DEFAULT_LOAD_SECONDS
+
+    def update(self, ready_batches: Iterable[Dict[str, Any]], blocked_connection_ids: Iterable[int] = ()):
+        """
+        Pick the active model of every host from the current backlog and work out
+        which connections must stay queued.
+
+        Args:
+            ready_batches: Batch dicts with 'queued_by_connection' from
+                           BatchService.get_batches_ready_for_processing()
+            blocked_connection_ids: Connections that cannot be dispatched (open circuit breakers)
+        """
+        blocked = set(blocked_connection_ids)
+        backlog: Dict[str, Dict[str, Dict[str, Any]]] = {}  # host -> model -> queued, oldest, connections
+        for batch in ready_batches:
+            for connection_id, queue in (batch.get('queued_by_connection') or {}).items():
+                key = self.model_key(connection_id)
+                if not key or connection_id in blocked or not queue.get('queued'):
+                    continue
+                host, model = key
+                entry = backlog.setdefault(host, {}).setdefault(model, {
+                    'queued': 0, 'oldest_queued_at': None, 'connections': set()
+                })
+                entry['queued'] += queue['queued']
+                entry['connections'].add(connection_id)
+                oldest = queue.get('oldest_queued_at')
+                if oldest and (entry['oldest_queued_at'] is None or oldest < entry['oldest_queued_at']):
+                    entry['oldest_queued_at'] = oldest
+
+        now = datetime.now()
+        shared = self.store.load(list(backlog)) if self.store and backlog else None
+        chosen = {}
+        proposals = {}  # host -> (expected model, chosen model), switched through the store
+        with self._lock:
+            for host, models in backlog.items():
+                state = self._host(host)
+                if shared is not None:
+                    self._adopt(host, state, shared.get(host))
+                else:
+                    state['shared_switches'] = None  # Budget from this process's own switches
+                chosen[host] = self._choose_model(host, state, models, now)
+                if shared is not None and chosen[host] != state['model']:
+                    proposals[host] = (state['model'], chosen[host])
+
+        results = {host: self.store.switch(host, expected, model) for host, (expected, model) in proposals.items()}
+
+        deferred = []
+        with self._lock:
+            for host, result in results.items():
+                if result is None:
+                    continue  # Store unreachable: the choice stays local
+                active, switched = result
+                state = self._host(host)
+                if switched:
+                    self._record_switch(host, state, active, shared=True)
+                else:
+                    # Another worker switched the host first; its model goes ahead
+                    self._adopt(host, state, {'model': active, 'recent_switches': (state['shared_switches'] or 0) + 1})
+                    chosen[host] = active
+            for host, models in backlog.items():
+                for model, entry in models.items():
+                    if model != chosen[host]:
+                        deferred.extend(entry['connections'])
+            self._deferred = sorted(deferred)
+
+    def _adopt(self, host: str, state: Dict[str, Any], shared: Optional[Dict[str, Any]]):
+        """Take over the model and switch count other workers recorded for a host"""
+        if shared is None:
+            # No worker has switched this host yet
+            state['shared_switches'] = state['shared_switches'] or 0
+            return
+        state['shared_switches'] = shared['recent_switches'] or 0
+        if shared['model'] != state['model']:
+            if state['model'] is not None:
+                logger.info(f"Model on {host} switched by another worker: {state['model']} -> {shared['model']}")
+            state['model'] = shared['model']
+            state['measure_load'] = True
+
+    def _record_switch(self, host: str, state: Dict[str, Any], model: str, shared: bool = False):
+        """Make a model the active model of a host; a change from another model is a switch"""
+        if state['model'] is not None:
+            state['switches'].append(self.clock())
+            state['switch_count'] += 1
+            if shared:
+                state['shared_switches'] = (state['shared_switches'] or 0) + 1
+            logger.info(f"Model switch on {host}: {state['model']} -> {model}")
+        state['model'] = model
+        state['measure_load'] = True
+
+    def _choose_model(self, host: str, state: Dict[str, Any], models: Dict[str, Dict[str, Any]],
+                      now: datetime) -> str:
+        def waited(model: str) -> float:
+            oldest = models[model]['oldest_queued_at']
+            return (now - oldest).total_seconds() if oldest else 0.0
+
+        current = state['model']
+        if current not in models:
+            # Drained (or nothing loaded yet): move on to the longest-waiting model
+            return max(models, key=waited)
+
+        if self._switch_budget_left(state) <= 0:
+            return current
+
+        # Preempt only for work that has waited longer than the swap is worth
+        worth = [
+            model for model in models
+            if model != current
+            and waited(model) >= max(self.min_wait_seconds, self.switch_cost_factor * self.switch_cost(host, model))
+        ]
+        return max(worth, key=waited) if worth else current
+
+    def deferred_connection_ids(self) -> List[int]:
+        """Connections whose rows stay queued until their host switches to their model"""
+        return list(self._deferred)
+
+    def record_dispatch(self, connection_id: Optional[int]):
+        """Note the model a host is now serving; a change of model is a switch"""
+        key = self.model_key(connection_id)
+        if not key:
+            return
+        host, model = key
+        with self._lock:
+            state = self._host(host)
+            if state['model'] == model:
+                return
+            expected = state['model']
+
+        # Only when the host was not switched in update() (e.g. its rows arrived since)
+        result = self.store.switch(host, expected, model) if self.store else None
+        with self._lock:
+            state = self._host(host)
+            if state['model'] == model:
+                return
+            if result is None or result[1]:
+                self._record_switch(host, state, model, shared=result is not None)
+            else:
+                self._adopt(host, state, {'model': result[0], 'recent_switches': (state['shared_switches'] or 0) + 1})
+
+    def record_completion(self, connection_id: Optional[int], response_time_ms: Optional[float],
+                          load_seconds: Optional[float] = None):
+        """
+        Learn a connection's load time and usual response time from a completed request.
+
+        Args:
+            load_seconds: Model load time reported by the provider (Ollama load_duration), if any
+        """
+        key = self.model_key(connection_id)
+        if not key:
+            return
+        with self._lock:
+            state = self._host(key[0])
+            stats = self._connections.setdefault(connection_id, {
+                'key': key, 'load_seconds': None, 'response_ms': None, 'samples': 0
+            })
+            stats['samples'] += 1
+
+            if load_seconds:
+                stats['load_seconds'] = _ewma(stats['load_seconds'], load_seconds)
+                state['measure_load'] = False
+            elif state['measure_load'] and state['model'] == key[1]:
+                # First response after a switch: the excess over the usual time is the load
+                if stats['response_ms'] is not None and response_time_ms:
+                    stats['load_seconds'] = _ewma(stats['load_seconds'],
+                                                  max(0.0, response_time_ms - stats['response_ms']) / 1000)
+                state['measure_load'] = False
+                return
+
+            if response_time_ms:
+                stats['response_ms'] = _ewma(stats['response_ms'], response_time_ms)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Active model, switch budget and observed load times per host"""
+        with self._lock:
+            return {
+                'switches_per_hour': self.switches_per_hour,
+                'min_wait_seconds': self.min_wait_seconds,
+                'switch_cost_factor': self.switch_cost_factor,
+                'shared': self.store is not None,
+                'deferred_connection_ids': list(self._deferred),
+                'hosts': {
+                    host: {
+                        'active_model': state['model'],
+                        'switches': state['switch_count'],
+                        'switch_budget_left': self._switch_budget_left(state)
+                    }
+                    for host, state in self._hosts.items()
+                },
+                'connections': {
+                    connection_id: {
+                        'host': stats['key'][0],
+                        'model': stats['key'][1],
+                        'load_seconds': round(stats['load_seconds'], 2) if stats['load_seconds'] is not None else None,
+                        'response_ms': round(stats['response_ms']) if stats['response_ms'] is not None else None,
+                        'samples': stats['samples']
+                    }
+                    for connection_id, stats in self._connections.items()
+                }
+            }
+
+
+# Global instance
+model_affinity = ModelAffinityScheduler(
+    store=HostModelStore() if os.getenv('MODEL_AFFINITY_SHARED', 'true').lower() == 'true' else None
+)
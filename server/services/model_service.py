@@ -13,6 +13,7 @@ from sqlalchemy.orm import Session as SQLSession, joinedload
 from database import Session
 from models import Model, ProviderModel, ModelAlias, LlmProvider
 from services.model_normalization_service import model_normalization_service
+from services.config_lookup import config_lookup
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,7 @@ class ModelService:
             session.commit()
             
             logger.info(f"Created model: {model.common_name}")
+            config_lookup.invalidate('models')
             return self._model_to_dict(model)
         finally:
             session.close()
@@ -84,6 +86,7 @@ class ModelService:
             session.commit()
 
             logger.info(f"Updated model: {model.common_name}")
+            config_lookup.invalidate('models')
             return self._model_to_dict(model)
         finally:
             session.close()
@@ -101,6 +104,7 @@ class ModelService:
             session.commit()
 
             logger.info(f"Model {model.common_name} globally {'activated' if is_active else 'deactivated'}")
+            config_lookup.invalidate('models')
             return True
         finally:
             session.close()
@@ -122,6 +126,7 @@ class ModelService:
             session.commit()
             
             logger.info(f"Deleted model: {model.common_name}")
+            config_lookup.invalidate('models')
             return True
         finally:
             session.close()
@@ -249,6 +254,8 @@ class ModelService:
                 linked_models += 1
             
             logger.info(f"Discovered {new_models} new models, linked {linked_models} total for provider {provider_id}")
+            if new_models:
+                config_lookup.invalidate('models')
             return new_models, linked_models
             
         except Exception as e:
@@ -0,0 +1,852 @@
+"""
+Provider Batches
+
+Offline bulk submission for batches with execution_mode 'provider_batch'.
+Instead of sending rows one request at a time, their QUEUED llm_responses rows
+are exported as JSONL files to the provider's batch API (cheaper, higher
+throughput, results within a completion window instead of seconds).
+
+- Connections whose provider_type is in PROVIDER_BATCH_PROVIDERS (default: openai)
+  are handled here; other connections of the batch stay on the interactive path
+- Each claim round writes one JSONL file of at most PROVIDER_BATCH_MAX_REQUESTS
+  lines and PROVIDER_BATCH_MAX_BYTES bytes, tracked as a provider_batch_jobs row
+- The file contract is the OpenAI one: upload to /files (purpose=batch), create a
+  /batches job, poll it, download /files/{id}/content of the output and error files;
+  each line carries the llm_responses id as custom_id
+- Exported rows are PROCESSING with task_id 'provider-batch-<job id>' until their
+  results are ingested, so the queue processor and lease reclaim leave them alone
+- Results are bulk-loaded with COPY into a temp table and applied with one UPDATE;
+  failed and missing rows go through BatchService.handle_task_failure (retry policy)
+
+Requests are built by the same provider adapters and document text extraction as
+the direct execution engine, so documents it cannot turn into text cannot be
+submitted offline either and are failed.
+"""
+
+import io
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Callable, Iterable, Tuple
+
+import requests
+from sqlalchemy import text, func
+
+from database import Session
+from models import Batch, ProviderBatchJob
+from services.retry_policy import TRANSIENT, PERMANENT
+from services.worker_lease import connect_knowledge_documents
+from services.direct_execution import ProviderRequestError, PROVIDER_ALIASES, document_text, build_messages
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_BATCH_TASK_PREFIX = 'provider-batch-'
+EXECUTION_MODES = ('interactive', 'provider_batch')
+ACTIVE_STATUSES = ('SUBMITTING', 'SUBMITTED', 'CANCELLING', 'INGESTING')
+# Provider batch states after which no more results will arrive
+FINAL_PROVIDER_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+# Generation request keys that only make sense for a live streamed request
+STREAM_KEYS = ('stream', 'stream_options')
+
+
+def csv_field(value) -> str:
+    """COPY ... (FORMAT csv) field: NULL unquoted, text always quoted (so '' stays '')"""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class BatchFile:
+    """One provider batch input file, filled line by line up to the request and size limits"""
+
+    def __init__(self, max_requests: int, max_bytes: int):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.lines: List[bytes] = []
+        self.custom_ids: List[str] = []
+        self.size = 0
+
+    def add(self, custom_id: str, url: str, body: Dict[str, Any]) -> bool:
+        """
+        Append a request line.
+
+        Returns:
+            False when the line does not fit; the file is full and the request
+            belongs in the next file
+
+        Raises:
+            ValueError: The request alone is larger than a file may be
+        """
+        line = json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': url, 'body': body},
+                          ensure_ascii=False).encode('utf-8') + b'\n'
+        if len(line) > self.max_bytes:
+            raise ValueError(f"Request {custom_id} is {len(line)} bytes, over the {self.max_bytes} byte file limit")
+        if len(self.lines) >= self.max_requests or self.size + len(line) > self.max_bytes:
+            return False
+        self.lines.append(line)
+        self.custom_ids.append(custom_id)
+        self.size += len(line)
+        return True
+
+    @property
+    def content(self) -> bytes:
+        return b''.join(self.lines)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+def split_batch_files(entries: Iterable[Tuple[str, str, Dict[str, Any]]], max_requests: int,
+                      max_bytes: int) -> List[BatchFile]:
+    """Pack (custom_id, url, body) requests into as few files as the limits allow"""
+    files = [BatchFile(max_requests, max_bytes)]
+    for custom_id, url, body in entries:
+        if not files[-1].add(custom_id, url, body):
+            files.append(BatchFile(max_requests, max_bytes))
+            files[-1].add(custom_id, url, body)
+    return [batch_file for batch_file in files if len(batch_file)]
+
+
+def batch_request(adapter, config: Dict[str, Any], messages: List[Dict[str, str]],
+                  options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    (url path, body) of a batch file line, built by the provider adapter like a direct request.
+
+    The batch API answers with whole completions, so the streaming options are dropped.
+    """
+    url, _, payload = adapter.build_generation_request(config, messages, options)
+    body = {key: value for key, value in payload.items() if key not in STREAM_KEYS}
+    return urlsplit(url).path, body
+
+
+def parse_batch_output(content: bytes, adapter) -> Dict[int, Dict[str, Any]]:
+    """
+    Results of a provider batch output or error file, by llm_responses id.
+
+    Returns:
+        {response_id: {'success', 'response_text', 'input_tokens', 'output_tokens',
+                       'cached_tokens', 'raw_result'} or {'success': False, 'status_code', 'error'}}
+    """
+    results = {}
+    for line in (content or b'').splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            response_id = int(record['custom_id'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Skipping unreadable provider batch result line: {line[:200]!r}")
+            continue
+
+        response = record.get('response') or {}
+        body = response.get('body')
+        status_code = response.get('status_code')
+        if status_code == 200 and isinstance(body, dict) and not record.get('error'):
+            parsed = adapter.parse_generation_chunk(body)
+            results[response_id] = {
+                'success': True,
+                'response_text': parsed.get('text', ''),
+                'input_tokens': parsed.get('input_tokens') or 0,
+                'output_tokens': parsed.get('output_tokens') or 0,
+                'cached_tokens': parsed.get('cached_tokens'),
+                'raw_result': body
+            }
+            continue
+
+        error = record.get('error') or (body.get('error') if isinstance(body, dict) else None) or body
+        if isinstance(error, dict):
+            error = error.get('message') or json.dumps(error)
+        results[response_id] = {
+            'success': False,
+            'status_code': status_code,
+            'error': str(error or 'Provider batch request failed')
+        }
+    return results
+
+
+def ingest_results(cursor, task_id: str, results: Dict[int, Dict[str, Any]]) -> int:
+    """
+    Bulk-write successful results into llm_responses with COPY.
+
+    Only rows still PROCESSING under this job's task id are updated, so ingesting
+    the same output twice is harmless. Runs on the caller's transaction.
+
+    Returns:
+        Number of rows completed
+    """
+    rows = [
+        (response_id, result['response_text'], json.dumps(result.get('raw_result') or {}),
+         result.get('input_tokens'), result.get('output_tokens'), result.get('cached_tokens'))
+        for response_id, result in sorted(results.items()) if result.get('success')
+    ]
+    if not rows:
+        return 0
+
+    cursor.execute("""
+        CREATE TEMP TABLE provider_batch_results (
+            id INTEGER PRIMARY KEY,
+            response_text TEXT,
+            response_json JSONB,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            cached_tokens INTEGER
+        ) ON COMMIT DROP
+    """)
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(csv_field(value) for value in row) + '\n')
+    buffer.seek(0)
+    cursor.copy_expert("""
+        COPY provider_batch_results (id, response_text, response_json, input_tokens, output_tokens, cached_tokens)
+        FROM STDIN WITH (FORMAT csv)
+    """, buffer)
+
+    cursor.execute("""
+        UPDATE llm_responses r
+        SET status = 'COMPLETED',
+            response_text = t.response_text,
+            response_json = t.response_json,
+            input_tokens = t.input_tokens,
+            output_tokens = t.output_tokens,
+            cached_tokens = t.cached_tokens,
+            completed_processing_at = NOW(),
+            claimed_by = NULL,
+            lease_expires_at = NULL
+        FROM provider_batch_results t
+        WHERE r.id = t.id
+        AND r.task_id = %s
+        AND r.status = 'PROCESSING'
+    """, (task_id,))
+    return cursor.rowcount
+
+
+class BatchAPIClient:
+    """Client for the OpenAI batch file contract (/files, /batches)"""
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, http=None, timeout: float = 300):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.http = http or requests
+        self.timeout = timeout
+
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+
+    def _check(self, response, action: str):
+        if response.status_code >= 400:
+            raise ProviderRequestError(response.status_code, f"{action} failed: {response.text[:500]}")
+        return response
+
+    def upload_file(self, content: bytes, filename: str) -> str:
+        """Upload a JSONL input file; returns its file id"""
+        response = self._check(self.http.post(
+            f"{self.base_url}/files", headers=self._headers(), timeout=self.timeout,
+            data={'purpose': 'batch'}, files={'file': (filename, content, 'application/jsonl')}
+        ), 'File upload')
+        return response.json()['id']
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Start a batch job over an uploaded file"""
+        return self._check(self.http.post(
+            f"{self.base_url}/batches", headers=self._headers(), timeout=self.timeout,
+            json={'input_file_id': input_file_id, 'endpoint': endpoint,
+                  'completion_window': completion_window, 'metadata': metadata or {}}
+        ), 'Batch creation').json()
+
+    def get_batch(self, provider_batch_id: str) -> Dict[str, Any]:
+        return self._check(self.http.get(
+            f"{self.base_url}/batches/{provider_batch_id}", headers=self._headers(), timeout=self.timeout
+        ), 'Batch status').json()
+
+    def cancel_batch(self, provider_batch_id: str) -> Dict[str, Any]:
+        return self._check(self.http.post(
+            f"{self.base_url}/batches/{provider_batch_id}/cancel", headers=self._headers(), timeout=self.timeout
+        ), 'Batch cancellation').json()
+
+    def download_file(self, file_id: str) -> bytes:
+        return self._check(self.http.get(
+            f"{self.base_url}/files/{file_id}/content", headers=self._headers(), timeout=self.timeout
+        ), 'File download').content
+
+
+class ProviderBatchManager:
+    """Exports, submits, polls and ingests provider batch jobs for provider_batch batches"""
+
+    def __init__(self, providers: Optional[str] = None, max_requests: Optional[int] = None,
+                 max_bytes: Optional[int] = None, completion_window: Optional[str] = None,
+                 poll_seconds: Optional[float] = None, max_active_jobs: Optional[int] = None,
+                 connect: Optional[Callable] = None,
+                 client_factory: Optional[Callable[[Dict[str, Any]], BatchAPIClient]] = None,
+                 lookup: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None,
+                 adapters: Optional[Dict[str, Any]] = None):
+        setting = providers if providers is not None else os.getenv('PROVIDER_BATCH_PROVIDERS', 'openai')
+        self.providers = {part.strip().lower() for part in setting.split(',') if part.strip()}
+        self.max_requests = max_requests or int(os.getenv('PROVIDER_BATCH_MAX_REQUESTS', '50000'))
+        self.max_bytes = max_bytes or int(os.getenv('PROVIDER_BATCH_MAX_BYTES', str(200 * 1024 * 1024)))
+        self.completion_window = completion_window or os.getenv('PROVIDER_BATCH_COMPLETION_WINDOW', '24h')
+        self.poll_seconds = poll_seconds if poll_seconds is not None \
+            else float(os.getenv('PROVIDER_BATCH_POLL_SECONDS', '60'))
+        self.max_active_jobs = max_active_jobs or int(os.getenv('PROVIDER_BATCH_MAX_ACTIVE_JOBS', '20'))
+        # A job stuck in SUBMITTING/INGESTING this long lost its process
+        self.stale_seconds = int(os.getenv('PROVIDER_BATCH_STALE_SECONDS', '3600'))
+        self.connect = connect or connect_knowledge_documents
+        self._client_factory = client_factory
+        self._lookup = lookup
+        self._adapters = adapters
+        self._cycle_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'jobs_submitted': 0,
+            'requests_submitted': 0,
+            'jobs_ingested': 0,
+            'rows_completed': 0,
+            'rows_failed': 0
+        }
+
+    # Connections
+
+    def _connection(self, connection_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        if connection_id is None:
+            return None
+        if self._lookup:
+            return self._lookup(connection_id)
+        from services.config_lookup import config_lookup
+        return config_lookup.get_connection(connection_id)
+
+    def _config(self, connection_id: int) -> Dict[str, Any]:
+        from utils.llm_config_formatter import format_llm_config_for_rag_api
+        details = self._connection(connection_id) or {}
+        return format_llm_config_for_rag_api(details) if details else {}
+
+    @staticmethod
+    def _provider_type(details: Optional[Dict[str, Any]]) -> str:
+        provider_type = ((details or {}).get('provider_type') or '').lower()
+        return PROVIDER_ALIASES.get(provider_type, provider_type)
+
+    def supports(self, connection_id: Optional[int]) -> bool:
+        """Whether a connection's provider has a batch API this manager can use"""
+        return self._provider_type(self._connection(connection_id)) in self.providers
+
+    def adapter_for(self, provider_type: str):
+        if self._adapters is None:
+            from services.llm_provider_service import llm_provider_service
+            self._adapters = llm_provider_service.provider_adapters
+        return self._adapters.get(provider_type)
+
+    def client_for(self, config: Dict[str, Any]) -> BatchAPIClient:
+        if self._client_factory:
+            return self._client_factory(config)
+        adapter = self.adapter_for(self._provider_type(config))
+        base_url = (adapter.extract_base_url(config) if adapter else '') or \
+            getattr(adapter, 'default_base_url', '')
+        return BatchAPIClient(base_url, config.get('api_key'))
+
+    # Cycle
+
+    def run_cycle(self):
+        """Submit and poll in a background thread; a cycle still running is not overlapped"""
+        with self._lock:
+            if self._cycle_thread and self._cycle_thread.is_alive():
+                return
+            self._cycle_thread = threading.Thread(target=self._cycle, name='provider-batches', daemon=True)
+            self._cycle_thread.start()
+
+    def _cycle(self):
+        try:
+            self.recover_stale()
+            self.submit_pending()
+            self.poll_jobs()
+        except Exception as e:
+            logger.error(f"Error in provider batch cycle: {e}", exc_info=True)
+
+    # Submission
+
+    def submit_pending(self) -> List[str]:
+        """Export the queued rows of provider_batch batches as new jobs"""
+        session = Session()
+        try:
+            batch_ids = [row[0] for row in session.query(Batch.id).filter(
+                Batch.execution_mode == 'provider_batch',
+                Batch.status.in_(['STAGED', 'PROCESSING'])
+            ).order_by(Batch.priority.desc(), Batch.created_at.asc()).all()]
+            active = session.query(func.count(ProviderBatchJob.id)).filter(
+                ProviderBatchJob.status.in_(ACTIVE_STATUSES)
+            ).scalar() or 0
+        finally:
+            session.close()
+        if not batch_ids:
+            return []
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT batch_id, connection_id
+                FROM llm_responses
+                WHERE batch_id = ANY(%s)
+                AND status = 'QUEUED'
+                AND connection_id IS NOT NULL
+                AND (claimed_by IS NULL OR lease_expires_at < NOW())
+                AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+                GROUP BY batch_id, connection_id
+            """, (batch_ids,))
+            pending = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        submitted = []
+        for batch_id, connection_id in sorted(pending, key=lambda row: batch_ids.index(row[0])):
+            if not self.supports(connection_id):
+                continue
+            while active < self.max_active_jobs:
+                job_id = self.submit_job(batch_id, connection_id)
+                if not job_id:
+                    break
+                submitted.append(job_id)
+                active += 1
+        return submitted
+
+    def submit_job(self, batch_id: int, connection_id: int) -> Optional[str]:
+        """
+        Claim one file's worth of QUEUED rows of a batch and connection and submit them.
+
+        Returns:
+            The job id, or None when there was nothing left to submit
+        """
+        from services.batch_service import batch_service
+        from services.config_lookup import config_lookup
+
+        config = self._config(connection_id)
+        provider_type = self._provider_type(config)
+        adapter = self.adapter_for(provider_type)
+        if not adapter:
+            logger.warning(f"No adapter for provider {provider_type!r} of connection {connection_id}")
+            return None
+
+        job_id = str(uuid.uuid4())
+        task_id = f"{PROVIDER_BATCH_TASK_PREFIX}{job_id}"
+        batch_file = BatchFile(self.max_requests, self.max_bytes)
+        unsubmittable = []
+        endpoint = None
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, document_id, prompt_id
+                FROM llm_responses
+                WHERE batch_id = %s
+                AND connection_id = %s
+                AND status = 'QUEUED'
+                AND (claimed_by IS NULL OR lease_expires_at < NOW())
+                AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+                ORDER BY document_id ASC, prompt_id ASC, id ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (batch_id, connection_id, self.max_requests))
+            rows = cursor.fetchall()
+
+            # Rows are in document order, so only the current document's text is held
+            current_doc, current_text, current_kb_id = None, None, None
+            for response_id, doc_id, prompt_id in rows:
+                if doc_id != current_doc:
+                    cursor.execute("""
+                        SELECT content, content_type, doc_type, document_id
+                        FROM docs
+                        WHERE id = %s
+                    """, (doc_id,))
+                    doc_row = cursor.fetchone()
+                    current_doc, current_text, current_kb_id = doc_id, None, None
+                    if doc_row:
+                        content, content_type, doc_type, current_kb_id = doc_row
+                        current_text = document_text({'encoded_content': content, 'content_type': content_type,
+                                                      'doc_type': doc_type})
+                prompt = config_lookup.get_prompt(prompt_id)
+                if current_text is None or not prompt:
+                    unsubmittable.append(response_id)
+                    continue
+
+                url, body = batch_request(
+                    adapter, config, build_messages(current_kb_id, current_text, prompt['prompt_text']),
+                    {'prompt_cache_key': f"{current_kb_id}:{connection_id}"}
+                )
+                endpoint = endpoint or url
+                try:
+                    if not batch_file.add(str(response_id), url, body):
+                        break  # File is full; the remaining rows go into the next job
+                except ValueError as e:
+                    logger.warning(str(e))
+                    unsubmittable.append(response_id)
+
+            if not len(batch_file):
+                conn.rollback()
+                cursor.close()
+            else:
+                # Record the job before its rows point at it, so a crash leaves a job to recover
+                self._create_job(job_id, batch_id, connection_id, provider_type, batch_file)
+                cursor.execute("""
+                    UPDATE llm_responses
+                    SET status = 'PROCESSING',
+                        task_id = %s,
+                        claimed_by = %s,
+                        lease_expires_at = NULL,
+                        started_processing_at = NOW()
+                    WHERE id = ANY(%s)
+                """, (task_id, f"provider-batch:{job_id}", [int(custom_id) for custom_id in batch_file.custom_ids]))
+                conn.commit()
+                cursor.close()
+        finally:
+            conn.close()
+
+        if unsubmittable:
+            failed = batch_service.handle_task_failure(None, {
+                'doc_ids': unsubmittable,
+                'batch_id': batch_id,
+                'error': 'Document has no extractable text or prompt for provider batch submission',
+                'failure_class': PERMANENT
+            })
+            if not len(batch_file) and failed.get('rows'):
+                # Every claimed row was unsubmittable; the rows behind them may not be
+                return self.submit_job(batch_id, connection_id)
+        if not len(batch_file):
+            return None
+
+        try:
+            client = self.client_for(config)
+            input_file_id = client.upload_file(batch_file.content, f"batch-{batch_id}-{job_id}.jsonl")
+            provider_batch = client.create_batch(input_file_id, endpoint, self.completion_window,
+                                                 {'batch_id': str(batch_id), 'job_id': job_id})
+        except Exception as e:
+            logger.error(f"Submitting provider batch job {job_id} for batch {batch_id} failed: {e}")
+            self._update_job(job_id, {'status': 'FAILED', 'error_message': str(e), 'finished_at': datetime.now()})
+            batch_service.handle_task_failure(task_id, {
+                'batch_id': batch_id,
+                'error': f"Provider batch submission failed: {e}",
+                'status_code': getattr(e, 'status_code', None)
+            })
+            return None
+
+        self._update_job(job_id, {
+            'status': 'SUBMITTED',
+            'provider_batch_id': provider_batch.get('id'),
+            'provider_status': provider_batch.get('status'),
+            'input_file_id': input_file_id,
+            'submitted_at': datetime.now()
+        })
+        self._mark_batch_processing(batch_id)
+        self.stats['jobs_submitted'] += 1
+        self.stats['requests_submitted'] += len(batch_file)
+        logger.info(f"Submitted provider batch job {job_id}: {len(batch_file)} requests "
+                    f"({batch_file.size} bytes) of batch {batch_id} on connection {connection_id}")
+        return job_id
+
+    # Polling and ingestion
+
+    def poll_jobs(self) -> List[str]:
+        """Check submitted jobs with the provider and ingest the finished ones"""
+        session = Session()
+        try:
+            jobs = [self.describe(job) for job in session.query(ProviderBatchJob).filter(
+                ProviderBatchJob.status.in_(['SUBMITTED', 'CANCELLING'])
+            ).order_by(ProviderBatchJob.submitted_at.asc()).all()]
+        finally:
+            session.close()
+
+        ingested = []
+        now = datetime.now()
+        for job in jobs:
+            polled_at = job['polled_at'] and datetime.fromisoformat(job['polled_at'])
+            if polled_at and (now - polled_at).total_seconds() < self.poll_seconds:
+                continue
+            try:
+                provider_batch = self.client_for(self._config(job['connection_id'])).get_batch(job['provider_batch_id'])
+            except Exception as e:
+                logger.warning(f"Could not poll provider batch job {job['job_id']}: {e}")
+                self._update_job(job['job_id'], {'polled_at': now})
+                continue
+
+            counts = provider_batch.get('request_counts') or {}
+            provider_status = provider_batch.get('status')
+            self._update_job(job['job_id'], {
+                'provider_status': provider_status,
+                'output_file_id': provider_batch.get('output_file_id'),
+                'error_file_id': provider_batch.get('error_file_id'),
+                'completed_count': counts.get('completed', 0),
+                'failed_count': counts.get('failed', 0),
+                'polled_at': now
+            })
+            if provider_status in FINAL_PROVIDER_STATUSES and self._claim_ingest(job['job_id']):
+                self.ingest(job['job_id'], provider_batch, cancelled=job['status'] == 'CANCELLING')
+                ingested.append(job['job_id'])
+        return ingested
+
+    def ingest(self, job_id: str, provider_batch: Dict[str, Any], cancelled: bool = False) -> Dict[str, Any]:
+        """
+        Write a finished provider batch's results into llm_responses.
+
+        Successful lines are bulk-loaded; failed lines and rows the provider never
+        answered (expired, cancelled, failed validation) are handed to the retry policy.
+        Rows of a job cancelled by the user fail instead of being re-queued.
+        """
+        from services.batch_service import batch_service
+
+        job = self.get_job(job_id)
+        task_id = f"{PROVIDER_BATCH_TASK_PREFIX}{job_id}"
+        config = self._config(job['connection_id'])
+        adapter = self.adapter_for(self._provider_type(config) or job['provider_type'])
+        client = self.client_for(config)
+        try:
+            results = {}
+            for file_id in (provider_batch.get('error_file_id'), provider_batch.get('output_file_id')):
+                if file_id:
+                    results.update(parse_batch_output(client.download_file(file_id), adapter))
+
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                completed = ingest_results(cursor, task_id, results)
+                conn.commit()
+                cursor.execute("""
+                    SELECT id FROM llm_responses
+                    WHERE task_id = %s AND status = 'PROCESSING'
+                    ORDER BY id
+                """, (task_id,))
+                remaining = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Left INGESTING; recover_stale() retries once the job goes stale
+            logger.error(f"Ingesting provider batch job {job_id} failed: {e}", exc_info=True)
+            self._update_job(job_id, {'error_message': str(e)})
+            return {'success': False, 'error': str(e)}
+
+        # One failure report per distinct provider error, so each gets its own classification
+        failures: Dict[Tuple, List[int]] = {}
+        for response_id in remaining:
+            result = results.get(response_id)
+            if cancelled:
+                key = (None, 'Cancelled by user', PERMANENT)
+            elif result:
+                key = (result.get('status_code'), result['error'], None)
+            elif provider_batch.get('status') == 'failed':
+                errors = (provider_batch.get('errors') or {}).get('data') or []
+                message = '; '.join(str(error.get('message')) for error in errors if isinstance(error, dict))
+                key = (None, f"Provider rejected the batch file: {message or 'validation failed'}", PERMANENT)
+            else:
+                key = (None, f"Provider batch {provider_batch.get('status')} without a result for this request",
+                       TRANSIENT)
+            failures.setdefault(key, []).append(response_id)
+
+        for (status_code, error, failure_class), doc_ids in failures.items():
+            error_data = {'doc_ids': doc_ids, 'batch_id': job['batch_id'], 'error': error}
+            if status_code:
+                error_data['status_code'] = status_code
+            if failure_class:
+                error_data['failure_class'] = failure_class
+            batch_service.handle_task_failure(None, error_data)
+
+        batch_service._check_batch_completion(job['batch_id'])
+
+        final_status = 'CANCELLED' if cancelled or provider_batch.get('status') == 'cancelled' else \
+            'COMPLETED' if provider_batch.get('status') == 'completed' else 'FAILED'
+        self._update_job(job_id, {
+            'status': final_status,
+            'completed_count': completed,
+            'failed_count': len(remaining),
+            'finished_at': datetime.now()
+        })
+        self.stats['jobs_ingested'] += 1
+        self.stats['rows_completed'] += completed
+        self.stats['rows_failed'] += len(remaining)
+        logger.info(f"Provider batch job {job_id} {final_status.lower()}: {completed} responses ingested, "
+                    f"{len(remaining)} failed or re-queued")
+        return {'success': True, 'completed': completed, 'failed': len(remaining), 'status': final_status}
+
+    def recover_stale(self) -> List[str]:
+        """
+        Settle jobs whose process died: SUBMITTING jobs give their rows back to the
+        retry policy, INGESTING jobs are polled and ingested again.
+        """
+        from services.batch_service import batch_service
+
+        session = Session()
+        try:
+            stale = {'stale_seconds': self.stale_seconds}
+            abandoned = session.execute(text("""
+                UPDATE provider_batch_jobs
+                SET status = 'FAILED', finished_at = NOW(), error_message = 'Abandoned while submitting'
+                WHERE status = 'SUBMITTING'
+                AND created_at < NOW() - make_interval(secs => :stale_seconds)
+                RETURNING id, batch_id
+            """), stale).fetchall()
+            retried = session.execute(text("""
+                UPDATE provider_batch_jobs
+                SET status = 'SUBMITTED', polled_at = NULL
+                WHERE status = 'INGESTING'
+                AND polled_at < NOW() - make_interval(secs => :stale_seconds)
+                RETURNING id
+            """), stale).fetchall()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error recovering stale provider batch jobs: {e}")
+            return []
+        finally:
+            session.close()
+
+        for job_id, batch_id in abandoned:
+            logger.warning(f"Provider batch job {job_id} was abandoned while submitting, re-queueing its rows")
+            batch_service.handle_task_failure(f"{PROVIDER_BATCH_TASK_PREFIX}{job_id}", {
+                'batch_id': batch_id,
+                'error': 'Provider batch submission was interrupted',
+                'failure_class': TRANSIENT
+            })
+        return [row[0] for row in abandoned] + [row[0] for row in retried]
+
+    def cancel(self, batch_id: int) -> int:
+        """
+        Cancel a batch's submitted provider jobs. Results the provider finished before
+        the cancellation are still ingested; the rest of the rows fail.
+
+        Returns:
+            Number of jobs cancelled
+        """
+        session = Session()
+        try:
+            jobs = [self.describe(job) for job in session.query(ProviderBatchJob).filter(
+                ProviderBatchJob.batch_id == batch_id,
+                ProviderBatchJob.status == 'SUBMITTED'
+            ).all()]
+        finally:
+            session.close()
+
+        cancelled = 0
+        for job in jobs:
+            try:
+                self.client_for(self._config(job['connection_id'])).cancel_batch(job['provider_batch_id'])
+            except Exception as e:
+                logger.warning(f"Could not cancel provider batch job {job['job_id']}: {e}")
+                continue
+            self._update_job(job['job_id'], {'status': 'CANCELLING', 'polled_at': None})
+            cancelled += 1
+        return cancelled
+
+    # Job rows
+
+    def _create_job(self, job_id: str, batch_id: int, connection_id: int, provider_type: str,
+                    batch_file: BatchFile):
+        session = Session()
+        try:
+            session.add(ProviderBatchJob(
+                id=job_id,
+                batch_id=batch_id,
+                connection_id=connection_id,
+                provider_type=provider_type,
+                status='SUBMITTING',
+                request_count=len(batch_file),
+                file_bytes=batch_file.size
+            ))
+            session.commit()
+        finally:
+            session.close()
+
+    def _update_job(self, job_id: str, values: Dict[str, Any]):
+        session = Session()
+        try:
+            session.query(ProviderBatchJob).filter(ProviderBatchJob.id == job_id).update(
+                values, synchronize_session=False
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating provider batch job {job_id}: {e}")
+        finally:
+            session.close()
+
+    def _claim_ingest(self, job_id: str) -> bool:
+        """SUBMITTED/CANCELLING -> INGESTING; False if another process got there first"""
+        session = Session()
+        try:
+            claimed = session.execute(text("""
+                UPDATE provider_batch_jobs
+                SET status = 'INGESTING', polled_at = NOW()
+                WHERE id = :job_id AND status IN ('SUBMITTED', 'CANCELLING')
+            """), {'job_id': job_id}).rowcount > 0
+            session.commit()
+            return claimed
+        finally:
+            session.close()
+
+    def _mark_batch_processing(self, batch_id: int):
+        session = Session()
+        try:
+            session.query(Batch).filter(Batch.id == batch_id, Batch.status == 'STAGED').update(
+                {'status': 'PROCESSING', 'started_at': func.now()}, synchronize_session=False
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        session = Session()
+        try:
+            job = session.query(ProviderBatchJob).filter(ProviderBatchJob.id == job_id).first()
+            return self.describe(job) if job else None
+        finally:
+            session.close()
+
+    def get_batch_jobs(self, batch_id: int) -> List[Dict[str, Any]]:
+        """Provider batch jobs of a batch, newest first"""
+        session = Session()
+        try:
+            return [self.describe(job) for job in session.query(ProviderBatchJob).filter(
+                ProviderBatchJob.batch_id == batch_id
+            ).order_by(ProviderBatchJob.created_at.desc()).all()]
+        finally:
+            session.close()
+
+    @staticmethod
+    def describe(job) -> Dict[str, Any]:
+        return {
+            'job_id': job.id,
+            'batch_id': job.batch_id,
+            'connection_id': job.connection_id,
+            'provider_type': job.provider_type,
+            'status': job.status,
+            'provider_batch_id': job.provider_batch_id,
+            'provider_status': job.provider_status,
+            'input_file_id': job.input_file_id,
+            'output_file_id': job.output_file_id,
+            'error_file_id': job.error_file_id,
+            'request_count': job.request_count or 0,
+            'file_bytes': job.file_bytes or 0,
+            'completed_count': job.completed_count or 0,
+            'failed_count': job.failed_count or 0,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'submitted_at': job.submitted_at.isoformat() if job.submitted_at else None,
+            'polled_at': job.polled_at.isoformat() if job.polled_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'error_message': job.error_message
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'providers': sorted(self.providers),
+            'max_requests': self.max_requests,
+            'max_bytes': self.max_bytes,
+            'completion_window': self.completion_window,
+            'stats': self.stats.copy()
+        }
+
+
+# Global instance
+provider_batches = ProviderBatchManager()
@@ -5,14 +5,18 @@ Handles communication with Amazon Bedrock for model discovery and connection tes
 Note: This is a basic implementation. Full AWS integration would require boto3 and proper AWS credentials.
 """
 
+import os
 import requests
 import json
-from typing import Dict, Any, List, Tuple
+from urllib.parse import quote
+from typing import Dict, Any, List, Tuple, Optional
 from .base_provider import BaseLLMProvider
 
 class AmazonProvider(BaseLLMProvider):
     """Amazon Bedrock provider adapter"""
     
+    stream_format = None
+    
     def __init__(self):
         super().__init__('amazon')
         self.default_region = 'us-east-1'
@@ -203,6 +207,50 @@ class AmazonProvider(BaseLLMProvider):
         # TODO: Implement AWS Signature Version 4 when boto3 is available
         return headers
     
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        Bedrock Converse request (not streamed - ConverseStream uses the binary AWS event stream).
+        
+        Authenticates with a Bedrock API key (the connection's api_key or AWS_BEARER_TOKEN_BEDROCK);
+        access key pairs need SigV4 signing, which is not implemented here.
+        """
+        api_key = config.get('api_key') or os.getenv('AWS_BEARER_TOKEN_BEDROCK')
+        if not api_key:
+            raise ValueError("Amazon Bedrock direct generation requires a Bedrock API key")
+        
+        region = config.get('region') or self.default_region
+        base_url = config.get('base_url') or ''
+        if 'amazonaws.com' not in base_url:
+            base_url = f'https://bedrock-runtime.{region}.amazonaws.com'
+        model_id = config.get('bedrock_model_id') or config.get('model_name')
+        
+        payload = {
+            'system': [{'text': m['content']} for m in messages if m['role'] == 'system'],
+            'messages': [
+                {'role': m['role'], 'content': [{'text': m['content']}]}
+                for m in messages if m['role'] != 'system'
+            ]
+        }
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'DocumentEvaluator-LLMProvider/1.0',
+            'Authorization': f'Bearer {api_key}'
+        }
+        return f"{base_url.rstrip('/')}/model/{quote(model_id, safe='')}/converse", headers, payload
+    
+    def parse_generation_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse a Converse response"""
+        content = ((chunk.get('output') or {}).get('message') or {}).get('content') or []
+        usage = chunk.get('usage') or {}
+        return {
+            'text': ''.join(block.get('text', '') for block in content),
+            'input_tokens': usage.get('inputTokens'),
+            'output_tokens': usage.get('outputTokens'),
+            'cached_tokens': usage.get('cacheReadInputTokens'),
+            'done': True
+        }
+    
     def parse_model_response(self, response_data: Any) -> List[Dict[str, Any]]:
         """Parse Amazon Bedrock model list response"""
         # This would parse actual AWS API response
@@ -6,7 +6,7 @@ Each provider adapter must implement the methods defined here.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +14,10 @@ logger = logging.getLogger(__name__)
 class BaseLLMProvider(ABC):
     """Abstract base class for LLM provider adapters"""
     
+    # Wire format of streamed generations: 'sse' (OpenAI "data:" events), 'ndjson'
+    # (one JSON object per line) or None when the provider answers in one response
+    stream_format = 'sse'
+    
     def __init__(self, provider_type: str):
         self.provider_type = provider_type
         self.logger = logging.getLogger(f"{__name__}.{provider_type}")
@@ -189,3 +193,62 @@ class BaseLLMProvider(ABC):
         """
         # Default implementation - should be overridden
         return f"{base_url}/models"
+    
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        Build the HTTP request for one chat generation (used by the direct execution engine)
+        
+        Args:
+            config: LLM config of the connection (base_url including port, model_name, api_key, ...)
+            messages: Chat messages, the document first so it forms a stable cacheable prefix
+            options: Per-request hints ('prompt_cache_key')
+            
+        Returns:
+            Tuple of (url, headers, json_payload)
+        """
+        raise NotImplementedError(f"{self.provider_type} does not support direct generation")
+    
+    def parse_generation_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parse one streamed event (or a whole non-streamed response) of a generation
+        
+        Args:
+            chunk: Decoded JSON event
+            
+        Returns:
+            Dictionary with whichever of 'text', 'input_tokens', 'output_tokens',
+            'cached_tokens', 'load_seconds' and 'done' the chunk reports
+        """
+        return self.parse_openai_chunk(chunk)
+    
+    def openai_chat_request(self, url: str, config: Dict[str, Any], messages: List[Dict[str, str]],
+                            options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Streamed /chat/completions request shared by OpenAI-compatible providers"""
+        payload = {
+            'model': config.get('model_name'),
+            'messages': messages,
+            'stream': True,
+            # The final event carries the provider's own token counts
+            'stream_options': {'include_usage': True}
+        }
+        return url, self.make_request_headers(config), payload
+    
+    def parse_openai_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse an OpenAI-compatible chat.completion.chunk (or a non-streamed completion)"""
+        parsed = {}
+        for choice in chunk.get('choices') or []:
+            content = (choice.get('delta') or choice.get('message') or {}).get('content')
+            if content:
+                parsed['text'] = parsed.get('text', '') + content
+            if choice.get('finish_reason'):
+                parsed['done'] = True
+        
+        usage = chunk.get('usage')
+        if isinstance(usage, dict):
+            parsed['input_tokens'] = usage.get('prompt_tokens')
+            parsed['output_tokens'] = usage.get('completion_tokens')
+            details = usage.get('prompt_tokens_details')
+            if isinstance(details, dict) and details.get('cached_tokens') is not None:
+                parsed['cached_tokens'] = details['cached_tokens']
+        return parsed
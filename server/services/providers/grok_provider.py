@@ -7,7 +7,7 @@ Grok uses an OpenAI-compatible API format.
 
 import requests
 import json
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 from .base_provider import BaseLLMProvider
 
 class GrokProvider(BaseLLMProvider):
@@ -205,6 +205,15 @@ class GrokProvider(BaseLLMProvider):
         
         return headers
     
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Streamed chat completion; xAI routes requests with the same conversation id to a warm cache"""
+        base_url = self.extract_base_url(config) or self.default_base_url
+        url, headers, payload = self.openai_chat_request(f"{base_url}/chat/completions", config, messages, options)
+        if options and options.get('prompt_cache_key'):
+            headers['x-grok-conv-id'] = options['prompt_cache_key']
+        return url, headers, payload
+    
     def parse_model_response(self, response_data: Any) -> List[Dict[str, Any]]:
         """Parse Grok model list response"""
         models = []
@@ -7,7 +7,7 @@ LM Studio provides an OpenAI-compatible API.
 
 import requests
 import json
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 from .base_provider import BaseLLMProvider
 
 class LMStudioProvider(BaseLLMProvider):
@@ -159,6 +159,17 @@ class LMStudioProvider(BaseLLMProvider):
         
         return headers
     
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Streamed chat completion on LM Studio's OpenAI-compatible server"""
+        base_url = self.extract_base_url(config)
+        if not base_url:
+            raise ValueError("Base URL is required for LM Studio")
+        url, headers, payload = self.openai_chat_request(f"{base_url}/v1/chat/completions", config, messages, options)
+        if config.get('ttl'):
+            payload['ttl'] = config['ttl']  # Keep the model loaded between requests
+        return url, headers, payload
+    
     def parse_model_response(self, response_data: Any) -> List[Dict[str, Any]]:
         """Parse LM Studio model list response (OpenAI-compatible format)"""
         models = []
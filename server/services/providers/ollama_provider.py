@@ -6,12 +6,14 @@ Handles communication with Ollama LLM service for model discovery and connection
 
 import requests
 import json
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 from .base_provider import BaseLLMProvider
 
 class OllamaProvider(BaseLLMProvider):
     """Ollama provider adapter"""
     
+    stream_format = 'ndjson'
+    
     def __init__(self):
         super().__init__('ollama')
         self.default_port = 11434
@@ -148,6 +150,35 @@ class OllamaProvider(BaseLLMProvider):
             'User-Agent': 'DocumentEvaluator-LLMProvider/1.0'
         }
     
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Streamed /api/chat request (newline-delimited JSON)"""
+        base_url = self.extract_base_url(config)
+        if not base_url:
+            raise ValueError("Base URL is required for Ollama")
+        payload = {
+            'model': config.get('model_name'),
+            'messages': messages,
+            'stream': True
+        }
+        if config.get('keep_alive'):
+            payload['keep_alive'] = config['keep_alive']
+        return f"{base_url}/api/chat", self.make_request_headers(config), payload
+    
+    def parse_generation_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse an /api/chat stream line; the final line carries token counts and durations"""
+        parsed = {}
+        content = (chunk.get('message') or {}).get('content')
+        if content:
+            parsed['text'] = content
+        if chunk.get('done'):
+            parsed['done'] = True
+            parsed['input_tokens'] = chunk.get('prompt_eval_count')
+            parsed['output_tokens'] = chunk.get('eval_count')
+            if chunk.get('load_duration'):
+                parsed['load_seconds'] = chunk['load_duration'] / 1e9  # Nanoseconds
+        return parsed
+    
     def parse_model_response(self, response_data: Any) -> List[Dict[str, Any]]:
         """Parse Ollama model list response"""
         models = []
@@ -6,7 +6,7 @@ Handles communication with OpenAI API for model discovery and connection testing
 
 import requests
 import json
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 from .base_provider import BaseLLMProvider
 
 class OpenAIProvider(BaseLLMProvider):
@@ -175,6 +175,15 @@ class OpenAIProvider(BaseLLMProvider):
         
         return headers
     
+    def build_generation_request(self, config: Dict[str, Any], messages: List[Dict[str, str]],
+                                 options: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Streamed chat completion; requests for the same document share a prompt cache key"""
+        base_url = self.extract_base_url(config) or self.default_base_url
+        url, headers, payload = self.openai_chat_request(f"{base_url}/chat/completions", config, messages, options)
+        if options and options.get('prompt_cache_key'):
+            payload['prompt_cache_key'] = options['prompt_cache_key']
+        return url, headers, payload
+    
     def parse_model_response(self, response_data: Any) -> List[Dict[str, Any]]:
         """Parse OpenAI model list response"""
         models = []
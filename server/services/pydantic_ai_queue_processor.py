@@ -12,12 +12,11 @@ import threading
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.models.anthropic import AnthropicModel
-from pydantic_ai.models.ollama import OllamaModel
 from services.batch_service import batch_service
 
+# pydantic_ai and its model backends are imported on demand - they are slow to
+# import and only needed once this processor actually starts.
+
 logger = logging.getLogger(__name__)
 
 
@@ -66,11 +65,9 @@ class PydanticAIBatchProcessor:
             'last_activity': None
         }
         
-        # Initialize agents for different providers
-        self._initialize_agents()
-        
     def _initialize_agents(self):
         """Initialize PydanticAI agents for different LLM providers"""
+        from pydantic_ai import Agent
         
         # Document analysis system prompt
         system_prompt = """You are an expert document analyst. 
@@ -119,6 +116,7 @@ class PydanticAIBatchProcessor:
             
     def _register_agent_tools(self):
         """Register tools for PydanticAI agents"""
+        from pydantic_ai import RunContext
         
         @self.agents['openai'].tool
         @self.agents['anthropic'].tool
@@ -173,6 +171,10 @@ class PydanticAIBatchProcessor:
             logger.warning("PydanticAI queue processor is already running")
             return
             
+        # Initialize agents for different providers on first start
+        if not self.agents:
+            self._initialize_agents()
+            
         self.is_running = True
         self.stats['started_at'] = datetime.now()
         self.processing_thread = threading.Thread(target=self._async_wrapper)
@@ -373,17 +375,20 @@ class PydanticAIBatchProcessor:
         provider_type = llm_config.get('provider_type', 'openai')
         
         if provider_type == 'openai':
+            from pydantic_ai.models.openai import OpenAIModel
             return OpenAIModel(
                 model=llm_config.get('model_name', 'gpt-4'),
                 api_key=llm_config.get('api_key'),
                 base_url=llm_config.get('base_url')
             )
         elif provider_type == 'anthropic':
+            from pydantic_ai.models.anthropic import AnthropicModel
             return AnthropicModel(
                 model=llm_config.get('model_name', 'claude-3-sonnet-20240229'),
                 api_key=llm_config.get('api_key')
             )
         elif provider_type == 'ollama':
+            from pydantic_ai.models.ollama import OllamaModel
             return OllamaModel(
                 model=llm_config.get('model_name', 'llama2'),
                 base_url=llm_config.get('base_url', 'http://localhost:11434')
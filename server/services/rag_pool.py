@@ -0,0 +1,316 @@
+"""
+RAG Endpoint Pool
+
+Spreads RAG API work over several RAG API instances instead of one hard-coded
+http://localhost:7001.
+
+- Instances come from services/config.py (every enabled RAG_API service:
+  rag_api, plus RAG_API_URLS) and from the rag_endpoints table, which is re-read
+  every RAG_POOL_REFRESH_SECONDS so instances can be added and drained at runtime
+  in every process (see api/service_routes.py)
+- New tasks go to the available instance with the fewest outstanding requests
+  from this process; an instance is unavailable while draining or while its
+  circuit breaker is open (failed submissions, failed health_monitor checks)
+- A task is pinned to the instance that accepted it: status polls go there, and
+  the instance is stored in llm_responses.rag_endpoint so another worker adopting
+  the row after a restart polls the same instance
+- A draining instance takes no new tasks but is still polled for the tasks it owns
+"""
+
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+from services.config import service_config, ServiceConfig, ServiceType
+from services.circuit_breakers import circuit_breakers, rag_endpoint_key
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_STATUSES = ('ACTIVE', 'DRAINING', 'REMOVED')
+
+
+@dataclass
+class RagInstance:
+    """One RAG API instance and this process's load on it"""
+    name: str
+    url: str
+    draining: bool = False
+    removed: bool = False
+    outstanding: int = 0
+    dispatched: int = 0
+
+
+class RagEndpointPool:
+    """Least-outstanding-requests balancing with task pinning over RAG API instances"""
+
+    def __init__(self, config=None, breakers=None, refresh_seconds: Optional[float] = None,
+                 load_endpoints=None):
+        self.config = config or service_config
+        self.breakers = breakers or circuit_breakers
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None \
+            else float(os.getenv('RAG_POOL_REFRESH_SECONDS', '30'))
+        # Returns [(name, url, status)] of runtime-managed instances (default: rag_endpoints table)
+        self._load_endpoints = load_endpoints or self._load_endpoints_from_db
+        self._instances: Dict[str, RagInstance] = {}
+        self._pins: Dict[str, str] = {}  # task_id -> instance url
+        self._lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self.stats = {
+            'dispatched': 0,
+            'no_instance_available': 0
+        }
+        # Configured instances right away; the table is read on first use
+        self._apply([])
+
+    # Membership
+
+    def refresh(self, force: bool = False):
+        """Re-read runtime instances from the rag_endpoints table (at most every refresh_seconds)"""
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_seconds:
+            return
+        self._refreshed_at = now
+
+        try:
+            runtime = self._load_endpoints() or []
+        except Exception as e:
+            logger.debug(f"Could not load rag_endpoints, keeping the current pool: {e}")
+            return
+        self._apply(runtime)
+
+    def _apply(self, runtime: List[tuple]):
+        """Merge runtime (name, url, status) instances with the configured RAG_API services"""
+        # Runtime instances are also health-checked by health_monitor, like configured ones
+        for name, url, status in runtime:
+            service = self.config.get_service(name)
+            if service is None:
+                self.config.add_service(ServiceConfig(
+                    name=name,
+                    service_type=ServiceType.RAG_API,
+                    base_url=url.rstrip('/'),
+                    timeout=60,
+                    health_check_endpoint="/api/health",
+                    enabled=status != 'REMOVED'
+                ))
+            else:
+                service.base_url, service.port = url.rstrip('/'), None
+                service.enabled = status != 'REMOVED'
+        statuses = {name: status for name, _, status in runtime}
+
+        with self._lock:
+            seen = set()
+            for name, service in self.config.get_services_by_type(ServiceType.RAG_API).items():
+                status = statuses.get(name, 'ACTIVE' if service.enabled else 'REMOVED')
+                instance = self._instances.get(name)
+                if instance is None:
+                    if status == 'REMOVED':
+                        continue
+                    instance = self._instances[name] = RagInstance(name=name, url=service.full_url.rstrip('/'))
+                    logger.info(f"RAG instance {name} ({instance.url}) joined the pool")
+                instance.url = service.full_url.rstrip('/')
+                instance.draining = status != 'ACTIVE'
+                instance.removed = status == 'REMOVED'
+                seen.add(name)
+
+            for name, instance in list(self._instances.items()):
+                if name not in seen:
+                    instance.draining = instance.removed = True
+                # Removed instances stay until their last pinned task is finished
+                if instance.removed and instance.outstanding <= 0:
+                    del self._instances[name]
+                    logger.info(f"RAG instance {name} ({instance.url}) left the pool")
+
+    @staticmethod
+    def _load_endpoints_from_db() -> List[tuple]:
+        from sqlalchemy import text
+        from database import Session
+        session = Session()
+        try:
+            return [tuple(row) for row in session.execute(text(
+                "SELECT name, url, status FROM rag_endpoints ORDER BY id"
+            ))]
+        finally:
+            session.close()
+
+    # Dispatch
+
+    def _available(self, instance: RagInstance) -> bool:
+        return not instance.draining and not self.breakers.is_blocking(rag_endpoint_key(instance.url))
+
+    def available(self) -> bool:
+        """Whether any instance can take a new task right now"""
+        self.refresh()
+        return any(self._available(instance) for instance in list(self._instances.values()))
+
+    def retry_after(self) -> float:
+        """Seconds until the first blocked instance may take a task again"""
+        delays = [self.breakers.get(rag_endpoint_key(instance.url)).retry_after()
+                  for instance in list(self._instances.values()) if not instance.draining]
+        return min(delays) if delays else 0.0
+
+    def acquire(self, exclude: Optional[str] = None) -> Optional[str]:
+        """
+        Pick the instance for a new task and count it as outstanding.
+
+        Instances with fewer outstanding requests go first (then fewer dispatched,
+        so idle instances take turns). In HALF_OPEN the breaker's probe slot is reserved.
+
+        Args:
+            exclude: Instance URL not to use (e.g. the one a hedged task is stuck on)
+
+        Returns:
+            The instance URL, or None when no instance is available. Follow up with
+            pin() once the task is accepted, or release_url() if it never was.
+        """
+        self.refresh()
+        with self._lock:
+            candidates = sorted(
+                (instance for instance in self._instances.values()
+                 if self._available(instance) and instance.url != (exclude or '').rstrip('/')),
+                key=lambda instance: (instance.outstanding, instance.dispatched)
+            )
+            for instance in candidates:
+                if self.breakers.allow_request(rag_endpoint_key(instance.url)):
+                    instance.outstanding += 1
+                    instance.dispatched += 1
+                    self.stats['dispatched'] += 1
+                    return instance.url
+        self.stats['no_instance_available'] += 1
+        return None
+
+    def _instance_by_url(self, url: Optional[str]) -> Optional[RagInstance]:
+        if not url:
+            return None
+        url = url.rstrip('/')
+        return next((instance for instance in self._instances.values() if instance.url == url), None)
+
+    def pin(self, task_id: str, url: str):
+        """Route status polls of an accepted task to the instance that accepted it"""
+        with self._lock:
+            self._pins[task_id] = url.rstrip('/')
+
+    def adopt(self, task_id: str, url: Optional[str]) -> str:
+        """
+        Pin a task submitted by another process (reclaimed row) and count it as outstanding.
+
+        Rows submitted before the pool existed have no stored instance; they belong
+        to the primary instance.
+        """
+        self.refresh()
+        url = (url or self.primary_url()).rstrip('/')
+        with self._lock:
+            if task_id not in self._pins:
+                self._pins[task_id] = url
+                instance = self._instance_by_url(url)
+                if instance:
+                    instance.outstanding += 1
+        return url
+
+    def url_for_task(self, task_id: str) -> str:
+        """Instance to poll for a task"""
+        return self._pins.get(task_id) or self.primary_url()
+
+    def release(self, task_id: str):
+        """The task is finished (or no longer tracked by this process)"""
+        with self._lock:
+            url = self._pins.pop(task_id, None)
+        if url:
+            self.release_url(url)
+
+    def release_url(self, url: Optional[str], cancel_probe: bool = False):
+        """
+        Drop one outstanding request of an instance.
+
+        Args:
+            cancel_probe: The request was never sent, give back a HALF_OPEN probe slot
+        """
+        with self._lock:
+            instance = self._instance_by_url(url)
+            if instance and instance.outstanding > 0:
+                instance.outstanding -= 1
+        if cancel_probe and url:
+            self.breakers.get(rag_endpoint_key(url)).cancel_request()
+
+    def record_success(self, url: str):
+        self.breakers.record_success(rag_endpoint_key(url))
+
+    def record_failure(self, url: str):
+        self.breakers.record_failure(rag_endpoint_key(url))
+
+    def primary_url(self) -> str:
+        """First configured instance, used for tasks without a known instance"""
+        instances = list(self._instances.values())
+        active = [instance for instance in instances if not instance.removed]
+        if active or instances:
+            return (active or instances)[0].url
+        rag_api = self.config.get_service('rag_api')
+        return rag_api.full_url.rstrip('/') if rag_api else "http://localhost:7001"
+
+    # Runtime management (persisted, so every process picks it up on its next refresh)
+
+    def set_endpoint(self, name: str, url: Optional[str] = None, status: str = 'ACTIVE') -> Dict[str, Any]:
+        """
+        Add an instance, or change the URL or status of one.
+
+        Args:
+            name: Instance name (also its service name for health checks)
+            url: Base URL, required when adding
+            status: ACTIVE, DRAINING (no new tasks, finish the pinned ones) or REMOVED
+
+        Returns:
+            The stored endpoint
+        """
+        from sqlalchemy import text
+        from database import Session
+        if status not in ENDPOINT_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(ENDPOINT_STATUSES)}")
+        if not url:
+            # Instances from configuration (or an earlier refresh) are known by name
+            service = self.config.get_service(name)
+            if service is None or service.service_type != ServiceType.RAG_API:
+                raise ValueError(f"Unknown RAG endpoint {name}, a url is required to add it")
+            url = service.full_url
+
+        session = Session()
+        try:
+            row = session.execute(text("""
+                INSERT INTO rag_endpoints (name, url, status, created_at, updated_at)
+                VALUES (:name, :url, :status, NOW(), NOW())
+                ON CONFLICT (name) DO UPDATE
+                SET url = EXCLUDED.url,
+                    status = EXCLUDED.status,
+                    updated_at = NOW()
+                RETURNING name, url, status
+            """), {'name': name, 'url': url.rstrip('/'), 'status': status}).first()
+            session.commit()
+        finally:
+            session.close()
+
+        self.refresh(force=True)
+        logger.info(f"RAG instance {row[0]} ({row[1]}) is now {row[2]}")
+        return {'name': row[0], 'url': row[1], 'status': row[2]}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'instances': [
+                {
+                    'name': instance.name,
+                    'url': instance.url,
+                    'status': 'REMOVED' if instance.removed else 'DRAINING' if instance.draining else 'ACTIVE',
+                    'available': self._available(instance),
+                    'outstanding': instance.outstanding,
+                    'dispatched': instance.dispatched,
+                    'circuit': self.breakers.get(rag_endpoint_key(instance.url)).state
+                }
+                for instance in list(self._instances.values())
+            ],
+            'pinned_tasks': len(self._pins),
+            'stats': self.stats.copy()
+        }
+
+
+# Global instance
+rag_endpoint_pool = RagEndpointPool()
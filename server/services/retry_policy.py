@@ -0,0 +1,179 @@
+"""
+Retry Policy
+
+Decides whether a failed llm_responses row is retried and when.
+
+Failures are classified as:
+- transient: RAG API restarts (404 on a known task), 5xx, timeouts, connection errors
+- rate_limited: 429 / provider rate limits - retried with a longer backoff
+- permanent: invalid requests, auth errors, context length exceeded, ... - never retried
+
+Retries use exponential backoff with full jitter and are limited per row
+(max_attempts) and per batch (a retry budget proportional to the batch size), so
+a batch that fails wholesale stops retrying instead of hammering a broken backend.
+Each process caches a batch's budget usage and counts its own retries on top, so
+the batch-wide count is only reloaded every RETRY_BUDGET_REFRESH_SECONDS.
+"""
+
+import os
+import re
+import time
+import random
+import threading
+from typing import Dict, Any, Optional, Callable, Tuple
+
+TRANSIENT = 'transient'
+RATE_LIMITED = 'rate_limited'
+PERMANENT = 'permanent'
+
+# Message patterns, checked in order: rate limits, then permanent, then transient
+RATE_LIMIT_PATTERNS = re.compile(r'\b429\b|rate.?limit|too many requests|quota', re.IGNORECASE)
+PERMANENT_PATTERNS = re.compile(
+    r'\b(400|401|403|413|422)\b|unauthori[sz]ed|forbidden|invalid api key|context length|'
+    r'maximum context|too long|invalid request|unsupported|not supported|model .*not found',
+    re.IGNORECASE
+)
+TRANSIENT_PATTERNS = re.compile(
+    r'\b(404|408|500|502|503|504)\b|timed? ?out|timeout|connection|unavailable|temporar|'
+    r'overloaded|reset by peer|exceeded maximum poll',
+    re.IGNORECASE
+)
+
+
+class RetryPolicy:
+    """Failure classification, backoff and retry budgets for llm_responses"""
+
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, rate_limit_delay: Optional[float] = None,
+                 budget_ratio: Optional[float] = None, min_budget: Optional[int] = None,
+                 budget_refresh_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('RETRY_MAX_ATTEMPTS', '4'))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv('RETRY_BASE_DELAY', '15'))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('RETRY_MAX_DELAY', '900'))
+        # Rate limits back off from a higher floor
+        self.rate_limit_delay = rate_limit_delay if rate_limit_delay is not None \
+            else float(os.getenv('RETRY_RATE_LIMIT_DELAY', '60'))
+        # Retries allowed per batch: max(min_budget, budget_ratio * responses in batch)
+        self.budget_ratio = budget_ratio if budget_ratio is not None else float(os.getenv('RETRY_BUDGET_RATIO', '0.2'))
+        self.min_budget = min_budget if min_budget is not None else int(os.getenv('RETRY_MIN_BUDGET', '10'))
+        # Retries of other processes are picked up when the cached usage is reloaded
+        self.budget_refresh_seconds = budget_refresh_seconds if budget_refresh_seconds is not None \
+            else float(os.getenv('RETRY_BUDGET_REFRESH_SECONDS', '60'))
+        self.clock = clock
+        self._batch_usage: Dict[int, list] = {}  # batch_id -> [retries used, responses, loaded at]
+        self._lock = threading.Lock()
+
+    def classify(self, error_data: Dict[str, Any]) -> str:
+        """
+        Classify a failure reported by a queue processor.
+
+        Args:
+            error_data: Failure info; 'failure_class' (set by the caller when it knows,
+                        e.g. a timeout), 'status_code' and 'error' are used
+
+        Returns:
+            TRANSIENT, RATE_LIMITED or PERMANENT
+        """
+        failure_class = error_data.get('failure_class')
+        if failure_class in (TRANSIENT, RATE_LIMITED, PERMANENT):
+            return failure_class
+
+        message = str(error_data.get('error') or '')
+        status_code = error_data.get('status_code')
+        if status_code:
+            if status_code == 429:
+                return RATE_LIMITED
+            # 404 is the RAG API losing a task on restart, unless the message names a
+            # permanent cause such as an unknown model
+            if status_code == 404 and PERMANENT_PATTERNS.search(message):
+                return PERMANENT
+            if status_code in (404, 408) or status_code >= 500:
+                return TRANSIENT
+            if 400 <= status_code < 500:
+                return PERMANENT
+
+        if RATE_LIMIT_PATTERNS.search(message):
+            return RATE_LIMITED
+        if PERMANENT_PATTERNS.search(message):
+            return PERMANENT
+        if TRANSIENT_PATTERNS.search(message):
+            return TRANSIENT
+
+        # Unknown errors reported by the model run itself are not worth repeating
+        return PERMANENT
+
+    def backoff_seconds(self, attempt: int, failure_class: str = TRANSIENT) -> float:
+        """
+        Delay before retry number `attempt` (1-based), exponential with full jitter.
+        """
+        base = self.rate_limit_delay if failure_class == RATE_LIMITED else self.base_delay
+        ceiling = min(self.max_delay, base * (2 ** max(attempt - 1, 0)))
+        # Full jitter, but never retry sooner than half the base delay
+        return max(base / 2, random.uniform(0, ceiling))
+
+    def batch_budget(self, total_responses: int) -> int:
+        """Number of retries a batch of this size may use in total"""
+        return max(self.min_budget, int(total_responses * self.budget_ratio))
+
+    def batch_usage(self, batch_id: int, load: Callable[[], Tuple[int, int]]) -> Tuple[int, int]:
+        """
+        Retries used and number of responses of a batch, from the cache while it is fresh.
+
+        Args:
+            load: Counts (retries used, responses) of the batch in the database
+
+        Returns:
+            (retries used, responses)
+        """
+        now = self.clock()
+        with self._lock:
+            usage = self._batch_usage.get(batch_id)
+            if usage and now - usage[2] < self.budget_refresh_seconds:
+                return usage[0], usage[1]
+
+        retries_used, total = load()
+        with self._lock:
+            # Drop batches nobody failed in for a while
+            self._batch_usage = {key: value for key, value in self._batch_usage.items()
+                                 if now - value[2] < self.budget_refresh_seconds}
+            self._batch_usage[batch_id] = [retries_used, total, now]
+        return retries_used, total
+
+    def record_retry(self, batch_id: int):
+        """Count a retry against the cached usage of its batch"""
+        with self._lock:
+            usage = self._batch_usage.get(batch_id)
+            if usage:
+                usage[0] += 1
+
+    def decide(self, failure_class: str, attempt_count: int, batch_retries_used: int,
+               batch_total: int) -> Dict[str, Any]:
+        """
+        Decide whether to retry a failed row.
+
+        Args:
+            failure_class: Result of classify()
+            attempt_count: Retries already made for this row
+            batch_retries_used: Retries already made across the batch
+            batch_total: Number of responses in the batch
+
+        Returns:
+            Dict with retry (bool), delay_seconds and reason
+        """
+        if failure_class == PERMANENT:
+            return {'retry': False, 'delay_seconds': None, 'reason': 'permanent failure'}
+        if attempt_count + 1 >= self.max_attempts:
+            return {'retry': False, 'delay_seconds': None,
+                    'reason': f'gave up after {attempt_count + 1} attempts'}
+        if batch_retries_used >= self.batch_budget(batch_total):
+            return {'retry': False, 'delay_seconds': None, 'reason': 'batch retry budget exhausted'}
+
+        return {
+            'retry': True,
+            'delay_seconds': self.backoff_seconds(attempt_count + 1, failure_class),
+            'reason': f'{failure_class} failure, retry {attempt_count + 1} of {self.max_attempts - 1}'
+        }
+
+
+# Global instance
+retry_policy = RetryPolicy()
@@ -78,6 +78,7 @@ def perform_simple_recovery():
                     AND status = 'PROCESSING'
                     AND (started_processing_at < NOW() - INTERVAL '1 hour' 
                          OR started_processing_at IS NULL)
+                    AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
                 """, (batch.id,))
                 
                 stuck_tasks = kb_cursor.rowcount
@@ -0,0 +1,562 @@
+"""
+Snapshot Engine
+
+Creates and restores snapshots of doc_eval and KnowledgeDocuments. Full and
+incremental snapshots cover both databases; quick snapshots only doc_eval.
+
+A snapshot is a directory:
+- <database>/                pg_dump directory format (-Fd), dumped with parallel jobs
+                             and compressed per table by pg_dump itself - no
+                             uncompressed temp file, no second compression pass
+- KnowledgeDocuments.changes/  incremental snapshots only: connection_snapshots,
+                             llm_responses and docs rows changed since the parent
+                             snapshot, streamed with COPY through a zstd (or gzip)
+                             compressor, plus the ids of every live row so
+                             deletions are replayed too
+- manifest.json              mode, parent, change watermark and per-database stats
+
+Incremental snapshots dump doc_eval in full (it is small) and only the changed
+KnowledgeDocuments rows. Restoring one restores the chain's full snapshot with
+parallel pg_restore, then applies each increment in order.
+
+Progress is reported from bytes written against an estimate of the output size
+(source table sizes times the compression ratio seen by the previous snapshot).
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Iterable
+
+import psycopg2
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DATABASES = ('doc_eval', 'KnowledgeDocuments')
+KB_DATABASE = 'KnowledgeDocuments'
+# Large KnowledgeDocuments tables exported row-wise by incremental snapshots
+# (connection_snapshots first: llm_responses rows reference it)
+INCREMENTAL_TABLES = ('connection_snapshots', 'llm_responses', 'docs')
+MANIFEST_NAME = 'manifest.json'
+CHANGES_DIR = f'{KB_DATABASE}.changes'
+
+# Compression ratio assumed for progress until a snapshot has measured one
+DEFAULT_COMPRESSION_RATIO = 0.3
+
+
+class SnapshotError(Exception):
+    """A dump, restore or export step failed"""
+    pass
+
+
+class CountingWriter:
+    """Passes writes through to a file object while counting bytes"""
+
+    def __init__(self, target, on_write: Optional[Callable[[int], None]] = None):
+        self.target = target
+        self.bytes_written = 0
+        self.on_write = on_write
+
+    def write(self, data):
+        self.target.write(data)
+        self.bytes_written += len(data)
+        if self.on_write:
+            self.on_write(self.bytes_written)
+        return len(data)
+
+
+def compressed_suffix() -> str:
+    return '.zst' if ZSTD_AVAILABLE else '.gz'
+
+
+def open_compressed_writer(path: str):
+    """Streaming compressor for a path ending in .zst or .gz"""
+    if path.endswith('.zst'):
+        if not ZSTD_AVAILABLE:
+            raise SnapshotError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(open(path, 'wb'), closefd=True)
+    return gzip.open(path, 'wb', compresslevel=5)
+
+
+def open_compressed_reader(path: str):
+    """Streaming decompressor for a path ending in .zst or .gz"""
+    if path.endswith('.zst'):
+        if not ZSTD_AVAILABLE:
+            raise SnapshotError(f"zstandard is required to read {path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return gzip.open(path, 'rb')
+
+
+def directory_size(path: str) -> int:
+    """Total size of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # pg_dump may be renaming/creating files
+    return total
+
+
+def read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def write_manifest(snapshot_dir: str, manifest: Dict[str, Any]):
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+
+def default_connect(database: str):
+    return psycopg2.connect(
+        host="studio.local",
+        database=database,
+        user="postgres",
+        password="prodogs03",
+        port=5432
+    )
+
+
+class SnapshotEngine:
+    """Parallel, streaming and incremental dumps and restores of both databases"""
+
+    def __init__(self, jobs: Optional[int] = None, compression: Optional[str] = None,
+                 pg_bin_dir: Optional[str] = None, connect: Optional[Callable] = None,
+                 runner: Optional[Callable] = None):
+        self.jobs = jobs or int(os.getenv('SNAPSHOT_JOBS', str(min(4, os.cpu_count() or 1))))
+        # pg_dump --compress method for directory dumps: zstd, lz4, gzip or none
+        self.compression = compression or os.getenv('SNAPSHOT_COMPRESSION', 'zstd')
+        self.pg_bin_dir = pg_bin_dir or os.getenv('PG_BIN_DIR', '/opt/homebrew/opt/postgresql@17/bin')
+        self.host = 'studio.local'
+        self.port = 5432
+        self.user = 'postgres'
+        self.password = 'prodogs03'
+        self.connect = connect or default_connect
+        self.runner = runner or subprocess.Popen
+        # Rows changed up to this long before the parent's watermark are exported again,
+        # covering transactions that were still open when the parent was taken
+        self.incremental_overlap = int(os.getenv('SNAPSHOT_INCREMENTAL_OVERLAP', '600'))
+
+    def _env(self) -> Dict[str, str]:
+        env = os.environ.copy()
+        env['PGPASSWORD'] = self.password
+        return env
+
+    def _connection_args(self) -> List[str]:
+        return [f'--host={self.host}', f'--port={self.port}', f'--username={self.user}', '--no-password']
+
+    def dump_command(self, database: str, output_dir: str, exclude_table_data: Iterable[str] = ()) -> List[str]:
+        """pg_dump into a directory-format archive with parallel jobs"""
+        cmd = [
+            os.path.join(self.pg_bin_dir, 'pg_dump'),
+            *self._connection_args(),
+            f'--dbname={database}',
+            '--format=directory',
+            f'--jobs={self.jobs}',
+            f'--file={output_dir}',
+            '--no-acl',
+            '--no-owner'
+        ]
+        if self.compression != 'none':
+            cmd.append(f'--compress={self.compression}')
+        for table in exclude_table_data:
+            cmd.append(f'--exclude-table-data=public.{table}')
+        return cmd
+
+    def restore_command(self, database: str, input_dir: str) -> List[str]:
+        """pg_restore of a directory-format archive with parallel jobs"""
+        return [
+            os.path.join(self.pg_bin_dir, 'pg_restore'),
+            *self._connection_args(),
+            f'--dbname={database}',
+            f'--jobs={self.jobs}',
+            '--clean',
+            '--if-exists',
+            '--no-acl',
+            '--no-owner',
+            input_dir
+        ]
+
+    def _run(self, cmd: List[str], description: str, poll: Optional[Callable[[], None]] = None):
+        """Run a command, calling poll about once a second while it runs"""
+        process = self.runner(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=self._env())
+
+        # Drain stderr in the background so a chatty process never blocks on a full pipe
+        stderr_chunks = []
+        reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        reader.start()
+
+        while process.poll() is None:
+            if poll:
+                poll()
+            time.sleep(1)
+        reader.join(timeout=5)
+
+        if process.returncode != 0:
+            error = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+            raise SnapshotError(f"{description} failed: {error}")
+
+    def source_bytes(self, database: str, exclude_table_data: Iterable[str] = ()) -> int:
+        """Size of the table data a dump will read"""
+        conn = self.connect(database)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(SUM(pg_table_size(c.oid)), 0)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind = 'r' AND n.nspname = 'public'
+                AND NOT (c.relname = ANY(%s))
+            """, (list(exclude_table_data),))
+            total = cursor.fetchone()[0]
+            cursor.close()
+            return int(total)
+        finally:
+            conn.close()
+
+    def current_time(self, database: str = KB_DATABASE) -> datetime:
+        """Database clock, used for change watermarks"""
+        conn = self.connect(database)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT NOW()::timestamp")
+            now = cursor.fetchone()[0]
+            cursor.close()
+            return now
+        finally:
+            conn.close()
+
+    def dump_database(self, database: str, output_dir: str, exclude_table_data: Iterable[str] = (),
+                      compression_ratio: Optional[float] = None,
+                      progress: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Dump one database with parallel pg_dump.
+
+        Args:
+            database: Database name
+            output_dir: Archive directory to create (must not exist)
+            exclude_table_data: Tables dumped schema-only
+            compression_ratio: Output/source size ratio used to estimate progress
+            progress: Called with (database, bytes_written, expected_bytes)
+
+        Returns:
+            Dump stats: source_bytes, bytes_written, duration_seconds
+        """
+        exclude_table_data = list(exclude_table_data)
+        started = time.monotonic()
+        source = self.source_bytes(database, exclude_table_data)
+        expected = max(1, int(source * (compression_ratio or DEFAULT_COMPRESSION_RATIO)))
+
+        def report():
+            if progress:
+                progress(database, directory_size(output_dir), expected)
+
+        logger.info(f"Dumping {database} with {self.jobs} jobs ({source / 1024 / 1024:.1f} MB of table data)")
+        self._run(self.dump_command(database, output_dir, exclude_table_data), f"pg_dump {database}", poll=report)
+
+        written = directory_size(output_dir)
+        if progress:
+            progress(database, written, written)
+        return {
+            'source_bytes': source,
+            'bytes_written': written,
+            'duration_seconds': round(time.monotonic() - started, 2),
+            'exclude_table_data': exclude_table_data
+        }
+
+    def restore_database(self, database: str, input_dir: str):
+        """Restore one database from a directory archive with parallel pg_restore"""
+        logger.info(f"Restoring {database} from {input_dir} with {self.jobs} jobs")
+        self._run(self.restore_command(database, input_dir), f"pg_restore {database}")
+
+    def terminate_connections(self, database: str):
+        """Disconnect other sessions so the database can be restored"""
+        conn = self.connect('postgres')
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE datname = %s AND pid <> pg_backend_pid()
+            """, (database,))
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _table_columns(self, cursor, table: str) -> List[str]:
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+            ORDER BY ordinal_position
+        """, (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def export_changes(self, output_dir: str, since: datetime,
+                       progress: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Stream llm_responses/docs rows changed since a watermark into compressed COPY files.
+
+        Everything is read in one REPEATABLE READ transaction, so the changed rows and
+        the live id lists are consistent with the returned watermark.
+
+        Returns:
+            Export stats including the new watermark and per-table row/byte counts
+        """
+        os.makedirs(output_dir)
+        started = time.monotonic()
+        conn = self.connect(KB_DATABASE)
+        try:
+            conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            cursor = conn.cursor()
+            cursor.execute("SELECT NOW()::timestamp")
+            watermark = cursor.fetchone()[0]
+            changed_since = since - timedelta(seconds=self.incremental_overlap)
+
+            # Estimate output from the changed row counts and average row widths
+            expected_source = 0
+            for table in INCREMENTAL_TABLES:
+                cursor.execute(f"""
+                    SELECT (SELECT COUNT(*) FROM {table} WHERE updated_at > %s),
+                           pg_table_size('{table}') / GREATEST(reltuples, 1)
+                    FROM pg_class WHERE oid = '{table}'::regclass
+                """, (changed_since,))
+                changed_rows, row_width = cursor.fetchone()
+                expected_source += changed_rows * float(row_width)
+            expected = max(1, int(expected_source * DEFAULT_COMPRESSION_RATIO))
+
+            tables = {}
+            total_written = 0
+            for table in INCREMENTAL_TABLES:
+                columns = self._table_columns(cursor, table)
+                if 'updated_at' not in columns:
+                    raise SnapshotError(
+                        f"{table}.updated_at is missing - run migrations/add_snapshot_change_tracking.py"
+                    )
+                column_list = ', '.join(columns)
+                rows_file = f'{table}.rows.copy{compressed_suffix()}'
+                ids_file = f'{table}.ids.copy{compressed_suffix()}'
+
+                base = total_written
+                with open_compressed_writer(os.path.join(output_dir, rows_file)) as target:
+                    writer = CountingWriter(target)
+                    query = cursor.mogrify(
+                        f"COPY (SELECT {column_list} FROM {table} WHERE updated_at > %s) TO STDOUT",
+                        (changed_since,)
+                    ).decode('utf-8')
+                    if progress:
+                        writer.on_write = lambda n: progress(KB_DATABASE, base + n, expected)
+                    cursor.copy_expert(query, writer)
+                    rows = cursor.rowcount
+
+                # Live ids, so rows deleted since the parent are deleted on restore
+                with open_compressed_writer(os.path.join(output_dir, ids_file)) as target:
+                    cursor.copy_expert(f"COPY (SELECT id FROM {table}) TO STDOUT", target)
+
+                written = os.path.getsize(os.path.join(output_dir, rows_file)) + \
+                    os.path.getsize(os.path.join(output_dir, ids_file))
+                total_written += written
+                tables[table] = {
+                    'columns': columns,
+                    'rows_file': rows_file,
+                    'ids_file': ids_file,
+                    'changed_rows': rows,
+                    'bytes_written': written
+                }
+                logger.info(f"Exported {rows} changed {table} rows ({written / 1024 / 1024:.1f} MB)")
+
+            conn.rollback()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return {
+            'watermark': watermark,
+            'changed_since': changed_since,
+            'tables': tables,
+            'bytes_written': total_written,
+            'duration_seconds': round(time.monotonic() - started, 2)
+        }
+
+    def apply_changes(self, input_dir: str, changes: Dict[str, Any]):
+        """Upsert the changed rows of an incremental snapshot and delete rows that no longer existed"""
+        conn = self.connect(KB_DATABASE)
+        try:
+            cursor = conn.cursor()
+            for table, info in changes['tables'].items():
+                columns = info['columns']
+                column_list = ', '.join(columns)
+                updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns if column != 'id')
+
+                cursor.execute(f"CREATE TEMP TABLE restore_{table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+                with open_compressed_reader(os.path.join(input_dir, info['rows_file'])) as source:
+                    cursor.copy_expert(f"COPY restore_{table} ({column_list}) FROM STDIN", source)
+                cursor.execute(f"""
+                    INSERT INTO {table} ({column_list})
+                    SELECT {column_list} FROM restore_{table}
+                    ON CONFLICT (id) DO UPDATE SET {updates}
+                """)
+                upserted = cursor.rowcount
+
+                cursor.execute(f"CREATE TEMP TABLE restore_{table}_ids (id BIGINT PRIMARY KEY) ON COMMIT DROP")
+                with open_compressed_reader(os.path.join(input_dir, info['ids_file'])) as source:
+                    cursor.copy_expert(f"COPY restore_{table}_ids (id) FROM STDIN", source)
+                cursor.execute(f"ANALYZE restore_{table}_ids")
+                cursor.execute(f"""
+                    DELETE FROM {table} t
+                    WHERE NOT EXISTS (SELECT 1 FROM restore_{table}_ids r WHERE r.id = t.id)
+                """)
+                deleted = cursor.rowcount
+
+                logger.info(f"Applied {table} changes: {upserted} upserted, {deleted} deleted")
+
+            # Keep id sequences ahead of the restored rows
+            for table in changes['tables']:
+                cursor.execute(f"""
+                    SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}
+                """)
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def create_snapshot(self, snapshot_dir: str, mode: str = 'full',
+                        parent: Optional[Dict[str, Any]] = None,
+                        progress: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Create a snapshot of both databases.
+
+        Args:
+            snapshot_dir: Directory to create
+            mode: 'full' (both databases), 'quick' (doc_eval only) or
+                  'incremental' (doc_eval in full, changed llm_responses/docs rows)
+            parent: Manifest of the previous snapshot in the chain - required for
+                    incremental, and supplies compression ratios for progress
+            progress: Called with (database, bytes_written, expected_bytes)
+
+        Returns:
+            The snapshot manifest (also written to manifest.json)
+        """
+        if mode == 'incremental' and not (parent and parent.get('change_watermark')):
+            raise SnapshotError("Incremental snapshots need a full or incremental parent snapshot")
+
+        os.makedirs(snapshot_dir)
+        started = time.monotonic()
+        manifest = {
+            'format_version': 1,
+            'mode': mode,
+            'created_at': datetime.now().isoformat(),
+            'compression': self.compression,
+            'jobs': self.jobs,
+            'databases': {},
+            'change_watermark': None
+        }
+
+        try:
+            if mode == 'incremental':
+                manifest['databases']['doc_eval'] = self.dump_database(
+                    'doc_eval', os.path.join(snapshot_dir, 'doc_eval'),
+                    compression_ratio=self._ratio(parent, 'doc_eval'), progress=progress
+                )
+                since = datetime.fromisoformat(str(parent['change_watermark']))
+                changes = self.export_changes(os.path.join(snapshot_dir, CHANGES_DIR), since, progress=progress)
+                manifest['change_watermark'] = changes['watermark']
+                manifest['databases'][KB_DATABASE] = {
+                    'incremental': True,
+                    'directory': CHANGES_DIR,
+                    'changed_since': changes['changed_since'],
+                    'tables': changes['tables'],
+                    'bytes_written': changes['bytes_written'],
+                    'duration_seconds': changes['duration_seconds']
+                }
+            else:
+                # Taken before the dump starts, so the next increment overlaps rather than misses rows
+                if mode == 'full':
+                    manifest['change_watermark'] = self.current_time(KB_DATABASE)
+                for database in self.databases_for(mode):
+                    manifest['databases'][database] = self.dump_database(
+                        database, os.path.join(snapshot_dir, database),
+                        compression_ratio=self._ratio(parent, database), progress=progress
+                    )
+
+        except Exception:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            raise
+
+        manifest['bytes_written'] = directory_size(snapshot_dir)
+        manifest['duration_seconds'] = round(time.monotonic() - started, 2)
+        write_manifest(snapshot_dir, manifest)
+        return manifest
+
+    @staticmethod
+    def databases_for(mode: str) -> List[str]:
+        """Databases a snapshot of this mode contains"""
+        return ['doc_eval'] if mode == 'quick' else list(DATABASES)
+
+    def _ratio(self, manifest: Optional[Dict[str, Any]], database: str) -> Optional[float]:
+        """Compression ratio measured by an earlier snapshot of a database"""
+        stats = (manifest or {}).get('databases', {}).get(database, {})
+        if stats.get('source_bytes') and stats.get('bytes_written'):
+            return stats['bytes_written'] / stats['source_bytes']
+        return None
+
+    def restore_snapshot(self, chain: List[str], databases: Optional[Iterable[str]] = None,
+                         progress: Optional[Callable[[str], None]] = None):
+        """
+        Restore a snapshot.
+
+        Args:
+            chain: Snapshot directories from the full snapshot to the one being
+                   restored (a single entry for full and quick snapshots)
+            databases: Databases to restore (default: every database in the snapshot)
+            progress: Called with a description of each step
+        """
+        target = read_manifest(chain[-1])
+        base = read_manifest(chain[0])
+        if len(chain) > 1 and base['mode'] != 'full':
+            raise SnapshotError("Incremental chains must start from a full snapshot")
+        databases = [database for database in (databases or DATABASES) if database in target['databases']]
+
+        for database in databases:
+            if progress:
+                progress(f"Terminating connections to {database}...")
+            self.terminate_connections(database)
+
+        # doc_eval is dumped in full by every snapshot
+        if 'doc_eval' in databases:
+            if progress:
+                progress("Restoring doc_eval...")
+            self.restore_database('doc_eval', os.path.join(chain[-1], 'doc_eval'))
+
+        if KB_DATABASE in databases:
+            if progress:
+                progress(f"Restoring {KB_DATABASE} from {os.path.basename(chain[0])}...")
+            self.restore_database(KB_DATABASE, os.path.join(chain[0], KB_DATABASE))
+
+            for snapshot_dir in chain[1:]:
+                manifest = read_manifest(snapshot_dir)
+                if progress:
+                    progress(f"Applying changes from {os.path.basename(snapshot_dir)}...")
+                kb = manifest['databases'][KB_DATABASE]
+                self.apply_changes(os.path.join(snapshot_dir, kb['directory']), kb)
+
+
+# Global instance
+snapshot_engine = SnapshotEngine()
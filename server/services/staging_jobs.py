@@ -0,0 +1,474 @@
+"""
+Staging Jobs
+
+Runs batch staging (reading, encoding and inserting every document of a batch
+into KnowledgeDocuments) as background jobs instead of inside the HTTP request.
+
+- Each job is a staging_jobs row; BatchService._perform_staging checkpoints it
+  after every chunk of documents (last documents.id, counters, heartbeat) and
+  renews the heartbeat between checkpoints while reading files
+- Progress is only written while this process still owns the job (claimed_by);
+  a job resumed elsewhere after a missed heartbeat stops at once
+- Cancellation is a status change (CANCELLING) picked up at the next checkpoint,
+  so it works whichever process runs the job
+- A job whose owner stopped heartbeating is resumed after its last checkpoint by
+  the next process that calls resume_interrupted() (app startup, workers)
+- Up to STAGING_MAX_CONCURRENT_JOBS jobs run at once per process and share one
+  I/O budget of STAGING_IO_BUDGET_MBPS (0 = unlimited) for reading files
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from sqlalchemy import text
+
+from database import Session
+from models import Batch, StagingJob
+from services.worker_lease import worker_lease
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('QUEUED', 'RUNNING', 'CANCELLING')
+
+
+class StagingCancelled(Exception):
+    """Raised inside a job when cancellation was requested"""
+    pass
+
+
+class StagingJobLost(Exception):
+    """Raised inside a job when another process has taken it over"""
+    pass
+
+
+class IOBudget:
+    """Token bucket in bytes per second, shared by every staging job of the process"""
+
+    def __init__(self, bytes_per_second: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = bytes_per_second
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = bytes_per_second  # One second of burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> float:
+        """
+        Take nbytes from the budget, sleeping while it is overdrawn.
+
+        Reads larger than the bucket are allowed and paid back by waiting, so a
+        single large file never blocks forever.
+
+        Returns:
+            Seconds waited
+        """
+        if self.rate <= 0 or nbytes <= 0:
+            return 0.0
+
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class StagingJobContext:
+    """Progress, checkpoint and cancellation hooks handed to BatchService._perform_staging"""
+
+    def __init__(self, manager: 'StagingJobManager', job_id: str, job: Dict[str, Any]):
+        self.manager = manager
+        self.job_id = job_id
+        self.last_document_id = job.get('last_document_id')
+        self.total_documents = job.get('total_documents') or 0
+        self.documents_done = job.get('documents_done') or 0
+        self.documents_staged = job.get('documents_staged') or 0
+        self.responses_created = job.get('responses_created') or 0
+        self.bytes_read = job.get('bytes_read') or 0
+        self.active_seconds = job.get('active_seconds') or 0.0
+        self.cancelled = False
+        self._segment_started = time.monotonic()
+        self._heartbeat_renewed = self._segment_started
+
+    def start(self, total_documents: int):
+        """Record the number of documents of the batch"""
+        self.total_documents = total_documents
+        self._write({'total_documents': total_documents})
+
+    def acquire_io(self, nbytes: int):
+        """Wait for the shared I/O budget before reading a file, renewing the heartbeat when due"""
+        self.manager.io_budget.acquire(nbytes)
+        if time.monotonic() - self._heartbeat_renewed >= self.manager.heartbeat_seconds:
+            self._write({})
+
+    def checkpoint(self, last_document_id: int, documents_done: int, documents_staged: int,
+                   responses_created: int, bytes_read: int):
+        """Persist progress after a committed chunk; picks up cancellation requests"""
+        now = time.monotonic()
+        self.active_seconds += now - self._segment_started
+        self._segment_started = now
+
+        self.last_document_id = last_document_id
+        self.documents_done = documents_done
+        self.documents_staged = documents_staged
+        self.responses_created = responses_created
+        self.bytes_read = bytes_read
+
+        self._write({
+            'last_document_id': last_document_id,
+            'documents_done': documents_done,
+            'documents_staged': documents_staged,
+            'responses_created': responses_created,
+            'bytes_read': bytes_read,
+            'active_seconds': self.active_seconds
+        })
+
+    def should_stop(self) -> bool:
+        return self.cancelled or self.manager._cancel_requested(self.job_id)
+
+    def _write(self, values: Dict[str, Any]):
+        """Write progress and renew the heartbeat; raises StagingJobLost if the job changed owner"""
+        status = self.manager._update_job(self.job_id, values)
+        if status is None:
+            raise StagingJobLost(f"Staging job {self.job_id} was taken over by another process")
+        self._heartbeat_renewed = time.monotonic()
+        if status == 'CANCELLING':
+            self.cancelled = True
+
+
+class StagingJobManager:
+    """Creates, runs, cancels and resumes staging jobs"""
+
+    def __init__(self, max_concurrent: Optional[int] = None, io_budget_mbps: Optional[float] = None,
+                 stale_seconds: Optional[int] = None):
+        self.max_concurrent = max_concurrent or int(os.getenv('STAGING_MAX_CONCURRENT_JOBS', '2'))
+        mbps = io_budget_mbps if io_budget_mbps is not None else float(os.getenv('STAGING_IO_BUDGET_MBPS', '100'))
+        self.io_budget = IOBudget(mbps * 1024 * 1024)
+        # A running job whose heartbeat is older than this is considered abandoned
+        self.stale_seconds = stale_seconds or int(os.getenv('STAGING_JOB_STALE_SECONDS', '300'))
+        # Renewed well within the stale window even when a chunk takes longer than it
+        self.heartbeat_seconds = self.stale_seconds / 3
+        self.worker_id = worker_lease.worker_id
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cancel_flags: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='staging')
+            return self._executor
+
+    def create_job(self, session, batch_id: int, folder_ids: List[int], connection_ids: List[int],
+                   prompt_ids: List[int], resume: bool = True) -> StagingJob:
+        """
+        Add a QUEUED job for a batch to the session (the caller commits, then calls start()).
+
+        Args:
+            resume: Continue after the checkpoint of the batch's last unfinished job - only
+                    valid while the rows that job staged still exist (not after a restage or
+                    reset, which supersede the checkpoint)
+        """
+        job = StagingJob(
+            id=str(uuid.uuid4()),
+            batch_id=batch_id,
+            status='QUEUED',
+            folder_ids=folder_ids,
+            connection_ids=connection_ids,
+            prompt_ids=prompt_ids
+        )
+
+        if resume:
+            previous = session.query(StagingJob).filter(
+                StagingJob.batch_id == batch_id,
+                StagingJob.status.in_(['CANCELLED', 'FAILED'])
+            ).order_by(StagingJob.created_at.desc()).first()
+            if previous and previous.last_document_id:
+                for field in ('last_document_id', 'documents_done', 'documents_staged',
+                              'responses_created', 'bytes_read', 'active_seconds'):
+                    setattr(job, field, getattr(previous, field))
+                logger.info(f"Staging job for batch {batch_id} resumes after document {previous.last_document_id}")
+
+        session.add(job)
+        return job
+
+    def supersede_checkpoints(self, session, batch_id: int) -> int:
+        """
+        Mark the batch's cancelled and failed jobs SUPERSEDED so no later job resumes from them.
+
+        Called when the rows those jobs staged are deleted or their documents unassigned (reset,
+        restage); the change is added to the caller's session.
+
+        Returns:
+            Number of jobs superseded
+        """
+        count = session.query(StagingJob).filter(
+            StagingJob.batch_id == batch_id,
+            StagingJob.status.in_(['CANCELLED', 'FAILED'])
+        ).update({'status': 'SUPERSEDED'}, synchronize_session=False)
+        if count:
+            logger.info(f"Superseded {count} staging checkpoint(s) of batch {batch_id}")
+        return count
+
+    def start(self, job_id: str):
+        """Run a committed QUEUED job in the background"""
+        self._cancel_flags[job_id] = threading.Event()
+        self._get_executor().submit(self._run, job_id)
+        logger.info(f"Staging job {job_id} submitted")
+
+    def submit(self, batch_id: int, folder_ids: List[int], connection_ids: List[int],
+               prompt_ids: List[int], resume: bool = True) -> Dict[str, Any]:
+        """Create and start a staging job; returns its description"""
+        session = Session()
+        try:
+            job = self.create_job(session, batch_id, folder_ids, connection_ids, prompt_ids, resume=resume)
+            session.commit()
+            description = self.describe(job)
+        finally:
+            session.close()
+
+        self.start(description['job_id'])
+        return description
+
+    def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """QUEUED -> RUNNING for this process; None if another process has it or it was cancelled"""
+        session = Session()
+        try:
+            row = session.execute(text("""
+                UPDATE staging_jobs
+                SET status = 'RUNNING', claimed_by = :worker_id, heartbeat_at = NOW(),
+                    started_at = COALESCE(started_at, NOW())
+                WHERE id = :job_id AND status = 'QUEUED'
+                RETURNING batch_id, folder_ids, connection_ids, prompt_ids, total_documents, documents_done,
+                          documents_staged, responses_created, bytes_read, last_document_id, active_seconds
+            """), {'job_id': job_id, 'worker_id': self.worker_id}).mappings().first()
+            session.commit()
+            return dict(row) if row else None
+        finally:
+            session.close()
+
+    def _run(self, job_id: str):
+        """Execute a job: stage the batch, then settle the job and batch status"""
+        from services.batch_service import batch_service
+        from services.document_encoding_service import DocumentEncodingService
+
+        job = self._claim(job_id)
+        if not job:
+            logger.info(f"Staging job {job_id} is no longer queued, not running it")
+            return
+
+        batch_id = job['batch_id']
+        context = StagingJobContext(self, job_id, job)
+        session = Session()
+        try:
+            result = batch_service._perform_staging(
+                session, batch_id, job['folder_ids'] or [], job['connection_ids'] or [],
+                job['prompt_ids'] or [], DocumentEncodingService(), job=context
+            )
+            session.commit()
+
+            if result.get('cancelled'):
+                self._finish(job_id, batch_id, 'CANCELLED', 'SAVED', None)
+            elif result['success']:
+                self._finish(job_id, batch_id, 'COMPLETED', 'STAGED', None,
+                             total_documents=result['total_documents'])
+            else:
+                self._finish(job_id, batch_id, 'FAILED', 'FAILED_STAGING', result.get('error'))
+
+        except StagingJobLost as e:
+            # The new owner settles the job and the batch
+            session.rollback()
+            logger.warning(str(e))
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Staging job {job_id} for batch {batch_id} failed: {e}", exc_info=True)
+            self._finish(job_id, batch_id, 'FAILED', 'FAILED_STAGING', str(e))
+        finally:
+            session.close()
+            self._cancel_flags.pop(job_id, None)
+
+    def _finish(self, job_id: str, batch_id: int, job_status: str, batch_status: str,
+                error: Optional[str], total_documents: Optional[int] = None):
+        session = Session()
+        try:
+            finished = session.execute(text("""
+                UPDATE staging_jobs
+                SET status = :status, finished_at = NOW(), error_message = :error, claimed_by = NULL
+                WHERE id = :job_id AND claimed_by = :worker_id
+            """), {'job_id': job_id, 'status': job_status, 'error': error, 'worker_id': self.worker_id})
+            if not finished.rowcount:
+                session.rollback()
+                logger.warning(f"Staging job {job_id} was taken over by another process, leaving it to its new owner")
+                return
+
+            values = {'status': batch_status}
+            if total_documents is not None:
+                values['total_documents'] = total_documents
+            session.query(Batch).filter(Batch.id == batch_id, Batch.status == 'STAGING').update(
+                values, synchronize_session=False
+            )
+            session.commit()
+            logger.info(f"Staging job {job_id} {job_status.lower()} - batch {batch_id} is {batch_status}")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error finishing staging job {job_id}: {e}")
+        finally:
+            session.close()
+
+    def _update_job(self, job_id: str, values: Dict[str, Any]) -> Optional[str]:
+        """Write progress and renew the heartbeat; returns the job status, None if this process lost the job"""
+        session = Session()
+        try:
+            assignments = ''.join(f"{column} = :{column}, " for column in values)
+            status = session.execute(text(f"""
+                UPDATE staging_jobs
+                SET {assignments}heartbeat_at = NOW()
+                WHERE id = :job_id AND claimed_by = :worker_id
+                RETURNING status
+            """), {**values, 'job_id': job_id, 'worker_id': self.worker_id}).scalar()
+            session.commit()
+            return status
+        finally:
+            session.close()
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        flag = self._cancel_flags.get(job_id)
+        return bool(flag and flag.is_set())
+
+    def cancel(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Request cancellation of a batch's active staging job.
+
+        A queued job is cancelled at once; a running one stops after its current chunk.
+
+        Returns:
+            The job description, or None if the batch has no active job
+        """
+        session = Session()
+        try:
+            job = session.query(StagingJob).filter(
+                StagingJob.batch_id == batch_id,
+                StagingJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(StagingJob.created_at.desc()).with_for_update().first()
+            if not job:
+                return None
+
+            if job.status == 'QUEUED':
+                job.status = 'CANCELLED'
+                job.finished_at = datetime.now()
+                session.query(Batch).filter(Batch.id == batch_id, Batch.status == 'STAGING').update(
+                    {'status': 'SAVED'}, synchronize_session=False
+                )
+            else:
+                job.status = 'CANCELLING'
+            session.commit()
+
+            flag = self._cancel_flags.get(job.id)
+            if flag:
+                flag.set()
+            logger.info(f"Cancellation requested for staging job {job.id} of batch {batch_id}")
+            return self.describe(job)
+        finally:
+            session.close()
+
+    def resume_interrupted(self) -> List[str]:
+        """
+        Restart jobs whose owner stopped heartbeating (crash or restart) after their last checkpoint.
+
+        Returns:
+            Ids of the resumed jobs
+        """
+        session = Session()
+        try:
+            stale = {'stale_seconds': self.stale_seconds}
+            # Abandoned while cancelling - finish the cancellation
+            cancelled = session.execute(text("""
+                UPDATE staging_jobs
+                SET status = 'CANCELLED', finished_at = NOW(), claimed_by = NULL
+                WHERE status = 'CANCELLING'
+                AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => :stale_seconds))
+                RETURNING batch_id
+            """), stale).fetchall()
+            if cancelled:
+                session.execute(text("""
+                    UPDATE batches SET status = 'SAVED' WHERE id = ANY(:ids) AND status = 'STAGING'
+                """), {'ids': [row[0] for row in cancelled]})
+
+            resumed = [row[0] for row in session.execute(text("""
+                UPDATE staging_jobs
+                SET status = 'QUEUED', claimed_by = NULL
+                WHERE (status = 'RUNNING'
+                       AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - make_interval(secs => :stale_seconds)))
+                OR (status = 'QUEUED' AND created_at < NOW() - make_interval(secs => :stale_seconds))
+                RETURNING id
+            """), stale)]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error resuming interrupted staging jobs: {e}")
+            return []
+        finally:
+            session.close()
+
+        for job_id in resumed:
+            logger.info(f"Resuming interrupted staging job {job_id}")
+            self.start(job_id)
+        return resumed
+
+    def get_batch_job(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """Description of the most recent staging job of a batch"""
+        session = Session()
+        try:
+            job = session.query(StagingJob).filter(StagingJob.batch_id == batch_id) \
+                .order_by(StagingJob.created_at.desc()).first()
+            return self.describe(job) if job else None
+        finally:
+            session.close()
+
+    @staticmethod
+    def describe(job) -> Dict[str, Any]:
+        """Progress and throughput of a job"""
+        active_seconds = job.active_seconds or 0
+        documents_done = job.documents_done or 0
+        total = job.total_documents or 0
+        bytes_read = job.bytes_read or 0
+
+        files_per_second = documents_done / active_seconds if active_seconds > 0 else None
+        remaining = max(total - documents_done, 0)
+
+        return {
+            'job_id': job.id,
+            'batch_id': job.batch_id,
+            'status': job.status,
+            'total_documents': total,
+            'documents_done': documents_done,
+            'documents_staged': job.documents_staged or 0,
+            'responses_created': job.responses_created or 0,
+            'progress_percent': round(100 * documents_done / total, 1) if total else 0,
+            'bytes_read': bytes_read,
+            'files_per_second': round(files_per_second, 2) if files_per_second is not None else None,
+            'mb_per_second': round(bytes_read / 1024 / 1024 / active_seconds, 2) if active_seconds > 0 else None,
+            'eta_seconds': round(remaining / files_per_second) if files_per_second else None,
+            'last_document_id': job.last_document_id,
+            'claimed_by': job.claimed_by,
+            'heartbeat_at': job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'error': job.error_message
+        }
+
+
+# Global instance
+staging_jobs = StagingJobManager()
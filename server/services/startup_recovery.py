@@ -3,320 +3,305 @@ Startup Recovery Service
 
 This service handles recovery of stuck batches and documents when the service starts.
 It ensures clean state recovery after unexpected shutdowns or crashes.
+
+Recovery is a handful of set-based statements, so it takes the same time for ten
+or a hundred thousand in-flight rows:
+1. Batches interrupted while STAGING without a staging job go back to SAVED
+   (staging jobs resume from their checkpoint instead)
+2. PROCESSING rows that were never submitted (no task_id) go back to QUEUED
+3. PROCESSING rows with a RAG task whose lease expired are released, keeping their
+   original started_processing_at; queue processors adopt them and re-verify them
+   with the RAG API a few per cycle (see BatchQueueProcessor._check_active_tasks)
+4. Interrupted ANALYZING/PROCESSING batches are settled from one grouped count;
+   batches with rows under an unexpired lease are still being run by another
+   worker and are left as they are
+
+Every worker and the API run recovery when they start. A session-level advisory lock
+lets one of them recover at a time; a process that finds the lock taken skips
+recovery (status SKIPPED), since the holder is already releasing the same rows.
+
+The report of the last run is kept for /api/maintenance/recovery/status.
 """
 
+import time
 import logging
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import Dict, Any, Callable, Optional
 from sqlalchemy import text
 from database import Session
-from models import Batch, Document
+from services.worker_lease import connect_knowledge_documents
 
 logger = logging.getLogger(__name__)
 
+# pg_try_advisory_lock key held while a process runs recovery
+RECOVERY_LOCK_KEY = 428001
+
 
 class StartupRecoveryService:
     """Handles recovery of stuck processing states on service startup"""
-    
-    def __init__(self):
-        self.recovered_batches = []
-        self.recovered_documents = []
-        self.recovered_tasks = []
-        
+
+    # Per-batch details kept in the report; totals always cover every batch
+    MAX_REPORTED_BATCHES = 100
+
+    def __init__(self, connect: Optional[Callable] = None, session_factory: Optional[Callable] = None):
+        self.connect = connect or connect_knowledge_documents
+        self.session_factory = session_factory or Session
+        self.last_report: Dict[str, Any] = {'status': 'NOT_RUN'}
+
     def perform_recovery(self) -> Dict[str, Any]:
         """
         Perform all recovery operations on startup.
-        Returns a summary of recovery actions taken.
+
+        Returns:
+            Recovery report (also kept as last_report)
         """
         logger.info("=" * 60)
         logger.info("Starting recovery process for stuck batches and documents")
         logger.info("=" * 60)
-        
-        recovery_summary = {
-            'start_time': datetime.now(),
-            'batches_recovered': 0,
-            'documents_recovered': 0,
-            'tasks_recovered': 0,
+
+        started = time.monotonic()
+        report = {
+            'status': 'RUNNING',
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'duration_seconds': None,
+            'timings': {},
+            'batches': {'reset_to_saved': 0, 'completed': 0, 'reset_to_staged': 0, 'left_running': 0,
+                        'details': []},
+            'responses': {'reset_to_queued': 0, 'awaiting_verification': 0, 'by_batch': {}},
             'errors': []
         }
-        
-        try:
-            # Recover stuck batches
-            batch_count = self._recover_stuck_batches()
-            recovery_summary['batches_recovered'] = batch_count
-            
-            # Recover stuck documents
-            doc_count = self._recover_stuck_documents()
-            recovery_summary['documents_recovered'] = doc_count
-            
-            # Recover orphaned tasks
-            task_count = self._recover_orphaned_tasks()
-            recovery_summary['tasks_recovered'] = task_count
-            
-            recovery_summary['end_time'] = datetime.now()
-            recovery_summary['duration'] = (recovery_summary['end_time'] - recovery_summary['start_time']).total_seconds()
-            
-            logger.info("=" * 60)
-            logger.info(f"Recovery completed in {recovery_summary['duration']:.2f} seconds")
-            logger.info(f"Batches recovered: {batch_count}")
-            logger.info(f"Documents recovered: {doc_count}")
-            logger.info(f"Tasks recovered: {task_count}")
-            logger.info("=" * 60)
-            
-        except Exception as e:
-            logger.error(f"Error during recovery process: {e}")
-            recovery_summary['errors'].append(str(e))
-            
-        return recovery_summary
-    
-    def _recover_stuck_batches(self) -> int:
-        """
-        Recover batches stuck in ANALYZING status from previous sessions.
-        These batches should be reset to STAGED for re-processing or marked as
-        COMPLETED if all documents are done.
-        """
-        session = Session()
-        recovered_count = 0
-        
+        self.last_report = report
+
+        session = self.session_factory()
+        kb_conn = None
         try:
-            # Find batches stuck in ANALYZING, STAGING, or PROCESSING status
-            stuck_batches = session.query(Batch).filter(
-                Batch.status.in_(['ANALYZING', 'STAGING', 'PROCESSING'])
-            ).all()
-            
-            if not stuck_batches:
-                logger.info("No stuck batches found in ANALYZING, STAGING, or PROCESSING status")
-                return 0
-            
-            logger.warning(f"Found {len(stuck_batches)} batches stuck in ANALYZING/STAGING/PROCESSING status")
-            
-            for batch in stuck_batches:
-                try:
-                    batch_id = batch.id
-                    batch_name = batch.batch_name
-                    batch_status = batch.status
-                    started_at = batch.started_at
-                    
-                    # Handle STAGING status - reset to SAVED
-                    if batch_status == 'STAGING':
-                        batch.status = 'SAVED'
-                        batch.started_at = None
-                        logger.info(f"Batch {batch_id} '{batch_name}' reset from STAGING to SAVED")
-                        self.recovered_batches.append({
-                            'batch_id': batch_id,
-                            'batch_name': batch_name,
-                            'action': 'RESET_TO_SAVED',
-                            'previous_status': 'STAGING'
-                        })
-                        recovered_count += 1
-                        continue
-                    
-                    # For ANALYZING or PROCESSING status, check document completion
-                    # Connect to KnowledgeDocuments database for llm_responses
-                    import psycopg2
-                    try:
-                        kb_conn = psycopg2.connect(
-                            host="studio.local",
-                            database="KnowledgeDocuments",
-                            user="postgres",
-                            password="prodogs03",
-                            port=5432
-                        )
-                        kb_cursor = kb_conn.cursor()
-                        
-                        # Check completed documents
-                        kb_cursor.execute("""
-                            SELECT COUNT(*) 
-                            FROM llm_responses 
-                            WHERE batch_id = %s 
-                            AND status = 'COMPLETED'
-                        """, (batch_id,))
-                        completed_docs = kb_cursor.fetchone()[0]
-                        
-                        # Check total documents expected
-                        kb_cursor.execute("""
-                            SELECT COUNT(*) 
-                            FROM llm_responses 
-                            WHERE batch_id = %s
-                        """, (batch_id,))
-                        total_docs = kb_cursor.fetchone()[0]
-                        
-                        kb_cursor.close()
-                        kb_conn.close()
-                    except Exception as kb_error:
-                        logger.error(f"Error checking KnowledgeDocuments for batch {batch_id}: {kb_error}")
-                        completed_docs = 0
-                        total_docs = 0
-                    
-                    if completed_docs == total_docs and total_docs > 0:
-                        # All documents completed, mark batch as COMPLETED
-                        batch.status = 'COMPLETED'
-                        batch.completed_at = datetime.now()
-                        logger.info(f"Batch {batch_id} '{batch_name}' recovered as COMPLETED ({completed_docs}/{total_docs} docs)")
-                    else:
-                        # Reset to STAGED for re-processing
-                        batch.status = 'STAGED'
-                        batch.started_at = None
-                        batch.completed_at = None
-                        
-                        # Reset any PROCESSING documents to QUEUED
-                        session.execute(text("""
-                            UPDATE llm_responses
-                            SET status = 'QUEUED',
-                                task_id = NULL,
-                                started_processing_at = NULL
-                            WHERE batch_id = :batch_id 
-                            AND status = 'PROCESSING'
-                        """), {'batch_id': batch_id})
-                        
-                        logger.info(f"Batch {batch_id} '{batch_name}' reset to STAGED ({completed_docs}/{total_docs} docs completed)")
-                    
-                    self.recovered_batches.append({
-                        'batch_id': batch_id,
-                        'batch_name': batch_name,
-                        'action': 'COMPLETED' if completed_docs == total_docs else 'RESET_TO_STAGED',
-                        'completed_docs': completed_docs,
-                        'total_docs': total_docs
-                    })
-                    
-                    recovered_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error recovering batch {batch.id}: {e}")
-                    
+            kb_conn = self.connect()
+            kb_cursor = kb_conn.cursor()
+
+            kb_cursor.execute("SELECT pg_try_advisory_lock(%s)", (RECOVERY_LOCK_KEY,))
+            if not kb_cursor.fetchone()[0]:
+                logger.info("Another process is running recovery - skipping")
+                report['status'] = 'SKIPPED'
+                kb_conn.rollback()
+                return self._finish(report, started)
+
+            self._timed(report, 'staging_batches', self._reset_staging_batches, session, report)
+            self._timed(report, 'unsubmitted_responses', self._reset_unsubmitted_responses, kb_cursor, report)
+            self._timed(report, 'in_flight_responses', self._release_in_flight_responses, kb_cursor, report)
+            kb_conn.commit()
+
+            self._timed(report, 'interrupted_batches', self._settle_interrupted_batches, session, kb_cursor, report)
             session.commit()
-            
+            # Closing the connection releases the lock as well (also on failure)
+            kb_cursor.execute("SELECT pg_advisory_unlock(%s)", (RECOVERY_LOCK_KEY,))
+            kb_conn.commit()
+            kb_cursor.close()
+
+            report['status'] = 'COMPLETED'
+
         except Exception as e:
-            logger.error(f"Error during batch recovery: {e}")
+            logger.error(f"Error during recovery process: {e}")
+            report['status'] = 'FAILED'
+            report['errors'].append(str(e))
             session.rollback()
+            if kb_conn is not None:
+                kb_conn.rollback()
         finally:
             session.close()
-            
-        return recovered_count
-    
-    def _recover_stuck_documents(self) -> int:
+            if kb_conn is not None:
+                kb_conn.close()
+
+        return self._finish(report, started)
+
+    def _finish(self, report: Dict[str, Any], started: float) -> Dict[str, Any]:
+        """Stamp the end of a run and log its totals"""
+        report['finished_at'] = datetime.now().isoformat()
+        report['duration_seconds'] = round(time.monotonic() - started, 3)
+
+        # Totals under the names earlier callers read
+        batches = report['batches']
+        report['batches_recovered'] = batches['reset_to_saved'] + batches['completed'] + batches['reset_to_staged']
+        report['documents_recovered'] = report['responses']['reset_to_queued']
+        report['tasks_recovered'] = report['responses']['awaiting_verification']
+
+        logger.info("=" * 60)
+        logger.info(f"Recovery {report['status'].lower()} in {report['duration_seconds']:.2f} seconds")
+        logger.info(f"Batches recovered: {report['batches_recovered']} "
+                    f"(saved {batches['reset_to_saved']}, completed {batches['completed']}, "
+                    f"staged {batches['reset_to_staged']})")
+        logger.info(f"Responses reset to QUEUED: {report['documents_recovered']}")
+        logger.info(f"Tasks awaiting re-verification: {report['tasks_recovered']}")
+        logger.info("=" * 60)
+
+        return report
+
+    def _timed(self, report: Dict[str, Any], step: str, func: Callable, *args):
+        step_started = time.monotonic()
+        func(*args)
+        report['timings'][step] = round(time.monotonic() - step_started, 3)
+
+    def _add_batch_detail(self, report: Dict[str, Any], detail: Dict[str, Any]):
+        if len(report['batches']['details']) < self.MAX_REPORTED_BATCHES:
+            report['batches']['details'].append(detail)
+
+    def _add_response_counts(self, report: Dict[str, Any], key: str, rows):
+        """Fold (batch_id, count) rows into the report"""
+        by_batch = report['responses']['by_batch']
+        for batch_id, count in rows:
+            report['responses'][key] += count
+            if batch_id in by_batch or len(by_batch) < self.MAX_REPORTED_BATCHES:
+                by_batch.setdefault(batch_id, {'reset_to_queued': 0, 'awaiting_verification': 0})[key] += count
+
+    def _reset_staging_batches(self, session, report: Dict[str, Any]):
         """
-        Recover documents stuck in PROCESSING status without active tasks.
+        Staging was interrupted outside a staging job - the batch goes back to SAVED.
+
+        Batches with an unfinished staging job are left alone; the job resumes from its
+        last checkpoint (StagingJobManager.resume_interrupted).
         """
-        session = Session()
-        recovered_count = 0
-        
-        try:
-            # Connect to KnowledgeDocuments database to update llm_responses
-            import psycopg2
-            kb_conn = psycopg2.connect(
-                host="studio.local",
-                database="KnowledgeDocuments",
-                user="postgres",
-                password="prodogs03",
-                port=5432
+        rows = session.execute(text("""
+            UPDATE batches
+            SET status = 'SAVED', started_at = NULL
+            WHERE status = 'STAGING'
+            AND NOT EXISTS (
+                SELECT 1 FROM staging_jobs j
+                WHERE j.batch_id = batches.id AND j.status IN ('QUEUED', 'RUNNING', 'CANCELLING')
             )
-            kb_cursor = kb_conn.cursor()
-            
-            # Find documents stuck in PROCESSING without task_id or with old task_ids
-            kb_cursor.execute("""
+            RETURNING id, batch_name
+        """)).fetchall()
+
+        report['batches']['reset_to_saved'] += len(rows)
+        for batch_id, batch_name in rows:
+            self._add_batch_detail(report, {'batch_id': batch_id, 'batch_name': batch_name,
+                                            'action': 'RESET_TO_SAVED', 'previous_status': 'STAGING'})
+        if rows:
+            logger.info(f"Reset {len(rows)} batches from STAGING to SAVED")
+
+    def _reset_unsubmitted_responses(self, kb_cursor, report: Dict[str, Any]):
+        """PROCESSING rows without a RAG task were never submitted - queue them again"""
+        kb_cursor.execute("""
+            WITH reset AS (
                 UPDATE llm_responses
                 SET status = 'QUEUED',
                     task_id = NULL,
                     started_processing_at = NULL,
+                    claimed_by = NULL,
+                    lease_expires_at = NULL,
                     error_message = 'Reset from PROCESSING on startup recovery'
                 WHERE status = 'PROCESSING'
-                AND (
-                    task_id IS NULL 
-                    OR task_id = ''
-                    OR started_processing_at < NOW() - INTERVAL '1 hour'
-                )
-                RETURNING id, document_id, batch_id
-            """)
-            
-            recovered_docs = kb_cursor.fetchall()
-            recovered_count = kb_cursor.rowcount
-            
-            if recovered_count > 0:
-                logger.info(f"Reset {recovered_count} stuck documents from PROCESSING to QUEUED")
-                for doc in recovered_docs:
-                    self.recovered_documents.append({
-                        'response_id': doc[0],
-                        'document_id': doc[1],
-                        'batch_id': doc[2],
-                        'action': 'RESET_TO_QUEUED'
-                    })
-            else:
-                logger.info("No stuck documents found in PROCESSING status")
-                
-            kb_conn.commit()
-            kb_cursor.close()
-            kb_conn.close()
-            
-        except Exception as e:
-            logger.error(f"Error during document recovery: {e}")
-            if 'kb_conn' in locals():
-                kb_conn.rollback()
-                kb_conn.close()
-        finally:
-            session.close()
-            
-        return recovered_count
-    
-    def _recover_orphaned_tasks(self) -> int:
+                AND (task_id IS NULL OR task_id = '')
+                AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                RETURNING batch_id
+            )
+            SELECT batch_id, COUNT(*) FROM reset GROUP BY batch_id
+        """)
+        self._add_response_counts(report, 'reset_to_queued', kb_cursor.fetchall())
+
+        if report['responses']['reset_to_queued']:
+            logger.info(f"Reset {report['responses']['reset_to_queued']} unsubmitted responses from PROCESSING to QUEUED")
+
+    def _release_in_flight_responses(self, kb_cursor, report: Dict[str, Any]):
         """
-        Recover tasks that have task_ids but may be orphaned from the RAG API.
-        This identifies tasks that need monitoring by the batch queue processor.
+        Release expired leases on rows with a RAG task so any queue processor can adopt them.
+
+        The rows stay PROCESSING with their original started_processing_at: the RAG task
+        may have finished while we were down, so it is re-verified rather than resubmitted,
+        and a task that has been running too long still times out on schedule.
         """
-        session = Session()
-        recovered_count = 0
-        
-        try:
-            # Connect to KnowledgeDocuments database to check for orphaned tasks
-            import psycopg2
-            kb_conn = psycopg2.connect(
-                host="studio.local",
-                database="KnowledgeDocuments",
-                user="postgres",
-                password="prodogs03",
-                port=5432
-            )
-            kb_cursor = kb_conn.cursor()
-            
-            # Find documents with task_ids that are still PROCESSING
-            # These will be picked up by the batch_queue_processor's recovery logic
-            kb_cursor.execute("""
-                SELECT COUNT(*)
-                FROM llm_responses
+        kb_cursor.execute("""
+            WITH released AS (
+                UPDATE llm_responses
+                SET claimed_by = NULL,
+                    lease_expires_at = NULL
                 WHERE status = 'PROCESSING'
                 AND task_id IS NOT NULL
                 AND task_id != ''
-            """)
-            orphaned_tasks = kb_cursor.fetchone()[0]
-            
-            kb_cursor.close()
-            kb_conn.close()
-            
-            if orphaned_tasks > 0:
-                logger.info(f"Found {orphaned_tasks} tasks with task_ids that will be monitored for completion")
-                recovered_count = orphaned_tasks
-            else:
-                logger.info("No orphaned tasks found")
-                
-        except Exception as e:
-            logger.error(f"Error checking for orphaned tasks: {e}")
-        finally:
-            session.close()
-            
-        return recovered_count
-    
+                AND task_id NOT LIKE 'provider-batch-%'  -- settled by services/provider_batches.py
+                AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                RETURNING batch_id
+            )
+            SELECT batch_id, COUNT(*) FROM released GROUP BY batch_id
+        """)
+        self._add_response_counts(report, 'awaiting_verification', kb_cursor.fetchall())
+
+        if report['responses']['awaiting_verification']:
+            logger.info(f"{report['responses']['awaiting_verification']} in-flight tasks will be re-verified with the RAG API")
+
+    def _settle_interrupted_batches(self, session, kb_cursor, report: Dict[str, Any]):
+        """
+        Settle batches left ANALYZING/PROCESSING from one grouped count of their responses:
+        no responses -> SAVED, every response finished -> COMPLETED, otherwise -> STAGED
+        so the queue processors carry on with the remaining rows.
+
+        A batch with rows under an unexpired lease is being processed by another live
+        worker (several workers share the queue), so it keeps its status and started_at.
+        """
+        batch_ids = [row[0] for row in session.execute(text("""
+            SELECT id FROM batches WHERE status IN ('ANALYZING', 'PROCESSING')
+        """))]
+        if not batch_ids:
+            logger.info("No stuck batches found in ANALYZING or PROCESSING status")
+            return
+
+        kb_cursor.execute("""
+            SELECT batch_id,
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE status IN ('COMPLETED', 'FAILED')),
+                   COUNT(*) FILTER (WHERE lease_expires_at > NOW())
+            FROM llm_responses
+            WHERE batch_id = ANY(%s)
+            GROUP BY batch_id
+        """, (batch_ids,))
+        rows = kb_cursor.fetchall()
+        counts = {row[0]: (row[1], row[2]) for row in rows}
+        running_ids = {row[0] for row in rows if row[3]}
+
+        for batch_id in sorted(running_ids):
+            total, done = counts[batch_id]
+            report['batches']['left_running'] += 1
+            self._add_batch_detail(report, {'batch_id': batch_id, 'action': 'LEFT_RUNNING',
+                                            'completed_docs': done, 'total_docs': total})
+        if running_ids:
+            logger.info(f"LEFT_RUNNING: {len(running_ids)} batches with live leases of other workers")
+
+        empty_ids = [batch_id for batch_id in batch_ids if batch_id not in counts]
+        done_ids = [batch_id for batch_id, (total, done) in counts.items() if done >= total]
+        remaining_ids = [batch_id for batch_id, (total, done) in counts.items()
+                         if done < total and batch_id not in running_ids]
+
+        actions = [
+            ('RESET_TO_SAVED', 'reset_to_saved', empty_ids, """
+                UPDATE batches SET status = 'SAVED', started_at = NULL, completed_at = NULL
+                WHERE id = ANY(:ids) AND status IN ('ANALYZING', 'PROCESSING')
+                RETURNING id, batch_name
+            """),
+            ('COMPLETED', 'completed', done_ids, """
+                UPDATE batches SET status = 'COMPLETED', completed_at = NOW()
+                WHERE id = ANY(:ids) AND status IN ('ANALYZING', 'PROCESSING')
+                RETURNING id, batch_name
+            """),
+            ('RESET_TO_STAGED', 'reset_to_staged', remaining_ids, """
+                UPDATE batches SET status = 'STAGED', started_at = NULL, completed_at = NULL
+                WHERE id = ANY(:ids) AND status IN ('ANALYZING', 'PROCESSING')
+                RETURNING id, batch_name
+            """),
+        ]
+
+        for action, key, ids, statement in actions:
+            if not ids:
+                continue
+            rows = session.execute(text(statement), {'ids': ids}).fetchall()
+            report['batches'][key] += len(rows)
+            for batch_id, batch_name in rows:
+                total, done = counts.get(batch_id, (0, 0))
+                self._add_batch_detail(report, {'batch_id': batch_id, 'batch_name': batch_name, 'action': action,
+                                                'completed_docs': done, 'total_docs': total})
+            logger.info(f"{action}: {len(rows)} interrupted batches")
+
     def get_recovery_summary(self) -> Dict[str, Any]:
-        """Get a summary of the recovery actions taken"""
-        return {
-            'recovered_batches': self.recovered_batches,
-            'recovered_documents': self.recovered_documents,
-            'recovered_tasks': self.recovered_tasks,
-            'total_recovered': {
-                'batches': len(self.recovered_batches),
-                'documents': len(self.recovered_documents),
-                'tasks': len(self.recovered_tasks)
-            }
-        }
+        """Get the report of the last recovery run"""
+        return self.last_report
 
 
 # Global instance
@@ -330,4 +315,4 @@ def perform_startup_recovery():
 
 def get_recovery_summary():
     """Get summary of last recovery operation"""
-    return startup_recovery.get_recovery_summary()
\ No newline at end of file
+    return startup_recovery.get_recovery_summary()
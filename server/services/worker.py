@@ -0,0 +1,191 @@
+"""
+Standalone Worker Entry Point
+
+Runs the background loops that used to live inside the Flask process as their
+own processes, so web request handling and dispatch no longer share one GIL and
+a web restart does not kill in-flight dispatch tracking.
+
+Usage (from the server directory):
+    python -m services.worker --processor batch
+    python -m services.worker --processor health
+    python -m services.worker --processor polling
+    python -m services.worker --processor all
+
+Start the API without its own background loops with:
+    RUN_BACKGROUND_WORKERS=false python app.py
+
+Each worker reports liveness and stats to the worker_heartbeats table, which
+/api/services and /api/queue/status read.
+
+The batch worker runs startup recovery first (--skip-recovery to leave it to
+another process). Recovery holds an advisory lock, so workers starting together
+recover one at a time and the others skip it.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+from typing import Dict, Any
+
+# Allow running as a script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+PROCESSORS = ['batch', 'health', 'polling']
+
+
+class WorkerHost:
+    """Starts the selected processors, reports heartbeats and stops cleanly on signals"""
+
+    def __init__(self, processors, heartbeat_interval: int = 10, check_interval: int = 5,
+                 max_concurrent: int = 3, run_recovery: bool = True):
+        self.processors = processors
+        self.heartbeat_interval = heartbeat_interval
+        self.check_interval = check_interval
+        self.max_concurrent = max_concurrent
+        self.run_recovery = run_recovery
+        self.should_stop = False
+
+        from services.worker_lease import worker_lease
+        self.worker_id = worker_lease.worker_id
+
+    def _registry_id(self, processor: str) -> str:
+        """Heartbeat row id - one row per processor hosted by this process"""
+        return f"{self.worker_id}:{processor}"
+
+    def start(self):
+        """Start every selected processor"""
+        if 'batch' in self.processors:
+            if self.run_recovery:
+                try:
+                    from services.startup_recovery import perform_startup_recovery
+                    recovery_result = perform_startup_recovery()
+                    logger.info(f"Startup recovery {recovery_result['status'].lower()} in {recovery_result['duration_seconds']}s")
+                except Exception as e:
+                    logger.error(f"Recovery failed but continuing: {e}")
+
+            from services.batch_queue_processor import batch_queue_processor
+            batch_queue_processor.check_interval = self.check_interval
+            batch_queue_processor.max_concurrent = self.max_concurrent
+            batch_queue_processor.start()
+
+        if 'health' in self.processors:
+            from services.health_monitor import health_monitor
+            health_monitor.start_monitoring()
+
+        if 'polling' in self.processors:
+            from api.status_polling import polling_service
+            polling_service.start_polling()
+
+        logger.info(f"Worker {self.worker_id} started processors: {', '.join(self.processors)}")
+
+    def stop(self):
+        """Stop every selected processor"""
+        if 'batch' in self.processors:
+            from services.batch_queue_processor import batch_queue_processor
+            batch_queue_processor.stop()
+
+        if 'health' in self.processors:
+            from services.health_monitor import health_monitor
+            health_monitor.stop_monitoring_service()
+
+        if 'polling' in self.processors:
+            from api.status_polling import polling_service
+            polling_service.stop_polling_service()
+
+        from services.worker_registry import worker_registry
+        for processor in self.processors:
+            worker_registry.mark_stopped(self._registry_id(processor), processor, self.get_stats(processor))
+
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    def get_stats(self, processor: str) -> Dict[str, Any]:
+        """Current status of one hosted processor"""
+        if processor == 'batch':
+            from services.batch_queue_processor import batch_queue_processor
+            return batch_queue_processor.get_status()
+
+        if processor == 'health':
+            from services.health_monitor import health_monitor
+            return {
+                'is_running': bool(health_monitor.monitoring_thread and health_monitor.monitoring_thread.is_alive()),
+                'check_interval': health_monitor.check_interval,
+                'services': health_monitor.get_all_service_status()
+            }
+
+        if processor == 'polling':
+            from api.status_polling import polling_service
+            return {
+                'is_running': bool(polling_service.polling_thread and polling_service.polling_thread.is_alive()),
+                'poll_interval': polling_service.poll_interval
+            }
+
+        return {}
+
+    def report(self):
+        """Write a heartbeat for every hosted processor"""
+        from services.worker_registry import worker_registry
+        for processor in self.processors:
+            worker_registry.heartbeat(self._registry_id(processor), processor, self.get_stats(processor))
+
+    def run(self):
+        """Run until SIGTERM/SIGINT"""
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+        self.start()
+        try:
+            while not self.should_stop:
+                self.report()
+                # Sleep in short steps so signals are handled promptly
+                deadline = time.time() + self.heartbeat_interval
+                while not self.should_stop and time.time() < deadline:
+                    time.sleep(0.5)
+        finally:
+            self.stop()
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Received signal {signum}, shutting down worker {self.worker_id}")
+        self.should_stop = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run DocumentEvaluator background workers outside the web server')
+    parser.add_argument('--processor', choices=PROCESSORS + ['all'], default='batch',
+                        help='Which background loop to run (default: batch)')
+    parser.add_argument('--heartbeat-interval', type=int, default=int(os.getenv('WORKER_HEARTBEAT_INTERVAL', '10')),
+                        help='Seconds between heartbeats written to worker_heartbeats')
+    parser.add_argument('--check-interval', type=int, default=5,
+                        help='Seconds between queue processor iterations')
+    parser.add_argument('--max-concurrent', type=int, default=int(os.getenv('WORKER_MAX_CONCURRENT', '3')),
+                        help='Maximum in-flight tasks for the batch processor')
+    parser.add_argument('--skip-recovery', action='store_true',
+                        help='Do not run startup recovery before starting the batch processor')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+
+    processors = PROCESSORS if args.processor == 'all' else [args.processor]
+    host = WorkerHost(
+        processors,
+        heartbeat_interval=args.heartbeat_interval,
+        check_interval=args.check_interval,
+        max_concurrent=args.max_concurrent,
+        run_recovery=not args.skip_recovery
+    )
+    host.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Worker Lease Service
+
+Lets several queue processor processes (on one or many nodes) share the
+KnowledgeDocuments llm_responses queue without double-polling or stealing work.
+
+- Every process has a worker_id (hostname:pid:random)
+- A worker claims an llm_responses row by setting claimed_by and lease_expires_at
+  in the same statement that selects it (FOR UPDATE SKIP LOCKED)
+- The owning worker renews its leases on every heartbeat
+- Rows whose lease has expired (the owner died or hung) are reclaimed by any worker:
+  QUEUED rows become claimable again, PROCESSING rows are adopted for polling
+"""
+
+import os
+import uuid
+import socket
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable, Iterable
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', '120'))
+
+
+def generate_worker_id() -> str:
+    """Build a worker id that is unique per process across nodes"""
+    return os.getenv('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def connect_knowledge_documents():
+    """Open a connection to the KnowledgeDocuments database"""
+    return psycopg2.connect(
+        host="studio.local",
+        database="KnowledgeDocuments",
+        user="postgres",
+        password="prodogs03",
+        port=5432
+    )
+
+
+class WorkerLease:
+    """Claims, renews and reclaims leases on llm_responses rows for one worker process"""
+
+    def __init__(self, worker_id: Optional[str] = None, lease_seconds: Optional[int] = None,
+                 connect: Optional[Callable] = None):
+        self.worker_id = worker_id or generate_worker_id()
+        self.lease_seconds = lease_seconds or DEFAULT_LEASE_SECONDS
+        self.connect = connect or connect_knowledge_documents
+        self.last_heartbeat: Optional[datetime] = None
+        self.stats = {
+            'claimed': 0,
+            'renewed': 0,
+            'reclaimed': 0,
+            'lost': 0
+        }
+
+    def claim_next(self, cursor, batch_id: int, exclude_connection_ids: Optional[List[int]] = None,
+                   document_order: bool = False, prefer: Optional[tuple] = None,
+                   cost_order: Optional[tuple] = None) -> Optional[tuple]:
+        """
+        Atomically claim the next QUEUED row of a batch for this worker.
+
+        Runs on the caller's cursor so the claim commits with the caller's transaction.
+
+        Args:
+            cursor: KnowledgeDocuments cursor
+            batch_id: Batch to claim from
+            exclude_connection_ids: Skip rows of these connections (open circuit breakers)
+            document_order: Claim in (document, connection, prompt) order instead of
+                            created_at, so a document's prompts go out back to back
+            prefer: (document_id, connection_id) to continue first, if it has rows left
+            cost_order: (column, params, 'ASC' or 'DESC') ranking rows by predicted
+                        cost (see JobCostModel.claim_order)
+
+        Returns:
+            (id, document_id, prompt_id, connection_id, connection_details, connection_snapshot_id) or None
+        """
+        order_by = "document_id ASC, connection_id ASC, prompt_id ASC, id ASC" if document_order \
+            else "created_at ASC, id ASC"
+        order_params = []
+        if cost_order:
+            expression, cost_params, direction = cost_order
+            # Default NULL placement (last for ASC, first for DESC), so one ascending
+            # index on the column serves both directions
+            order_by = f"{expression} {direction}, " + order_by
+            order_params = list(cost_params)
+
+        # The preferred document is a separate, narrow claim: as a leading ORDER BY term
+        # it would make every claim sort all queued rows of the batch
+        if prefer:
+            row = self._claim(cursor, batch_id, exclude_connection_ids, order_by, order_params,
+                              "AND document_id = %s AND connection_id IS NOT DISTINCT FROM %s", list(prefer))
+            if row:
+                return row
+        return self._claim(cursor, batch_id, exclude_connection_ids, order_by, order_params)
+
+    def _claim(self, cursor, batch_id: int, exclude_connection_ids: Optional[List[int]], order_by: str,
+               order_params: List[Any], condition: str = "", condition_params: Optional[List[Any]] = None):
+        params = [self.worker_id, self.lease_seconds, batch_id, list(exclude_connection_ids or [])] \
+            + list(condition_params or []) + order_params
+        cursor.execute(f"""
+            UPDATE llm_responses
+            SET claimed_by = %s,
+                lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE id = (
+                SELECT id
+                FROM llm_responses
+                WHERE batch_id = %s
+                AND status = 'QUEUED'
+                AND (claimed_by IS NULL OR lease_expires_at < NOW())
+                AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())  -- retries wait out their backoff
+                AND (connection_id IS NULL OR NOT (connection_id = ANY(%s)))
+                {condition}
+                ORDER BY {order_by}
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, document_id, prompt_id, connection_id, connection_details, connection_snapshot_id
+        """, params)
+
+        row = cursor.fetchone()
+        if row:
+            self.stats['claimed'] += 1
+        return row
+
+    def claim_siblings(self, cursor, response_id: int, limit: int) -> List[tuple]:
+        """
+        Claim the other QUEUED rows of a claimed row's (batch, document, connection),
+        so all their prompts can go to the RAG API as one request.
+
+        Args:
+            cursor: KnowledgeDocuments cursor (the claim commits with the caller's transaction)
+            response_id: Row already claimed by this worker with claim_next
+            limit: Maximum number of additional rows
+
+        Returns:
+            List of (id, document_id, prompt_id, connection_id, connection_details, connection_snapshot_id)
+        """
+        if limit <= 0:
+            return []
+
+        cursor.execute("""
+            UPDATE llm_responses
+            SET claimed_by = %s,
+                lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE id IN (
+                SELECT sibling.id
+                FROM llm_responses claimed
+                JOIN llm_responses sibling
+                  ON sibling.batch_id = claimed.batch_id
+                 AND sibling.document_id = claimed.document_id
+                 AND sibling.connection_id IS NOT DISTINCT FROM claimed.connection_id
+                WHERE claimed.id = %s
+                AND sibling.id != claimed.id
+                AND sibling.status = 'QUEUED'
+                AND (sibling.claimed_by IS NULL OR sibling.lease_expires_at < NOW())
+                AND (sibling.next_attempt_at IS NULL OR sibling.next_attempt_at <= NOW())
+                ORDER BY sibling.prompt_id, sibling.id
+                LIMIT %s
+                FOR UPDATE OF sibling SKIP LOCKED
+            )
+            RETURNING id, document_id, prompt_id, connection_id, connection_details, connection_snapshot_id
+        """, (self.worker_id, self.lease_seconds, response_id, limit))
+
+        rows = sorted(cursor.fetchall(), key=lambda row: (row[2], row[0]))
+        self.stats['claimed'] += len(rows)
+        return rows
+
+    def renew(self, response_ids: Iterable[int]) -> List[int]:
+        """
+        Extend the leases this worker holds on the given rows.
+
+        Returns:
+            The ids whose lease is still held; ids missing from the result were lost
+            to another worker and must no longer be tracked by this process.
+        """
+        response_ids = list(response_ids)
+        self.last_heartbeat = datetime.now()
+        if not response_ids:
+            return []
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE llm_responses
+                SET lease_expires_at = NOW() + make_interval(secs => %s)
+                WHERE id = ANY(%s)
+                AND claimed_by = %s
+                AND status IN ('QUEUED', 'PROCESSING')
+                RETURNING id
+            """, (self.lease_seconds, response_ids, self.worker_id))
+            held = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self.stats['renewed'] += len(held)
+        lost = len(response_ids) - len(held)
+        if lost:
+            self.stats['lost'] += lost
+            logger.warning(f"Worker {self.worker_id} lost {lost} leases to other workers")
+        return held
+
+    def reclaim_expired(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Adopt PROCESSING rows whose lease expired (or that predate leasing).
+
+        The RAG API task is still running, so adopted rows are polled rather than resubmitted.
+        The original started_processing_at is returned for timeout accounting.
+        """
+        if limit <= 0:
+            return []
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE llm_responses
+                SET claimed_by = %s,
+                    lease_expires_at = NOW() + make_interval(secs => %s)
+                WHERE id IN (
+                    SELECT id
+                    FROM llm_responses
+                    WHERE status = 'PROCESSING'
+                    AND task_id IS NOT NULL
+                    AND task_id != ''
+                    AND task_id NOT LIKE 'provider-batch-%%'  -- owned by the provider batch job until ingested
+                    AND (claimed_by IS NULL OR lease_expires_at < NOW())
+                    ORDER BY started_processing_at ASC NULLS FIRST
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, task_id, document_id, batch_id, started_processing_at, rag_endpoint
+            """, (self.worker_id, self.lease_seconds, limit))
+            rows = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self.stats['reclaimed'] += len(rows)
+        return [
+            {
+                'response_id': row[0],
+                'task_id': row[1],
+                'document_id': row[2],
+                'batch_id': row[3],
+                'started_processing_at': row[4],
+                'rag_endpoint': row[5]
+            }
+            for row in rows
+        ]
+
+    def release(self, response_id: int, delay_seconds: float = 0) -> bool:
+        """
+        Give a claimed QUEUED row back to the queue without dispatching it.
+
+        Args:
+            response_id: llm_responses id claimed by this worker
+            delay_seconds: Keep the row from being claimed again for this long
+        """
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE llm_responses
+                SET claimed_by = NULL,
+                    lease_expires_at = NULL,
+                    next_attempt_at = CASE WHEN %s > 0 THEN NOW() + make_interval(secs => %s) ELSE next_attempt_at END
+                WHERE id = %s
+                AND claimed_by = %s
+                AND status = 'QUEUED'
+            """, (delay_seconds, delay_seconds, response_id, self.worker_id))
+            released = cursor.rowcount > 0
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return released
+
+    def release_all(self) -> int:
+        """Give up every lease held by this worker (used on clean shutdown)"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE llm_responses
+                SET lease_expires_at = NOW()
+                WHERE claimed_by = %s
+                AND status IN ('QUEUED', 'PROCESSING')
+            """, (self.worker_id,))
+            released = cursor.rowcount
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return released
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get lease status for this worker"""
+        return {
+            'worker_id': self.worker_id,
+            'lease_seconds': self.lease_seconds,
+            'last_heartbeat': self.last_heartbeat.isoformat() if self.last_heartbeat else None,
+            'stats': self.stats.copy()
+        }
+
+
+# Global instance - one worker identity per process
+worker_lease = WorkerLease()
@@ -0,0 +1,117 @@
+"""
+Worker Registry
+
+Records liveness and stats of background worker processes in the worker_heartbeats
+table, so the Flask API can report workers that run outside its own process.
+"""
+
+import os
+import json
+import socket
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable
+
+from sqlalchemy import text
+from database import Session
+from models import WorkerHeartbeat
+
+logger = logging.getLogger(__name__)
+
+# A worker that has not reported for this long is considered dead
+DEFAULT_STALE_AFTER_SECONDS = int(os.getenv('WORKER_STALE_AFTER_SECONDS', '60'))
+
+
+def _json_safe(value: Any) -> Any:
+    """Convert processor status (which may hold datetimes) into plain JSON"""
+    return json.loads(json.dumps(value, default=str))
+
+
+class WorkerRegistry:
+    """Reads and writes worker heartbeats"""
+
+    def __init__(self, stale_after_seconds: int = DEFAULT_STALE_AFTER_SECONDS,
+                 session_factory: Optional[Callable] = None):
+        self.stale_after_seconds = stale_after_seconds
+        self.session_factory = session_factory or Session
+
+    def heartbeat(self, worker_id: str, processor: str, stats: Optional[Dict[str, Any]] = None,
+                  status: str = 'RUNNING') -> bool:
+        """Insert or refresh the heartbeat row for a worker"""
+        session = self.session_factory()
+        try:
+            session.execute(text("""
+                INSERT INTO worker_heartbeats
+                    (worker_id, processor, hostname, pid, status, started_at, last_heartbeat_at, stats)
+                VALUES
+                    (:worker_id, :processor, :hostname, :pid, :status, NOW(), NOW(), CAST(:stats AS JSONB))
+                ON CONFLICT (worker_id) DO UPDATE
+                SET status = EXCLUDED.status,
+                    last_heartbeat_at = NOW(),
+                    stats = EXCLUDED.stats
+            """), {
+                'worker_id': worker_id,
+                'processor': processor,
+                'hostname': socket.gethostname(),
+                'pid': os.getpid(),
+                'status': status,
+                'stats': json.dumps(_json_safe(stats or {}))
+            })
+            session.commit()
+            return True
+
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error recording heartbeat for worker {worker_id}: {e}")
+            return False
+        finally:
+            session.close()
+
+    def mark_stopped(self, worker_id: str, processor: str, stats: Optional[Dict[str, Any]] = None) -> bool:
+        """Record a clean worker shutdown"""
+        return self.heartbeat(worker_id, processor, stats, status='STOPPED')
+
+    def list_workers(self, processor: Optional[str] = None, include_stopped: bool = False) -> List[Dict[str, Any]]:
+        """List known workers with a derived health flag"""
+        session = self.session_factory()
+        try:
+            query = session.query(WorkerHeartbeat)
+            if processor:
+                query = query.filter(WorkerHeartbeat.processor == processor)
+            if not include_stopped:
+                query = query.filter(WorkerHeartbeat.status != 'STOPPED')
+
+            now = datetime.now()
+            workers = []
+            for worker in query.order_by(WorkerHeartbeat.processor, WorkerHeartbeat.started_at).all():
+                age = (now - worker.last_heartbeat_at).total_seconds() if worker.last_heartbeat_at else None
+                workers.append({
+                    'worker_id': worker.worker_id,
+                    'processor': worker.processor,
+                    'hostname': worker.hostname,
+                    'pid': worker.pid,
+                    'status': worker.status,
+                    'healthy': worker.status == 'RUNNING' and age is not None and age <= self.stale_after_seconds,
+                    'started_at': worker.started_at.isoformat() if worker.started_at else None,
+                    'last_heartbeat_at': worker.last_heartbeat_at.isoformat() if worker.last_heartbeat_at else None,
+                    'seconds_since_heartbeat': round(age, 1) if age is not None else None,
+                    'stats': worker.stats or {}
+                })
+            return workers
+
+        except Exception as e:
+            logger.error(f"Error listing workers: {e}")
+            return []
+        finally:
+            session.close()
+
+    def get_latest_stats(self, processor: str) -> Optional[Dict[str, Any]]:
+        """Stats from the most recently reporting healthy worker of a processor type"""
+        healthy = [w for w in self.list_workers(processor) if w['healthy']]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda w: w['seconds_since_heartbeat'])['stats']
+
+
+# Global instance
+worker_registry = WorkerRegistry()
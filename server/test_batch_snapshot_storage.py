@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for compact config snapshot storage.
+
+Uses an in-memory SQLite database in place of PostgreSQL and verifies that:
+1. Batch queries do not load config_snapshot until it is accessed
+2. Snapshot documents live in their own table and go away with their batch
+3. Snapshot documents are written in bounded chunks, valid documents only
+4. The document list is paged from batch_snapshot_documents
+5. Snapshots created before batch_snapshot_documents are paged from their embedded list
+"""
+
+import sys
+import os
+from datetime import datetime
+
+import pytest
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session as OrmSession, sessionmaker
+
+import services.batch_service as batch_service_module
+from database import Base
+from models import Batch, BatchSnapshotDocument, Document, Folder
+from services.batch_service import BatchService
+
+
+@compiles(JSONB, 'sqlite')
+def compile_jsonb_for_sqlite(type_, compiler, **kwargs):
+    return 'JSON'
+
+
+class RecordingSession(OrmSession):
+    """Records the size of every batch_snapshot_documents insert"""
+
+    inserts = []
+
+    def execute(self, statement, params=None, *args, **kwargs):
+        if getattr(statement, 'table', None) is BatchSnapshotDocument.__table__:
+            RecordingSession.inserts.append(len(params))
+        return super().execute(statement, params, *args, **kwargs)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[
+        Folder.__table__, Batch.__table__, Document.__table__, BatchSnapshotDocument.__table__
+    ])
+    factory = sessionmaker(bind=engine, class_=RecordingSession)
+    monkeypatch.setattr(batch_service_module, 'Session', factory)
+    RecordingSession.inserts = []
+    return factory
+
+
+def add_folder_documents(session, folder_id, count, invalid=0):
+    session.add(Folder(id=folder_id, folder_path=f'/data/folder{folder_id}', folder_name=f'folder{folder_id}'))
+    for i in range(count + invalid):
+        session.add(Document(
+            filepath=f'/data/folder{folder_id}/sub/doc{i}.pdf', filename=f'doc{i}.pdf', folder_id=folder_id,
+            meta_data={'file_size': i}, valid='Y' if i < count else 'N', created_at=datetime(2026, 1, 1)
+        ))
+    session.flush()
+
+
+def test_batch_queries_defer_config_snapshot():
+    sql = str(select(Batch).compile(dialect=postgresql.dialect()))
+    assert 'batches.status' in sql
+    assert 'config_snapshot' not in sql
+
+
+def test_snapshot_documents_cascade_with_batch():
+    foreign_keys = list(BatchSnapshotDocument.__table__.c.batch_id.foreign_keys)
+    assert len(foreign_keys) == 1
+    assert foreign_keys[0].target_fullname == 'batches.id'
+    assert foreign_keys[0].ondelete == 'CASCADE'
+    assert BatchSnapshotDocument.__table__.c.batch_id.index
+
+
+def test_snapshot_documents_are_saved_in_chunks(database):
+    session = database()
+    add_folder_documents(session, 1, 1500, invalid=3)
+    add_folder_documents(session, 2, 700)
+    session.add(Batch(id=9, batch_number=1, status='SAVED'))
+    session.flush()
+
+    written = BatchService()._save_snapshot_documents(session, 9, [1, 2])
+    session.commit()
+
+    assert written == 2200
+    assert RecordingSession.inserts == [1000, 1000, 200]
+    first = session.query(BatchSnapshotDocument).order_by(BatchSnapshotDocument.id).first()
+    assert (first.relative_path, first.folder_id, first.file_size) == ('sub/doc0.pdf', 1, 0)
+    assert BatchService()._save_snapshot_documents(session, 9, []) == 0
+    session.close()
+
+
+def test_snapshot_documents_are_paged(database):
+    session = database()
+    add_folder_documents(session, 1, 25)
+    session.add(Batch(id=9, batch_number=1, status='SAVED'))
+    session.flush()
+    BatchService()._save_snapshot_documents(session, 9, [1])
+    session.commit()
+    session.close()
+
+    page = BatchService().get_config_snapshot_documents(9, limit=10, offset=20)
+    assert page['total'] == 25
+    assert [doc['filename'] for doc in page['documents']] == [f'doc{i}.pdf' for i in range(20, 25)]
+    assert page['documents'][0]['discovered_at'] == '2026-01-01T00:00:00'
+
+
+def test_embedded_snapshot_documents_are_paged(database):
+    session = database()
+    embedded = [{'filename': f'old{i}.pdf', 'filepath': f'/legacy/old{i}.pdf'} for i in range(7)]
+    session.add(Batch(id=4, batch_number=1, status='COMPLETED', config_snapshot={'documents': embedded}))
+    session.add(Batch(id=5, batch_number=2, status='COMPLETED', config_snapshot={'folders': []}))
+    session.commit()
+    session.close()
+
+    assert BatchService().get_config_snapshot_documents(4, limit=3, offset=3) == {
+        'documents': embedded[3:6], 'total': 7
+    }
+    assert BatchService().get_config_snapshot_documents(5) == {'documents': [], 'total': 0}
+    assert BatchService().get_config_snapshot_documents(404) == {'documents': [], 'total': 0}
+
+
+if __name__ == "__main__":
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All batch snapshot storage tests passed")
+    sys.exit(exit_code)
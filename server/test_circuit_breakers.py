@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for per-connection and per-RAG-endpoint circuit breakers.
+
+Verifies:
+1. A breaker opens after repeated failures and rejects requests
+2. After the recovery timeout exactly one probe is let through (half-open)
+3. A successful probe closes the breaker, a failed one reopens it
+4. The registry reports blocked connections and reacts to health checks
+"""
+
+import sys
+import os
+import time
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.stability_helpers import CircuitBreaker
+from services.circuit_breakers import CircuitBreakerRegistry, connection_key, rag_endpoint_key
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60, name='test')
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == 'CLOSED'
+
+    breaker.record_failure()
+    assert breaker.state == 'OPEN'
+    assert breaker.is_blocking()
+    assert not breaker.allow_request()
+    assert 0 < breaker.retry_after() <= 60
+
+
+def test_half_open_allows_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05, name='test')
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert not breaker.is_blocking()
+    assert breaker.allow_request()
+    assert breaker.state == 'HALF_OPEN'
+    assert breaker.is_blocking()
+    assert not breaker.allow_request()
+
+    # A cancelled probe frees the slot again
+    breaker.cancel_request()
+    assert breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == 'CLOSED'
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=0.05, name='test')
+    breaker.trip('down')
+    assert breaker.state == 'OPEN'
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'OPEN'
+    assert not breaker.allow_request()
+
+
+def test_decorator_still_works():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+
+    @breaker
+    def flaky():
+        raise ValueError('boom')
+
+    try:
+        flaky()
+    except ValueError:
+        pass
+    try:
+        flaky()
+        assert False, 'expected the open circuit to reject the call'
+    except Exception as e:
+        assert 'OPEN' in str(e)
+
+
+def test_registry_blocked_connections_and_health():
+    registry = CircuitBreakerRegistry(failure_threshold=2, recovery_timeout=60)
+    registry.record_failure(connection_key(7))
+    registry.record_failure(connection_key(7))
+    registry.record_failure(connection_key(8))
+
+    assert registry.blocked_connection_ids() == [7]
+    assert set(registry.get_status()) == {'connection:7', 'connection:8'}
+
+    url = 'http://localhost:7001/'
+    registry.record_health(url, healthy=False, reason='Connection error')
+    assert registry.is_blocking(rag_endpoint_key(url))
+
+    # A passing health check allows a probe before the recovery timeout
+    registry.record_health(url, healthy=True)
+    assert registry.allow_request(rag_endpoint_key('http://localhost:7001'))
+    registry.record_success(rag_endpoint_key(url))
+    assert registry.get(rag_endpoint_key(url)).state == 'CLOSED'
+
+
+if __name__ == "__main__":
+    test_opens_after_threshold()
+    test_half_open_allows_single_probe()
+    test_failed_probe_reopens()
+    test_decorator_still_works()
+    test_registry_blocked_connections_and_health()
+    print("✅ All circuit breaker tests passed")
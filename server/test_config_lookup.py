@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for the versioned config lookup cache (services/config_lookup.py).
+
+Database access is replaced with in-memory tables so the tests verify:
+1. Repeated lookups are served from memory
+2. A local invalidate() reloads the category on next use
+3. A version bump made by another process is picked up after the check interval
+4. Model changes cascade into the connection details that embed them
+"""
+
+import sys
+import os
+import time
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.config_lookup import ConfigLookupService
+
+
+class InMemoryConfigLookup(ConfigLookupService):
+    """ConfigLookupService backed by dicts instead of doc_eval"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tables = {
+            'prompts': {1: {'id': 1, 'prompt_text': 'Summarize', 'description': 'Summary', 'active': True}},
+            'models': {7: {'id': 7, 'common_name': 'llama3', 'display_name': 'llama3:8b',
+                           'model_family': None, 'context_length': None, 'is_globally_active': True}},
+            'providers': {3: {'id': 3, 'name': 'Ollama', 'provider_type': 'ollama',
+                              'default_base_url': None, 'is_active': True}},
+        }
+        self.connections = {5: {'provider_id': 3, 'model_id': 7, 'base_url': 'http://studio.local', 'port_no': 11434}}
+        self.db_versions = {name: 0 for name in ('prompts', 'connections', 'models', 'providers')}
+        self.loads = []
+
+    def _load(self, session, category):
+        self.loads.append(category)
+        if category != 'connections':
+            return {k: dict(v) for k, v in self.tables[category].items()}
+
+        result = {}
+        for conn_id, conn in self.connections.items():
+            model = self._data['models'].get(conn['model_id'])
+            details = {'id': conn_id, 'name': f"conn-{conn_id}", 'provider_id': conn['provider_id'],
+                       'model_id': conn['model_id'], 'model_name': model['display_name'] if model else 'default',
+                       'provider_type': self._data['providers'][conn['provider_id']]['provider_type'],
+                       'api_key': None, 'base_url': conn['base_url'], 'port_no': conn['port_no'],
+                       'connection_config': None}
+            details['llm_config'] = {'model_name': details['model_name']}
+            result[conn_id] = details
+        return result
+
+    def _read_versions(self):
+        return dict(self.db_versions)
+
+    def _bump_versions(self, categories):
+        for name in categories:
+            self.db_versions[name] += 1
+
+
+def test_lookups_are_served_from_memory():
+    """Only the first lookup of a category loads it"""
+    lookup = InMemoryConfigLookup(version_check_interval=60)
+
+    for _ in range(100):
+        assert lookup.get_prompt(1)['prompt_text'] == 'Summarize'
+        assert lookup.get_connection(5)['model_name'] == 'llama3:8b'
+
+    assert lookup.loads.count('prompts') == 1
+    assert lookup.loads.count('connections') == 1
+    assert lookup.get_llm_config(5) == {'model_name': 'llama3:8b'}
+    assert 'llm_config' not in lookup.get_connection(5)
+
+
+def test_local_invalidate_reloads():
+    """A write in this process is visible on the next lookup"""
+    lookup = InMemoryConfigLookup(version_check_interval=60)
+    assert lookup.get_prompt(1)['prompt_text'] == 'Summarize'
+
+    lookup.tables['prompts'][1]['prompt_text'] = 'Summarize briefly'
+    lookup.invalidate('prompts')
+
+    assert lookup.get_prompt(1)['prompt_text'] == 'Summarize briefly'
+    assert lookup.db_versions['prompts'] == 1
+
+
+def test_remote_version_bump_is_detected():
+    """A write by another process is picked up after the version check interval"""
+    lookup = InMemoryConfigLookup(version_check_interval=0.05)
+    assert lookup.get_prompt(1)['prompt_text'] == 'Summarize'
+
+    lookup.tables['prompts'][1]['prompt_text'] = 'Changed elsewhere'
+    lookup.db_versions['prompts'] += 1
+
+    time.sleep(0.06)
+    assert lookup.get_prompt(1)['prompt_text'] == 'Changed elsewhere'
+
+
+def test_model_change_cascades_to_connections():
+    """Connections embed the model name, so a model write reloads them too"""
+    lookup = InMemoryConfigLookup(version_check_interval=60)
+    assert lookup.get_connection(5)['model_name'] == 'llama3:8b'
+
+    lookup.tables['models'][7]['display_name'] = 'llama3:70b'
+    lookup.invalidate('models')
+
+    assert lookup.get_connection(5)['model_name'] == 'llama3:70b'
+    assert lookup.get_model_name(7) == 'llama3:70b'
+
+
+def test_unknown_ids_return_none():
+    lookup = InMemoryConfigLookup(version_check_interval=60)
+    assert lookup.get_prompt(999) is None
+    assert lookup.get_connection(None) is None
+
+
+if __name__ == "__main__":
+    test_lookups_are_served_from_memory()
+    test_local_invalidate_reloads()
+    test_remote_version_bump_is_detected()
+    test_model_change_cascades_to_connections()
+    test_unknown_ids_return_none()
+    print("✅ All config lookup tests passed")
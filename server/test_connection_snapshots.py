@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for shared connection snapshots (services/connection_snapshots.py).
+
+The connection_snapshots table is simulated by a fake cursor, so the tests verify:
+1. Snapshots are keyed by content, independent of key order
+2. Interning the same details again reuses the snapshot; edited details get a new one
+3. Readers load uncached snapshots in one query and keep a bounded cache
+4. Rows staged before snapshots resolve from their inline connection_details
+5. Staging writes snapshot ids into llm_responses instead of copies of the details
+"""
+
+import sys
+import os
+import json
+import tempfile
+from types import SimpleNamespace
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.batch_service import BatchService
+from services.connection_snapshots import ConnectionSnapshotStore, snapshot_hash
+
+DETAILS = {'id': 7, 'name': 'gemma-local', 'provider_type': 'ollama', 'model_name': 'gemma3',
+           'base_url': 'http://studio.local', 'port_no': 11434, 'api_key': None,
+           'connection_config': {'temperature': 0.2}}
+
+
+class SnapshotTableCursor:
+    """connection_snapshots in memory, answering the statements ConnectionSnapshotStore runs"""
+
+    def __init__(self):
+        self.rows = {}  # id -> (content_hash, details json)
+        self.queries = []
+        self._result = []
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.queries.append(sql)
+        if sql.startswith('INSERT INTO connection_snapshots'):
+            content_hash, _, details = params
+            if any(existing == content_hash for existing, _ in self.rows.values()):
+                self._result = []
+            else:
+                snapshot_id = len(self.rows) + 1
+                self.rows[snapshot_id] = (content_hash, details)
+                self._result = [(snapshot_id,)]
+        elif sql.startswith('SELECT id FROM connection_snapshots WHERE content_hash'):
+            self._result = [(snapshot_id,) for snapshot_id, (content_hash, _) in self.rows.items()
+                            if content_hash == params[0]]
+        elif sql.startswith('SELECT id, details FROM connection_snapshots'):
+            self._result = [(snapshot_id, self.rows[snapshot_id][1]) for snapshot_id in params[0]
+                            if snapshot_id in self.rows]
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+
+def test_snapshot_hash_is_independent_of_key_order():
+    reordered = dict(reversed(list(DETAILS.items())))
+    assert snapshot_hash(reordered) == snapshot_hash(DETAILS)
+    assert snapshot_hash({**DETAILS, 'model_name': 'gemma3:27b'}) != snapshot_hash(DETAILS)
+
+
+def test_identical_details_are_stored_once():
+    cursor = SnapshotTableCursor()
+    store = ConnectionSnapshotStore()
+
+    first = store.intern(cursor, DETAILS)
+    assert store.intern(cursor, dict(reversed(list(DETAILS.items())))) == first
+    edited = store.intern(cursor, {**DETAILS, 'connection_config': {'temperature': 0.7}})
+
+    assert edited != first and len(cursor.rows) == 2
+    assert store.stats['interned'] == 3 and store.stats['created'] == 2
+
+
+def test_readers_load_missing_snapshots_once_and_cache_them():
+    cursor = SnapshotTableCursor()
+    store = ConnectionSnapshotStore(cache_size=2)
+    ids = [store.intern(cursor, {**DETAILS, 'id': connection_id}) for connection_id in (1, 2, 3)]
+    cursor.queries.clear()
+
+    # One query for a page of rows sharing two snapshots
+    found = store.get_many([ids[0], ids[1], ids[0], None], cursor)
+    assert found[ids[0]]['id'] == 1 and found[ids[1]]['id'] == 2
+    assert len(cursor.queries) == 1
+
+    # Cached: no further queries
+    assert store.get(ids[1], cursor)['id'] == 2
+    assert len(cursor.queries) == 1
+
+    # The cache keeps the most recently used snapshots only
+    store.get(ids[2], cursor)
+    assert store.get_status()['cached'] == 2
+    store.get(ids[0], cursor)
+    assert len(cursor.queries) == 3
+    assert store.get(99, cursor) is None
+
+
+def test_rows_staged_before_snapshots_use_inline_details():
+    store = ConnectionSnapshotStore()
+    cursor = SnapshotTableCursor()
+    snapshot_id = store.intern(cursor, DETAILS)
+
+    assert store.resolve(None, json.dumps(DETAILS), cursor) == DETAILS
+    assert store.resolve(None, DETAILS) == DETAILS
+    assert store.resolve(snapshot_id, None, cursor) == DETAILS
+    assert store.resolve(None, None) is None
+
+
+class StagingCursor:
+    def __init__(self):
+        self.inserted = []
+        self._result = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        if sql.startswith('SELECT id FROM docs'):
+            self._result = None
+        elif sql.startswith('INSERT INTO docs'):
+            self._result = (55,)
+        elif sql.startswith('INSERT INTO llm_responses'):
+            self.inserted.append((sql, params))
+            self._result = (len(self.inserted),)
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self._result
+
+
+def test_staging_references_snapshots():
+    cursor = StagingCursor()
+    with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+        f.write(b'document text')
+    try:
+        doc = SimpleNamespace(id=3, filename='report.txt', filepath=f.name)
+        staged = BatchService()._stage_document(cursor, 9, doc, {7: 101, 8: 102}, [1, 2])
+    finally:
+        os.unlink(f.name)
+
+    assert staged == {'responses_created': 4, 'bytes_read': len(b'document text')}
+    sql, params = cursor.inserted[0]
+    assert 'connection_snapshot_id' in sql and 'connection_details' not in sql
+    assert params[:5] == (55, 1, 7, 101, 9)
+    assert params[5] > 0  # predicted_cost_ms for cost-ordered claims
+    assert sorted((params[2], params[3]) for _, params in cursor.inserted) == [(7, 101), (7, 101), (8, 102), (8, 102)]
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All connection snapshot tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Tests for the job cost model (services/cost_model.py).
+
+History is passed in directly and claims run against a fake cursor, so the
+tests verify:
+1. Response time is learned per document type as a line over file size
+2. Connection speed factors separate fast and slow connections of the same work
+3. Completion is predicted from grouped remaining work over the dispatch slots
+4. Claims are ordered by the predicted cost stored on the row, after the preferred document
+5. The queue processor passes the configured job order to claims
+6. Real-time batch progress counts llm_responses and carries the completion estimate
+"""
+
+import sys
+import os
+import random
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_service as batch_service_module
+from services.cost_model import JobCostModel, fit_line
+from services.worker_lease import WorkerLease
+
+KB = 1024
+MB = 1024 * KB
+
+
+def history(seed=7):
+    """pdf: 5s + 40ms/KB, txt: 2s + 1ms/KB; connection 2 runs three times slower than connection 1"""
+    rng = random.Random(seed)
+    rows = []
+    for connection_id, speed in ((1, 1.0), (2, 3.0)):
+        for _ in range(40):
+            size = rng.randint(10, 5000) * KB
+            rows.append((connection_id, 'PDF', size, speed * (5000 + 40 * size / KB) * rng.uniform(0.95, 1.05)))
+            size = rng.randint(1, 200) * KB
+            rows.append((connection_id, 'txt', size, speed * (2000 + 1 * size / KB) * rng.uniform(0.95, 1.05)))
+    return rows
+
+
+def fitted_model():
+    model = JobCostModel(min_samples=10, refresh_seconds=0, load_samples=lambda limit: history())
+    model.refresh()
+    return model
+
+
+def test_fit_line():
+    assert fit_line([(0, 1), (1, 3), (2, 5)]) == (1.0, 2.0)
+    assert fit_line([(4, 10)]) == (10.0, 0.0)
+    # A negative intercept is refitted through the origin
+    intercept, slope = fit_line([(1, 0), (2, 5), (3, 10)])
+    assert intercept == 0.0 and abs(slope - 40 / 14) < 1e-9
+
+
+def test_time_is_learned_per_type_size_and_connection():
+    model = fitted_model()
+    assert model.samples == 160
+
+    # A 30 MB PDF costs orders of magnitude more than a 2 KB text file
+    big_pdf = model.predict_ms(1, 'pdf', 30 * MB)
+    small_txt = model.predict_ms(1, 'txt', 2 * KB)
+    assert 1_100_000 < big_pdf < 1_350_000
+    assert 1_700 < small_txt < 2_300
+
+    speeds = model.get_status()['connection_speeds']
+    assert 2.6 < speeds[2] / speeds[1] < 3.4
+    assert model.predict_ms(2, 'pdf', MB) > 2.5 * model.predict_ms(1, 'pdf', MB)
+
+    # Unknown types and connections fall back to the pooled line and a neutral speed
+    assert model.predict_ms(99, 'docx', MB) > 0
+
+
+def test_completion_is_predicted_over_dispatch_slots():
+    model = JobCostModel(min_samples=10)
+    model.default_line = (1000.0, 0.0)  # Every row takes 1s
+
+    estimate = model.estimate_completion([(1, 'txt', 10, 0, 0)], [], slots=2)
+    assert estimate['seconds'] == 5 and estimate['predicted_work_seconds'] == 10
+
+    # One long row is the makespan when the rest fits beside it
+    model.lines['pdf'] = (0.0, 1000.0)  # 1s per KB
+    queued = [(1, 'pdf', 1, 8 * KB, 8 * KB), (1, 'txt', 4, 0, 0)]
+    assert model.estimate_completion(queued, [], slots=2)['seconds'] == 8
+
+    # Grouped totals give the same work as the rows one by one
+    queued = [(1, 'pdf', 3, 12 * KB, 6 * KB)]
+    assert model.estimate_completion(queued, [], slots=3)['seconds'] == 6
+    assert model.estimate_completion(queued, [], slots=1)['seconds'] == 12
+
+    # Rows in flight count with their remaining time
+    estimate = model.estimate_completion([], [(1, 'pdf', 1, 8 * KB, 6.0)], slots=1)
+    assert estimate['seconds'] == 2
+
+
+def test_batch_completion_reads_grouped_totals(monkeypatch):
+    import services.batch_service as batch_service_module
+
+    class GroupedCursor:
+        def execute(self, sql, params=None):
+            self.sql = ' '.join(sql.split())
+
+        def fetchall(self):
+            assert 'GROUP BY' in self.sql
+            # status, connection_id, doc_type, rows, total size, max size, total elapsed
+            return [('QUEUED', 1, 'txt', 40_000, 0, 0, 0), ('PROCESSING', 1, 'txt', 4, 0, 0, 2.0)]
+
+        def close(self):
+            pass
+
+    class GroupedConnection:
+        def cursor(self):
+            return GroupedCursor()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: GroupedConnection())
+    model = JobCostModel(min_samples=10, refresh_seconds=3600, load_samples=lambda limit: [])
+    model.default_line = (1000.0, 0.0)
+    model.refresh()
+    monkeypatch.setattr(batch_service_module, 'job_cost_model', model)
+
+    estimate = batch_service_module.BatchService().estimate_batch_completion(7)
+    assert (estimate['queued'], estimate['processing'], estimate['slots']) == (40_000, 4, 4)
+    # 40,000 rows of 1s plus 4 x 0.5s left in flight, over the 4 rows in flight
+    assert estimate['seconds'] == 10_000
+
+
+class ProgressCursor:
+    """Answers the llm_responses queries of get_real_time_batch_progress and estimate_batch_completion"""
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        if sql.startswith('SELECT status, COUNT(*)'):
+            self.rows = [('COMPLETED', 3, 1500.0, 1000, 2000), ('FAILED', 1, None, None, None),
+                         ('PROCESSING', 1, None, None, None), ('QUEUED', 3, None, None, None)]
+        elif sql.startswith('SELECT d.document_id'):
+            # document, rows, completed, failed, processing
+            self.rows = [('batch_7_doc_1', 2, 2, 0, 0), ('batch_7_doc_2', 2, 1, 1, 0),
+                         ('batch_7_doc_3', 4, 0, 0, 1)]
+        else:
+            assert 'GROUP BY r.status, r.connection_id' in sql
+            self.rows = [('QUEUED', 1, 'txt', 3, 0, 0, 0), ('PROCESSING', 1, 'txt', 1, 0, 0, 0.5)]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class ProgressConnection:
+    def cursor(self):
+        return ProgressCursor()
+
+    def close(self):
+        pass
+
+
+class ProgressSession:
+    def __init__(self):
+        self.batch = SimpleNamespace(id=7, batch_number=3, batch_name='b', status='PROCESSING', folder_ids=[5],
+                                     created_at=None, started_at=datetime.utcnow(), completed_at=None)
+        self.documents = [SimpleNamespace(id=i, batch_id=7, folder_id=5) for i in (1, 2, 3, 4)]
+
+    def query(self, model):
+        self.model = model
+        return self
+
+    def filter(self, *conditions):
+        return self
+
+    def first(self):
+        return self.batch if self.model is batch_service_module.Batch else \
+            SimpleNamespace(folder_name='reports', folder_path='/data/reports')
+
+    def all(self):
+        return self.documents
+
+    def close(self):
+        pass
+
+
+def test_real_time_progress_reports_the_completion_estimate(monkeypatch):
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: ProgressConnection())
+    monkeypatch.setattr(batch_service_module, 'Session', ProgressSession)
+    model = JobCostModel(min_samples=10, refresh_seconds=3600, load_samples=lambda limit: [])
+    model.default_line = (1000.0, 0.0)
+    model.refresh()
+    monkeypatch.setattr(batch_service_module, 'job_cost_model', model)
+
+    progress = batch_service_module.BatchService().get_real_time_batch_progress(7)
+
+    assert progress['responses'] == {'total': 8, 'completed': 3, 'failed': 1, 'processing': 1, 'waiting': 3,
+                                     'progress_percent': 50.0, 'success_rate': 100.0}
+    documents = progress['documents']
+    assert (documents['completed'], documents['failed'], documents['processing'], documents['waiting']) == (2, 0, 1, 1)
+    assert progress['folder_progress'][0]['total_responses'] == 8
+    assert progress['performance']['avg_processing_time_ms'] == 1500.0
+    # 3 queued rows of 1s plus 0.5s left in flight, over the 1 row in flight
+    estimate = progress['estimated_completion']
+    assert (estimate['queued'], estimate['processing'], estimate['seconds']) == (3, 1, 3)
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchone(self):
+        return None
+
+
+def test_claims_are_ordered_by_stored_predicted_cost():
+    model = fitted_model()
+    assert model.claim_order('fifo') is None
+    assert model.claim_order('largest_first') == ('predicted_cost_ms', [], 'DESC')
+    assert model.claim_order('shortest_first')[2] == 'ASC'
+
+    lease = WorkerLease(worker_id='worker-1', lease_seconds=60)
+    cursor = RecordingCursor()
+    lease.claim_next(cursor, 5, [3], document_order=True, prefer=(11, 1),
+                     cost_order=model.claim_order('largest_first'))
+
+    # The preferred document is tried on its own, then the batch in cost order
+    (preferred_sql, preferred_params), (sql, params) = cursor.statements
+    assert 'AND document_id = %s AND connection_id IS NOT DISTINCT FROM %s ORDER BY' in preferred_sql
+    assert preferred_params == ['worker-1', 60, 5, [3], 11, 1]
+    assert params == ['worker-1', 60, 5, [3]]
+    for statement, values in cursor.statements:
+        order_by = statement.split('ORDER BY ')[1]
+        # A plain indexed column, not a per-row score of every queued row
+        assert order_by.startswith('predicted_cost_ms DESC, document_id ASC')
+        assert 'SELECT' not in order_by.split(' LIMIT')[0]
+        assert statement.count('%s') == len(values)
+
+
+def test_refit_rescores_queued_rows_in_one_statement():
+    model = fitted_model()
+    cursor = RecordingCursor()
+    model.rescore_queued(cursor)
+
+    (sql, params), = cursor.statements
+    assert sql.startswith('UPDATE llm_responses target SET predicted_cost_ms = scored.cost')
+    assert "JOIN docs d ON d.id = r.document_id WHERE r.status = 'QUEUED'" in sql
+    # Rows whose stored prediction is still close are left alone
+    assert 'ABS(target.predicted_cost_ms - scored.cost) > %s * scored.cost' in sql and params[-1] == 0.1
+    assert sql.count('%s') == len(params)
+    assert params[0] == list(model.speeds.values()) and params[1] == list(model.speeds)
+
+
+def test_processor_passes_job_order_to_claims(make_processor):
+    processor, fake_service, _ = make_processor(None, cost_model=fitted_model())
+
+    assert processor.job_order == 'fifo'
+    processor._dispatch_next_document(1)
+    assert fake_service.claims[-1]['cost_order'] is None
+
+    processor.job_order = 'shortest_first'
+    processor._dispatch_next_document(1)
+    assert fake_service.claims[-1]['cost_order'][2] == 'ASC'
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All cost model tests passed")
+    sys.exit(exit_code)
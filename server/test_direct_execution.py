@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Tests for the direct execution engine (services/direct_execution.py).
+
+Provider HTTP is replaced with a fake pooled session, so the tests verify:
+1. Ollama streams are accumulated with native token counts and load time, unscored
+2. OpenAI-compatible streams use the final usage event, including cached tokens
+3. A document's prompts run back to back with the document as a shared prefix
+4. A provider error after the first prompt keeps the answers so far
+5. Connections are selected by connection_config before DIRECT_EXECUTION_CONNECTIONS,
+   and connections that require scores stay on the RAG API
+6. Documents without extractable text and unknown task ids are handled
+7. The queue processor polls direct tasks in-process and skips the RAG API breaker
+"""
+
+import sys
+import os
+import json
+import time
+import base64
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_queue_processor as processor_module
+from services.circuit_breakers import rag_endpoint_key
+from services.direct_execution import DirectExecutionEngine, document_text
+from services.providers.ollama_provider import OllamaProvider
+from services.providers.openai_provider import OpenAIProvider
+
+
+class FakeContent:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __aiter__(self):
+        self._iter = iter(self.lines)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeResponse:
+    def __init__(self, status, lines):
+        self.status = status
+        self.content = FakeContent(lines)
+
+    async def text(self):
+        return b''.join(self.content.lines).decode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+    """Answers each request with the next scripted (status, lines) reply"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = []
+
+    def post(self, url, json=None, headers=None):
+        self.requests.append({'url': url, 'json': json, 'headers': headers})
+        status, lines = self.replies.pop(0)
+        return FakeResponse(status, lines)
+
+
+def ollama_stream(*parts, prompt_tokens=100, output_tokens=5):
+    lines = [json.dumps({'message': {'content': part}, 'done': False}).encode() + b'\n' for part in parts]
+    lines.append(json.dumps({'message': {'content': ''}, 'done': True, 'prompt_eval_count': prompt_tokens,
+                             'eval_count': output_tokens, 'load_duration': 2_000_000_000}).encode() + b'\n')
+    return lines
+
+
+def make_engine(replies, connections='all', lookup=None):
+    session = FakeSession(replies)
+    engine = DirectExecutionEngine(
+        connections=connections,
+        adapters={'ollama': OllamaProvider(), 'openai': OpenAIProvider()},
+        session_factory=lambda: session,
+        lookup=lookup or (lambda connection_id: None)
+    )
+    return engine, session
+
+
+def doc_info(provider_type='ollama', prompts=('Summarize', 'List risks'), doc_type='txt'):
+    return {
+        'response_id': 101,
+        'response_ids': [101 + i for i in range(len(prompts))],
+        'document_id': 'batch_1_doc_5',
+        'encoded_content': base64.b64encode(b'Quarterly report text').decode(),
+        'doc_type': doc_type,
+        'content_type': 'text/plain' if doc_type == 'txt' else 'application/octet-stream',
+        'prompt': {'id': 1, 'text': prompts[0]},
+        'prompts': [{'response_id': 101 + i, 'id': i + 1, 'text': text} for i, text in enumerate(prompts)],
+        'llm_config': {'provider_type': provider_type, 'base_url': 'http://studio.local:11434',
+                       'model_name': 'gemma3:latest', 'api_key': 'sk-test', 'keep_alive': '30m'},
+        'connection_id': 7,
+        'connection_details': {}
+    }
+
+
+def wait_for(engine, task_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = engine.poll(task_id)
+        if status['completed']:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"Task {task_id} did not finish")
+
+
+def test_ollama_prompts_run_back_to_back_with_native_token_counts():
+    engine, session = make_engine([
+        (200, ollama_stream('The report ', 'covers Q3.', prompt_tokens=120, output_tokens=6)),
+        (200, ollama_stream('No risks.', prompt_tokens=118, output_tokens=3)),
+    ])
+    try:
+        task_id = engine.submit(doc_info())
+        status = wait_for(engine, task_id)
+    finally:
+        engine.shutdown()
+
+    assert status['success']
+    assert status['overall_score'] is None and status['raw_data']['scored'] is False
+    assert [r['response_text'] for r in status['results']] == ['The report covers Q3.', 'No risks.']
+    assert [(r['input_tokens'], r['output_tokens']) for r in status['results']] == [(120, 6), (118, 3)]
+    assert status['input_tokens'] == 238 and status['output_tokens'] == 9
+    assert status['load_seconds'] == 4.0
+
+    first, second = session.requests
+    assert first['url'] == 'http://studio.local:11434/api/chat'
+    assert first['json']['stream'] is True and first['json']['keep_alive'] == '30m'
+    # Same document prefix, different prompt
+    assert first['json']['messages'][0] == second['json']['messages'][0]
+    assert 'Quarterly report text' in first['json']['messages'][0]['content']
+    assert [r['json']['messages'][1]['content'] for r in session.requests] == ['Summarize', 'List risks']
+
+
+def test_openai_stream_uses_final_usage_event():
+    events = [
+        {'choices': [{'delta': {'content': 'Fine'}, 'finish_reason': None}]},
+        {'choices': [{'delta': {'content': '.'}, 'finish_reason': 'stop'}]},
+        {'choices': [], 'usage': {'prompt_tokens': 900, 'completion_tokens': 2,
+                                  'prompt_tokens_details': {'cached_tokens': 768}}},
+    ]
+    lines = [f"data: {json.dumps(event)}\n".encode() for event in events] + [b'\n', b'data: [DONE]\n']
+    engine, session = make_engine([(200, lines)])
+    try:
+        status = wait_for(engine, engine.submit(doc_info('openai', prompts=('Summarize',))))
+    finally:
+        engine.shutdown()
+
+    assert status['response_text'] == 'Fine.'
+    assert (status['input_tokens'], status['output_tokens'], status['cached_tokens']) == (900, 2, 768)
+    request = session.requests[0]
+    assert request['url'].endswith('/chat/completions')
+    assert request['json']['stream_options'] == {'include_usage': True}
+    assert request['json']['prompt_cache_key'] == 'batch_1_doc_5:7'
+    assert request['headers']['Authorization'] == 'Bearer sk-test'
+
+
+def test_provider_error_after_first_prompt_keeps_answers():
+    engine, _ = make_engine([
+        (200, ollama_stream('Answer one')),
+        (503, [b'model is loading']),
+    ])
+    try:
+        status = wait_for(engine, engine.submit(doc_info()))
+    finally:
+        engine.shutdown()
+    assert status['success'] and len(status['results']) == 1
+
+    engine, _ = make_engine([(429, [b'slow down'])])
+    try:
+        status = wait_for(engine, engine.submit(doc_info(prompts=('Summarize',))))
+    finally:
+        engine.shutdown()
+    assert not status['success'] and status['status_code'] == 429
+
+
+def test_connection_selection_and_fallbacks():
+    configs = {7: {'connection_config': {'execution_mode': 'direct'}},
+               8: {'connection_config': json.dumps({'execution_mode': 'rag'})},
+               11: {'connection_config': {'execution_mode': 'direct', 'require_score': True}},
+               12: {'connection_config': {'require_score': True}}}
+    engine, _ = make_engine([], connections='8,9,12', lookup=configs.get)
+    assert engine.is_direct(7)  # connection_config wins over the env list
+    assert not engine.is_direct(8)
+    assert engine.is_direct(9)
+    assert not engine.is_direct(10)
+    # Scored evaluations stay with the RAG API, which does the scoring
+    assert not engine.is_direct(11) and not engine.is_direct(12)
+
+    # Binary documents need the RAG API's text extraction
+    assert document_text(doc_info(doc_type='docx')) is None
+    assert engine.submit(doc_info(doc_type='docx')) is None
+    assert engine.stats['fallbacks'] == 1
+
+    # A direct task of a process that has died is re-queued as a transient failure
+    status = engine.poll('direct-0123')
+    assert status['completed'] and not status['success'] and status['failure_class'] == 'transient'
+
+
+def test_processor_runs_direct_connections_without_the_rag_api(monkeypatch, make_processor):
+    engine, _ = make_engine([(200, ollama_stream('Answer', prompt_tokens=50, output_tokens=4))])
+    info = doc_info(prompts=('Summarize',))
+    processor, fake_service, posted = make_processor(lambda claims: info if len(claims) == 1 else None,
+                                                     direct=engine)
+    monkeypatch.setattr(processor_module.requests, 'get',
+                        lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("RAG API polled")))
+    # An open RAG API circuit does not hold back direct connections
+    rag_key = rag_endpoint_key(processor.rag_api_url)
+    for _ in range(10):
+        processor.breakers.record_failure(rag_key)
+    assert processor.breakers.is_blocking(rag_key)
+
+    try:
+        assert processor._dispatch_next_document(1)
+        task_id = fake_service.task_updates[0][1]
+        assert engine.owns(task_id) and processor.active_tasks[task_id]['direct']
+
+        deadline = time.time() + 5
+        while processor.active_tasks and time.time() < deadline:
+            processor._check_active_tasks()
+            time.sleep(0.01)
+    finally:
+        engine.shutdown()
+
+    assert posted == [] and fake_service.failures == []
+    completed_id, result = fake_service.completions[0]
+    assert completed_id == task_id
+    assert (result['response_text'], result['input_tokens'], result['output_tokens']) == ('Answer', 50, 4)
+    assert processor.stats['processed'] == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All direct execution tests passed")
+    sys.exit(exit_code)
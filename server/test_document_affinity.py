@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for document-affinity dispatch ordering and cached-token reporting.
+
+The KnowledgeDocuments cursor, BatchService and the RAG API (conftest.py) are
+replaced with fakes so the tests verify:
+1. Document ordering claims a document's rows together and continues the last dispatch first
+2. The processor passes its previous (document, connection) to the next claim
+3. Requests carry the stable-prefix cache hints
+4. Cached-token counts are read from the usage formats providers report
+"""
+
+import sys
+import os
+import json
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.batch_queue_processor import extract_cached_tokens
+from services.worker_lease import WorkerLease
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchone(self):
+        return None
+
+
+def claimed_document(claims):
+    return {
+        'response_id': 100 + len(claims),
+        'doc_id': 42,
+        'document_id': 'batch_1_doc_5',
+        'prompt': {'id': 1, 'text': 'summarise'},
+        'llm_config': {},
+        'connection_id': 7
+    }
+
+
+def test_document_order_claim():
+    lease = WorkerLease(worker_id='w1', lease_seconds=60, connect=lambda: None)
+    cursor = RecordingCursor()
+
+    lease.claim_next(cursor, 1)
+    assert 'ORDER BY created_at ASC, id ASC' in cursor.statements[0][0]
+
+    # The previous document first, then the rest of the batch in document order
+    cursor.statements.clear()
+    lease.claim_next(cursor, 1, [9], document_order=True, prefer=(42, 7))
+    (preferred_sql, preferred_params), (sql, params) = cursor.statements
+    assert ('AND document_id = %s AND connection_id IS NOT DISTINCT FROM %s '
+            'ORDER BY document_id ASC, connection_id ASC, prompt_id ASC, id ASC') in preferred_sql
+    assert preferred_params == ['w1', 60, 1, [9], 42, 7]
+    assert 'ORDER BY document_id ASC, connection_id ASC, prompt_id ASC, id ASC' in sql
+    assert params == ['w1', 60, 1, [9]]
+
+
+def test_processor_continues_previous_document(monkeypatch, make_processor):
+    monkeypatch.delenv('DISPATCH_ORDER', raising=False)
+    processor, fake_service, posted = make_processor(claimed_document)
+    assert processor.dispatch_order == 'created'
+    processor.dispatch_order = 'document'
+
+    processor._dispatch_next_document(1)
+    processor._dispatch_next_document(1)
+
+    assert fake_service.claims[0]['document_order'] and fake_service.claims[0]['prefer'] is None
+    assert fake_service.claims[1]['prefer'] == (42, 7)
+    assert json.loads(posted[0][1]['meta_data']) == {
+        'document_position': 'prefix', 'prompt_cache_key': 'batch_1_doc_5:7'
+    }
+
+    processor.dispatch_order = 'created'
+    processor._dispatch_next_document(1)
+    assert not fake_service.claims[2]['document_order'] and fake_service.claims[2]['prefer'] is None
+    assert json.loads(posted[2][1]['meta_data']) == {}
+
+
+def test_cached_tokens_from_provider_usage():
+    assert extract_cached_tokens({'usage': {'prompt_tokens': 900, 'prompt_tokens_details': {'cached_tokens': 768}}}) == 768
+    assert extract_cached_tokens({'cache_read_input_tokens': 512}) == 512
+    assert extract_cached_tokens({'cached_tokens': '64'}) == 64
+    assert extract_cached_tokens({'cached_tokens': 0}) == 0
+    assert extract_cached_tokens({'input_tokens': 900}) is None
+    assert extract_cached_tokens(None) is None
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All document affinity tests passed")
+    sys.exit(exit_code)
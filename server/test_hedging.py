@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged requests (services/hedging.py and the queue processor).
+
+RAG API calls are replaced with fakes (conftest.py), so the tests verify:
+1. The straggler threshold is a percentile of the connection's completion times
+2. Each task is hedged once, within the hedge rate budget
+3. Equivalent connections serve the same model with the same generation settings
+   from another host, fastest first
+4. A hedge on another RAG API instance that answers first is written to the rows
+   of the original task, and the ignored loser is watched to measure the time saved
+5. A copy that fails while the other one runs is not reported, and the copy that
+   answers is recorded as the answering connection
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_queue_processor as processor_module
+from services.config import ServiceConfigManager
+from services.hedging import HedgingPolicy, percentile
+from services.rag_pool import RagEndpointPool
+
+RAG_1 = 'http://localhost:7001'
+RAG_2 = 'http://rag2.local:7001'
+
+CONNECTIONS = {
+    7: {'id': 7, 'model_id': 3, 'base_url': 'http://studio.local', 'port_no': 11434, 'is_active': True},
+    8: {'id': 8, 'model_id': 3, 'base_url': 'http://mini.local', 'port_no': 11434, 'is_active': True},
+    9: {'id': 9, 'model_id': 3, 'base_url': 'http://studio.local:11434', 'port_no': None, 'is_active': True},
+    10: {'id': 10, 'model_id': 3, 'base_url': 'http://old.local', 'port_no': 11434, 'is_active': False},
+    11: {'id': 11, 'model_id': 4, 'base_url': 'http://mini.local', 'port_no': 11434, 'is_active': True},
+    12: {'id': 12, 'model_id': 3, 'base_url': 'http://gpu.local', 'port_no': 11434, 'is_active': True},
+}
+
+
+def make_policy(**kwargs):
+    options = dict(enabled=True, percentile_threshold=95, min_samples=5, min_seconds=1, max_rate=1.0,
+                   connections=lambda: CONNECTIONS)
+    options.update(kwargs)
+    return HedgingPolicy(**options)
+
+
+def test_threshold_is_a_percentile_of_completion_times():
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile(range(1, 101), 95) == 95
+
+    policy = make_policy()
+    for seconds in (10, 12, 11, 13):
+        policy.record_latency(7, seconds)
+    assert policy.threshold(7) is None  # Not enough history yet
+    policy.record_latency(7, 60)
+    assert policy.threshold(7) == 60
+
+    task = {'connection_id': 7, 'doc_info': {'document_id': 'd'}}
+    policy.record_dispatch()
+    assert not policy.should_hedge(task, 30)
+    assert policy.should_hedge(task, 61)
+    # Once per task, never a copy of a copy, never without the request to resend
+    assert not policy.should_hedge({**task, 'hedge_attempted': True}, 61)
+    assert not policy.should_hedge({**task, 'hedge_of': 'task-0'}, 61)
+    assert not policy.should_hedge({'connection_id': 7}, 61)
+
+
+def test_hedge_rate_budget_and_disabled_policy():
+    policy = make_policy(min_samples=1, max_rate=0.5)
+    policy.record_latency(7, 10)
+    task = {'connection_id': 7, 'doc_info': {'document_id': 'd'}}
+
+    policy.record_dispatch()
+    policy.record_dispatch()
+    assert policy.should_hedge(task, 20)
+    policy.record_hedge()
+    assert not policy.should_hedge(task, 20)
+    assert policy.get_status()['hedge_rate'] == 0.5
+
+    disabled = make_policy(enabled=False, min_samples=1)
+    disabled.record_latency(7, 10)
+    disabled.record_dispatch()
+    assert not disabled.should_hedge(task, 20)
+
+
+def test_equivalent_connections_serve_the_same_model_elsewhere():
+    policy = make_policy()
+    # 9 is the same host, 10 inactive, 11 another model; unknown speed goes last
+    assert policy.equivalent_connections(7) == [8, 12]
+    for seconds in (5, 5, 5):
+        policy.record_latency(12, seconds)
+    policy.record_latency(8, 50)
+    assert policy.equivalent_connections(7) == [12, 8]
+    assert policy.equivalent_connections(7, exclude=[12]) == [8]
+    assert policy.equivalent_connections(None) == []
+
+
+def test_equivalent_connections_generate_with_the_same_settings():
+    connections = {
+        1: {'id': 1, 'model_id': 3, 'base_url': 'http://studio.local', 'provider_type': 'ollama',
+            'connection_config': {'temperature': 0.2, 'max_tokens': 512, 'keep_alive': '30m'}},
+        2: {'id': 2, 'model_id': 3, 'base_url': 'http://mini.local', 'provider_type': 'ollama',
+            'connection_config': '{"max_tokens": 512, "temperature": 0.2}'},
+        3: {'id': 3, 'model_id': 3, 'base_url': 'http://gpu.local', 'provider_type': 'ollama',
+            'connection_config': {'temperature': 0.9, 'max_tokens': 512}},
+        4: {'id': 4, 'model_id': 3, 'base_url': 'http://box.local', 'provider_type': 'ollama',
+            'connection_config': {'temperature': 0.2}},
+        5: {'id': 5, 'model_id': 3, 'base_url': 'http://lm.local', 'provider_type': 'lm_studio',
+            'connection_config': {'temperature': 0.2, 'max_tokens': 512}},
+    }
+    policy = make_policy(connections=lambda: connections)
+    # keep_alive only tunes the host; temperature, max_tokens and the provider decide the answer
+    assert policy.equivalent_connections(1) == [2]
+
+
+PROMPT = {'response_id': 101, 'id': 1, 'text': 'Summarize', 'description': ''}
+DOC_INFO = {'response_id': 101, 'response_ids': [101], 'document_id': 'batch_1_doc_5', 'prompt': PROMPT,
+            'prompts': [PROMPT], 'llm_config': {'provider_type': 'ollama'}, 'connection_id': 7}
+
+
+def make_hedging_processor(make_processor, policy):
+    config = ServiceConfigManager()
+    config.services['rag_api'].base_url, config.services['rag_api'].port = RAG_1, None
+    config.services['rag_api'].enabled = True
+    processor, fake_service, posted = make_processor(DOC_INFO, hedging=policy)
+    processor.rag_pool = RagEndpointPool(config=config, breakers=processor.breakers, refresh_seconds=0,
+                                         load_endpoints=lambda: [('rag_2', RAG_2, 'ACTIVE')])
+    for seconds in (2, 2, 3):
+        policy.record_latency(7, seconds)
+    return processor, fake_service, posted
+
+
+def test_hedge_on_another_instance_wins_and_loser_is_measured(make_processor):
+    processor, fake_service, posted = make_hedging_processor(
+        make_processor, make_policy(min_samples=3, connections=lambda: {7: CONNECTIONS[7]}))
+    statuses = {'task-1': {'completed': False, 'status': 'processing'}}
+    processor._check_task_status = lambda task_id: statuses[task_id]
+
+    assert processor._dispatch_next_document(1)
+    assert processor.active_tasks['task-1']['rag_endpoint'] == RAG_1
+
+    # Within the connection's usual time: no hedge
+    processor._check_active_tasks()
+    assert [url for url, _ in posted] == [f"{RAG_1}/analyze_document_with_llm"]
+
+    processor.active_tasks['task-1']['submitted_at'] -= timedelta(seconds=10)
+    processor._check_active_tasks()
+    assert posted[1][0] == f"{RAG_2}/analyze_document_with_llm"
+    hedge = processor.active_tasks['task-2']
+    assert hedge['hedge_of'] == 'task-1' and hedge['connection_id'] == 7 and hedge['rag_endpoint'] == RAG_2
+    assert processor.rag_pool.url_for_task('task-2') == RAG_2
+
+    statuses['task-2'] = {'completed': True, 'success': True, 'response_text': 'fast answer'}
+    processor._check_active_tasks()
+    # Written to the rows of the original task; the loser is no longer an active task
+    assert [(task_id, result['response_text']) for task_id, result in fake_service.completions] == \
+        [('task-1', 'fast answer')]
+    assert fake_service.completions[0][1]['answered_by_connection_id'] == 7
+    assert processor.active_tasks == {} and 'task-1' in processor._hedge_losers
+    assert processor.rag_pool.url_for_task('task-1') == RAG_1
+
+    processor._hedge_losers['task-1']['won_at'] -= timedelta(seconds=40)
+    statuses['task-1'] = {'completed': True, 'success': True, 'response_text': 'slow answer'}
+    processor._check_active_tasks()
+    assert processor._hedge_losers == {} and len(fake_service.completions) == 1
+
+    stats = processor.get_status()['hedging']['stats']
+    assert (stats['hedged'], stats['hedge_wins'], stats['primary_wins'], stats['losers_measured']) == (1, 1, 0, 1)
+    assert 40 <= stats['saved_seconds'] < 45
+
+
+class FakeConfigLookup:
+    def get_connection(self, connection_id):
+        return dict(CONNECTIONS[connection_id], provider_type='ollama')
+
+    def get_llm_config(self, connection_id):
+        return {'provider_type': 'ollama', 'url': CONNECTIONS[connection_id]['base_url']}
+
+
+def test_failed_copy_is_not_reported_while_the_other_runs(monkeypatch, make_processor):
+    processor, fake_service, _ = make_hedging_processor(make_processor, make_policy(min_samples=3))
+    monkeypatch.setattr(processor_module, 'config_lookup', FakeConfigLookup())
+    statuses = {'task-1': {'completed': False, 'status': 'processing'}}
+    processor._check_task_status = lambda task_id: statuses[task_id]
+
+    assert processor._dispatch_next_document(1)
+    processor.active_tasks['task-1']['submitted_at'] = datetime.now() - timedelta(seconds=10)
+    processor._check_active_tasks()
+
+    # Same model on another host; its request carries that connection's config
+    hedge = processor.active_tasks['task-2']
+    assert hedge['connection_id'] == 8 and hedge['hedge_of'] == 'task-1'
+
+    statuses['task-1'] = {'completed': True, 'success': False, 'error': 'model crashed'}
+    statuses['task-2'] = {'completed': False, 'status': 'processing'}
+    processor._check_active_tasks()
+    assert fake_service.failures == [] and list(processor.active_tasks) == ['task-2']
+
+    statuses['task-2'] = {'completed': True, 'success': True, 'response_text': 'answer'}
+    processor._check_active_tasks()
+    assert [task_id for task_id, _ in fake_service.completions] == ['task-1']
+    # Written to the original rows, credited to the connection that answered
+    assert fake_service.completions[0][1]['answered_by_connection_id'] == 8
+    assert processor.active_tasks == {} and processor._hedge_losers == {}
+    assert processor.hedging.stats['copies_failed'] == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All hedging tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for conditional GETs and response compression (utils/http_cache.py).
+
+A throwaway Flask app stands in for the API so the tests verify:
+1. A matching If-None-Match is answered with 304 without running the view
+2. A version change produces a new ETag and a full response
+3. An unknown version (None) disables ETags instead of serving stale data
+4. Clock-dependent responses get a new ETag once their time bucket passes
+5. Large JSON is gzip-compressed, small responses are left alone
+"""
+
+import sys
+import os
+import gzip
+import json
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+
+import utils.http_cache as http_cache_module
+from utils.http_cache import conditional_get, init_http_cache
+
+
+def create_test_app(state):
+    app = Flask(__name__)
+    init_http_cache(app)
+
+    @app.route('/items/<int:item_id>')
+    @conditional_get(lambda item_id: state['version'])
+    def get_item(item_id):
+        state['calls'] += 1
+        return jsonify({'success': True, 'id': item_id, 'rows': ['x' * 40] * state['rows']})
+
+    @app.route('/progress')
+    @conditional_get(lambda: state['version'], max_age_seconds=10)
+    def get_progress():
+        state['calls'] += 1
+        return jsonify({'success': True, 'elapsed_seconds': state['calls']})
+
+    return app
+
+
+def test_matching_etag_returns_304_without_running_view():
+    state = {'version': (3,), 'calls': 0, 'rows': 1}
+    client = create_test_app(state).test_client()
+
+    first = client.get('/items/1')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+    assert state['calls'] == 1
+
+    second = client.get('/items/1', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    assert state['calls'] == 1
+
+
+def test_version_change_invalidates_etag():
+    state = {'version': (1,), 'calls': 0, 'rows': 1}
+    client = create_test_app(state).test_client()
+
+    etag = client.get('/items/1').headers['ETag']
+    state['version'] = (2,)
+
+    response = client.get('/items/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert state['calls'] == 2
+
+    # Different paths never share an ETag
+    assert client.get('/items/2').headers['ETag'] != response.headers['ETag']
+
+
+def test_unknown_version_skips_etag():
+    state = {'version': None, 'calls': 0, 'rows': 1}
+    client = create_test_app(state).test_client()
+
+    response = client.get('/items/1', headers={'If-None-Match': '*'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert state['calls'] == 1
+
+
+def test_clock_dependent_etag_expires_with_its_time_bucket(monkeypatch):
+    state = {'version': (1,), 'calls': 0, 'rows': 1}
+    client = create_test_app(state).test_client()
+    now = [1000.0]
+    monkeypatch.setattr(http_cache_module.time, 'time', lambda: now[0])
+
+    etag = client.get('/progress').headers['ETag']
+    now[0] = 1009.0
+    assert client.get('/progress', headers={'If-None-Match': etag}).status_code == 304
+
+    # Nothing changed in the database, but elapsed time did
+    now[0] = 1010.0
+    response = client.get('/progress', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert state['calls'] == 2
+
+
+def test_large_json_is_compressed():
+    state = {'version': (1,), 'calls': 0, 'rows': 200}
+    client = create_test_app(state).test_client()
+
+    plain = client.get('/items/1')
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = client.get('/items/1', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] in ('gzip', 'br')
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert int(compressed.headers['Content-Length']) < len(plain.data)
+    if compressed.headers['Content-Encoding'] == 'gzip':
+        assert json.loads(gzip.decompress(compressed.data)) == json.loads(plain.data)
+
+
+def test_small_response_is_not_compressed():
+    state = {'version': (1,), 'calls': 0, 'rows': 1}
+    client = create_test_app(state).test_client()
+
+    response = client.get('/items/1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All HTTP cache tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test that importing the database layer does not connect to PostgreSQL.
+
+The engine and session factory are created on first use, so the app, the
+workers and the migration scripts can import database/models without a
+reachable database.
+"""
+
+import sys
+import os
+import importlib
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _fresh_database_module(url):
+    os.environ['DATABASE_URL'] = url
+    import database
+    return importlib.reload(database)
+
+
+def test_import_does_not_create_engine():
+    """Importing database and models leaves the engine uncreated"""
+    database = _fresh_database_module("postgresql://postgres:x@127.0.0.1:1/unreachable")
+    import models  # noqa: F401
+
+    assert not database.is_engine_initialized()
+
+
+def test_engine_created_on_first_use_and_reused():
+    """The engine is built once on first access, also through the legacy module attribute"""
+    database = _fresh_database_module("postgresql://postgres:x@127.0.0.1:1/unreachable")
+
+    engine = database.get_engine()
+    assert database.is_engine_initialized()
+    assert database.engine is engine
+    assert database.get_session_factory() is database.SessionLocal
+
+
+def test_check_database_connection_fails_only_when_called():
+    """Connectivity is checked explicitly, not as a side effect of creating the engine"""
+    database = _fresh_database_module("postgresql://postgres:x@127.0.0.1:1/unreachable")
+    database.get_engine()
+
+    try:
+        database.check_database_connection()
+    except Exception as e:
+        assert "Failed to connect" in str(e)
+    else:
+        raise AssertionError("expected connection failure")
+
+
+if __name__ == "__main__":
+    test_import_does_not_create_engine()
+    test_engine_created_on_first_use_and_reused()
+    test_check_database_connection_fails_only_when_called()
+    print("✅ All lazy database tests passed")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Tests for model affinity scheduling (services/model_affinity.py).
+
+Connections are looked up from a fixed table and time is a fake clock, so the
+tests verify:
+1. A host keeps serving its active model while that model has queued work
+2. It moves on to the longest-waiting model once the active model is drained
+3. Work that waited longer than the switch is worth preempts, within the switch budget
+4. Load time is measured from the first response after a switch
+5. Remote providers are never deferred, and local configs carry keep-alive settings
+6. Workers sharing a host store agree on its active model and switch budget; a worker
+   that loses a switch race defers to the winner, and an unreachable store falls back
+   to per-process state
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.model_affinity import ModelAffinityScheduler
+from utils.llm_config_formatter import format_llm_config_for_rag_api, duration_seconds
+
+CONNECTIONS = {
+    1: {'provider_type': 'ollama', 'base_url': 'http://studio.local', 'port_no': 11434, 'model_name': 'gemma3'},
+    2: {'provider_type': 'ollama', 'base_url': 'http://studio.local', 'port_no': 11434, 'model_name': 'llama3'},
+    3: {'provider_type': 'ollama', 'base_url': 'http://studio.local:11434', 'model_name': 'llama3'},
+    4: {'provider_type': 'openai', 'base_url': 'https://api.openai.com', 'model_name': 'gpt-4o'},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(**kwargs):
+    clock = FakeClock()
+    options = {'switches_per_hour': 2, 'min_wait_seconds': 60, 'switch_cost_factor': 10}
+    options.update(kwargs)
+    return ModelAffinityScheduler(clock=clock, lookup=CONNECTIONS.get, **options), clock
+
+
+def ready(queues):
+    """One ready batch; queues maps connection_id -> seconds its oldest row has waited"""
+    now = datetime.now()
+    return [{'batch_id': 1, 'queued_by_connection': {
+        connection_id: {'queued': 5, 'oldest_queued_at': now - timedelta(seconds=waited)}
+        for connection_id, waited in queues.items()
+    }}]
+
+
+def test_host_drains_active_model_before_switching():
+    scheduler, _ = make_scheduler()
+    scheduler.update(ready({1: 30, 2: 10, 4: 50}))
+    # Nothing loaded yet: the longest-waiting model goes first; remote connections are never deferred
+    assert scheduler.deferred_connection_ids() == [2]
+
+    scheduler.record_dispatch(1)
+    scheduler.update(ready({1: 5, 2: 40}))
+    assert scheduler.deferred_connection_ids() == [2]  # 40s is not worth a swap
+
+    scheduler.update(ready({2: 40, 3: 45}))
+    assert scheduler.deferred_connection_ids() == []  # gemma3 drained; both llama3 connections share a model
+    scheduler.record_dispatch(2)
+    assert scheduler.get_status()['hosts']['http://studio.local:11434']['switches'] == 1
+
+
+def test_long_waits_preempt_within_switch_budget():
+    scheduler, clock = make_scheduler(switches_per_hour=1)
+    scheduler.update(ready({1: 10}))
+    scheduler.record_dispatch(1)
+
+    # Default load estimate is 20s, so waiting more than 200s justifies a swap
+    scheduler.update(ready({1: 5, 2: 250}))
+    assert scheduler.deferred_connection_ids() == [1]
+    scheduler.record_dispatch(2)
+
+    # Budget used up: gemma3 has to wait until llama3 is drained
+    scheduler.update(ready({1: 900, 2: 5}))
+    assert scheduler.deferred_connection_ids() == [1]
+
+    clock.now += 3601
+    scheduler.update(ready({1: 900, 2: 5}))
+    assert scheduler.deferred_connection_ids() == [2]
+
+
+def test_load_time_measured_after_switch():
+    scheduler, _ = make_scheduler()
+    scheduler.record_dispatch(2)
+    scheduler.record_completion(2, 2000)  # Cold start, nothing to compare with yet
+    scheduler.record_completion(2, 2000)
+    scheduler.record_dispatch(1)
+    scheduler.record_dispatch(2)
+    scheduler.record_completion(2, 32000)  # First response after the swap back
+
+    assert scheduler.get_status()['connections'][2]['load_seconds'] == 30.0
+    assert scheduler.switch_cost('http://studio.local:11434', 'llama3') == 30.0
+
+    scheduler.record_completion(1, 1500, load_seconds=12.0)  # Reported by Ollama
+    assert scheduler.get_status()['connections'][1]['load_seconds'] == 12.0
+
+
+class FakeHostModelStore:
+    """host_model_affinity in memory, with the compare-and-set switch of HostModelStore"""
+
+    def __init__(self):
+        self.rows = {}  # host -> {'model', 'switches'}
+        self.available = True
+
+    def load(self, hosts):
+        if not self.available:
+            return None
+        return {host: {'model': row['model'], 'recent_switches': len(row['switches'])}
+                for host, row in self.rows.items() if host in hosts}
+
+    def switch(self, host, expected, model):
+        if not self.available:
+            return None
+        row = self.rows.setdefault(host, {'model': None, 'switches': []})
+        if row['model'] != expected:
+            return row['model'], False
+        if row['model'] is not None:
+            row['switches'].append(model)
+        row['model'] = model
+        return model, True
+
+
+HOST = 'http://studio.local:11434'
+
+
+def test_workers_share_the_active_model_of_a_host():
+    store = FakeHostModelStore()
+    first, _ = make_scheduler(store=store)
+    second, _ = make_scheduler(store=store)
+
+    first.update(ready({1: 30, 2: 10}))
+    # The host already serves gemma3 for the second worker too, although llama3 waited longer
+    second.update(ready({1: 30, 2: 60}))
+    assert first.deferred_connection_ids() == [2] and second.deferred_connection_ids() == [2]
+    assert store.rows[HOST] == {'model': 'gemma3', 'switches': []}
+
+    # Both see llama3 waiting long enough; the first to switch wins, the other follows it
+    stale = store.load([HOST])
+    first.update(ready({1: 5, 2: 250}))
+    second.store.load = lambda hosts: stale
+    second.update(ready({1: 5, 2: 250}))
+    assert first.deferred_connection_ids() == [1] and second.deferred_connection_ids() == [1]
+    assert store.rows[HOST] == {'model': 'llama3', 'switches': ['llama3']}
+    assert first.get_status()['hosts'][HOST]['switches'] == 1
+    assert second.get_status()['hosts'][HOST] == {'active_model': 'llama3', 'switches': 0, 'switch_budget_left': 1}
+
+
+def test_switch_budget_is_shared_and_store_outages_fall_back():
+    store = FakeHostModelStore()
+    first, _ = make_scheduler(store=store, switches_per_hour=1)
+    second, _ = make_scheduler(store=store, switches_per_hour=1)
+    first.update(ready({1: 10}))
+    first.update(ready({1: 5, 2: 250}))
+
+    # The first worker used the host's only switch of the hour
+    second.update(ready({1: 900, 2: 5}))
+    assert second.deferred_connection_ids() == [1]
+    assert second.get_status()['hosts'][HOST]['switch_budget_left'] == 0
+
+    store.available = False
+    third, _ = make_scheduler(store=store)
+    third.update(ready({1: 30, 2: 10}))
+    third.record_dispatch(1)
+    assert third.deferred_connection_ids() == [2] and third.get_status()['shared']
+    assert third.get_status()['hosts'][HOST]['active_model'] == 'gemma3'
+
+
+def test_local_configs_keep_models_loaded(monkeypatch):
+    monkeypatch.setenv('LLM_KEEP_ALIVE', '45m')
+    assert format_llm_config_for_rag_api(CONNECTIONS[1])['keep_alive'] == '45m'
+    lmstudio = format_llm_config_for_rag_api({'provider_type': 'lmstudio', 'base_url': 'http://box', 'model_name': 'm'})
+    assert lmstudio['ttl'] == 2700
+    assert 'keep_alive' not in format_llm_config_for_rag_api(CONNECTIONS[4])
+    assert duration_seconds('-1') is None and duration_seconds('90s') == 90
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All model affinity tests passed")
+    sys.exit(exit_code)
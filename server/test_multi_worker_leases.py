@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Multi-process integration test for leased llm_responses claims.
+
+Runs several worker processes against a local PostgreSQL database and a stub
+RAG API, and verifies:
+1. Every row is dispatched exactly once, no matter how many workers compete
+2. Throughput scales with the number of worker processes
+3. Leases of a dead worker expire and are reclaimed by another worker
+4. Rows waiting out a retry backoff are not claimed until it has passed
+
+Requires a scratch PostgreSQL database, e.g.:
+    TEST_KB_DSN="dbname=lease_test user=postgres host=localhost" python test_multi_worker_leases.py
+
+The test works inside a throwaway schema and is skipped when TEST_KB_DSN is not set.
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import threading
+import multiprocessing
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+import pytest
+import requests
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.worker_lease import WorkerLease
+
+TEST_KB_DSN = os.getenv('TEST_KB_DSN')
+STUB_RAG_LATENCY_SECONDS = 0.02
+
+pytestmark = pytest.mark.skipif(not TEST_KB_DSN, reason="TEST_KB_DSN not set - no local PostgreSQL available")
+
+
+def _connect(dsn, schema):
+    return psycopg2.connect(dsn, options=f"-c search_path={schema}")
+
+
+class _StubRagHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the RAG API analyze endpoint"""
+
+    submissions = []
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        time.sleep(STUB_RAG_LATENCY_SECONDS)
+        self.submissions.append(body)
+
+        payload = json.dumps({'task_id': uuid.uuid4().hex}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub_rag_api():
+    _StubRagHandler.submissions = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRagHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _create_schema(schema, rows, batch_id=1):
+    conn = psycopg2.connect(TEST_KB_DSN)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"""
+        CREATE TABLE {schema}.llm_responses (
+            id SERIAL PRIMARY KEY,
+            batch_id INTEGER,
+            document_id INTEGER,
+            prompt_id INTEGER,
+            connection_id INTEGER,
+            connection_details JSONB,
+            connection_snapshot_id INTEGER,
+            status TEXT,
+            task_id TEXT,
+            started_processing_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT NOW(),
+            claimed_by TEXT,
+            lease_expires_at TIMESTAMP,
+            next_attempt_at TIMESTAMP,
+            attempt_count INTEGER DEFAULT 0,
+            rag_endpoint TEXT
+        )
+    """)
+    cursor.execute(f"""
+        INSERT INTO {schema}.llm_responses (batch_id, document_id, prompt_id, connection_id, status)
+        SELECT %s, n, 1, 1, 'QUEUED' FROM generate_series(1, %s) AS n
+    """, (batch_id, rows))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def _drop_schema(schema):
+    conn = psycopg2.connect(TEST_KB_DSN)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def _worker_main(dsn, schema, batch_id, rag_url, results):
+    """Claim rows until the batch is drained, submitting each one to the stub RAG API"""
+    lease = WorkerLease(lease_seconds=30, connect=partial(_connect, dsn, schema))
+    conn = lease.connect()
+    cursor = conn.cursor()
+    session = requests.Session()
+    dispatched = 0
+
+    while True:
+        row = lease.claim_next(cursor, batch_id)
+        conn.commit()
+        if not row:
+            break
+
+        response_id, document_id = row[0], row[1]
+        task_id = session.post(f"{rag_url}/analyze_document_with_llm",
+                               data={'doc_id': document_id}, timeout=10).json()['task_id']
+        cursor.execute("""
+            UPDATE llm_responses
+            SET status = 'COMPLETED', task_id = %s, claimed_by = NULL, lease_expires_at = NULL
+            WHERE id = %s AND claimed_by = %s
+        """, (task_id, response_id, lease.worker_id))
+        conn.commit()
+        dispatched += 1
+
+    cursor.close()
+    conn.close()
+    results.put((lease.worker_id, dispatched))
+
+
+def _run_workers(schema, worker_count, rag_url):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker_main, args=(TEST_KB_DSN, schema, 1, rag_url, results))
+        for _ in range(worker_count)
+    ]
+
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    counts = dict(results.get(timeout=120) for _ in workers)
+    for worker in workers:
+        worker.join(timeout=30)
+    return counts, time.time() - started
+
+
+def test_each_row_dispatched_once_and_throughput_scales():
+    """Competing workers never double-dispatch, and more workers drain faster"""
+    server, rag_url = _start_stub_rag_api()
+    rows = 200
+    elapsed = {}
+
+    try:
+        for worker_count in (1, 4):
+            schema = f"lease_test_{uuid.uuid4().hex[:8]}"
+            _create_schema(schema, rows)
+            try:
+                _StubRagHandler.submissions = []
+                counts, elapsed[worker_count] = _run_workers(schema, worker_count, rag_url)
+
+                assert sum(counts.values()) == rows, counts
+                assert len(_StubRagHandler.submissions) == rows
+
+                conn = _connect(TEST_KB_DSN, schema)
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM llm_responses WHERE status = 'COMPLETED'")
+                assert cursor.fetchone()[0] == rows
+                cursor.close()
+                conn.close()
+            finally:
+                _drop_schema(schema)
+    finally:
+        server.shutdown()
+
+    speedup = elapsed[1] / elapsed[4]
+    print(f"1 worker: {elapsed[1]:.2f}s, 4 workers: {elapsed[4]:.2f}s, speedup {speedup:.1f}x")
+    assert speedup > 2.0, elapsed
+
+
+def test_expired_leases_are_reclaimed():
+    """Rows held by a worker that stops renewing are adopted by another worker"""
+    schema = f"lease_test_{uuid.uuid4().hex[:8]}"
+    _create_schema(schema, 5)
+    connect = partial(_connect, TEST_KB_DSN, schema)
+
+    try:
+        dead = WorkerLease(worker_id='dead-worker', lease_seconds=1, connect=connect)
+        alive = WorkerLease(worker_id='alive-worker', lease_seconds=30, connect=connect)
+
+        # The dead worker claims everything and submits three rows before dying
+        conn = connect()
+        cursor = conn.cursor()
+        claimed = []
+        while True:
+            row = dead.claim_next(cursor, 1)
+            if not row:
+                break
+            claimed.append(row[0])
+        for response_id in claimed[:3]:
+            cursor.execute("""
+                UPDATE llm_responses
+                SET status = 'PROCESSING', task_id = %s, started_processing_at = NOW() - INTERVAL '5 minutes'
+                WHERE id = %s
+            """, (f"task-{response_id}", response_id))
+        conn.commit()
+
+        # Nothing can be taken while the lease is live
+        assert alive.claim_next(cursor, 1) is None
+        conn.commit()
+        assert alive.reclaim_expired(limit=10) == []
+
+        time.sleep(1.5)
+
+        # In-flight rows are adopted with their original start time...
+        adopted = alive.reclaim_expired(limit=10)
+        assert sorted(row['response_id'] for row in adopted) == sorted(claimed[:3])
+        assert all(row['started_processing_at'] is not None for row in adopted)
+
+        # ...queued rows become claimable again...
+        requeued = [alive.claim_next(cursor, 1), alive.claim_next(cursor, 1)]
+        conn.commit()
+        assert sorted(row[0] for row in requeued) == sorted(claimed[3:])
+
+        # ...and the dead worker finds out it lost them on its next heartbeat
+        assert dead.renew(claimed) == []
+        assert sorted(alive.renew(claimed)) == sorted(claimed)
+
+        cursor.close()
+        conn.close()
+    finally:
+        _drop_schema(schema)
+
+
+def test_rows_in_backoff_are_not_claimed():
+    """Retried rows and rows released with a delay wait for next_attempt_at"""
+    schema = f"lease_test_{uuid.uuid4().hex[:8]}"
+    _create_schema(schema, 3)
+    connect = partial(_connect, TEST_KB_DSN, schema)
+
+    try:
+        lease = WorkerLease(worker_id='worker-1', lease_seconds=30, connect=connect)
+        conn = connect()
+        cursor = conn.cursor()
+
+        # Row 1 failed transiently and waits out its backoff; row 2's backoff is over
+        cursor.execute("""
+            UPDATE llm_responses
+            SET attempt_count = 1,
+                next_attempt_at = CASE id WHEN 1 THEN NOW() + INTERVAL '1 hour'
+                                          ELSE NOW() - INTERVAL '1 second' END
+            WHERE id IN (1, 2)
+        """)
+        conn.commit()
+
+        claimed = [lease.claim_next(cursor, 1), lease.claim_next(cursor, 1)]
+        conn.commit()
+        assert sorted(row[0] for row in claimed) == [2, 3]
+        assert lease.claim_next(cursor, 1) is None
+        conn.commit()
+
+        # A row released with a delay is not handed out again right away
+        assert lease.release(3, delay_seconds=60)
+        assert lease.claim_next(cursor, 1) is None
+        conn.commit()
+
+        cursor.execute("UPDATE llm_responses SET next_attempt_at = NOW() - INTERVAL '1 second' WHERE id = 1")
+        conn.commit()
+        assert lease.claim_next(cursor, 1)[0] == 1
+        conn.commit()
+
+        cursor.close()
+        conn.close()
+    finally:
+        _drop_schema(schema)
+
+
+if __name__ == "__main__":
+    if not TEST_KB_DSN:
+        print("TEST_KB_DSN not set - skipping multi-worker lease tests")
+        sys.exit(0)
+    test_each_row_dispatched_once_and_throughput_scales()
+    test_expired_leases_are_reclaimed()
+    test_rows_in_backoff_are_not_claimed()
+    print("✅ All multi-worker lease tests passed")
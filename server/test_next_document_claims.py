@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests for claiming the next document (BatchService.get_next_document_for_processing).
+
+The lease, the KnowledgeDocuments connection and the config lookup are replaced
+with fakes, so the tests verify:
+1. A claim is committed once, together with the document and prompt lookups
+2. Rows whose document is missing are failed in the claiming transaction
+3. Rows whose prompt is missing are failed; the other claimed prompts are still dispatched
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_service as batch_service_module
+from services.batch_service import BatchService
+
+PROMPTS = {1: {'prompt_text': 'Summarize', 'description': 'summary'},
+           2: {'prompt_text': 'Grade', 'description': 'grade'}}
+
+
+def claimed_row(response_id, prompt_id, doc_id=55):
+    return (response_id, doc_id, prompt_id, 7, {'id': 7, 'provider_type': 'ollama'}, None)
+
+
+class FakeLease:
+    worker_id = 'host:1:test'
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def claim_next(self, cursor, batch_id, exclude_connection_ids=None, **kwargs):
+        return self.rows[0] if self.rows else None
+
+    def claim_siblings(self, cursor, response_id, limit):
+        return self.rows[1:1 + limit]
+
+
+class FakeConnection:
+    """KnowledgeDocuments connection recording statements and where each commit happened"""
+
+    def __init__(self, doc_exists=True):
+        self.doc_exists = doc_exists
+        self.executed = []
+        self.commits = []
+        self._result = None
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.executed.append((sql, params))
+        if sql.startswith('SELECT content'):
+            self._result = ('ZW5jb2RlZA==', 'text/plain', 'txt', 7, 'batch_9_doc_3') if self.doc_exists else None
+
+    def fetchone(self):
+        return self._result
+
+    def commit(self):
+        self.commits.append(len(self.executed))
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def failed(self):
+        """(error_message, response_ids) of every committed FAILED update"""
+        last_commit = self.commits[-1] if self.commits else 0
+        return [(params[0], params[1]) for sql, params in self.executed[:last_commit]
+                if sql.startswith("UPDATE llm_responses SET status = 'FAILED'")]
+
+
+class FakeSession:
+    def __init__(self):
+        self.batch = SimpleNamespace(id=9, status='PROCESSING')
+
+    def query(self, model):
+        return self
+
+    def filter_by(self, **kwargs):
+        return self
+
+    def first(self):
+        return self.batch
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def claim(monkeypatch, rows, doc_exists=True, max_prompts=1):
+    kb = FakeConnection(doc_exists)
+    completion_checks = []
+    service = BatchService()
+    monkeypatch.setattr(service, '_check_batch_completion', completion_checks.append)
+    monkeypatch.setattr(batch_service_module, 'Session', FakeSession)
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: kb)
+    monkeypatch.setattr(batch_service_module, 'worker_lease', FakeLease(rows))
+    monkeypatch.setattr(batch_service_module.config_lookup, 'get_prompt', PROMPTS.get)
+    monkeypatch.setattr(batch_service_module.connection_snapshots, 'resolve',
+                        lambda snapshot_id, details, cursor=None: details)
+    result = service.get_next_document_for_processing(9, max_prompts=max_prompts)
+    return result, kb, completion_checks
+
+
+def test_claim_commits_once_with_the_lookups(monkeypatch):
+    result, kb, completion_checks = claim(monkeypatch, [claimed_row(101, 1), claimed_row(102, 2)], max_prompts=2)
+
+    assert result['response_ids'] == [101, 102] and result['prompt']['text'] == 'Summarize'
+    assert len(kb.commits) == 1 and kb.commits[0] == len(kb.executed)
+    assert kb.failed() == [] and completion_checks == []
+
+
+def test_missing_document_fails_every_claimed_row(monkeypatch):
+    result, kb, completion_checks = claim(monkeypatch, [claimed_row(101, 1), claimed_row(102, 2)],
+                                          doc_exists=False, max_prompts=2)
+
+    assert result is None
+    assert kb.failed() == [('Document 55 not found', [101, 102])]
+    # Failing the last open rows may finish the batch
+    assert completion_checks == [9]
+
+
+def test_missing_prompt_fails_only_its_row(monkeypatch):
+    result, kb, _ = claim(monkeypatch, [claimed_row(101, 99), claimed_row(102, 2)], max_prompts=2)
+
+    assert kb.failed() == [('Prompt 99 not found', [101])]
+    # The remaining prompt is dispatched in its place
+    assert result['response_id'] == 102 and result['response_ids'] == [102]
+    assert result['prompt'] == {'id': 2, 'text': 'Grade', 'description': 'grade'}
+
+    result, kb, completion_checks = claim(monkeypatch, [claimed_row(101, 99)])
+    assert result is None and kb.failed() == [('Prompt 99 not found', [101])]
+    assert completion_checks == [9]
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All next document claim tests passed")
+    sys.exit(exit_code)
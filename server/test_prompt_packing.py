@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for multi-prompt packing in the batch queue processor.
+
+The RAG API and BatchService are replaced with fakes (conftest.py) so the tests verify:
+1. All prompts claimed for a document and connection are sent in one request
+2. Every claimed row is marked PROCESSING under the shared task id
+3. Per-prompt results are written to their own rows with their own metrics
+4. Task totals are split evenly when the RAG API reports no per-prompt metrics
+5. Rows left without a result are re-queued
+6. Packing is off unless PROMPTS_PER_REQUEST opts in
+"""
+
+import sys
+import os
+import json
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.batch_queue_processor import BatchQueueProcessor, split_prompt_results
+
+
+PROMPTS = [{'response_id': 100 + i, 'id': i, 'text': f'prompt {i}', 'description': ''} for i in range(1, 4)]
+
+DOC_INFO = {
+    'response_id': 101,
+    'response_ids': [p['response_id'] for p in PROMPTS],
+    'document_id': 'batch_1_doc_5',
+    'prompt': PROMPTS[0],
+    'prompts': PROMPTS,
+    'llm_config': {'provider_type': 'ollama'},
+    'connection_id': 7
+}
+
+
+def test_prompts_of_a_document_are_sent_in_one_request(make_processor):
+    processor, fake_service, posted = make_processor(DOC_INFO, max_prompts_per_request=8)
+
+    assert processor._dispatch_next_document(1)
+
+    assert fake_service.claims[0]['max_prompts'] == 8
+    assert len(posted) == 1
+    assert json.loads(posted[0][1]['prompts']) == [{'prompt': 'prompt 1'}, {'prompt': 'prompt 2'}, {'prompt': 'prompt 3'}]
+    assert fake_service.task_updates == [([101, 102, 103], 'task-1', 'PROCESSING')]
+    assert processor.active_tasks['task-1']['doc_ids'] == [101, 102, 103]
+
+
+def test_packing_is_opt_in(monkeypatch):
+    monkeypatch.delenv('PROMPTS_PER_REQUEST', raising=False)
+    assert BatchQueueProcessor().max_prompts_per_request == 1
+
+    monkeypatch.setenv('PROMPTS_PER_REQUEST', '4')
+    assert BatchQueueProcessor().max_prompts_per_request == 4
+
+
+def test_split_uses_per_prompt_metrics():
+    status = {
+        'input_tokens': 999, 'output_tokens': 999,
+        'results': [
+            {'response_text': 'a', 'input_tokens': 10, 'output_tokens': 3, 'time_taken_seconds': 1.5},
+            {'response': 'b', 'input_tokens': 12, 'output_tokens': 4, 'time_taken_seconds': 0.5, 'score': 80},
+        ]
+    }
+    results, missing = split_prompt_results(status, [101, 102])
+    assert missing == []
+    assert [(r['response_id'], r['response_text'], r['input_tokens'], r['response_time_ms']) for r in results] == [
+        (101, 'a', 10, 1500), (102, 'b', 12, 500)
+    ]
+    assert results[1]['overall_score'] == 80
+
+
+def test_split_divides_task_totals_and_reports_missing_rows():
+    status = {
+        'input_tokens': 300, 'output_tokens': 60, 'response_time_ms': 9000,
+        'results': [{'response_text': 'a'}, {'response_text': 'b'}]
+    }
+    results, missing = split_prompt_results(status, [101, 102, 103])
+    assert [r['input_tokens'] for r in results] == [150, 150]
+    assert [r['output_tokens'] for r in results] == [30, 30]
+    assert [r['response_time_ms'] for r in results] == [4500, 4500]
+    assert missing == [103]
+
+
+def test_packed_completion_writes_rows_and_requeues_missing(monkeypatch, make_processor):
+    processor, fake_service, _ = make_processor(DOC_INFO, max_prompts_per_request=8)
+    processor._dispatch_next_document(1)
+    monkeypatch.setattr(processor, '_check_task_status', lambda task_id: {
+        'completed': True, 'success': True, 'input_tokens': 40, 'output_tokens': 0, 'response_time_ms': 0,
+        'results': [{'response_text': 'one'}, {'response_text': 'two'}]
+    })
+
+    processor._check_active_tasks()
+
+    task_id, result_data = fake_service.completions[0]
+    assert task_id == 'task-1'
+    assert [(r['response_id'], r['response_text'], r['input_tokens']) for r in result_data['prompt_results']] == [
+        (101, 'one', 20), (102, 'two', 20)
+    ]
+    assert fake_service.failures[0][1]['doc_ids'] == [103]
+    assert processor.stats['processed'] == 2
+    assert 'task-1' not in processor.active_tasks
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All prompt packing tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Tests for offline provider batch submission (services/provider_batches.py).
+
+A local stand-in server implements the OpenAI batch file contract (/v1/files,
+/v1/batches, /v1/files/<id>/content) and answers every request of a file at
+once, so the tests verify:
+1. Requests are split into files by request count and byte size
+2. Batch lines are built by the provider adapter, without streaming options
+3. Files round-trip through upload, batch creation, polling and download
+4. Output and error lines are mapped back to llm_responses ids
+5. Results are bulk-loaded with COPY (NULL and empty text kept apart)
+6. The queue processor leaves provider batch connections of a batch alone
+"""
+
+import io
+import sys
+import os
+import csv
+import json
+import uuid
+import threading
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask, request, jsonify, Response
+from werkzeug.serving import make_server
+
+import services.batch_queue_processor as processor_module
+from services.batch_queue_processor import BatchQueueProcessor
+from services.circuit_breakers import CircuitBreakerRegistry
+from services.model_affinity import ModelAffinityScheduler
+from services.providers.openai_provider import OpenAIProvider
+from services.provider_batches import (
+    BatchAPIClient, batch_request, split_batch_files, parse_batch_output, ingest_results
+)
+
+
+def create_stand_in_app():
+    """Minimal provider batch API that completes each batch as soon as it is created"""
+    app = Flask(__name__)
+    files, batches = {}, {}
+
+    @app.route('/v1/files', methods=['POST'])
+    def upload_file():
+        if request.form.get('purpose') != 'batch' or 'file' not in request.files:
+            return jsonify({'error': {'message': 'purpose=batch and file are required'}}), 400
+        file_id = f"file-{uuid.uuid4().hex[:8]}"
+        files[file_id] = request.files['file'].read()
+        return jsonify({'id': file_id, 'object': 'file', 'bytes': len(files[file_id]), 'purpose': 'batch'})
+
+    @app.route('/v1/batches', methods=['POST'])
+    def create_batch():
+        data = request.get_json()
+        output, errors = [], []
+        for line in files[data['input_file_id']].splitlines():
+            item = json.loads(line)
+            assert item['url'] == data['endpoint']
+            body = item['body']
+            if body['model'] == 'missing-model':
+                errors.append({'custom_id': item['custom_id'], 'response': {
+                    'status_code': 404, 'body': {'error': {'message': 'The model does not exist'}}}, 'error': None})
+                continue
+            answer = f"Answer to: {body['messages'][-1]['content']}"
+            output.append({'custom_id': item['custom_id'], 'error': None, 'response': {'status_code': 200, 'body': {
+                'choices': [{'message': {'role': 'assistant', 'content': answer}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 50, 'completion_tokens': 7,
+                          'prompt_tokens_details': {'cached_tokens': 32}}}}})
+
+        batch = {'id': f"batch_{uuid.uuid4().hex[:8]}", 'status': 'validating', 'endpoint': data['endpoint'],
+                 'metadata': data.get('metadata'),
+                 'request_counts': {'total': len(output) + len(errors), 'completed': len(output),
+                                    'failed': len(errors)}}
+        for name, lines in (('output_file_id', output), ('error_file_id', errors)):
+            file_id = None
+            if lines:
+                file_id = f"file-{uuid.uuid4().hex[:8]}"
+                files[file_id] = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+            batch[name] = file_id
+        batches[batch['id']] = batch
+        return jsonify(batch)
+
+    @app.route('/v1/batches/<batch_id>', methods=['GET'])
+    def get_batch(batch_id):
+        batches[batch_id]['status'] = 'completed'
+        return jsonify(batches[batch_id])
+
+    @app.route('/v1/files/<file_id>/content', methods=['GET'])
+    def download_file(file_id):
+        return Response(files[file_id], mimetype='application/jsonl')
+
+    return app
+
+
+@pytest.fixture
+def stand_in_server():
+    server = make_server('127.0.0.1', 0, create_stand_in_app())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v1"
+    finally:
+        server.shutdown()
+
+
+def line_entries(count, text='x'):
+    return [(str(100 + i), '/v1/chat/completions', {'model': 'gpt-4o-mini', 'messages': [{'content': text}]})
+            for i in range(count)]
+
+
+def test_batch_files_respect_request_and_size_limits():
+    files = split_batch_files(line_entries(5), max_requests=2, max_bytes=10_000)
+    assert [len(f) for f in files] == [2, 2, 1]
+    assert [f.custom_ids for f in files][0] == ['100', '101']
+
+    line_size = len(split_batch_files(line_entries(1), 10, 10_000)[0].content)
+    files = split_batch_files(line_entries(5), max_requests=100, max_bytes=line_size * 2 + 1)
+    assert [len(f) for f in files] == [2, 2, 1]
+    assert all(f.size <= line_size * 2 + 1 and f.size == len(f.content) for f in files)
+
+    with pytest.raises(ValueError):
+        split_batch_files(line_entries(1, text='x' * 500), max_requests=10, max_bytes=100)
+
+
+def test_batch_lines_are_built_by_the_provider_adapter():
+    config = {'provider_type': 'openai', 'base_url': 'http://127.0.0.1:9999/v1', 'model_name': 'gpt-4o-mini',
+              'api_key': 'sk-test'}
+    url, body = batch_request(OpenAIProvider(), config, [{'role': 'user', 'content': 'Summarize'}],
+                              {'prompt_cache_key': 'doc-1:7'})
+    assert url == '/v1/chat/completions'
+    assert 'stream' not in body and 'stream_options' not in body
+    assert body['model'] == 'gpt-4o-mini' and body['prompt_cache_key'] == 'doc-1:7'
+
+
+def test_round_trip_against_stand_in_batch_server(stand_in_server):
+    entries = [
+        ('101', '/v1/chat/completions', {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'one'}]}),
+        ('102', '/v1/chat/completions', {'model': 'missing-model', 'messages': [{'role': 'user', 'content': 'two'}]}),
+        ('103', '/v1/chat/completions', {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': 'three'}]}),
+    ]
+    batch_file = split_batch_files(entries, max_requests=100, max_bytes=1_000_000)[0]
+    client = BatchAPIClient(stand_in_server, api_key='sk-test')
+
+    file_id = client.upload_file(batch_file.content, 'batch-1.jsonl')
+    created = client.create_batch(file_id, '/v1/chat/completions', '24h', {'batch_id': '1'})
+    assert created['status'] == 'validating' and created['metadata'] == {'batch_id': '1'}
+
+    polled = client.get_batch(created['id'])
+    assert polled['status'] == 'completed'
+    assert polled['request_counts'] == {'total': 3, 'completed': 2, 'failed': 1}
+
+    adapter = OpenAIProvider()
+    results = parse_batch_output(client.download_file(polled['output_file_id']), adapter)
+    results.update(parse_batch_output(client.download_file(polled['error_file_id']), adapter))
+
+    assert results[101]['success'] and results[101]['response_text'] == 'Answer to: one'
+    assert (results[103]['input_tokens'], results[103]['output_tokens'], results[103]['cached_tokens']) == (50, 7, 32)
+    assert not results[102]['success']
+    assert results[102]['status_code'] == 404 and 'does not exist' in results[102]['error']
+
+
+class FakeCursor:
+    def __init__(self):
+        self.statements = []
+        self.copied = None
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+        if sql.strip().startswith('UPDATE'):
+            self.rowcount = len(self.copied)
+
+    def copy_expert(self, sql, file):
+        self.statements.append((' '.join(sql.split()), None))
+        self.copied = list(csv.reader(io.StringIO(file.read())))
+
+
+def test_results_are_ingested_with_copy():
+    cursor = FakeCursor()
+    results = {
+        102: {'success': True, 'response_text': '', 'input_tokens': 10, 'output_tokens': 0,
+              'cached_tokens': None, 'raw_result': {}},
+        101: {'success': True, 'response_text': 'He said "yes", then left.\nDone', 'input_tokens': 50,
+              'output_tokens': 7, 'cached_tokens': 32, 'raw_result': {'id': 'chatcmpl-1'}},
+        103: {'success': False, 'status_code': 404, 'error': 'The model does not exist'},
+    }
+
+    assert ingest_results(cursor, 'provider-batch-job-1', results) == 2
+
+    assert cursor.copied == [
+        ['101', 'He said "yes", then left.\nDone', '{"id": "chatcmpl-1"}', '50', '7', '32'],
+        ['102', '', '{}', '10', '0', ''],
+    ]
+    create, copy, update = cursor.statements
+    assert create[0].startswith('CREATE TEMP TABLE provider_batch_results') and 'ON COMMIT DROP' in create[0]
+    assert copy[0].startswith('COPY provider_batch_results') and 'FORMAT csv' in copy[0]
+    assert "r.task_id = %s AND r.status = 'PROCESSING'" in update[0] and update[1] == ('provider-batch-job-1',)
+
+    # Nothing succeeded - nothing to load
+    assert ingest_results(FakeCursor(), 'provider-batch-job-2', {103: results[103]}) == 0
+
+
+def test_processor_leaves_provider_batch_connections_alone(monkeypatch):
+    requested = {}
+
+    class FakeBatchService:
+        def get_batches_ready_for_processing(self):
+            return [{'batch_id': 1, 'priority': 0, 'queued_count': 4, 'queued_by_connection': {},
+                     'execution_mode': 'provider_batch', 'provider_batch_connection_ids': [7]}]
+
+        def get_next_document_for_processing(self, batch_id, exclude_connection_ids=None, **kwargs):
+            requested['exclude'] = exclude_connection_ids
+            return None
+
+    monkeypatch.setattr(processor_module, 'batch_service', FakeBatchService())
+    processor = BatchQueueProcessor()
+    processor.breakers = CircuitBreakerRegistry()
+    processor.affinity = ModelAffinityScheduler(lookup=lambda connection_id: None)
+
+    processor._monitor_batches()
+    assert requested['exclude'] == [7]
+
+
+if __name__ == "__main__":
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All provider batch tests passed")
+    sys.exit(exit_code)
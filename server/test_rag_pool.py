@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests for the RAG endpoint pool (services/rag_pool.py).
+
+The pool runs on its own service configuration and circuit breakers, with the
+rag_endpoints table replaced by an in-memory list, so the tests verify:
+1. New tasks go to the instance with the fewest outstanding requests
+2. Instances added or drained at runtime are picked up on the next refresh
+3. A removed instance stays until the tasks pinned to it are finished
+4. An instance with an open circuit takes no new tasks
+5. The queue processor polls a task on the instance that accepted it
+"""
+
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_queue_processor as processor_module
+from services.batch_queue_processor import BatchQueueProcessor
+from services.circuit_breakers import CircuitBreakerRegistry, rag_endpoint_key
+from services.config import ServiceConfigManager
+from services.rag_pool import RagEndpointPool
+
+RAG_1 = 'http://localhost:7001'
+RAG_2 = 'http://rag2.local:7001'
+RAG_3 = 'http://rag3.local:7001'
+
+
+def make_pool(endpoints):
+    """Pool over the configured rag_api (RAG_1) plus the given runtime endpoints"""
+    config = ServiceConfigManager()
+    config.services['rag_api'].base_url, config.services['rag_api'].port = RAG_1, None
+    config.services['rag_api'].enabled = True
+    breakers = CircuitBreakerRegistry(failure_threshold=3, recovery_timeout=60)
+    pool = RagEndpointPool(config=config, breakers=breakers, refresh_seconds=0,
+                           load_endpoints=lambda: list(endpoints))
+    return pool, breakers
+
+
+def test_least_outstanding_instance_takes_the_next_task():
+    pool, _ = make_pool([('rag_2', RAG_2, 'ACTIVE')])
+
+    first, second = pool.acquire(), pool.acquire()
+    assert {first, second} == {RAG_1, RAG_2}
+    pool.pin('task-1', first)
+    pool.pin('task-2', second)
+
+    # task-1 finishes: its instance is the least loaded one again
+    pool.release('task-1')
+    assert pool.acquire() == first
+    assert {i['url']: i['outstanding'] for i in pool.get_status()['instances']} == {RAG_1: 1, RAG_2: 1}
+
+
+def test_instances_join_and_drain_at_runtime():
+    endpoints = []
+    pool, _ = make_pool(endpoints)
+    assert [i['url'] for i in pool.get_status()['instances']] == [RAG_1]
+
+    endpoints.append(('rag_2', RAG_2, 'ACTIVE'))
+    pool.refresh()
+    assert [i['url'] for i in pool.get_status()['instances']] == [RAG_1, RAG_2]
+    # Runtime instances are health-checked like configured ones
+    assert pool.config.get_service('rag_2').full_url == RAG_2
+
+    # A draining instance takes no new tasks, but its pinned tasks are still polled there
+    pool.adopt('task-2', RAG_2)
+    endpoints[0] = ('rag_2', RAG_2, 'DRAINING')
+    assert all(pool.acquire() == RAG_1 for _ in range(3))
+    assert pool.url_for_task('task-2') == RAG_2
+
+
+def test_removed_instance_stays_until_its_tasks_finish():
+    endpoints = [('rag_2', RAG_2, 'ACTIVE'), ('rag_3', RAG_3, 'ACTIVE')]
+    pool, _ = make_pool(endpoints)
+    pool.adopt('task-3', RAG_3)
+
+    endpoints[1] = ('rag_3', RAG_3, 'REMOVED')
+    pool.refresh()
+    status = {i['url']: i for i in pool.get_status()['instances']}
+    assert status[RAG_3]['status'] == 'REMOVED' and status[RAG_3]['outstanding'] == 1
+    assert RAG_3 not in {pool.acquire() for _ in range(4)}
+    assert pool.url_for_task('task-3') == RAG_3
+
+    pool.release('task-3')
+    pool.refresh()
+    assert RAG_3 not in [i['url'] for i in pool.get_status()['instances']]
+
+    # Rows from before the pool existed belong to the primary instance
+    assert pool.adopt('task-old', None) == RAG_1
+
+
+def test_open_circuit_takes_an_instance_out_of_rotation():
+    pool, breakers = make_pool([('rag_2', RAG_2, 'ACTIVE')])
+    for _ in range(3):
+        pool.record_failure(RAG_2)
+    assert breakers.is_blocking(rag_endpoint_key(RAG_2))
+
+    assert all(pool.acquire() == RAG_1 for _ in range(3))
+    for _ in range(3):
+        pool.record_failure(RAG_1)
+    assert not pool.available() and pool.acquire() is None
+    assert 0 < pool.retry_after() <= 60
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {'status': 'processing'}
+
+
+def test_processor_polls_the_instance_that_owns_the_task(monkeypatch):
+    pool, _ = make_pool([('rag_2', RAG_2, 'ACTIVE')])
+    polled = []
+
+    def fake_get(url, timeout=None):
+        polled.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(processor_module.requests, 'get', fake_get)
+    processor = BatchQueueProcessor()
+    processor.rag_pool = pool
+    pool.pin('task-a', RAG_2)
+
+    assert processor._check_task_status('task-a') == {'completed': False, 'status': 'processing'}
+    assert processor._check_task_status('task-unknown')['completed'] is False
+    assert polled == [f"{RAG_2}/task_status/task-a", f"{RAG_1}/task_status/task-unknown"]
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All RAG endpoint pool tests passed")
+    sys.exit(exit_code)
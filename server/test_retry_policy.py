@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the llm_responses retry policy (services/retry_policy.py).
+
+Verifies:
+1. Failures are classified as transient, rate limited or permanent
+2. Backoff grows exponentially, is jittered and capped
+3. Permanent failures, exhausted rows and exhausted batches are not retried
+4. Batch budget usage is cached and counted locally between reloads
+"""
+
+import sys
+import os
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.retry_policy import RetryPolicy, TRANSIENT, RATE_LIMITED, PERMANENT
+
+
+def test_classification():
+    policy = RetryPolicy()
+    assert policy.classify({'error': 'Task not found on RAG API (404)', 'status_code': 404}) == TRANSIENT
+    assert policy.classify({'error': "model 'llama9' not found, try pulling it first", 'status_code': 404}) == PERMANENT
+    assert policy.classify({'error': 'RAG API error (503): Service Unavailable', 'status_code': 503}) == TRANSIENT
+    assert policy.classify({'error': 'Task processing timeout', 'failure_class': TRANSIENT}) == TRANSIENT
+    assert policy.classify({'error': 'Read timed out'}) == TRANSIENT
+    assert policy.classify({'error': 'Rate limit reached for requests'}) == RATE_LIMITED
+    assert policy.classify({'error': 'failed', 'status_code': 429}) == RATE_LIMITED
+    assert policy.classify({'error': 'Invalid API key provided', 'status_code': 401}) == PERMANENT
+    assert policy.classify({'error': "This model's maximum context length is 8192 tokens"}) == PERMANENT
+    assert policy.classify({'error': 'Task failed'}) == PERMANENT
+
+
+def test_backoff_is_exponential_jittered_and_capped():
+    policy = RetryPolicy(base_delay=10, max_delay=100, rate_limit_delay=60)
+    for attempt in range(1, 8):
+        delays = [policy.backoff_seconds(attempt) for _ in range(200)]
+        assert min(delays) >= 5
+        assert max(delays) <= min(100, 10 * 2 ** (attempt - 1))
+    # Jitter spreads retries out
+    assert len({round(policy.backoff_seconds(4), 3) for _ in range(20)}) > 1
+    # Rate limits wait longer
+    assert min(policy.backoff_seconds(1, RATE_LIMITED) for _ in range(50)) >= 30
+
+
+def test_retry_decisions():
+    policy = RetryPolicy(max_attempts=3, budget_ratio=0.1, min_budget=5)
+
+    assert policy.decide(TRANSIENT, 0, 0, 100)['retry'] is True
+    assert policy.decide(RATE_LIMITED, 1, 0, 100)['retry'] is True
+    assert policy.decide(PERMANENT, 0, 0, 100)['retry'] is False
+
+    exhausted_row = policy.decide(TRANSIENT, 2, 0, 100)
+    assert exhausted_row['retry'] is False and 'attempts' in exhausted_row['reason']
+
+    # Budget is max(min_budget, 10% of 1000) = 100 retries
+    assert policy.decide(TRANSIENT, 0, 99, 1000)['retry'] is True
+    exhausted_batch = policy.decide(TRANSIENT, 0, 100, 1000)
+    assert exhausted_batch['retry'] is False and 'budget' in exhausted_batch['reason']
+    # Small batches still get min_budget
+    assert policy.batch_budget(3) == 5
+
+
+def test_batch_usage_is_cached_between_reloads():
+    now = [0.0]
+    policy = RetryPolicy(budget_refresh_seconds=60, clock=lambda: now[0])
+    loads = []
+
+    def load():
+        loads.append(now[0])
+        return 7, 100
+
+    assert policy.batch_usage(1, load) == (7, 100)
+    policy.record_retry(1)
+    policy.record_retry(1)
+    now[0] = 30
+    assert policy.batch_usage(1, load) == (9, 100)
+    assert loads == [0.0]
+
+    # Reloaded once stale, picking up the database count again
+    now[0] = 61
+    assert policy.batch_usage(1, load) == (7, 100)
+    assert loads == [0.0, 61]
+
+
+if __name__ == "__main__":
+    test_classification()
+    test_backoff_is_exponential_jittered_and_capped()
+    test_retry_decisions()
+    test_batch_usage_is_cached_between_reloads()
+    print("✅ All retry policy tests passed")
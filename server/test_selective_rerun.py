@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Tests for selective batch reruns (BatchService.selective_rerun_batch).
+
+The KnowledgeDocuments cursor is replaced with an in-memory fake so the tests verify:
+1. Files not modified since staging are skipped without being read
+2. Edited files are detected by content hash and their staged copy refreshed
+3. Rows staged before content_hash existed are compared via their stored content
+4. Only finished statuses can be rerun
+5. Requeued rows keep nothing from their previous run
+"""
+
+import re
+import sys
+import os
+import base64
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_service as batch_service_module
+from services.batch_service import BatchService
+
+
+class FakeCursor:
+    """Answers the docs queries made by _find_changed_documents"""
+
+    def __init__(self, docs):
+        self.docs = docs  # kb id -> dict(document_id, content, content_hash, created_at)
+        self.executed = []
+        self._result = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((' '.join(sql.split()), params))
+        if sql.strip().startswith('SELECT id, document_id'):
+            self._result = [(kb_id, d['document_id'], d['content_hash'], d['created_at'])
+                            for kb_id, d in self.docs.items() if d['document_id'] in params[0]]
+        elif sql.strip().startswith('SELECT content'):
+            self._result = [(self.docs[params[0]]['content'],)]
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    def updates(self):
+        return [params for sql, params in self.executed if sql.startswith('UPDATE docs')]
+
+
+def make_document(directory, doc_id, content):
+    path = os.path.join(directory, f"doc{doc_id}.txt")
+    with open(path, 'wb') as f:
+        f.write(content)
+    return SimpleNamespace(id=doc_id, filepath=path, filename=os.path.basename(path))
+
+
+def staged(document_id, content, with_hash=True, staged_at=None):
+    return {
+        'document_id': document_id,
+        'content': base64.b64encode(content).decode('utf-8'),
+        'content_hash': hashlib.sha256(content).hexdigest() if with_hash else None,
+        'created_at': staged_at or datetime.now() - timedelta(hours=1)
+    }
+
+
+def test_unmodified_files_are_not_read():
+    with tempfile.TemporaryDirectory() as directory:
+        doc = make_document(directory, 1, b'original')
+        cursor = FakeCursor({10: staged('batch_5_doc_1', b'something else', staged_at=datetime.now() + timedelta(hours=1))})
+
+        changed = BatchService()._find_changed_documents(cursor, 5, [doc], refresh=True)
+
+        # Staged after the file's mtime - trusted without hashing, even though the content differs
+        assert changed == {}
+        assert cursor.updates() == []
+
+
+def test_edited_file_is_detected_and_refreshed():
+    with tempfile.TemporaryDirectory() as directory:
+        edited = make_document(directory, 1, b'edited content')
+        touched = make_document(directory, 2, b'same content')
+        cursor = FakeCursor({
+            10: staged('batch_5_doc_1', b'original content'),
+            11: staged('batch_5_doc_2', b'same content'),
+        })
+
+        changed = BatchService()._find_changed_documents(cursor, 5, [edited, touched], refresh=True)
+
+        assert list(changed) == [10]
+        assert changed[10]['content_hash'] == hashlib.sha256(b'edited content').hexdigest()
+        updates = cursor.updates()
+        assert len(updates) == 1
+        assert updates[0][2] == changed[10]['content_hash'] and updates[0][3] == 10
+
+
+def test_dry_run_does_not_write():
+    with tempfile.TemporaryDirectory() as directory:
+        doc = make_document(directory, 1, b'edited content')
+        cursor = FakeCursor({10: staged('batch_5_doc_1', b'original content')})
+
+        changed = BatchService()._find_changed_documents(cursor, 5, [doc], refresh=False)
+
+        assert list(changed) == [10]
+        assert cursor.updates() == []
+
+
+def test_legacy_rows_are_compared_by_stored_content():
+    with tempfile.TemporaryDirectory() as directory:
+        doc = make_document(directory, 1, b'same content')
+        cursor = FakeCursor({10: staged('batch_5_doc_1', b'same content', with_hash=False)})
+
+        changed = BatchService()._find_changed_documents(cursor, 5, [doc], refresh=True)
+
+        assert changed == {}
+        # Missing hash is backfilled
+        assert cursor.updates() == [(hashlib.sha256(b'same content').hexdigest(), 10)]
+
+
+def test_only_finished_statuses_can_be_rerun():
+    result = BatchService().selective_rerun_batch(5, statuses=['failed', 'PROCESSING'], dry_run=True)
+    assert result['success'] is False
+    assert 'PROCESSING' in result['error']
+
+
+class RecordingConnection:
+    """KnowledgeDocuments connection recording statements; the rerun's SELECTs see one finished row"""
+
+    def __init__(self):
+        self.executed = []
+        self.rowcount = 1
+        self._result = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.executed.append(sql)
+        if sql.startswith('SELECT status, connection_id'):
+            self._result = [('COMPLETED', 3, 1, 1, 100, 50)]
+        elif sql.startswith('SELECT COUNT(*)'):
+            self._result = [(1,)]
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def assigned_columns(self, prefix):
+        sql = next(sql for sql in self.executed if sql.startswith(prefix))
+        assignments = sql.split(' SET ', 1)[1].split(' WHERE ', 1)[0]
+        return dict(re.findall(r'(\w+) = ([^,]+)', assignments))
+
+
+class FakeSession:
+    def __init__(self, batch):
+        self.batch = batch
+
+    def query(self, model):
+        return self
+
+    def filter(self, *conditions):
+        return self
+
+    def first(self):
+        return self.batch
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_requeued_rows_are_reset_completely(monkeypatch):
+    service = BatchService()
+    monkeypatch.setattr(service, '_check_batch_completion', lambda batch_id: None)
+
+    # Columns a finished row carries: written on completion, by partial output flushes and at dispatch
+    written = RecordingConnection()
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: written)
+    service.handle_task_completion('task-1', {'batch_id': 5, 'response_text': 'answer'})
+    result_columns = set(written.assigned_columns('UPDATE llm_responses')) | {'partial_output_at', 'rag_endpoint'}
+
+    batch = SimpleNamespace(id=5, status='COMPLETED', completed_at=datetime.now())
+    rerun = RecordingConnection()
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: rerun)
+    monkeypatch.setattr(batch_service_module, 'Session', lambda: FakeSession(batch))
+    result = service.selective_rerun_batch(5, statuses=['COMPLETED'])
+
+    assert result['success'] and result['calls'] == 1 and batch.status == 'STAGED'
+    reset = rerun.assigned_columns('UPDATE llm_responses')
+    assert reset['status'] == "'QUEUED'" and reset['attempt_count'] == '0'
+    leftover = {column for column in result_columns - {'status'} if reset.get(column) != 'NULL'}
+    assert leftover == set()
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All selective rerun tests passed")
+    sys.exit(exit_code)
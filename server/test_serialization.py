@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the serializer layer (utils/serialization.py).
+
+Covers:
+1. Stored response_json is embedded verbatim instead of re-parsed
+2. JSON output matches what Flask's default provider produced for dates etc.
+3. Cache values round-trip through msgpack/pickle and legacy JSON entries still decode
+"""
+
+import sys
+import os
+import json
+import decimal
+from datetime import datetime, date
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+
+from utils.serialization import (
+    RawJSON, json_passthrough, dumps_json, loads_json,
+    pack_cache_value, unpack_cache_value, install_json_provider
+)
+
+
+def test_json_passthrough_embeds_stored_json():
+    """JSON object/array text becomes RawJSON and is emitted unchanged"""
+    stored = '{"overall_score": 87, "sections": [{"name": "a", "score": 9}]}'
+    payload = {'responses': [{'id': 1, 'response_json': json_passthrough(stored)}]}
+
+    data = dumps_json(payload)
+
+    assert json.loads(data) == {'responses': [{'id': 1, 'response_json': json.loads(stored)}]}
+    assert stored.encode() in data
+
+
+def test_json_passthrough_rejects_non_json_text():
+    """Plain text and empty values map to None like the old json.loads fallback"""
+    assert json_passthrough(None) is None
+    assert json_passthrough('') is None
+    assert json_passthrough('not json') is None
+    assert json_passthrough({'a': 1}) == {'a': 1}
+    assert json_passthrough(' [1, 2] ') == RawJSON('[1, 2]')
+
+
+def test_json_passthrough_rejects_malformed_json():
+    """Text that only looks like JSON is never embedded verbatim into a response"""
+    assert json_passthrough('{"score": 87, }') is None
+    assert json_passthrough('{not json}') is None
+    assert json_passthrough('[1, 2], "x": [3]') is None
+    assert json.loads(dumps_json({'response_json': json_passthrough('{"a": 1}]')})) == {'response_json': None}
+
+
+def test_dumps_json_matches_flask_defaults():
+    """Dates use the HTTP date format and Decimals become strings, as with stdlib jsonify"""
+    when = datetime(2024, 5, 1, 12, 30)
+    data = loads_json(dumps_json({'when': when, 'amount': decimal.Decimal('1.50'), 2: 'int key'}))
+
+    assert data == {'when': 'Wed, 01 May 2024 12:30:00 GMT', 'amount': '1.50', '2': 'int key'}
+
+
+def test_jsonify_uses_fast_provider():
+    """jsonify output is compact JSON with RawJSON spliced in"""
+    app = Flask(__name__)
+    install_json_provider(app)
+
+    with app.app_context():
+        response = jsonify({'success': True, 'response_json': RawJSON('{"x":1}')})
+
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == {'success': True, 'response_json': {'x': 1}}
+
+
+def test_cache_values_round_trip():
+    """msgpack-able values, datetimes and arbitrary objects survive the cache encoding"""
+    values = [
+        {'batch_id': 1, 'scores': [1.5, 2.5], 'name': 'Batch'},
+        {'created_at': datetime(2024, 5, 1, 12, 30), 'day': date(2024, 5, 1)},
+        {1: 'int keys'},
+        decimal.Decimal('3.14'),
+    ]
+    for value in values:
+        assert unpack_cache_value(pack_cache_value(value)) == value
+
+
+def test_legacy_cache_entries_still_decode():
+    """Entries written before the serializer layer (plain JSON bytes) are readable"""
+    assert unpack_cache_value(json.dumps({'a': [1, 2]}).encode()) == {'a': [1, 2]}
+    assert unpack_cache_value(b'') is None
+
+
+if __name__ == "__main__":
+    test_json_passthrough_embeds_stored_json()
+    test_json_passthrough_rejects_non_json_text()
+    test_json_passthrough_rejects_malformed_json()
+    test_dumps_json_matches_flask_defaults()
+    test_jsonify_uses_fast_provider()
+    test_cache_values_round_trip()
+    test_legacy_cache_entries_still_decode()
+    print("✅ All serialization tests passed")
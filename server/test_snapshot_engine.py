@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Tests for the snapshot engine (services/snapshot_engine.py).
+
+pg_dump/pg_restore and the database connections are replaced with fakes so the
+tests verify:
+1. Dumps use the directory format with parallel jobs and built-in compression
+2. Full snapshots cover both databases, quick snapshots only doc_eval
+3. Progress is reported from bytes written
+4. Incremental exports stream changed rows through a compressor with a watermark
+5. Restoring an incremental snapshot restores its full base and applies each increment
+"""
+
+import sys
+import os
+import io
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.snapshot_engine import (
+    SnapshotEngine, SnapshotError, CountingWriter, open_compressed_writer, open_compressed_reader,
+    read_manifest, compressed_suffix, CHANGES_DIR
+)
+
+WATERMARK = datetime(2026, 1, 2, 3, 4, 5)
+
+
+class FakeProcess:
+    """Stands in for pg_dump/pg_restore: a dump writes a few table files into --file"""
+
+    commands = []
+
+    def __init__(self, cmd, stdout=None, stderr=None, env=None):
+        FakeProcess.commands.append(cmd)
+        self.returncode = 0
+        self.stderr = io.BytesIO(b'')
+        output = [arg.split('=', 1)[1] for arg in cmd if arg.startswith('--file=')]
+        if output:
+            os.makedirs(output[0])
+            for i in range(3):
+                with open(os.path.join(output[0], f'{i}.dat.zst'), 'wb') as f:
+                    f.write(b'x' * 100)
+
+    def poll(self):
+        return self.returncode
+
+
+class FakeCursor:
+    def __init__(self, tables):
+        self.tables = tables  # table -> list of (id, value, updated_at)
+        self.result = None
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        if 'pg_table_size(c.oid)' in sql:
+            self.result = [(1000,)]
+        elif sql.startswith('SELECT NOW()'):
+            self.result = [(WATERMARK,)]
+        elif sql.startswith('SELECT (SELECT COUNT(*)'):
+            self.result = [(2, 50)]
+        elif 'information_schema.columns' in sql:
+            self.result = [('id',), ('value',), ('updated_at',)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def mogrify(self, sql, params):
+        return sql.replace('%s', f"'{params[0].isoformat()}'").encode('utf-8')
+
+    def copy_expert(self, sql, file):
+        table = [name for name in self.tables if f'FROM {name}' in sql][0]
+        rows = self.tables[table]
+        if 'updated_at >' in sql:
+            since = datetime.fromisoformat(sql.split("updated_at > '")[1].split("'")[0])
+            rows = [row for row in rows if row[2] > since]
+            self.rowcount = len(rows)
+            for row in rows:
+                file.write(f"{row[0]}\t{row[1]}\t{row[2].isoformat()}\n".encode('utf-8'))
+        else:
+            for row in rows:
+                file.write(f"{row[0]}\n".encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def set_session(self, **kwargs):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_engine(tables=None):
+    FakeProcess.commands = []
+    cursor = FakeCursor(tables or {})
+    return SnapshotEngine(jobs=4, compression='zstd', pg_bin_dir='/pg/bin',
+                          connect=lambda database: FakeConnection(cursor), runner=FakeProcess)
+
+
+def test_dump_and_restore_commands_are_parallel_directory_archives():
+    engine = make_engine()
+    dump = engine.dump_command('KnowledgeDocuments', '/snapshots/s1/KnowledgeDocuments')
+    assert dump[0] == '/pg/bin/pg_dump'
+    assert '--format=directory' in dump and '--jobs=4' in dump and '--compress=zstd' in dump
+    assert '--file=/snapshots/s1/KnowledgeDocuments' in dump
+
+    restore = engine.restore_command('doc_eval', '/snapshots/s1/doc_eval')
+    assert restore[0] == '/pg/bin/pg_restore'
+    assert '--jobs=4' in restore and '--clean' in restore and restore[-1] == '/snapshots/s1/doc_eval'
+
+
+def test_full_and_quick_snapshots():
+    engine = make_engine()
+    progress = []
+    with tempfile.TemporaryDirectory() as directory:
+        full = engine.create_snapshot(os.path.join(directory, 'full'), mode='full',
+                                      progress=lambda *args: progress.append(args))
+        assert set(full['databases']) == {'doc_eval', 'KnowledgeDocuments'}
+        assert full['change_watermark'] == WATERMARK
+        assert full['bytes_written'] >= 600
+        assert read_manifest(os.path.join(directory, 'full'))['mode'] == 'full'
+        # The final report for each database has bytes written equal to the expected bytes
+        assert ('KnowledgeDocuments', 300, 300) in progress
+
+        quick = engine.create_snapshot(os.path.join(directory, 'quick'), mode='quick', parent=full)
+        assert set(quick['databases']) == {'doc_eval'}
+        assert quick['change_watermark'] is None
+
+        with pytest.raises(SnapshotError):
+            engine.create_snapshot(os.path.join(directory, 'incremental'), mode='incremental', parent=quick)
+        assert not os.path.exists(os.path.join(directory, 'incremental'))
+
+
+def test_counting_writer_streams_through_compressor():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'rows{compressed_suffix()}')
+        seen = []
+        with open_compressed_writer(path) as target:
+            writer = CountingWriter(target, on_write=seen.append)
+            writer.write(b'1\ta\n')
+            writer.write(b'2\tb\n')
+        assert seen == [4, 8]
+        with open_compressed_reader(path) as source:
+            assert source.read() == b'1\ta\n2\tb\n'
+
+
+def test_incremental_export_contains_only_changed_rows():
+    old, new = datetime(2025, 1, 1), datetime(2026, 1, 1)
+    tables = {
+        'connection_snapshots': [(3, 'c', old)],
+        'llm_responses': [(1, 'a', old), (2, 'b', new)],
+        'docs': [(7, 'd', old)],
+    }
+    engine = make_engine(tables)
+    engine.incremental_overlap = 0
+    with tempfile.TemporaryDirectory() as directory:
+        base = {'change_watermark': datetime(2025, 6, 1).isoformat(), 'databases': {}}
+        manifest = engine.create_snapshot(os.path.join(directory, 'inc'), mode='incremental', parent=base)
+
+        assert manifest['change_watermark'] == WATERMARK
+        kb = manifest['databases']['KnowledgeDocuments']
+        assert kb['tables']['llm_responses']['changed_rows'] == 1
+        assert kb['tables']['docs']['changed_rows'] == 0
+
+        changes_dir = os.path.join(directory, 'inc', CHANGES_DIR)
+        with open_compressed_reader(os.path.join(changes_dir, kb['tables']['llm_responses']['rows_file'])) as f:
+            assert f.read().decode('utf-8').startswith('2\tb\t')
+        with open_compressed_reader(os.path.join(changes_dir, kb['tables']['llm_responses']['ids_file'])) as f:
+            assert f.read() == b'1\n2\n'
+        # doc_eval is always dumped in full
+        assert os.path.isdir(os.path.join(directory, 'inc', 'doc_eval'))
+
+
+def test_restore_chain_applies_increments_in_order():
+    engine = make_engine({'connection_snapshots': [], 'llm_responses': [], 'docs': []})
+    engine.incremental_overlap = 0
+    applied, terminated = [], []
+    engine.apply_changes = lambda path, changes: applied.append(path)
+    engine.terminate_connections = terminated.append
+
+    with tempfile.TemporaryDirectory() as directory:
+        chain = [os.path.join(directory, name) for name in ('full', 'inc1', 'inc2')]
+        parent = engine.create_snapshot(chain[0], mode='full')
+        for path in chain[1:]:
+            parent = engine.create_snapshot(path, mode='incremental', parent=parent)
+
+        FakeProcess.commands = []
+        engine.restore_snapshot(chain)
+
+        restores = [cmd[-1] for cmd in FakeProcess.commands]
+        assert restores == [os.path.join(chain[2], 'doc_eval'), os.path.join(chain[0], 'KnowledgeDocuments')]
+        assert applied == [os.path.join(chain[1], CHANGES_DIR), os.path.join(chain[2], CHANGES_DIR)]
+        assert set(terminated) == {'doc_eval', 'KnowledgeDocuments'}
+
+        with pytest.raises(SnapshotError):
+            engine.restore_snapshot(chain[1:])
+
+
+if __name__ == "__main__":
+    test_dump_and_restore_commands_are_parallel_directory_archives()
+    test_full_and_quick_snapshots()
+    test_counting_writer_streams_through_compressor()
+    test_incremental_export_contains_only_changed_rows()
+    test_restore_chain_applies_increments_in_order()
+    print("✅ All snapshot engine tests passed")
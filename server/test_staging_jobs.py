@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Tests for background staging jobs (services/staging_jobs.py and BatchService._perform_staging).
+
+The doc_eval session and KnowledgeDocuments connection are replaced with fakes so
+the tests verify:
+1. The shared I/O budget throttles reads to its byte rate
+2. Staging checkpoints after every chunk and resumes after the last checkpoint
+3. Cancellation stops staging between chunks
+4. Response inserts skip rows an interrupted chunk already created
+5. Job descriptions report throughput and ETA
+6. A stage after a reset starts over instead of resuming an earlier job's checkpoint
+7. The heartbeat is renewed while reading files, not only at chunk checkpoints
+8. A job taken over by another process stops without committing its current chunk
+"""
+
+import sys
+import os
+import operator
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+import services.batch_service as batch_service_module
+from database import Base
+from models import Batch, Document, StagingJob
+from services.batch_service import BatchService
+from services.staging_jobs import IOBudget, StagingJobContext, StagingJobLost, StagingJobManager
+
+
+@compiles(JSONB, 'sqlite')
+def compile_jsonb_for_sqlite(type_, compiler, **kwargs):
+    return 'JSON'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeQuery:
+    """Supports the Document queries of _perform_staging: assign, count, keyset chunks"""
+
+    def __init__(self, documents, after=None, limit=None):
+        self.documents = documents
+        self.after = after
+        self._limit = limit
+
+    def filter(self, *criteria):
+        after = self.after
+        for criterion in criteria:
+            if getattr(criterion, 'operator', None) is operator.gt:
+                after = criterion.right.value
+        return FakeQuery(self.documents, after, self._limit)
+
+    def update(self, values, synchronize_session=None):
+        return 0
+
+    def count(self):
+        return len(self._rows())
+
+    def order_by(self, *args):
+        return self
+
+    def limit(self, limit):
+        return FakeQuery(self.documents, self.after, limit)
+
+    def all(self):
+        return self._rows()[:self._limit]
+
+    def _rows(self):
+        return [doc for doc in self.documents if self.after is None or doc.id > self.after]
+
+
+class FakeSession:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def query(self, *columns):
+        return FakeQuery(self.documents)
+
+    def commit(self):
+        pass
+
+
+class FakeKnowledgeDocuments:
+    """docs, connection_snapshots and llm_responses tables with transactions, savepoints and commits recorded"""
+
+    def __init__(self):
+        self.docs = {}
+        self.responses = set()
+        self.pending_docs, self.pending_responses = {}, set()
+        self.commits = 0
+        self.result = None
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.result = None
+        if sql.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            return
+        if sql.startswith('SELECT id FROM docs'):
+            doc_id = {**self.docs, **self.pending_docs}.get(params[0])
+            self.result = (doc_id,) if doc_id else None
+        elif sql.startswith('UPDATE docs'):
+            self.result = ({**self.docs, **self.pending_docs}[params[3]],)
+        elif sql.startswith('INSERT INTO docs'):
+            kb_id = len(self.docs) + len(self.pending_docs) + 1
+            self.pending_docs[params[0]] = kb_id
+            self.result = (kb_id,)
+        elif sql.startswith('INSERT INTO connection_snapshots'):
+            self.result = (1,)
+        elif sql.startswith('INSERT INTO llm_responses'):
+            key = (params[0], params[1], params[2])
+            if key not in self.responses | self.pending_responses:
+                self.pending_responses.add(key)
+                self.result = (len(self.responses) + len(self.pending_responses),)
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self.result
+
+    def commit(self):
+        self.docs.update(self.pending_docs)
+        self.responses |= self.pending_responses
+        self.pending_docs, self.pending_responses = {}, set()
+        self.commits += 1
+
+    def rollback(self):
+        self.pending_docs, self.pending_responses = {}, set()
+
+    def close(self):
+        pass
+
+
+class FakeManager:
+    """Stands in for StagingJobManager: records checkpoints, cancels or loses the job on request"""
+
+    def __init__(self, cancel_after_checkpoints=None, heartbeat_seconds=300, lost_after_updates=None):
+        self.io_budget = IOBudget(0)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.updates = []
+        self.cancel_after_checkpoints = cancel_after_checkpoints
+        self.lost_after_updates = lost_after_updates
+
+    def _update_job(self, job_id, values):
+        if self.lost_after_updates is not None and len(self.updates) >= self.lost_after_updates:
+            return None
+        self.updates.append(values)
+        checkpoints = len([update for update in self.updates if 'last_document_id' in update])
+        if self.cancel_after_checkpoints and checkpoints >= self.cancel_after_checkpoints:
+            return 'CANCELLING'
+        return 'RUNNING'
+
+    def _cancel_requested(self, job_id):
+        return False
+
+
+class FakeResetConnection:
+    """KnowledgeDocuments connection for the reset action: accepts the llm_responses delete"""
+
+    rowcount = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        assert sql.startswith('DELETE FROM llm_responses')
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_documents(directory, count):
+    documents = []
+    for i in range(1, count + 1):
+        path = os.path.join(directory, f'doc{i}.txt')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 10)
+        documents.append(SimpleNamespace(id=i * 10, filename=f'doc{i}.txt', filepath=path))
+    return documents
+
+
+def run_staging(monkeypatch, documents, kb, job):
+    monkeypatch.setenv('STAGING_CHUNK_SIZE', '2')
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: kb)
+    monkeypatch.setattr(batch_service_module.config_lookup, 'get_connection', lambda conn_id: {'id': conn_id})
+    return BatchService()._perform_staging(FakeSession(documents), 7, [1], [3], [4, 5], None, job=job)
+
+
+def test_io_budget_throttles_to_rate():
+    clock = FakeClock()
+    budget = IOBudget(100, clock=clock.time, sleep=clock.sleep)
+
+    assert budget.acquire(100) == 0  # One second of burst
+    budget.acquire(50)
+    budget.acquire(150)
+    assert clock.now == 2.0  # 300 bytes at 100 bytes/s
+    assert IOBudget(0).acquire(10 ** 9) == 0  # Unlimited
+
+
+def test_staging_checkpoints_per_chunk_and_resumes(monkeypatch):
+    kb = FakeKnowledgeDocuments()
+    with tempfile.TemporaryDirectory() as directory:
+        documents = make_documents(directory, 5)
+
+        # Interrupted after the first chunk (cancelled at its checkpoint)
+        manager = FakeManager(cancel_after_checkpoints=1)
+        job = StagingJobContext(manager, 'job-1', {})
+        result = run_staging(monkeypatch, documents, kb, job)
+        assert result['cancelled'] and not result['success']
+        assert job.last_document_id == 20 and job.documents_done == 2
+        assert len(kb.responses) == 4  # 2 documents x 1 connection x 2 prompts
+
+        # A new job carrying the checkpoint picks up at document 30
+        checkpoint = {field: getattr(job, field) for field in (
+            'last_document_id', 'documents_done', 'documents_staged', 'responses_created', 'bytes_read')}
+        manager = FakeManager()
+        resumed = StagingJobContext(manager, 'job-2', checkpoint)
+        result = run_staging(monkeypatch, documents, kb, resumed)
+
+        assert result['success']
+        assert result['total_documents'] == 5 and result['total_responses'] == 10
+        assert resumed.bytes_read == 50
+        checkpoints = [update['last_document_id'] for update in manager.updates if 'last_document_id' in update]
+        assert checkpoints == [40, 50]
+        assert manager.updates[0] == {'total_documents': 5}
+
+
+def test_rerun_of_interrupted_chunk_does_not_duplicate_responses(monkeypatch):
+    kb = FakeKnowledgeDocuments()
+    with tempfile.TemporaryDirectory() as directory:
+        documents = make_documents(directory, 3)
+        run_staging(monkeypatch, documents, kb, StagingJobContext(FakeManager(), 'job-1', {}))
+        assert len(kb.responses) == 6
+
+        # Crash before any checkpoint was written: the whole batch is staged again
+        result = run_staging(monkeypatch, documents, kb, StagingJobContext(FakeManager(), 'job-2', {}))
+        assert result['success'] and result['total_responses'] == 0
+        assert len(kb.responses) == 6 and len(kb.docs) == 3
+
+
+def test_stage_after_reset_does_not_resume_old_checkpoint(monkeypatch):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Batch.__table__, Document.__table__, StagingJob.__table__])
+    session = sessionmaker(bind=engine)()
+    monkeypatch.setattr(batch_service_module.psycopg2, 'connect', lambda **kwargs: FakeResetConnection())
+
+    batch = Batch(id=7, batch_number=7, status='SAVED', folder_ids=[1],
+                  config_snapshot={'connection_ids': [3], 'prompt_ids': [4]})
+    session.add(batch)
+    session.add(StagingJob(id='job-1', batch_id=7, status='CANCELLED', last_document_id=20, documents_done=2))
+    session.commit()
+    service = BatchService()
+
+    # Without a reset the next job carries on after the cancelled one
+    resumed = service._action_stage(batch, None, session)
+    assert session.get(StagingJob, resumed['staging_job_id']).last_document_id == 20
+    session.rollback()
+
+    # A reset unassigns the documents and deletes the responses that job staged
+    service._action_reset(batch, None, session)
+    result = service._action_stage(batch, None, session)
+    session.flush()
+
+    job = session.get(StagingJob, result['staging_job_id'])
+    assert job.last_document_id is None and job.documents_done in (None, 0)
+    assert session.get(StagingJob, 'job-1').status == 'SUPERSEDED'
+
+
+def test_heartbeat_is_renewed_while_reading_files(monkeypatch):
+    kb = FakeKnowledgeDocuments()
+    with tempfile.TemporaryDirectory() as directory:
+        documents = make_documents(directory, 3)
+
+        manager = FakeManager()
+        run_staging(monkeypatch, documents, kb, StagingJobContext(manager, 'job-1', {}))
+        assert {} not in manager.updates  # Checkpoints alone renew a fast job's heartbeat
+
+        # A renewal is due before every read: one per document besides the checkpoints
+        manager = FakeManager(heartbeat_seconds=0)
+        run_staging(monkeypatch, documents, kb, StagingJobContext(manager, 'job-2', {}))
+        assert manager.updates.count({}) == 3
+
+
+def test_lost_job_stops_without_committing_its_chunk(monkeypatch):
+    kb = FakeKnowledgeDocuments()
+    with tempfile.TemporaryDirectory() as directory:
+        documents = make_documents(directory, 5)
+
+        # Taken over after the first checkpoint, at the first heartbeat of the second chunk
+        manager = FakeManager(heartbeat_seconds=0, lost_after_updates=4)
+        job = StagingJobContext(manager, 'job-1', {})
+        with pytest.raises(StagingJobLost):
+            run_staging(monkeypatch, documents, kb, job)
+
+        assert job.last_document_id == 20
+        assert len(kb.responses) == 4 and len(kb.docs) == 2
+
+
+def test_describe_reports_throughput_and_eta():
+    job = SimpleNamespace(
+        id='job-1', batch_id=7, status='RUNNING', total_documents=100, documents_done=40,
+        documents_staged=38, responses_created=76, bytes_read=20 * 1024 * 1024, active_seconds=10.0,
+        last_document_id=400, claimed_by='host:1', heartbeat_at=None, created_at=None,
+        started_at=None, finished_at=None, error_message=None
+    )
+    description = StagingJobManager.describe(job)
+    assert description['files_per_second'] == 4.0
+    assert description['mb_per_second'] == 2.0
+    assert description['eta_seconds'] == 15
+    assert description['progress_percent'] == 40.0
+
+    job.active_seconds = 0
+    assert StagingJobManager.describe(job)['eta_seconds'] is None
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All staging job tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Tests for set-based startup recovery (services/startup_recovery.py) and the
+rate-limited re-verification of recovered tasks in the queue processor.
+
+Both databases are replaced with in-memory fakes so the tests verify:
+1. Recovery issues a fixed number of statements however many rows are in flight,
+   and only one process recovers at a time
+2. Interrupted batches are settled as SAVED / COMPLETED / STAGED from grouped counts,
+   except batches another worker still holds live leases in
+3. The report keeps totals for every batch but caps per-batch details
+4. Recovered tasks are re-verified a few per cycle, keeping their original start time;
+   adoption is limited by that budget and tasks past their timeout fail without waiting
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.batch_queue_processor as processor_module
+from services.startup_recovery import StartupRecoveryService
+from services.batch_queue_processor import BatchQueueProcessor
+
+
+def normalize(sql):
+    return ' '.join(sql.split())
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    """doc_eval batches table: id -> (batch_name, status)"""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.statements = []
+        self.committed = False
+
+    def execute(self, statement, params=None):
+        sql = normalize(str(statement))
+        self.statements.append(sql)
+        if sql.startswith("UPDATE batches SET status = 'SAVED', started_at = NULL WHERE status = 'STAGING'"):
+            return FakeResult(self._transition('SAVED', lambda batch_id, status: status == 'STAGING'))
+        if sql.startswith('SELECT id FROM batches'):
+            return FakeResult([(i,) for i, b in self.batches.items() if b[1] in ('ANALYZING', 'PROCESSING')])
+        if sql.startswith('UPDATE batches SET status ='):
+            return FakeResult(self._transition(sql.split("'")[1], lambda batch_id, status: (
+                batch_id in params['ids'] and status in ('ANALYZING', 'PROCESSING'))))
+        raise AssertionError(f"Unexpected statement: {sql}")
+
+    def _transition(self, new_status, selected):
+        rows = []
+        for batch_id, (name, status) in sorted(self.batches.items()):
+            if selected(batch_id, status):
+                self.batches[batch_id] = (name, new_status)
+                rows.append((batch_id, name))
+        return rows
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    """llm_responses rows: (batch_id, status, task_id[, live lease])"""
+
+    def __init__(self, rows, lock_taken=False):
+        self.rows = rows
+        self.lock_taken = lock_taken
+        self.statements = []
+        self._result = []
+
+    def execute(self, sql, params=None):
+        sql = normalize(sql)
+        self.statements.append(sql)
+        if sql.startswith('SELECT pg_try_advisory_lock'):
+            self._result = [(not self.lock_taken,)]
+        elif sql.startswith('SELECT pg_advisory_unlock'):
+            self._result = [(True,)]
+        elif sql.startswith('WITH reset AS'):
+            self._result = self._group(lambda r: r[1] == 'PROCESSING' and not r[2])
+            self.rows = [(r[0], 'QUEUED', None) if r[1] == 'PROCESSING' and not r[2] else r for r in self.rows]
+        elif sql.startswith('WITH released AS'):
+            self._result = self._group(lambda r: r[1] == 'PROCESSING' and r[2] and not self._leased(r))
+        elif sql.startswith('SELECT batch_id, COUNT(*), COUNT(*) FILTER'):
+            totals = {}
+            for row in self.rows:
+                if row[0] in params[0]:
+                    total, done, leased = totals.get(row[0], (0, 0, 0))
+                    totals[row[0]] = (total + 1, done + (row[1] in ('COMPLETED', 'FAILED')),
+                                      leased + self._leased(row))
+            self._result = [(batch_id, *counts) for batch_id, counts in totals.items()]
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    @staticmethod
+    def _leased(row):
+        return len(row) > 3 and row[3]
+
+    def _group(self, match):
+        counts = {}
+        for row in self.rows:
+            if match(row):
+                counts[row[0]] = counts.get(row[0], 0) + 1
+        return list(counts.items())
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run_recovery(batches, rows):
+    session = FakeSession(batches)
+    cursor = FakeCursor(rows)
+    service = StartupRecoveryService(connect=lambda: FakeConnection(cursor), session_factory=lambda: session)
+    return service, service.perform_recovery(), session, cursor
+
+
+def test_statement_count_does_not_grow_with_backlog():
+    small = run_recovery({1: ('b1', 'PROCESSING')}, [(1, 'PROCESSING', 't1')])
+    rows = [(batch_id, 'PROCESSING', f't{i}' if i % 2 else None)
+            for batch_id in range(1, 201) for i in range(500)]
+    large = run_recovery({i: (f'b{i}', 'PROCESSING') for i in range(1, 201)}, rows)
+
+    assert len(large[3].statements) == len(small[3].statements)
+    assert len(large[2].statements) == len(small[2].statements)
+    assert large[1]['status'] == 'COMPLETED'
+    assert large[1]['responses']['reset_to_queued'] == 50000
+    assert large[1]['responses']['awaiting_verification'] == 50000
+
+
+def test_interrupted_batches_are_settled():
+    batches = {
+        1: ('staging', 'STAGING'),
+        2: ('empty', 'ANALYZING'),
+        3: ('finished', 'PROCESSING'),
+        4: ('in flight', 'PROCESSING'),
+        5: ('done earlier', 'COMPLETED'),
+    }
+    rows = [
+        (3, 'COMPLETED', 't1'), (3, 'FAILED', 't2'),
+        (4, 'COMPLETED', 't3'), (4, 'PROCESSING', 't4'), (4, 'PROCESSING', None),
+    ]
+    _, report, session, cursor = run_recovery(batches, rows)
+
+    assert {i: status for i, (_, status) in session.batches.items()} == {
+        1: 'SAVED', 2: 'SAVED', 3: 'COMPLETED', 4: 'STAGED', 5: 'COMPLETED'
+    }
+    assert report['batches'] == {
+        'reset_to_saved': 2, 'completed': 1, 'reset_to_staged': 1, 'left_running': 0,
+        'details': report['batches']['details']
+    }
+    assert report['batches_recovered'] == 4
+    assert report['responses']['by_batch'] == {4: {'reset_to_queued': 1, 'awaiting_verification': 1}}
+    assert session.committed
+    # The in-flight row keeps its task for re-verification
+    assert (4, 'PROCESSING', 't4') in cursor.rows
+
+
+def test_batches_with_live_leases_are_left_running():
+    batches = {1: ('other worker', 'PROCESSING'), 2: ('abandoned', 'PROCESSING')}
+    rows = [
+        (1, 'COMPLETED', 't1'), (1, 'PROCESSING', 't2', True), (1, 'QUEUED', None),
+        (2, 'COMPLETED', 't3'), (2, 'PROCESSING', 't4'),
+    ]
+    _, report, session, _ = run_recovery(batches, rows)
+
+    assert session.batches == {1: ('other worker', 'PROCESSING'), 2: ('abandoned', 'STAGED')}
+    assert report['batches']['left_running'] == 1 and report['batches']['reset_to_staged'] == 1
+    assert {'batch_id': 1, 'action': 'LEFT_RUNNING', 'completed_docs': 1, 'total_docs': 3} \
+        in report['batches']['details']
+    # The live task is not released for adoption either
+    assert report['responses']['awaiting_verification'] == 1
+
+
+def test_report_caps_details_but_keeps_totals():
+    batches = {i: (f'b{i}', 'STAGING') for i in range(1, 251)}
+    rows = [(i, 'PROCESSING', None) for i in range(1, 251)]
+    service, report, _, _ = run_recovery(batches, rows)
+
+    assert report['batches']['reset_to_saved'] == 250
+    assert len(report['batches']['details']) == StartupRecoveryService.MAX_REPORTED_BATCHES
+    assert report['responses']['reset_to_queued'] == 250
+    assert len(report['responses']['by_batch']) == StartupRecoveryService.MAX_REPORTED_BATCHES
+    assert service.get_recovery_summary() is report
+
+
+def test_recovery_is_skipped_while_another_process_runs_it():
+    session = FakeSession({1: ('b1', 'PROCESSING')})
+    cursor = FakeCursor([(1, 'PROCESSING', None)], lock_taken=True)
+    service = StartupRecoveryService(connect=lambda: FakeConnection(cursor), session_factory=lambda: session)
+    report = service.perform_recovery()
+
+    assert report['status'] == 'SKIPPED'
+    assert len(cursor.statements) == 1 and session.statements == []
+    assert cursor.rows == [(1, 'PROCESSING', None)] and session.batches[1][1] == 'PROCESSING'
+
+    _, report, _, cursor = run_recovery({1: ('b1', 'PROCESSING')}, [(1, 'PROCESSING', None)])
+    assert report['status'] == 'COMPLETED'
+    assert cursor.statements[0].startswith('SELECT pg_try_advisory_lock')
+    assert cursor.statements[-1].startswith('SELECT pg_advisory_unlock')
+
+
+def test_failure_is_reported():
+    def broken_connect():
+        raise RuntimeError('database unavailable')
+
+    service = StartupRecoveryService(connect=broken_connect, session_factory=lambda: FakeSession({}))
+    report = service.perform_recovery()
+
+    assert report['status'] == 'FAILED'
+    assert report['errors'] == ['database unavailable']
+    assert report['duration_seconds'] is not None
+
+
+def test_recovered_tasks_are_verified_a_few_per_cycle():
+    processor = BatchQueueProcessor()
+    processor.recovery_verify_per_cycle = 2
+    started = datetime.now() - timedelta(minutes=10)
+    polled = []
+    processor._check_task_status = lambda task_id: polled.append(task_id) or {'completed': False, 'success': False}
+
+    for i in range(5):
+        processor.recovering_tasks[f't{i}'] = {
+            'doc_id': i, 'batch_id': 1, 'submitted_at': started, 'document_id': i,
+            'poll_count': 0, 'recovered': True
+        }
+
+    processor._check_active_tasks()
+    assert polled == ['t0', 't1']
+    assert processor.get_recovery_status()['pending_verification'] == 3
+    # Waiting tasks have not used up any of their poll allowance
+    assert processor.recovering_tasks['t4']['poll_count'] == 0
+
+    processor._check_active_tasks()
+    assert polled == ['t0', 't1', 't0', 't1', 't2', 't3']
+    assert processor.active_tasks['t2']['submitted_at'] == started
+    assert processor.stats['recovery_verified'] == 4
+
+
+class FakeLease:
+    worker_id = 'worker-1'
+    lease_seconds = 60
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.limits = []
+
+    def reclaim_expired(self, limit):
+        self.limits.append(limit)
+        taken, self.rows = self.rows[:max(0, limit)], self.rows[max(0, limit):]
+        return taken
+
+
+def test_adoption_is_limited_by_the_verification_budget():
+    processor = BatchQueueProcessor(check_interval=5)
+    processor.recovery_verify_per_cycle = 2
+    processor.heartbeat_interval = 15  # Three check cycles per heartbeat
+    processor.lease = FakeLease([
+        {'response_id': i, 'task_id': f't{i}', 'document_id': 'd', 'batch_id': 1,
+         'started_processing_at': datetime.now(), 'rag_endpoint': None}
+        for i in range(20)
+    ])
+    # Busy dispatching: adoption does not depend on free dispatch slots
+    processor.active_tasks = {f'busy{i}': {} for i in range(processor.max_concurrent)}
+
+    processor._recover_processing_documents()
+    assert len(processor.recovering_tasks) == 6
+
+    processor.recovering_tasks.pop('t0')
+    processor._recover_processing_documents()
+    assert processor.lease.limits == [6, 1] and len(processor.recovering_tasks) == 6
+
+
+def test_recovered_tasks_past_their_timeout_fail_without_waiting(monkeypatch):
+    failures = []
+    monkeypatch.setattr(processor_module.batch_service, 'handle_task_failure',
+                        lambda task_id, error_data: failures.append(task_id) or {'success': True})
+    processor = BatchQueueProcessor()
+    processor.recovery_verify_per_cycle = 1
+    processor._check_task_status = lambda task_id: {'completed': False, 'success': False}
+    long_ago = datetime.now() - timedelta(hours=2)
+    for i in range(3):
+        processor.recovering_tasks[f'old{i}'] = {
+            'doc_id': i, 'batch_id': 1, 'submitted_at': long_ago, 'document_id': i,
+            'poll_count': 0, 'recovered': True
+        }
+    processor.recovering_tasks['fresh'] = {
+        'doc_id': 9, 'batch_id': 1, 'submitted_at': datetime.now(), 'document_id': 9,
+        'poll_count': 0, 'recovered': True
+    }
+
+    processor._check_active_tasks()
+
+    # All timed-out tasks fail in one cycle; the budget goes to the live one
+    assert failures == ['old0', 'old1', 'old2']
+    assert list(processor.active_tasks) == ['fresh'] and processor.recovering_tasks == {}
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All startup recovery tests passed")
+    sys.exit(exit_code)
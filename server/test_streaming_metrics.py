@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming latency metrics and partial output flushing.
+
+Provider HTTP is replaced with a fake session that yields a scripted stream, so
+the tests verify:
+1. Time-to-first-token, inter-token latency and tokens/sec are derived from stream timing
+2. Non-streamed responses report a rate over the whole request and no first-token time
+3. Long generations flush their partial text per response row while streaming
+4. Metrics reach the per-prompt results written by the queue processor
+"""
+
+import sys
+import os
+import json
+import time
+import base64
+import asyncio
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.batch_queue_processor import split_prompt_results
+from services.direct_execution import DirectExecutionEngine, stream_metrics
+from services.providers.ollama_provider import OllamaProvider
+
+
+class SlowContent:
+    """Yields stream lines with a delay before each, like a model generating tokens"""
+
+    def __init__(self, lines, delay):
+        self.lines = lines
+        self.delay = delay
+
+    def __aiter__(self):
+        self._iter = iter(self.lines)
+        return self
+
+    async def __anext__(self):
+        try:
+            line = next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delay)
+        return line
+
+
+class FakeResponse:
+    def __init__(self, lines, delay):
+        self.status = 200
+        self.content = SlowContent(lines, delay)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+    def __init__(self, lines, delay):
+        self.lines = lines
+        self.delay = delay
+
+    def post(self, url, json=None, headers=None):
+        return FakeResponse(self.lines, self.delay)
+
+
+def ollama_stream(parts, output_tokens):
+    lines = [json.dumps({'message': {'content': part}, 'done': False}).encode() for part in parts]
+    lines.append(json.dumps({'done': True, 'prompt_eval_count': 40, 'eval_count': output_tokens}).encode())
+    return lines
+
+
+def test_stream_metrics_from_timestamps():
+    # First token after 0.5s, 11 tokens over the following 2s
+    metrics = stream_metrics(started=10.0, first_token_at=10.5, last_token_at=12.5, finished=12.6,
+                             output_tokens=11, chunks=6)
+    assert metrics == {'time_to_first_token_ms': 500, 'inter_token_latency_ms': 200.0, 'tokens_per_second': 5.0}
+
+    # Without provider token counts the streamed chunks stand in for tokens
+    assert stream_metrics(0.0, 1.0, 3.0, 3.0, None, 5)['tokens_per_second'] == 2.0
+
+    # Not streamed: no first-token time, rate over the whole request
+    metrics = stream_metrics(0.0, None, None, 4.0, 100, 0)
+    assert metrics == {'time_to_first_token_ms': None, 'inter_token_latency_ms': None, 'tokens_per_second': 25.0}
+
+
+def test_long_generation_flushes_partial_output_per_row():
+    flushed = []
+    engine = DirectExecutionEngine(
+        connections='all',
+        adapters={'ollama': OllamaProvider()},
+        session_factory=lambda: FakeSession(ollama_stream(['a', 'b', 'c', 'd'], output_tokens=4), delay=0.02),
+        lookup=lambda connection_id: None,
+        partial_flush_seconds=0.03,
+        partial_sink=lambda response_id, text: flushed.append((response_id, text))
+    )
+    doc_info = {
+        'response_id': 101, 'document_id': 'batch_1_doc_5', 'connection_id': 7,
+        'encoded_content': base64.b64encode(b'text').decode(), 'doc_type': 'txt',
+        'prompt': {'id': 1, 'text': 'Summarize'},
+        'prompts': [{'response_id': 101, 'id': 1, 'text': 'Summarize'}],
+        'llm_config': {'provider_type': 'ollama', 'base_url': 'http://studio.local:11434', 'model_name': 'gemma3'}
+    }
+    try:
+        task_id = engine.submit(doc_info)
+        deadline = time.time() + 5
+        status = engine.poll(task_id)
+        while not status['completed'] and time.time() < deadline:
+            time.sleep(0.01)
+            status = engine.poll(task_id)
+    finally:
+        engine.shutdown()
+
+    assert status['success'] and status['response_text'] == 'abcd'
+    # Flushed while streaming, each flush a growing prefix of the answer for row 101
+    assert flushed and all(response_id == 101 for response_id, _ in flushed)
+    assert all('abcd'.startswith(text) for _, text in flushed)
+    assert [len(text) for _, text in flushed] == sorted({len(text) for _, text in flushed})
+    assert engine.stats['partial_flushes'] == len(flushed)
+
+    assert status['time_to_first_token_ms'] >= 15
+    assert status['inter_token_latency_ms'] >= 15
+    assert 0 < status['tokens_per_second'] < 100
+
+
+def test_packed_results_carry_stream_metrics():
+    status = {'results': [
+        {'response_text': 'a', 'time_to_first_token_ms': 320, 'inter_token_latency_ms': 21.5,
+         'tokens_per_second': 46.5},
+        {'response_text': 'b'},
+    ]}
+    results, _ = split_prompt_results(status, [101, 102])
+    assert (results[0]['time_to_first_token_ms'], results[0]['inter_token_latency_ms'],
+            results[0]['tokens_per_second']) == (320, 21.5, 46.5)
+    assert results[1]['time_to_first_token_ms'] is None and results[1]['tokens_per_second'] is None
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All streaming metrics tests passed")
+    sys.exit(exit_code)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Tests for standalone workers (services/worker.py) and their heartbeats
+(services/worker_registry.py).
+
+The worker_heartbeats table is replaced with an in-memory fake session, so the tests verify:
+1. A heartbeat upserts the worker's row with JSON-safe stats; a failed write rolls back
+2. Workers are healthy while RUNNING and reporting within the stale threshold
+3. get_latest_stats reads the most recently reporting healthy worker of a processor
+4. The batch worker runs startup recovery before the queue processor unless told to skip it
+"""
+
+import sys
+import os
+import json
+import operator
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Add the server directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import services.startup_recovery as startup_recovery_module
+import services.batch_queue_processor as processor_module
+from services.worker import WorkerHost
+from services.worker_registry import WorkerRegistry
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, condition):
+        compare = operator.eq if condition.operator is operator.eq else operator.ne
+        column, value = condition.left.key, condition.right.value
+        return FakeQuery([row for row in self.rows if compare(getattr(row, column), value)])
+
+    def order_by(self, *columns):
+        return FakeQuery(sorted(self.rows, key=lambda row: tuple(getattr(row, c.key) for c in columns)))
+
+    def all(self):
+        return self.rows
+
+
+class HeartbeatSession:
+    """worker_heartbeats keyed by worker_id"""
+
+    def __init__(self, table, fail=False):
+        self.table = table
+        self.fail = fail
+        self.committed = self.rolled_back = False
+
+    def execute(self, statement, params=None):
+        sql = ' '.join(str(statement).split())
+        if self.fail:
+            raise RuntimeError('database unavailable')
+        assert sql.startswith('INSERT INTO worker_heartbeats') and 'ON CONFLICT (worker_id) DO UPDATE' in sql
+        existing = self.table.get(params['worker_id'])
+        self.table[params['worker_id']] = SimpleNamespace(
+            worker_id=params['worker_id'], processor=params['processor'], hostname=params['hostname'],
+            pid=params['pid'], status=params['status'],
+            started_at=existing.started_at if existing else datetime.now(),
+            last_heartbeat_at=datetime.now(), stats=json.loads(params['stats'])
+        )
+
+    def query(self, model):
+        return FakeQuery(list(self.table.values()))
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+def make_registry(table, **kwargs):
+    sessions = []
+
+    def factory():
+        sessions.append(HeartbeatSession(table, **kwargs))
+        return sessions[-1]
+    return WorkerRegistry(stale_after_seconds=60, session_factory=factory), sessions
+
+
+def test_heartbeat_upserts_one_row_per_worker():
+    table = {}
+    registry, sessions = make_registry(table)
+
+    assert registry.heartbeat('host:1:a:batch', 'batch', {'started_at': datetime(2026, 1, 2), 'active_tasks': 2})
+    first_start = table['host:1:a:batch'].started_at
+    assert registry.heartbeat('host:1:a:batch', 'batch', {'active_tasks': 3})
+
+    assert list(table) == ['host:1:a:batch'] and all(session.committed for session in sessions)
+    row = table['host:1:a:batch']
+    assert row.stats == {'active_tasks': 3} and row.started_at == first_start and row.status == 'RUNNING'
+
+    assert registry.mark_stopped('host:1:a:batch', 'batch')
+    assert table['host:1:a:batch'].status == 'STOPPED'
+
+    # Datetimes in processor status are stored as text
+    registry.heartbeat('host:2:b:batch', 'batch', {'started_at': datetime(2026, 1, 2)})
+    assert table['host:2:b:batch'].stats == {'started_at': '2026-01-02 00:00:00'}
+
+
+def test_failed_heartbeat_rolls_back():
+    registry, sessions = make_registry({}, fail=True)
+    assert registry.heartbeat('host:1:a:batch', 'batch', {}) is False
+    assert sessions[0].rolled_back and not sessions[0].committed
+
+
+def worker_row(worker_id, processor, status='RUNNING', seconds_ago=0, stats=None):
+    now = datetime.now()
+    return SimpleNamespace(worker_id=worker_id, processor=processor, hostname='host', pid=1, status=status,
+                           started_at=now - timedelta(hours=1), last_heartbeat_at=now - timedelta(seconds=seconds_ago),
+                           stats=stats or {})
+
+
+def test_latest_stats_come_from_the_freshest_healthy_worker():
+    table = {row.worker_id: row for row in [
+        worker_row('a', 'batch', seconds_ago=20, stats={'active_tasks': 1}),
+        worker_row('b', 'batch', seconds_ago=5, stats={'active_tasks': 2}),
+        worker_row('c', 'batch', seconds_ago=300, stats={'active_tasks': 3}),  # stale
+        worker_row('d', 'batch', status='STOPPED', seconds_ago=1, stats={'active_tasks': 4}),
+        worker_row('e', 'health', seconds_ago=1, stats={'services': {}}),
+    ]}
+    registry, _ = make_registry(table)
+
+    workers = registry.list_workers('batch')
+    assert [(w['worker_id'], w['healthy']) for w in workers] == [('a', True), ('b', True), ('c', False)]
+    assert len(registry.list_workers('batch', include_stopped=True)) == 4
+
+    assert registry.get_latest_stats('batch') == {'active_tasks': 2}
+    assert registry.get_latest_stats('polling') is None
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+
+def start_batch_worker(monkeypatch, run_recovery):
+    calls = []
+    processor = FakeProcessor()
+    monkeypatch.setattr(startup_recovery_module, 'perform_startup_recovery',
+                        lambda: calls.append(processor.started) or {'status': 'COMPLETED', 'duration_seconds': 0.1})
+    monkeypatch.setattr(processor_module, 'batch_queue_processor', processor)
+    WorkerHost(['batch'], run_recovery=run_recovery, max_concurrent=5).start()
+    return calls, processor
+
+
+def test_recovery_runs_before_the_queue_processor_unless_skipped(monkeypatch):
+    calls, processor = start_batch_worker(monkeypatch, run_recovery=True)
+    # Recovery ran once, while the processor was not started yet
+    assert calls == [False] and processor.started and processor.max_concurrent == 5
+
+    calls, processor = start_batch_worker(monkeypatch, run_recovery=False)
+    assert calls == [] and processor.started
+
+
+if __name__ == "__main__":
+    import pytest
+    exit_code = pytest.main([__file__, '-q'])
+    if exit_code == 0:
+        print("✅ All worker tests passed")
+    sys.exit(exit_code)
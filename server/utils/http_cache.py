@@ -0,0 +1,127 @@
+"""
+HTTP caching helpers
+
+- conditional_get: version-based weak ETags for read-heavy GET endpoints. The
+  version is computed before the view runs, so a matching If-None-Match is
+  answered with 304 without executing the view's queries or serialization.
+  Responses with clock-derived fields (elapsed time, throughput, ETA) add a
+  coarse time bucket to the version so those fields do not freeze while no
+  row changes.
+- compress_response: gzip (or brotli when installed and accepted) for large
+  JSON responses.
+
+Register the compression hook with init_http_cache(app).
+"""
+
+import gzip
+import time
+import hashlib
+import logging
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from flask import current_app, request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of cached responses changes so clients drop old ETags
+ETAG_FORMAT_VERSION = '1'
+
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+
+def make_etag(path: str, version: Any) -> str:
+    """ETag for a request path (including query string) at a given resource version"""
+    key = f"{ETAG_FORMAT_VERSION}|{path}|{version!r}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def conditional_get(version_func: Callable[..., Optional[Any]], max_age_seconds: Optional[float] = None):
+    """
+    Answer conditional GETs from a resource version.
+
+    Args:
+        version_func: Called with the view's arguments; returns a hashable version
+                      of everything the response depends on, or None if unknown
+                      (the view then runs normally without an ETag)
+        max_age_seconds: For responses that also depend on the clock - the ETag
+                         changes at least this often even if the version does not
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            try:
+                version = version_func(*args, **kwargs)
+            except Exception as e:
+                logger.debug(f"Version lookup failed for {request.path}: {e}")
+                version = None
+
+            if version is None:
+                return view(*args, **kwargs)
+            if max_age_seconds:
+                version = (version, int(time.time() // max_age_seconds))
+
+            etag = make_etag(request.full_path, version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _accepts(encoding: str) -> bool:
+    return request.accept_encodings[encoding] > 0
+
+
+def compress_response(response):
+    """after_request hook: compress large text/JSON responses the client accepts compressed"""
+    min_size = current_app.config.get('COMPRESS_MIN_SIZE', DEFAULT_COMPRESS_MIN_SIZE)
+
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if BROTLI_AVAILABLE and _accepts('br'):
+        compressed, encoding = brotli.compress(data, quality=4), 'br'
+    elif _accepts('gzip'):
+        compressed, encoding = gzip.compress(data, compresslevel=5), 'gzip'
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(compressed))
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_http_cache(app):
+    """Register response compression with a Flask app"""
+    app.after_request(compress_response)
+    logger.info(f"Response compression enabled ({'brotli, gzip' if BROTLI_AVAILABLE else 'gzip'})")
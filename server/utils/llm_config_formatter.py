@@ -6,11 +6,15 @@ for the RAG API. This prevents inconsistencies and breaking changes when
 formatting LLM provider data.
 """
 
+import os
 import logging
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Providers that load models on demand and unload them after an idle timeout
+KEEP_ALIVE_PROVIDERS = ('ollama', 'lmstudio', 'lm_studio', 'lm-studio')
+
 
 def format_llm_config_for_rag_api(connection_data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -33,6 +37,9 @@ def format_llm_config_for_rag_api(connection_data: Dict[str, Any]) -> Dict[str,
             - base_url: Complete URL including port
             - model_name: Name of the model
             - api_key: Optional API key
+            - keep_alive: How long a local provider keeps the model loaded
+              (Ollama keep_alive duration, e.g. '30m'); LM Studio gets the same
+              value as 'ttl' in seconds
             
     Example:
         Input: {
@@ -57,14 +64,10 @@ def format_llm_config_for_rag_api(connection_data: Dict[str, Any]) -> Dict[str,
     # Fallback: if model_name is missing but model_id exists, try to look it up
     if not model_name and connection_data.get('model_id'):
         try:
-            from database import Session
-            from models import Model
-            session = Session()
-            model = session.query(Model).filter_by(id=connection_data['model_id']).first()
-            if model:
-                model_name = model.display_name
+            from services.config_lookup import config_lookup
+            model_name = config_lookup.get_model_name(connection_data['model_id'])
+            if model_name:
                 logger.info(f"Resolved model_id {connection_data['model_id']} to model_name '{model_name}'")
-            session.close()
         except Exception as e:
             logger.warning(f"Failed to resolve model_id {connection_data.get('model_id')}: {e}")
     
@@ -88,11 +91,46 @@ def format_llm_config_for_rag_api(connection_data: Dict[str, Any]) -> Dict[str,
     if api_key:
         config['api_key'] = api_key
     
+    # Keep local models loaded between requests; the model affinity scheduler
+    # (services/model_affinity.py) relies on the model still being warm
+    if (provider_type or '').lower() in KEEP_ALIVE_PROVIDERS:
+        connection_config = connection_data.get('connection_config') or {}
+        keep_alive = (connection_data.get('keep_alive') or
+                      (connection_config.get('keep_alive') if isinstance(connection_config, dict) else None) or
+                      os.getenv('LLM_KEEP_ALIVE', '30m'))
+        if keep_alive:
+            if provider_type.lower() == 'ollama':
+                config['keep_alive'] = keep_alive
+            else:
+                ttl = duration_seconds(keep_alive)
+                if ttl:
+                    config['ttl'] = ttl
+    
     logger.debug(f"Formatted LLM config: provider={provider_type}, url={url}, model={model_name}")
     
     return config
 
 
+def duration_seconds(duration: Any) -> Optional[int]:
+    """
+    Convert an Ollama-style duration ('30m', '1h', '90s', 300) to seconds.
+    
+    Returns:
+        Seconds, or None for negative ("forever") or unparseable durations
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    try:
+        if isinstance(duration, (int, float)):
+            seconds = int(duration)
+        elif duration[-1:] in units:
+            seconds = int(float(duration[:-1]) * units[duration[-1]])
+        else:
+            seconds = int(duration)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds >= 0 else None
+
+
 def build_complete_url(base_url: str, port: Optional[int]) -> str:
     """
     Build a complete URL from base URL and optional port.
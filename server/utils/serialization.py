@@ -0,0 +1,262 @@
+"""
+Serialization utilities
+
+One place for encoding API payloads and cache values:
+- JSON via orjson when installed (stdlib json otherwise)
+- Cache values via msgpack when installed (pickle for anything msgpack can't hold)
+- RawJSON to embed an already-serialized JSON document (e.g. llm_responses.response_json)
+  in a response without re-encoding it
+"""
+
+import re
+import json
+import uuid
+import pickle
+import decimal
+import logging
+import dataclasses
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+
+from werkzeug.http import http_date
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# orjson >= 3.9 can embed pre-serialized JSON natively
+_ORJSON_FRAGMENT = getattr(orjson, 'Fragment', None)
+
+# Leading byte of cache payloads written by pack_cache_value; legacy payloads
+# (plain JSON or pickle) never start with these
+_CACHE_MSGPACK = b'\x01'
+_CACHE_PICKLE = b'\x02'
+
+# msgpack extension type for datetimes/dates (stored as ISO strings)
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+
+
+class RawJSON:
+    """A JSON document that is already serialized and is emitted verbatim"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text.decode('utf-8') if isinstance(text, (bytes, bytearray, memoryview)) else text
+
+    def __repr__(self):
+        return f"RawJSON({self.text[:40]!r}...)" if len(self.text) > 40 else f"RawJSON({self.text!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, RawJSON) and other.text == self.text
+
+
+def json_passthrough(value: Any) -> Any:
+    """
+    Prepare a stored JSON column for a response without re-encoding it.
+
+    The text is validated before it is embedded verbatim: a TEXT column can hold
+    anything, and invalid text would otherwise corrupt the whole response body.
+
+    Args:
+        value: Column value - a JSON string (TEXT or jsonb selected as ::text),
+               an already parsed dict/list, or None
+
+    Returns:
+        RawJSON for valid JSON object/array text, the value itself for parsed values,
+        None for empty or non-JSON text (matching the old json.loads-or-None behavior)
+    """
+    if value is None or isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value).decode('utf-8')
+    if not isinstance(value, str):
+        return value
+
+    text = value.strip()
+    if len(text) < 2 or (text[0], text[-1]) not in (('{', '}'), ('[', ']')):
+        return None
+    try:
+        loads_json(text)
+    except ValueError:
+        return None
+    return RawJSON(text)
+
+
+def json_default(obj: Any) -> Any:
+    """Encode types JSON does not support, the same way Flask's default provider does"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    if isinstance(obj, RawJSON):
+        # Only reached on the stdlib fallback path
+        return json.loads(obj.text)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _FragmentCollector:
+    """Replaces RawJSON values with placeholders when orjson.Fragment is unavailable"""
+
+    _PLACEHOLDER = re.compile(rb'"\\u0000rawjson:(\d+)"')
+
+    def __init__(self, default: Callable[[Any], Any]):
+        self.default = default
+        self.fragments = []
+
+    def __call__(self, obj: Any) -> Any:
+        if isinstance(obj, RawJSON):
+            self.fragments.append(obj.text.encode('utf-8'))
+            return f"\x00rawjson:{len(self.fragments) - 1}"
+        return self.default(obj)
+
+    def splice(self, data: bytes) -> bytes:
+        if not self.fragments:
+            return data
+        return self._PLACEHOLDER.sub(lambda m: self.fragments[int(m.group(1))], data)
+
+
+def dumps_json(obj: Any, default: Optional[Callable[[Any], Any]] = None, indent: bool = False,
+               sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj to JSON bytes.
+
+    Args:
+        obj: Value to serialize; may contain RawJSON values
+        default: Handler for unsupported types (json_default if None)
+        indent: Pretty-print with two-space indentation
+        sort_keys: Sort dict keys
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    default = default or json_default
+
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        if _ORJSON_FRAGMENT is not None:
+            def fragment_default(o):
+                if isinstance(o, RawJSON):
+                    return _ORJSON_FRAGMENT(o.text)
+                return default(o)
+            return orjson.dumps(obj, default=fragment_default, option=option)
+
+        collector = _FragmentCollector(default)
+        return collector.splice(orjson.dumps(obj, default=collector, option=option))
+
+    separators = None if indent else (',', ':')
+    return json.dumps(obj, default=default, indent=2 if indent else None, separators=separators,
+                      sort_keys=sort_keys).encode('utf-8')
+
+
+def loads_json(data: Any) -> Any:
+    """Parse JSON from str or bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode('ascii'))
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode('ascii'))
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, RawJSON):
+        return loads_json(obj.text)
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode('ascii'))
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode('ascii'))
+    return msgpack.ExtType(code, data)
+
+
+def pack_cache_value(value: Any) -> bytes:
+    """
+    Encode a value for the cache.
+
+    msgpack is used when installed and able to represent the value; anything
+    else (custom classes, etc.) is pickled as before.
+    """
+    if MSGPACK_AVAILABLE:
+        try:
+            return _CACHE_MSGPACK + msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return _CACHE_PICKLE + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_cache_value(data: bytes) -> Any:
+    """Decode a value written by pack_cache_value, or a legacy JSON/pickle cache entry"""
+    if not data:
+        return None
+
+    marker = data[:1]
+    if marker == _CACHE_MSGPACK:
+        return msgpack.unpackb(data[1:], ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+    if marker == _CACHE_PICKLE:
+        return pickle.loads(data[1:])
+
+    # Entries written before the serializer layer: JSON first, then pickle
+    try:
+        return json.loads(data.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return pickle.loads(data)
+
+
+def install_json_provider(app):
+    """Use the fast JSON provider for jsonify/app.json in a Flask app"""
+    from flask.json.provider import JSONProvider
+
+    class FastJSONProvider(JSONProvider):
+        """Flask JSON provider backed by dumps_json/loads_json"""
+
+        mimetype = 'application/json'
+        compact = None
+
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return dumps_json(obj, default=kwargs.get('default'), sort_keys=kwargs.get('sort_keys', False),
+                              indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+        def loads(self, s: Any, **kwargs: Any) -> Any:
+            return loads_json(s)
+
+        def response(self, *args: Any, **kwargs: Any):
+            obj = self._prepare_response_obj(args, kwargs)
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            # Hand bytes straight to the response instead of str -> bytes again
+            return self._app.response_class(dumps_json(obj, indent=indent) + b'\n', mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
+    logger.info(f"JSON provider: {'orjson' if ORJSON_AVAILABLE else 'stdlib json'}, "
+                f"cache serializer: {'msgpack' if MSGPACK_AVAILABLE else 'pickle'}")
+    return app.json
@@ -5,6 +5,7 @@ Stability Helpers - Quick wins for immediate stability improvements
 import time
 import logging
 import functools
+import threading
 from typing import Callable, Any, Optional, Dict
 from contextlib import contextmanager
 import psycopg2
@@ -91,24 +92,30 @@ def safe_database_operation(session, operation_name: str = "database operation")
 class CircuitBreaker:
     """
     Circuit breaker pattern implementation to prevent cascading failures.
+
+    Use as a decorator, or call allow_request() / record_success() / record_failure()
+    around a request. After recovery_timeout an OPEN breaker goes HALF_OPEN and lets
+    up to half_open_max_calls probe requests through; a successful probe closes it,
+    a failed one reopens it.
     """
-    def __init__(self, failure_threshold: int = 5, recovery_timeout: int = 60):
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: int = 60,
+                 name: str = "circuit", half_open_max_calls: int = 1):
+        self.name = name
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
         self.failure_count = 0
         self.last_failure_time: Optional[float] = None
+        self.opened_at: Optional[float] = None
+        self.half_open_calls = 0
         self.state = "CLOSED"  # CLOSED, OPEN, HALF_OPEN
+        self._lock = threading.Lock()
         
     def __call__(self, func: Callable) -> Callable:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            if self.state == "OPEN":
-                if self._should_attempt_reset():
-                    self.state = "HALF_OPEN"
-                    logger.info(f"Circuit breaker for {func.__name__} is HALF_OPEN, attempting reset")
-                else:
-                    time_remaining = self.recovery_timeout - (time.time() - self.last_failure_time)
-                    raise Exception(f"Circuit breaker is OPEN. Service will retry in {time_remaining:.0f} seconds")
+            if not self.allow_request():
+                raise Exception(f"Circuit breaker is OPEN. Service will retry in {self.retry_after():.0f} seconds")
             
             try:
                 result = func(*args, **kwargs)
@@ -120,25 +127,98 @@ class CircuitBreaker:
                 
         return wrapper
     
+    def allow_request(self) -> bool:
+        """Whether a request may go through now; in HALF_OPEN this reserves a probe slot"""
+        with self._lock:
+            if self.state == "OPEN":
+                if not self._should_attempt_reset():
+                    return False
+                self.state = "HALF_OPEN"
+                self.half_open_calls = 0
+                logger.info(f"Circuit breaker {self.name} is HALF_OPEN, attempting reset")
+            
+            if self.state == "HALF_OPEN":
+                if self.half_open_calls >= self.half_open_max_calls:
+                    return False
+                self.half_open_calls += 1
+            return True
+    
+    def is_blocking(self) -> bool:
+        """Whether requests would be rejected right now (does not reserve a probe slot)"""
+        with self._lock:
+            if self.state == "OPEN":
+                return not self._should_attempt_reset()
+            if self.state == "HALF_OPEN":
+                return self.half_open_calls >= self.half_open_max_calls
+            return False
+    
+    def retry_after(self) -> float:
+        """Seconds until an OPEN breaker allows a probe"""
+        if self.state != "OPEN" or not self.opened_at:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.time() - self.opened_at))
+    
+    def cancel_request(self):
+        """Give back a probe slot reserved by allow_request() when no request was made"""
+        with self._lock:
+            if self.state == "HALF_OPEN" and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+    
+    def record_success(self):
+        self._on_success(self.name)
+    
+    def record_failure(self):
+        self._on_failure(self.name)
+    
+    def trip(self, reason: str = ""):
+        """Open the breaker immediately, e.g. on a failed health check"""
+        with self._lock:
+            if self.state != "OPEN":
+                logger.error(f"Circuit breaker {self.name} is now OPEN{': ' + reason if reason else ''}")
+            self.state = "OPEN"
+            self.failure_count = max(self.failure_count, self.failure_threshold)
+            self.last_failure_time = self.opened_at = time.time()
+    
+    def allow_probe(self):
+        """Skip the rest of the recovery timeout, e.g. after a passing health check"""
+        with self._lock:
+            if self.state == "OPEN":
+                self.state = "HALF_OPEN"
+                self.half_open_calls = 0
+                logger.info(f"Circuit breaker {self.name} is HALF_OPEN after a passing health check")
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'failure_count': self.failure_count,
+            'retry_after_seconds': round(self.retry_after(), 1)
+        }
+    
     def _should_attempt_reset(self) -> bool:
-        return (
-            self.last_failure_time and 
-            time.time() - self.last_failure_time >= self.recovery_timeout
+        return bool(
+            self.opened_at and
+            time.time() - self.opened_at >= self.recovery_timeout
         )
     
     def _on_success(self, func_name: str):
-        if self.state == "HALF_OPEN":
-            logger.info(f"Circuit breaker for {func_name} is now CLOSED")
-        self.failure_count = 0
-        self.state = "CLOSED"
+        with self._lock:
+            if self.state == "HALF_OPEN":
+                logger.info(f"Circuit breaker for {func_name} is now CLOSED")
+            self.failure_count = 0
+            self.half_open_calls = 0
+            self.state = "CLOSED"
     
     def _on_failure(self, func_name: str):
-        self.failure_count += 1
-        self.last_failure_time = time.time()
-        
-        if self.failure_count >= self.failure_threshold:
-            self.state = "OPEN"
-            logger.error(f"Circuit breaker for {func_name} is now OPEN after {self.failure_count} failures")
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure_time = time.time()
+            
+            # A failed probe reopens immediately
+            if self.state == "HALF_OPEN" or self.failure_count >= self.failure_threshold:
+                if self.state != "OPEN":
+                    logger.error(f"Circuit breaker for {func_name} is now OPEN after {self.failure_count} failures")
+                self.state = "OPEN"
+                self.opened_at = self.last_failure_time
 
 
 def validate_batch_data(batch_data: Dict[str, Any]) -> Dict[str, Any]: